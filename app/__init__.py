@@ -27,6 +27,10 @@ def create_app(test_config=None):
 
     # Create and configure the app
     app = Flask(__name__, instance_relative_config=True)
+    
+    # Les fichiers envoyés sont écrits une seule fois, directement dans DATA_DIR/temp
+    from app.api.ingest import IngestRequest
+    app.request_class = IngestRequest
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY') or secrets.token_hex(32),  # Clé sécurisée
         DATA_DIR='/app/data',
@@ -36,6 +40,53 @@ def create_app(test_config=None):
         ALLOWED_EXTENSIONS={'pdf', 'jpg', 'jpeg', 'png'},
         WTF_CSRF_ENABLED=True,  # Activer la protection CSRF
         MAX_CONTENT_LENGTH=1024 * 1024 * 1024,  # Limiter la taille des fichiers à 1 Go
+        COALESCE_ENABLED=True,  # Partager le résultat des traitements identiques concurrents
+        COALESCE_WAIT_TIMEOUT=180,  # Attente maximale d'un traitement identique en cours (secondes)
+        ENGINE_SOCKET=os.environ.get('PDFEDITOR_SOCKET', '/app/data/engine/engine.sock'),  # Moteur résident
+        RAM_STAGING_DIR=os.environ.get('RAM_STAGING_DIR', '/dev/shm/pdfstudio'),  # Fichiers de travail en mémoire (tmpfs)
+        RAM_STAGING_BUDGET=int(os.environ.get('RAM_STAGING_BUDGET_MB', '256')) * 1024 * 1024,  # Budget global, 0 pour désactiver
+        RAM_STAGING_THRESHOLD=5 * 1024 * 1024,  # Au-delà de 5 Mo, travail sur disque
+        DOWNLOAD_OFFLOAD=os.environ.get('DOWNLOAD_OFFLOAD', ''),  # '', 'x-accel' (nginx) ou 'x-sendfile' : envoi délégué au proxy
+        DOWNLOAD_OFFLOAD_PREFIX=os.environ.get('DOWNLOAD_OFFLOAD_PREFIX', '/protected/processed'),  # Emplacement interne du proxy (x-accel)
+        LINEARIZE_THRESHOLD=int(os.environ.get('LINEARIZE_THRESHOLD_MB', '10')) * 1024 * 1024,  # PDF linéarisés au-delà de 10 Mo en entrée, 0 pour désactiver
+        BUNDLE_CACHE_ENABLED=True,  # Archives de téléchargement groupé enregistrées pour les demandes suivantes
+        LAZY_SPLIT_CACHE_BYTES=int(os.environ.get('LAZY_SPLIT_CACHE_MB', '512')) * 1024 * 1024,  # Documents des découpages différés en cache
+        FILE_RETENTION_HOURS=int(os.environ.get('FILE_RETENTION_HOURS', '6')),  # Durée de conservation des fichiers reçus et traités
+        RECONCILE_INTERVAL=3600,  # Réconciliation de l'index des fichiers avec le disque, au plus une fois par heure (secondes)
+        JANITOR_ENABLED=os.environ.get('JANITOR_ENABLED', 'true').lower() == 'true',  # Nettoyage continu en arrière-plan (un seul worker)
+        JANITOR_INTERVAL=30,  # Intervalle entre deux passages du janitor (secondes)
+        JANITOR_BATCH_SIZE=100,  # Fichiers expirés supprimés par lot
+        JANITOR_RATE=int(os.environ.get('JANITOR_RATE', '200')),  # Débit maximal de suppression (fichiers par seconde), 0 sans limite
+        JANITOR_MAX_BATCHES=50,  # Lots par passage, le reste est repris au passage suivant
+        JANITOR_ORPHAN_AGE=2 * 3600,  # Répertoires de travail abandonnés au-delà de 2 heures (secondes)
+        JANITOR_SWEEP_INTERVAL=3600,  # Nettoyage complet des autres répertoires, au plus une fois par heure (secondes)
+        JANITOR_HASH_BATCH=20,  # Empreintes des fichiers traités calculées par passage (ETag fort), 0 pour désactiver
+        STORAGE_HIGH_WATERMARK=float(os.environ.get('STORAGE_HIGH_WATERMARK', '0.85')),  # Éviction des fichiers traités au-delà de 85 % d'occupation du disque
+        STORAGE_LOW_WATERMARK=float(os.environ.get('STORAGE_LOW_WATERMARK', '0.75')),  # Éviction jusqu'à 75 % d'occupation
+        STORAGE_CRITICAL_WATERMARK=float(os.environ.get('STORAGE_CRITICAL_WATERMARK', '0.95')),  # Traitements refusés (507) au-delà de 95 % d'occupation estimée
+        STORAGE_ADMISSION_FACTOR=3,  # Espace estimé d'un traitement : 3 fois la taille de la requête (fichiers de travail et résultats)
+        STORAGE_LEASE_SECONDS=900,  # Fichiers traités jamais évincés dans les 15 minutes suivant leur production (secondes)
+        STORAGE_BACKEND=os.environ.get('STORAGE_BACKEND', 'local'),  # 'local' ou 's3' : fichiers traités copiés dans un bucket partagé par tous les nœuds
+        S3_BUCKET=os.environ.get('S3_BUCKET', ''),
+        S3_PREFIX=os.environ.get('S3_PREFIX', 'processed/'),  # Préfixe des clés des fichiers traités
+        S3_ENDPOINT_URL=os.environ.get('S3_ENDPOINT_URL', ''),  # Stockage compatible S3 (MinIO, Ceph...), vide pour AWS
+        S3_REGION=os.environ.get('S3_REGION', ''),
+        S3_ACCESS_KEY_ID=os.environ.get('S3_ACCESS_KEY_ID', ''),  # Vide : identifiants de l'environnement (rôle, profil)
+        S3_SECRET_ACCESS_KEY=os.environ.get('S3_SECRET_ACCESS_KEY', ''),
+        S3_ADDRESSING_STYLE=os.environ.get('S3_ADDRESSING_STYLE', 'auto'),  # 'path' pour MinIO
+        S3_MULTIPART_CHUNK_SIZE=int(os.environ.get('S3_MULTIPART_CHUNK_MB', '8')) * 1024 * 1024,  # Taille des parties de l'envoi multipart (5 Mo minimum)
+        S3_PRESIGNED_DOWNLOADS=os.environ.get('S3_PRESIGNED_DOWNLOADS', 'true').lower() == 'true',  # Téléchargements redirigés vers une URL présignée, sinon relayés
+        S3_PRESIGN_EXPIRES=300,  # Validité des URL présignées (secondes)
+        UPLOAD_DEDUP_PRECHECK=os.environ.get('UPLOAD_DEDUP_PRECHECK', 'true').lower() == 'true',  # Envoi évité si le client annonce l'empreinte d'un contenu déjà stocké
+        ENGINE_TIMEOUT=60,  # Durée maximale d'exécution du moteur dans une requête (secondes)
+        JOB_WORKERS=int(os.environ.get('JOB_WORKERS', '2')),  # Processus des traitements asynchrones lancés par le superviseur, 0 s'ils sont lancés à part (worker.py)
+        JOB_TIMEOUT=int(os.environ.get('JOB_TIMEOUT', '1800')),  # Durée maximale d'exécution du moteur dans un traitement asynchrone (secondes)
+        JOB_POLL_INTERVAL=0.5,  # Lecture de la file par un worker inoccupé (secondes)
+        JOB_HEARTBEAT_INTERVAL=10,  # Signalement d'un traitement en cours et surveillance des workers (secondes)
+        JOB_STALE_AFTER=60,  # Traitement remis en file si son worker ne s'est pas signalé depuis 1 minute (secondes)
+        JOB_MAX_ATTEMPTS=3,  # Tentatives d'un traitement dont le worker s'arrête
+        JOB_MAX_PENDING=20,  # Traitements en attente ou en cours par session
+        JOB_EVENTS_TIMEOUT=30,  # Durée d'un flux d'événements SSE avant reconnexion du client (secondes)
     )
 
     # Log directory paths
@@ -57,6 +108,14 @@ def create_app(test_config=None):
         os.makedirs(dir_path, exist_ok=True)
         logger.info(f"Directory created/verified: {dir_path}")
 
+    # Refuse processing requests (507) before reading their body when the disk is nearly full
+    from app.api import governor
+    governor.init_app(app)
+
+    # Release the uploaded contents pinned by each request's processing
+    from app.api import blobs
+    blobs.init_app(app)
+
     # Initialize CSRF protection
     csrf = CSRFProtect()
     csrf.init_app(app)
@@ -103,8 +162,16 @@ def create_app(test_config=None):
     def request_entity_too_large(e):
         return render_template('error.html', error="The file is too large. The maximum size is 20 MB."), 413
 
-    # Clean old files
-    clean_old_sessions(app)
+    # Run asynchronous jobs in local worker processes, supervised by one elected web worker
+    from app.api import jobs
+    jobs.start(app)
+
+    # Clean old files: background janitor elected across workers, or a single sweep at startup
+    if app.config['JANITOR_ENABLED']:
+        from app.api import janitor
+        janitor.start(app)
+    else:
+        clean_old_sessions(app)
 
     logger.info("Application successfully initialized")
     return app 
@@ -0,0 +1,199 @@
+"""
+Lecture en place des archives ZIP de découpage
+
+Les documents d'une archive split_<id>.zip sont servis directement depuis
+l'archive, à partir de la position de leur en-tête local : rien n'est extrait
+ni recopié dans le répertoire des fichiers traités. Les membres stockés sans
+compression (cas des archives écrites par le moteur) sont transmis tels
+quels, par sendfile lorsque le serveur le permet ; les membres compressés
+sont décompressés au fil de l'envoi.
+
+Le répertoire central de chaque archive est lu une seule fois par processus
+et gardé en cache, tant que le fichier n'est pas modifié.
+"""
+import os
+import re
+import zlib
+import struct
+import zipfile
+import logging
+from collections import OrderedDict
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATTERN = re.compile(r'^split_[0-9A-Za-z_-]+\.zip$')
+
+# Répertoires centraux gardés en cache : (chemin, identité du fichier) -> membres
+_directories = OrderedDict()
+MAX_CACHED_DIRECTORIES = 128
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+LOCAL_HEADER_SIGNATURE = 0x04034b50
+
+# Taille des blocs lus pour les membres compressés
+CHUNK_SIZE = 256 * 1024
+
+
+class ArchiveError(Exception):
+    """Archive ou membre introuvable, avec le code HTTP à retourner"""
+
+    def __init__(self, message, status_code=404):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_archive_path(zip_filename):
+    """
+    Retourne le chemin d'une archive de découpage du répertoire des fichiers traités
+
+    Args:
+        zip_filename: Nom de l'archive (split_<id>.zip)
+
+    Returns:
+        str: Chemin de l'archive
+
+    Raises:
+        ArchiveError: Nom invalide ou archive introuvable
+    """
+    if not zip_filename or not ARCHIVE_PATTERN.match(zip_filename):
+        raise ArchiveError('Invalid ZIP filename', 400)
+    # Archive produite sur un autre nœud : récupérée depuis le stockage partagé
+    zip_path = storage.resolve(zip_filename)
+    if zip_path is None:
+        raise ArchiveError('ZIP file not found', 404)
+    return zip_path
+
+
+def list_members(zip_path):
+    """
+    Liste les membres d'une archive, depuis son seul répertoire central
+
+    Args:
+        zip_path: Chemin de l'archive
+
+    Returns:
+        list: Dictionnaires name, size, compress_size, method, crc, offset
+              (position de l'en-tête local)
+    """
+    st = os.stat(zip_path)
+    key = (zip_path, st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+    members = _directories.get(key)
+    if members is not None:
+        _directories.move_to_end(key)
+        return members
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_file:
+        members = [
+            {
+                'name': info.filename,
+                'size': info.file_size,
+                'compress_size': info.compress_size,
+                'method': info.compress_type,
+                'crc': info.CRC,
+                'offset': info.header_offset
+            }
+            for info in zip_file.infolist()
+            if not info.is_dir()
+        ]
+
+    _directories[key] = members
+    while len(_directories) > MAX_CACHED_DIRECTORIES:
+        _directories.popitem(last=False)
+    return members
+
+
+def get_member(zip_path, name):
+    """
+    Retourne la description d'un membre de l'archive
+
+    Raises:
+        ArchiveError: Membre introuvable
+    """
+    for member in list_members(zip_path):
+        if member['name'] == name:
+            return member
+    raise ArchiveError('File not found in ZIP', 404)
+
+
+class MemberReader:
+    """
+    Lecture du contenu d'un membre stocké, limitée à ses octets
+
+    Expose fileno() et la position du descripteur au début du membre : un
+    serveur qui utilise sendfile (gunicorn) transmet alors les octets de
+    l'archive sans les copier, en s'arrêtant au Content-Length.
+    """
+
+    def __init__(self, path, data_offset, size):
+        self._file = open(path, 'rb', buffering=0)
+        self._file.seek(data_offset)
+        self.remaining = size
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._file.read(size) if size else b''
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+
+
+def _data_offset(zip_path, member):
+    """Position du contenu d'un membre, lue dans son en-tête local"""
+    with open(zip_path, 'rb') as f:
+        f.seek(member['offset'])
+        header = f.read(LOCAL_HEADER.size)
+    if len(header) != LOCAL_HEADER.size:
+        raise ArchiveError('Corrupted ZIP file', 500)
+    fields = LOCAL_HEADER.unpack(header)
+    if fields[0] != LOCAL_HEADER_SIGNATURE:
+        raise ArchiveError('Corrupted ZIP file', 500)
+    name_length, extra_length = fields[9], fields[10]
+    return member['offset'] + LOCAL_HEADER.size + name_length + extra_length
+
+
+def _inflate(zip_path, data_offset, compress_size):
+    decompressor = zlib.decompressobj(-15)
+    with open(zip_path, 'rb') as f:
+        f.seek(data_offset)
+        remaining = compress_size
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            output = decompressor.decompress(data)
+            if output:
+                yield output
+        output = decompressor.flush()
+        if output:
+            yield output
+
+
+def open_member(zip_path, member):
+    """
+    Ouvre le contenu d'un membre pour l'envoyer
+
+    Args:
+        zip_path: Chemin de l'archive
+        member: Description du membre (voir list_members)
+
+    Returns:
+        MemberReader pour un membre stocké, ou générateur des blocs décompressés
+
+    Raises:
+        ArchiveError: Archive corrompue ou méthode de compression non prise en charge
+    """
+    data_offset = _data_offset(zip_path, member)
+    if member['method'] == zipfile.ZIP_STORED:
+        return MemberReader(zip_path, data_offset, member['size'])
+    if member['method'] == zipfile.ZIP_DEFLATED:
+        logger.info(f"Membre compressé décompressé à l'envoi: {member['name']}")
+        return _inflate(zip_path, data_offset, member['compress_size'])
+    raise ArchiveError('Unsupported ZIP compression method', 415)
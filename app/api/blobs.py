@@ -0,0 +1,239 @@
+"""
+Stockage des fichiers reçus par contenu (déduplication)
+
+Les mêmes modèles et relevés sont envoyés encore et encore : chaque fichier
+reçu est stocké sous son empreinte SHA-256 (uploads/blobs/ab/cd/<sha256>.pdf),
+et des envois identiques partagent un seul fichier. Chaque envoi reçoit
+toujours son propre identifiant de document (voir documents.py).
+
+Un fichier stocké est référencé (table blob_refs de l'index, voir
+catalog.py) :
+
+    - par chaque session qui l'a envoyé, pendant FILE_RETENTION_HOURS après
+      son dernier envoi ;
+    - par chaque traitement qui l'utilise, le temps du traitement (référence
+      posée dès la mise en file d'un traitement asynchrone, retirée à la fin
+      de la requête, ou après JANITOR_ORPHAN_AGE si le worker s'est arrêté).
+
+Le janitor supprime les fichiers qui ne sont plus référencés (collect).
+
+Un client qui connaît l'empreinte de son fichier peut l'annoncer avant
+l'envoi (/upload : champ known_files, /api/uploads : métadonnée sha256) :
+si le contenu est déjà stocké, il est rattaché à la session sans être
+transféré. La taille annoncée doit correspondre. UPLOAD_DEDUP_PRECHECK
+désactive ce raccourci (il révèle qu'un contenu est déjà stocké sur le
+serveur à qui connaît son empreinte).
+"""
+import os
+import re
+import uuid
+import time
+import shutil
+import logging
+from flask import current_app, g
+from . import catalog
+from . import coalesce
+from . import documents
+
+logger = logging.getLogger(__name__)
+
+BLOBS_DIR_NAME = 'blobs'
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+# Répertoires de répartition : deux niveaux de deux caractères hexadécimaux
+SHARD_LEVELS = 2
+
+
+def get_blobs_dir():
+    """
+    Retourne le répertoire des fichiers reçus stockés par contenu
+
+    Returns:
+        str: Chemin vers uploads/blobs
+    """
+    blobs_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], BLOBS_DIR_NAME)
+    os.makedirs(blobs_dir, exist_ok=True)
+    return blobs_dir
+
+
+def blob_path(sha256, extension=''):
+    """
+    Chemin du fichier d'un contenu
+
+    Args:
+        sha256: Empreinte du contenu
+        extension: Extension du premier fichier reçu avec ce contenu
+
+    Returns:
+        str: Chemin uploads/blobs/ab/cd/<sha256><extension>
+    """
+    shard = [sha256[2 * i:2 * i + 2] for i in range(SHARD_LEVELS)]
+    return os.path.join(get_blobs_dir(), *shard, f"{sha256}{extension}")
+
+
+def is_valid_hash(value):
+    """Empreinte SHA-256 hexadécimale (minuscules)"""
+    return bool(value) and bool(SHA256_PATTERN.match(value))
+
+
+def _session_holder():
+    return f"session:{documents.current_session_id()}"
+
+
+def _attached(row, filename, deduplicated):
+    """Identifiant de document et enregistrement dans l'index d'un contenu rattaché à la session"""
+    handle = documents.register(row['path'], filename, 'upload', sha256=row['sha256'])
+    catalog.record([{'path': row['path'], 'size': row['size'], 'kind': 'blob', 'sha256': row['sha256']}],
+                   'upload', documents.current_session_id(), area='uploads')
+    coalesce.remember_hash(row['path'], row['sha256'])
+    return {
+        'path': row['path'],
+        'size': row['size'],
+        'sha256': row['sha256'],
+        'handle': handle,
+        'deduplicated': deduplicated
+    }
+
+
+def store(staged_file, filename):
+    """
+    Stocke un fichier reçu, ou le remplace par le contenu identique déjà stocké
+
+    L'empreinte du fichier reçu n'est acceptée que si le serveur l'a calculée
+    sur son contenu actuel (mémorisée par la réception, voir ingest.py et
+    uploads.py, pour cet état du fichier) ; sinon, elle est recalculée depuis
+    le disque. Un contenu n'est donc jamais publié sous l'empreinte d'un
+    autre, qui serait ensuite servie aux envois identiques des autres
+    sessions.
+
+    Args:
+        staged_file: Fichier reçu (StagedFile, empreinte calculée à la réception si possible)
+        filename: Nom d'origine du document
+
+    Returns:
+        dict: path, size, sha256, handle, deduplicated (le fichier reçu a été
+              supprimé au profit du contenu déjà stocké)
+    """
+    sha256 = staged_file.sha256
+    if sha256 is None or coalesce.known_hash(staged_file.path) != sha256:
+        if sha256 is not None:
+            logger.info(f"Empreinte non vérifiée pour {filename}, recalculée depuis le disque")
+        sha256 = coalesce.hash_file(staged_file.path)
+    expires_at = time.time() + catalog.get_retention()
+
+    row, deduplicated = catalog.store_blob(sha256, staged_file.size, _session_holder(), expires_at)
+    if not deduplicated:
+        # Copie éventuelle (fichiers de travail en mémoire) hors transaction, renommage dans la transaction
+        target = blob_path(sha256, os.path.splitext(filename)[1].lower())
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        pending_path = os.path.join(os.path.dirname(target), f".{uuid.uuid4().hex}.tmp")
+        shutil.move(staged_file.path, pending_path)
+
+        def publish():
+            os.rename(pending_path, target)
+            return target
+
+        try:
+            row, deduplicated = catalog.store_blob(sha256, staged_file.size, _session_holder(), expires_at, publish)
+        finally:
+            if os.path.exists(pending_path):
+                os.remove(pending_path)
+
+    if deduplicated and os.path.exists(staged_file.path):
+        os.remove(staged_file.path)
+    if deduplicated:
+        logger.info(f"Fichier reçu déjà stocké: {filename} (sha256 {sha256[:12]}, {row['size']} octets évités)")
+    return _attached(row, filename, deduplicated)
+
+
+def attach(sha256, size, filename):
+    """
+    Rattache à la session un contenu déjà stocké, sans transfert
+
+    Args:
+        sha256: Empreinte annoncée par le client
+        size: Taille annoncée par le client
+        filename: Nom d'origine du document
+
+    Returns:
+        dict: Comme store(), ou None si le contenu n'est pas stocké (le
+              fichier doit être envoyé)
+    """
+    if not current_app.config.get('UPLOAD_DEDUP_PRECHECK', True) or not is_valid_hash(sha256):
+        return None
+    row = catalog.get_blob(sha256)
+    if row is None or row['size'] != size:
+        return None
+
+    expires_at = time.time() + catalog.get_retention()
+    row, deduplicated = catalog.store_blob(sha256, size, _session_holder(), expires_at, transfer_skipped=True)
+    if row is None:
+        return None
+    logger.info(f"Envoi évité, contenu déjà stocké: {filename} (sha256 {sha256[:12]})")
+    return _attached(row, filename, True)
+
+
+def pin(documents_used, holder=None, expires_at=None):
+    """
+    Référence les contenus utilisés par la requête en cours
+
+    Les références sont retirées à la fin de la requête (voir init_app).
+    Un traitement asynchrone référence ses contenus dès sa mise en file, sous
+    son propre identifiant (voir jobs.py).
+
+    Args:
+        documents_used: Documents résolus (StoredDocument)
+        holder: Détenteur des références (par défaut, celui de la requête en cours)
+        expires_at: Expiration des références (par défaut, après JANITOR_ORPHAN_AGE)
+    """
+    if holder is None:
+        holder = getattr(g, 'blob_holder', None)
+    if holder is None:
+        holder = g.blob_holder = f"job:{uuid.uuid4().hex}"
+    if expires_at is None:
+        expires_at = time.time() + current_app.config.get('JANITOR_ORPHAN_AGE', 7200)
+    for document in documents_used:
+        if document.sha256 and is_valid_hash(document.sha256):
+            catalog.add_blob_ref(document.sha256, holder, expires_at)
+
+
+def release(holder):
+    """Retire les références d'un traitement terminé"""
+    catalog.release_blob_refs(holder)
+
+
+def init_app(app):
+    """
+    Retire à la fin de chaque requête les références de ses traitements
+
+    Args:
+        app (Flask): Instance de l'application
+    """
+    @app.teardown_request
+    def release_request_blobs(exc):
+        holder = g.pop('blob_holder', None)
+        if holder is not None:
+            try:
+                release(holder)
+            except Exception as e:
+                logger.error(f"Erreur lors du retrait des références de {holder}: {str(e)}")
+
+
+def collect(now):
+    """
+    Supprime par lots les fichiers reçus qui ne sont plus référencés
+
+    Returns:
+        Tuple (nombre de fichiers, octets libérés)
+    """
+    batch_size = current_app.config.get('JANITOR_BATCH_SIZE', 100)
+    max_batches = current_app.config.get('JANITOR_MAX_BATCHES', 50)
+    total_files = 0
+    total_freed = 0
+    for _ in range(max_batches):
+        files, freed = catalog.collect_blobs(now, batch_size)
+        total_files += files
+        total_freed += freed
+        if files < batch_size:
+            break
+    return total_files, total_freed
@@ -0,0 +1,241 @@
+"""
+Cache des archives ZIP de téléchargement groupé
+
+Une même liste de fichiers est souvent téléchargée plusieurs fois (bouton
+« tout télécharger », URL d'archive d'un découpage). La première demande
+diffuse l'archive au fil de l'eau (voir zipstream.py) et l'enregistre en même
+temps dans processed/.bundles ; les demandes suivantes envoient directement
+l'archive enregistrée.
+
+Une archive est identifiée par la liste triée des fichiers (nom dans
+processed, nom dans l'archive), la version de leur contenu et le mode de
+compression. La version d'un membre est son empreinte SHA-256 si elle est
+déjà connue (index des fichiers, empreintes mémorisées par la coalescence),
+sinon son état (inode, taille, date) : les membres ne sont jamais relus pour
+construire la clé. Un fichier de métadonnées par liste de fichiers
+(<clé des noms>.json) conserve l'état des membres et leurs versions. Une archive n'est valable que tant que tous ses membres existent ;
+elle est supprimée avec eux par le nettoyage périodique.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+from flask import current_app
+from . import catalog
+from . import coalesce
+from . import outputs
+
+logger = logging.getLogger(__name__)
+
+# Sous-répertoire du cache, ignoré par les listes de fichiers (pas d'extension)
+BUNDLES_DIR_NAME = '.bundles'
+
+
+def get_bundles_dir():
+    """
+    Retourne le répertoire du cache des archives
+
+    Returns:
+        str: Chemin vers processed/.bundles
+    """
+    bundles_dir = os.path.join(outputs.get_processed_dir(), BUNDLES_DIR_NAME)
+    os.makedirs(bundles_dir, exist_ok=True)
+    return bundles_dir
+
+
+def _digest(payload):
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _member_state(path, name):
+    """État d'un membre, permettant de savoir s'il a changé depuis son enregistrement"""
+    st = os.stat(path)
+    return {
+        'path': os.path.abspath(path),
+        'name': name,
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'ino': st.st_ino
+    }
+
+
+def _state_version(member):
+    """Version d'un membre dont l'empreinte n'est pas connue, tirée de son état"""
+    return f"state:{member['ino']}:{member['size']}:{member['mtime_ns']}"
+
+
+def _same_state(recorded, member):
+    return all(recorded.get(field) == member[field] for field in ('path', 'size', 'mtime_ns', 'ino'))
+
+
+def _read_meta(meta_path):
+    """Lit un fichier de métadonnées, ou None s'il est absent ou illisible"""
+    try:
+        with open(meta_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(meta_path, meta):
+    """Écrit un fichier de métadonnées de manière atomique"""
+    tmp_path = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+
+def _members_valid(meta):
+    """Vérifie que tous les membres d'une archive existent et sont inchangés"""
+    for recorded in meta.get('members', []):
+        try:
+            if not _same_state(recorded, _member_state(recorded['path'], recorded['name'])):
+                return False
+        except OSError:
+            return False
+    return True
+
+
+class Bundle:
+    """
+    Archive d'une liste de fichiers, enregistrée ou à enregistrer
+
+    Attributes:
+        path: Chemin de l'archive dans le cache
+        cached: True si l'archive est déjà enregistrée
+    """
+
+    def __init__(self, bundles_dir, names_key, key, members, compression):
+        self.path = os.path.join(bundles_dir, f"{key}.zip")
+        self.meta_path = os.path.join(bundles_dir, f"{names_key}.json")
+        self.key = key
+        self.members = members
+        self.compression = compression
+
+    @property
+    def cached(self):
+        return os.path.isfile(self.path)
+
+    def record(self, chunks):
+        """
+        Enregistre l'archive pendant sa diffusion
+
+        Les blocs sont transmis tels quels ; l'archive n'est publiée dans le
+        cache (renommage atomique) que si elle a été entièrement produite.
+        Un envoi interrompu ne laisse aucun fichier.
+
+        Args:
+            chunks: Blocs de l'archive (par exemple un ZipStream)
+
+        Yields:
+            bytes: Les mêmes blocs
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            os.replace(tmp_path, self.path)
+            _write_meta(self.meta_path, {
+                'archive': os.path.basename(self.path),
+                'key': self.key,
+                'compression': self.compression,
+                'members': self.members,
+                'created_at': time.time()
+            })
+            logger.info(f"Archive enregistrée dans le cache: {os.path.basename(self.path)}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def lookup(files, compression):
+    """
+    Retourne l'archive d'une liste de fichiers
+
+    Les versions enregistrées sont réutilisées tant que les membres sont
+    inchangés ; sinon, l'empreinte connue de l'index ou de la coalescence est
+    prise, ou à défaut l'état du fichier. Aucun membre n'est relu.
+
+    Args:
+        files: Liste de tuples (chemin, nom dans l'archive)
+        compression: Mode de compression de l'archive
+
+    Returns:
+        Bundle: Archive, déjà enregistrée (cached) ou à enregistrer avec record()
+    """
+    bundles_dir = get_bundles_dir()
+    members = [_member_state(path, name) for path, name in files]
+    names_key = _digest({
+        'files': sorted([os.path.basename(member['path']), member['name']] for member in members),
+        'compression': compression
+    })
+
+    meta = _read_meta(os.path.join(bundles_dir, f"{names_key}.json")) or {}
+    recorded = {entry['path']: entry for entry in meta.get('members', [])}
+    unknown = []
+    for member in members:
+        previous = recorded.get(member['path'])
+        if previous and previous.get('version') and _same_state(previous, member):
+            member['version'] = previous['version']
+        else:
+            unknown.append(member)
+
+    indexed = catalog.get_hashes([member['path'] for member in unknown]) if unknown else {}
+    for member in unknown:
+        sha256, size = indexed.get(member['path'], (None, None))
+        if sha256 is None or size != member['size']:
+            sha256 = coalesce.known_hash(member['path'])
+        member['version'] = sha256 or _state_version(member)
+
+    key = _digest({
+        'files': sorted([os.path.basename(member['path']), member['name'], member['version']] for member in members),
+        'compression': compression
+    })
+    return Bundle(bundles_dir, names_key, key, members, compression)
+
+
+def is_enabled():
+    """Indique si le cache des archives est activé"""
+    return current_app.config.get('BUNDLE_CACHE_ENABLED', True)
+
+
+def clean_stale(max_age_seconds):
+    """
+    Supprime les archives dont un membre a disparu ou changé, ou plus anciennes que max_age_seconds
+
+    Args:
+        max_age_seconds: Âge maximal d'une archive
+    """
+    bundles_dir = get_bundles_dir()
+    now = time.time()
+    referenced = set()
+
+    for filename in os.listdir(bundles_dir):
+        if not filename.endswith('.json'):
+            continue
+        meta_path = os.path.join(bundles_dir, filename)
+        meta = _read_meta(meta_path)
+        archive_path = os.path.join(bundles_dir, meta['archive']) if meta and meta.get('archive') else None
+        expired = meta is None or now - meta.get('created_at', 0) > max_age_seconds
+        if expired or not _members_valid(meta):
+            for path in (archive_path, meta_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            logger.info(f"Archive du cache expirée: {filename}")
+        elif archive_path:
+            referenced.add(os.path.basename(archive_path))
+
+    # Archives sans métadonnées et fichiers d'envois interrompus
+    for filename in os.listdir(bundles_dir):
+        path = os.path.join(bundles_dir, filename)
+        if filename.endswith('.json') or filename in referenced:
+            continue
+        try:
+            if now - os.path.getmtime(path) > max_age_seconds:
+                os.remove(path)
+        except OSError:
+            continue
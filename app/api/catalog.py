@@ -0,0 +1,1154 @@
+"""
+Index des fichiers stockés (fichiers traités et fichiers reçus)
+
+Chaque fichier publié dans processed (ou reçu dans uploads) est enregistré
+dans une base SQLite (DATA_DIR/catalog.db, mode WAL, partagée par tous les
+workers) : session propriétaire, opération, traitement (job) qui l'a produit,
+archive parente, taille, empreinte, nombre de pages, dates de création et
+d'expiration. Les listes de fichiers, le tableau de bord et le nettoyage sont
+des requêtes indexées : ils ne parcourent plus les répertoires et ne font
+plus un stat() par fichier.
+
+Les propriétaires sont enregistrés à part (un résultat partagé par des
+requêtes identiques concurrentes appartient à chacune de leurs sessions) :
+les listes d'une session ne lisent que les fichiers de cette session.
+
+Chaque fichier garde sa date de dernier accès (enregistrement, puis chaque
+téléchargement) et un bail (lease_until) posé à l'enregistrement : sous
+pression disque, le gouverneur de stockage (voir governor.py) évince les
+fichiers traités les moins récemment téléchargés, jamais ceux dont le bail
+court encore (résultats d'un traitement en cours) ni les documents d'entrée
+d'un traitement asynchrone en attente ou en cours (table job_inputs). Avec un stockage partagé
+(voir storage.py), seule la copie locale est évincée : la ligne et ses
+propriétaires restent (evicted_at), le fichier reste listé et téléchargeable.
+
+Les fichiers reçus sont stockés par contenu (voir blobs.py) : la table
+blobs associe chaque empreinte SHA-256 à son fichier, et blob_refs aux
+sessions et traitements qui le référencent. Le nombre de références est tenu
+par des déclencheurs ; un fichier sans référence est supprimé par le
+janitor, et non à l'expiration de sa ligne dans files (type 'blob').
+
+Des compteurs par zone et par opération (fichiers, octets) sont tenus à jour
+par des déclencheurs SQLite à chaque écriture de l'index : le tableau de
+bord les lit en temps constant. Ils sont recalculés à chaque réconciliation.
+
+La même base tient la file des traitements asynchrones (table jobs, voir
+jobs.py) : un traitement en attente est pris par un seul worker dans une
+transaction, et la file survit aux redémarrages.
+
+L'index peut s'écarter du disque (fichier supprimé à la main, écriture
+interrompue, fichier publié hors de register_outputs) : reconcile() compare
+les deux et répare l'index. Elle est lancée par le nettoyage, au plus une
+fois par RECONCILE_INTERVAL pour l'ensemble des workers.
+
+L'empreinte SHA-256 n'est pas calculée à l'enregistrement (pas de relecture
+des fichiers produits) ni pendant un téléchargement : elle est renseignée
+quand elle est déjà connue (fichiers reçus, empreintes mémorisées par la
+coalescence), ou par le janitor, en arrière-plan. Elle donne l'ETag fort des
+téléchargements (voir delivery.py).
+"""
+import os
+import re
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from flask import current_app
+from . import outputs
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILENAME = 'catalog.db'
+
+# Zones de stockage indexées
+AREAS = ('processed', 'uploads')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    area TEXT NOT NULL,
+    name TEXT NOT NULL,
+    operation TEXT,
+    kind TEXT NOT NULL DEFAULT 'file',
+    parent TEXT,
+    job_id TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    sha256 TEXT,
+    page_count INTEGER,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL,
+    lease_until REAL,
+    evicted_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_area_created ON files (area, created_at);
+CREATE INDEX IF NOT EXISTS files_expires ON files (expires_at);
+CREATE INDEX IF NOT EXISTS files_parent ON files (parent);
+CREATE TABLE IF NOT EXISTS owners (
+    session_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    job_id TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, path)
+);
+CREATE INDEX IF NOT EXISTS owners_path ON owners (path);
+CREATE INDEX IF NOT EXISTS owners_session_created ON owners (session_id, created_at);
+CREATE INDEX IF NOT EXISTS owners_job ON owners (job_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS counters (
+    area TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    files INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (area, operation)
+);
+CREATE TRIGGER IF NOT EXISTS files_counters_insert AFTER INSERT ON files BEGIN
+    INSERT INTO counters (area, operation, files, bytes) VALUES (NEW.area, COALESCE(NEW.operation, ''), 1, NEW.size)
+    ON CONFLICT (area, operation) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes;
+END;
+CREATE TRIGGER IF NOT EXISTS files_counters_delete AFTER DELETE ON files BEGIN
+    UPDATE counters SET files = files - 1, bytes = bytes - OLD.size
+    WHERE area = OLD.area AND operation = COALESCE(OLD.operation, '');
+END;
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    refs INTEGER NOT NULL DEFAULT 0,
+    uploads INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS blobs_refs ON blobs (refs);
+CREATE TABLE IF NOT EXISTS blob_refs (
+    sha256 TEXT NOT NULL,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (sha256, holder)
+);
+CREATE INDEX IF NOT EXISTS blob_refs_expires ON blob_refs (expires_at);
+CREATE INDEX IF NOT EXISTS blob_refs_holder ON blob_refs (holder);
+CREATE TRIGGER IF NOT EXISTS blob_refs_insert AFTER INSERT ON blob_refs BEGIN
+    UPDATE blobs SET refs = refs + 1 WHERE sha256 = NEW.sha256;
+END;
+CREATE TRIGGER IF NOT EXISTS blob_refs_delete AFTER DELETE ON blob_refs BEGIN
+    UPDATE blobs SET refs = refs - 1 WHERE sha256 = OLD.sha256;
+END;
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    heartbeat REAL,
+    status_code INTEGER,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_session ON jobs (session_id, status);
+CREATE TABLE IF NOT EXISTS job_inputs (
+    job_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (job_id, path)
+);
+CREATE INDEX IF NOT EXISTS job_inputs_path ON job_inputs (path);
+CREATE TRIGGER IF NOT EXISTS files_counters_update AFTER UPDATE OF area, operation, size ON files BEGIN
+    UPDATE counters SET files = files - 1, bytes = bytes - OLD.size
+    WHERE area = OLD.area AND operation = COALESCE(OLD.operation, '');
+    INSERT INTO counters (area, operation, files, bytes) VALUES (NEW.area, COALESCE(NEW.operation, ''), 1, NEW.size)
+    ON CONFLICT (area, operation) DO UPDATE SET files = files + 1, bytes = bytes + excluded.bytes;
+END;
+"""
+
+# Colonnes ajoutées après la création de l'index (migrées à la connexion)
+MIGRATED_COLUMNS = (
+    ('last_access', 'REAL'),
+    ('lease_until', 'REAL'),
+    ('evicted_at', 'REAL'),
+)
+
+# Opération déduite du nom d'un fichier trouvé sur le disque (réconciliation)
+NAME_OPERATIONS = (
+    (re.compile(r'^split_.*\.zip$'), 'splitzip', 'archive'),
+    (re.compile(r'^pdf_files_.*\.zip$'), 'download', 'archive'),
+    (re.compile(r'^merged_'), 'merge', 'file'),
+    (re.compile(r'^compressed_'), 'compress', 'file'),
+    (re.compile(r'^rotated_'), 'rotate', 'file'),
+    (re.compile(r'^watermarked_'), 'watermark', 'file'),
+    (re.compile(r'^protected_'), 'protect', 'file'),
+    (re.compile(r'^unlocked_'), 'unlock', 'file'),
+    (re.compile(r'_pages?_[0-9-]+\.pdf$'), 'split', 'page'),
+)
+
+# Connexion par processus et par thread (jamais héritée d'un fork)
+_local = threading.local()
+
+
+def get_catalog_path():
+    """
+    Retourne le chemin de la base de l'index
+
+    Returns:
+        str: Chemin vers DATA_DIR/catalog.db
+    """
+    return os.path.join(current_app.config['DATA_DIR'], CATALOG_FILENAME)
+
+
+def get_area_dir(area):
+    """Répertoire d'une zone de stockage indexée"""
+    if area == 'uploads':
+        return current_app.config['UPLOAD_FOLDER']
+    return outputs.get_processed_dir()
+
+
+def get_retention():
+    """Durée de conservation d'un fichier, en secondes"""
+    return current_app.config.get('FILE_RETENTION_HOURS', 6) * 3600
+
+
+def get_connection():
+    """
+    Retourne la connexion à l'index du processus et du thread courants
+
+    La base est créée au premier accès.
+
+    Returns:
+        sqlite3.Connection: Connexion en mode autocommit (transactions explicites)
+    """
+    db_path = get_catalog_path()
+    key = (os.getpid(), db_path)
+    if getattr(_local, 'key', None) == key:
+        return _local.connection
+
+    connection = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.executescript(SCHEMA)
+    _migrate(connection)
+    _local.key = key
+    _local.connection = connection
+
+    # Index créé avant les compteurs : les calculer une fois
+    if connection.execute("SELECT 1 FROM meta WHERE key = 'counters_built'").fetchone() is None:
+        rebuild_counters()
+    return connection
+
+
+def _migrate(connection):
+    """Ajoute aux index existants les colonnes apparues depuis leur création"""
+    columns = {row['name'] for row in connection.execute("PRAGMA table_info(files)")}
+    for name, column_type in MIGRATED_COLUMNS:
+        if name not in columns:
+            try:
+                connection.execute(f"ALTER TABLE files ADD COLUMN {name} {column_type}")
+            except sqlite3.OperationalError:
+                # Colonne ajoutée entre-temps par un autre worker
+                pass
+            if name == 'last_access':
+                # Fichiers déjà indexés : dernier accès inconnu, date de création à la place
+                connection.execute("UPDATE files SET last_access = created_at WHERE last_access IS NULL")
+    connection.execute("CREATE INDEX IF NOT EXISTS files_lru ON files (area, last_access)")
+
+
+@contextmanager
+def transaction():
+    """Transaction d'écriture (verrou pris dès le début, pas d'interblocage entre workers)"""
+    connection = get_connection()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        yield connection
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    connection.execute('COMMIT')
+
+
+def record(entries, operation, session_id=None, job_id=None, area='processed'):
+    """
+    Enregistre des fichiers stockés
+
+    Un fichier déjà enregistré (résultat partagé par des requêtes identiques
+    concurrentes) gagne un propriétaire et voit son expiration repoussée.
+    Chaque fichier reçoit un bail de STORAGE_LEASE_SECONDS pendant lequel le
+    gouverneur de stockage ne l'évince pas (traitement encore en cours,
+    résultat pas encore téléchargé).
+
+    Args:
+        entries: Dictionnaires décrivant les fichiers ('path' ; facultatifs :
+                 'size', 'kind', 'parent', 'page_count', 'sha256')
+        operation: Opération qui a produit les fichiers
+        session_id: Session propriétaire
+        job_id: Identifiant du traitement qui a produit les fichiers
+        area: Zone de stockage ('processed' ou 'uploads')
+    """
+    now = time.time()
+    expires_at = now + get_retention()
+    lease_until = now + current_app.config.get('STORAGE_LEASE_SECONDS', 900)
+    rows = []
+    for entry in entries:
+        path = os.path.abspath(entry['path'])
+        size = entry.get('size')
+        if size is None:
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+        rows.append((path, area, os.path.basename(path), operation, entry.get('kind') or 'file',
+                     entry.get('parent'), job_id, size, entry.get('sha256'), entry.get('page_count'),
+                     now, expires_at, now, lease_until))
+    if not rows:
+        return
+
+    with transaction() as connection:
+        connection.executemany(
+            "INSERT INTO files (path, area, name, operation, kind, parent, job_id, size, sha256, page_count,"
+            " created_at, expires_at, last_access, lease_until) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (path) DO UPDATE SET expires_at = MAX(expires_at, excluded.expires_at),"
+            " last_access = MAX(COALESCE(last_access, 0), excluded.last_access),"
+            " lease_until = MAX(COALESCE(lease_until, 0), excluded.lease_until), evicted_at = NULL,"
+            " operation = excluded.operation, kind = excluded.kind, parent = COALESCE(excluded.parent, parent),"
+            " job_id = COALESCE(job_id, excluded.job_id), page_count = COALESCE(excluded.page_count, page_count)",
+            rows
+        )
+        if session_id:
+            connection.executemany(
+                "INSERT OR IGNORE INTO owners (session_id, path, job_id, created_at) VALUES (?, ?, ?, ?)",
+                [(session_id, row[0], job_id, now) for row in rows]
+            )
+
+
+def forget(paths):
+    """
+    Retire des fichiers de l'index (après leur suppression)
+
+    Args:
+        paths: Chemins des fichiers supprimés
+    """
+    rows = [(os.path.abspath(path),) for path in paths]
+    if not rows:
+        return
+    with transaction() as connection:
+        connection.executemany("DELETE FROM owners WHERE path = ?", rows)
+        connection.executemany("DELETE FROM files WHERE path = ?", rows)
+
+
+def release_owner(session_id, paths):
+    """
+    Retire une session des propriétaires de fichiers
+
+    Args:
+        session_id: Session qui ne veut plus des fichiers
+        paths: Chemins des fichiers
+
+    Returns:
+        list: Chemins qui n'ont plus aucun propriétaire (à supprimer)
+    """
+    paths = [os.path.abspath(path) for path in paths]
+    with transaction() as connection:
+        connection.executemany("DELETE FROM owners WHERE session_id = ? AND path = ?",
+                               [(session_id, path) for path in paths])
+        return [path for path in paths
+                if connection.execute("SELECT 1 FROM owners WHERE path = ? LIMIT 1", (path,)).fetchone() is None]
+
+
+def set_hash(path, sha256):
+    """Renseigne l'empreinte d'un fichier indexé"""
+    get_connection().execute(
+        "UPDATE files SET sha256 = ? WHERE path = ? AND (sha256 IS NULL OR sha256 != ?)",
+        (sha256, os.path.abspath(path), sha256)
+    )
+
+
+def get_hashes(paths):
+    """
+    Empreintes connues de fichiers indexés (sans relire les fichiers)
+
+    Args:
+        paths: Chemins des fichiers
+
+    Returns:
+        dict: Chemin absolu -> (empreinte SHA-256, taille indexée), pour les fichiers dont l'empreinte est connue
+    """
+    paths = [os.path.abspath(path) for path in paths]
+    connection = get_connection()
+    hashes = {}
+    # Par lots (nombre de paramètres d'une requête SQLite limité)
+    for start in range(0, len(paths), 500):
+        batch = paths[start:start + 500]
+        for row in connection.execute(
+                f"SELECT path, sha256, size FROM files WHERE sha256 IS NOT NULL"
+                f" AND path IN ({', '.join('?' for _ in batch)})", batch):
+            hashes[row['path']] = (row['sha256'], row['size'])
+    return hashes
+
+
+def unhashed(limit):
+    """
+    Fichiers traités présents sur le disque dont l'empreinte n'est pas connue
+
+    Args:
+        limit: Nombre maximal de fichiers
+
+    Returns:
+        list: Lignes de l'index (sqlite3.Row), les plus récemment utilisés en premier
+    """
+    return get_connection().execute(
+        "SELECT * FROM files WHERE area = 'processed' AND sha256 IS NULL AND evicted_at IS NULL"
+        " ORDER BY last_access DESC LIMIT ?", (limit,)
+    ).fetchall()
+
+
+def touch(path):
+    """Enregistre un accès à un fichier indexé (ordre d'éviction du gouverneur)"""
+    get_connection().execute(
+        "UPDATE files SET last_access = ? WHERE path = ?", (time.time(), os.path.abspath(path))
+    )
+
+
+def _owned_files_query(columns, session_id, area, job_id, exclude_kinds, extension):
+    """Requête des fichiers d'une session (ou d'un de ses traitements) et ses paramètres"""
+    query = (f"SELECT {columns} FROM owners JOIN files ON files.path = owners.path"
+             " WHERE owners.session_id = ? AND files.area = ?")
+    params = [session_id, area]
+    if job_id:
+        query += " AND owners.job_id = ?"
+        params.append(job_id)
+    if exclude_kinds:
+        query += f" AND files.kind NOT IN ({', '.join('?' for _ in exclude_kinds)})"
+        params += list(exclude_kinds)
+    if extension:
+        query += " AND files.name LIKE ?"
+        params.append(f"%{extension}")
+    return query, params
+
+
+def list_files(session_id, area='processed', job_id=None, exclude_kinds=('page',), extension=None,
+               limit=None, offset=0):
+    """
+    Liste les fichiers d'une session, les plus récents d'abord
+
+    Seules les lignes de la session sont lues (index sur la session et la
+    date) : le coût ne dépend pas du nombre total de fichiers stockés.
+
+    Args:
+        session_id: Session propriétaire
+        area: Zone de stockage
+        job_id: Ne retenir que les fichiers de ce traitement
+        exclude_kinds: Types de fichiers à ignorer (par défaut les documents
+                       issus d'un découpage, présents dans leur archive)
+        extension: Extension des fichiers à retenir ('.pdf'), toutes si None
+        limit: Nombre maximal de fichiers (tous si None)
+        offset: Nombre de fichiers à sauter (pagination)
+
+    Returns:
+        list: Lignes de l'index (sqlite3.Row), avec la colonne 'owned_at'
+    """
+    query, params = _owned_files_query('files.*, owners.created_at AS owned_at',
+                                       session_id, area, job_id, exclude_kinds, extension)
+    query += " ORDER BY owners.created_at DESC"
+    if limit is not None:
+        query += " LIMIT ? OFFSET ?"
+        params += [limit, offset]
+    return get_connection().execute(query, params).fetchall()
+
+
+def count_files(session_id, area='processed', job_id=None, exclude_kinds=('page',), extension=None):
+    """Nombre de fichiers d'une session (mêmes filtres que list_files)"""
+    query, params = _owned_files_query('COUNT(*)', session_id, area, job_id, exclude_kinds, extension)
+    return get_connection().execute(query, params).fetchone()[0]
+
+
+def get_stats():
+    """
+    Nombre de fichiers et octets occupés, par zone de stockage et par opération
+
+    Lit les compteurs tenus à jour à chaque écriture de l'index (déclencheurs
+    SQLite) : le coût ne dépend pas du nombre de fichiers stockés.
+
+    Returns:
+        dict: Zone -> {'count', 'bytes', 'operations' : liste de {'operation', 'count', 'bytes'}}
+    """
+    stats = {area: {'count': 0, 'bytes': 0, 'operations': []} for area in AREAS}
+    for row in get_connection().execute(
+            "SELECT area, operation, files, bytes FROM counters WHERE files > 0 ORDER BY bytes DESC"):
+        area = stats.setdefault(row['area'], {'count': 0, 'bytes': 0, 'operations': []})
+        area['count'] += row['files']
+        area['bytes'] += row['bytes']
+        area['operations'].append({'operation': row['operation'] or 'other', 'count': row['files'], 'bytes': row['bytes']})
+    return stats
+
+
+def rebuild_counters():
+    """
+    Recalcule les compteurs depuis l'index (réparation d'un écart éventuel)
+
+    Returns:
+        int: Nombre de compteurs corrigés
+    """
+    with transaction() as connection:
+        before = {(row['area'], row['operation']): (row['files'], row['bytes'])
+                  for row in connection.execute("SELECT * FROM counters WHERE files != 0 OR bytes != 0")}
+        connection.execute("DELETE FROM counters")
+        connection.execute(
+            "INSERT INTO counters (area, operation, files, bytes)"
+            " SELECT area, COALESCE(operation, ''), COUNT(*), COALESCE(SUM(size), 0) FROM files"
+            " GROUP BY area, COALESCE(operation, '')"
+        )
+        after = {(row['area'], row['operation']): (row['files'], row['bytes'])
+                 for row in connection.execute("SELECT * FROM counters")}
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('counters_built', ?)", (str(time.time()),))
+
+    corrected = sum(1 for key in set(before) | set(after) if before.get(key) != after.get(key))
+    if corrected:
+        logger.info(f"Compteurs de stockage recalculés: {corrected} corrigés")
+    return corrected
+
+
+def expired(max_age_seconds, now=None):
+    """
+    Fichiers expirés ou plus anciens que max_age_seconds
+
+    Les fichiers reçus stockés par contenu (type 'blob') sont exclus : ils
+    sont supprimés quand plus rien ne les référence (voir collect_blobs).
+
+    Returns:
+        list: Lignes de l'index (sqlite3.Row)
+    """
+    now = now or time.time()
+    return get_connection().execute(
+        "SELECT * FROM files WHERE (expires_at <= ? OR created_at <= ?) AND kind != 'blob'",
+        (now, now - max_age_seconds)
+    ).fetchall()
+
+
+def expiring(now, limit):
+    """
+    Prochains fichiers expirés, par date d'expiration (index sur expires_at)
+
+    Args:
+        now: Date de référence
+        limit: Nombre maximal de fichiers
+
+    Returns:
+        list: Lignes de l'index (sqlite3.Row)
+    """
+    return get_connection().execute(
+        "SELECT * FROM files WHERE expires_at <= ? AND kind != 'blob' ORDER BY expires_at LIMIT ?", (now, limit)
+    ).fetchall()
+
+
+def lru_candidates(now, limit):
+    """
+    Fichiers traités évinçables, du moins récemment utilisé au plus récent
+
+    Les fichiers dont le bail court encore (traitement en cours, résultat
+    tout juste produit), les documents d'entrée des traitements asynchrones
+    en attente ou en cours et ceux dont la copie locale est déjà évincée sont
+    exclus.
+
+    Args:
+        now: Date de référence
+        limit: Nombre maximal de fichiers
+
+    Returns:
+        list: Lignes de l'index (sqlite3.Row)
+    """
+    return get_connection().execute(
+        "SELECT * FROM files WHERE area = 'processed' AND evicted_at IS NULL"
+        " AND (lease_until IS NULL OR lease_until <= ?)"
+        " AND path NOT IN (SELECT job_inputs.path FROM job_inputs JOIN jobs ON jobs.id = job_inputs.job_id"
+        " WHERE jobs.status IN ('queued', 'running'))"
+        " ORDER BY last_access LIMIT ?", (now, limit)
+    ).fetchall()
+
+
+def get_backlog(now=None):
+    """
+    Fichiers expirés restant à supprimer
+
+    Returns:
+        dict: 'count', 'bytes' et 'next_expiry' (prochaine expiration, None si l'index est vide)
+    """
+    now = now or time.time()
+    connection = get_connection()
+    row = connection.execute(
+        "SELECT COUNT(*) AS count, COALESCE(SUM(size), 0) AS bytes FROM files WHERE expires_at <= ? AND kind != 'blob'",
+        (now,)
+    ).fetchone()
+    next_expiry = connection.execute("SELECT MIN(expires_at) FROM files WHERE kind != 'blob'").fetchone()[0]
+    return {'count': row['count'], 'bytes': row['bytes'], 'next_expiry': next_expiry}
+
+
+def get_meta(key, default=None):
+    """Valeur enregistrée dans la table meta"""
+    row = get_connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row['value'] if row else default
+
+
+def set_meta(key, value):
+    """Enregistre une valeur dans la table meta"""
+    get_connection().execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def remove_files(rows):
+    """
+    Supprime des fichiers indexés et les retire de l'index
+
+    Args:
+        rows: Lignes de l'index (sqlite3.Row)
+
+    Returns:
+        Tuple (nombre de fichiers, octets libérés)
+    """
+    removed = []
+    freed = 0
+    for row in rows:
+        try:
+            os.remove(row['path'])
+            freed += row['size']
+            logger.info(f"Fichier nettoyé: {row['path']}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Erreur lors du nettoyage du fichier {row['path']}: {str(e)}")
+            continue
+        removed.append(row['path'])
+    forget(removed)
+    return len(removed), freed
+
+
+def evict_files(rows):
+    """
+    Supprime la copie locale de fichiers conservés dans le stockage partagé
+
+    Les lignes et leurs propriétaires restent dans l'index (fichiers toujours
+    listés, téléchargeables et supprimés à leur expiration) ; storage.resolve
+    récupère à nouveau le fichier au besoin.
+
+    Args:
+        rows: Lignes de l'index (sqlite3.Row)
+
+    Returns:
+        Tuple (nombre de fichiers, octets libérés)
+    """
+    evicted = []
+    freed = 0
+    for row in rows:
+        try:
+            os.remove(row['path'])
+            freed += row['size']
+            logger.info(f"Copie locale évincée: {row['path']}")
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Erreur lors de l'éviction du fichier {row['path']}: {str(e)}")
+            continue
+        evicted.append((time.time(), row['path']))
+    if evicted:
+        with transaction() as connection:
+            connection.executemany("UPDATE files SET evicted_at = ? WHERE path = ?", evicted)
+    return len(evicted), freed
+
+
+def delete_expired(max_age_seconds):
+    """
+    Supprime les fichiers expirés et les retire de l'index
+
+    Args:
+        max_age_seconds: Âge maximal d'un fichier
+
+    Returns:
+        Tuple (nombre de fichiers, octets libérés)
+    """
+    return remove_files(expired(max_age_seconds))
+
+
+def _add_to_meta(connection, key, value):
+    """Ajoute une valeur à un total enregistré dans la table meta"""
+    connection.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE"
+        " SET value = CAST(value AS INTEGER) + CAST(excluded.value AS INTEGER)",
+        (key, str(value))
+    )
+
+
+def store_blob(sha256, size, holder, expires_at, publish=None, transfer_skipped=False):
+    """
+    Référence le fichier reçu d'une empreinte, en le publiant s'il n'est pas déjà stocké
+
+    La recherche, la publication et la référence sont faites dans une même
+    transaction : une suppression concurrente (collect_blobs) ne peut pas
+    retirer le fichier entre-temps.
+
+    Args:
+        sha256: Empreinte du contenu
+        size: Taille du contenu
+        holder: Détenteur de la référence ('session:<id>' ou 'job:<id>')
+        expires_at: Fin de la référence
+        publish: Fonction appelée dans la transaction si le contenu n'est pas
+                 encore stocké ; retourne le chemin du fichier publié. Sans
+                 publish, seul un contenu déjà stocké est référencé
+        transfer_skipped: Contenu annoncé par son empreinte, sans envoi
+
+    Returns:
+        Tuple (ligne de blobs, True si le contenu était déjà stocké), ou
+        (None, False) si le contenu est inconnu et publish absent
+    """
+    with transaction() as connection:
+        row = connection.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        deduplicated = row is not None and os.path.isfile(row['path'])
+        if deduplicated:
+            size = row['size']
+            connection.execute("UPDATE blobs SET uploads = uploads + 1 WHERE sha256 = ?", (sha256,))
+            _add_to_meta(connection, 'dedup_hits', 1)
+            _add_to_meta(connection, 'dedup_saved_bytes', size)
+            if transfer_skipped:
+                _add_to_meta(connection, 'dedup_skipped_transfers', 1)
+        elif publish is None:
+            return None, False
+        else:
+            # Fichier disparu : la ligne et ses références sont conservées
+            connection.execute(
+                "INSERT INTO blobs (sha256, path, size, created_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (sha256) DO UPDATE SET path = excluded.path, size = excluded.size,"
+                " uploads = uploads + 1",
+                (sha256, publish(), size, time.time())
+            )
+        _add_to_meta(connection, 'upload_count', 1)
+        _add_to_meta(connection, 'upload_bytes', size)
+        connection.execute(
+            "INSERT INTO blob_refs (sha256, holder, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (sha256, holder) DO UPDATE SET expires_at = MAX(expires_at, excluded.expires_at)",
+            (sha256, holder, expires_at)
+        )
+        row = connection.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+    return row, deduplicated
+
+
+def get_blob(sha256):
+    """Ligne de blobs d'une empreinte, ou None"""
+    return get_connection().execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+
+
+def add_blob_ref(sha256, holder, expires_at):
+    """
+    Ajoute une référence à un contenu déjà stocké
+
+    Returns:
+        bool: False si le contenu n'est pas stocké
+    """
+    with transaction() as connection:
+        if connection.execute("SELECT 1 FROM blobs WHERE sha256 = ?", (sha256,)).fetchone() is None:
+            return False
+        connection.execute(
+            "INSERT INTO blob_refs (sha256, holder, expires_at) VALUES (?, ?, ?)"
+            " ON CONFLICT (sha256, holder) DO UPDATE SET expires_at = MAX(expires_at, excluded.expires_at)",
+            (sha256, holder, expires_at)
+        )
+    return True
+
+
+def release_blob_refs(holder):
+    """Retire les références d'un détenteur (fin d'un traitement)"""
+    get_connection().execute("DELETE FROM blob_refs WHERE holder = ?", (holder,))
+
+
+def collect_blobs(now, limit):
+    """
+    Supprime les fichiers reçus qui ne sont plus référencés
+
+    Les références expirées sont retirées d'abord. Les fichiers sont supprimés
+    dans la transaction, sérialisée avec store_blob.
+
+    Args:
+        now: Date de référence
+        limit: Nombre maximal de fichiers supprimés
+
+    Returns:
+        Tuple (nombre de fichiers, octets libérés)
+    """
+    removed = []
+    freed = 0
+    with transaction() as connection:
+        connection.execute("DELETE FROM blob_refs WHERE expires_at <= ?", (now,))
+        for row in connection.execute("SELECT * FROM blobs WHERE refs <= 0 LIMIT ?", (limit,)).fetchall():
+            try:
+                os.remove(row['path'])
+                freed += row['size']
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Erreur lors de la suppression du fichier reçu {row['path']}: {str(e)}")
+                continue
+            removed.append(row)
+        connection.executemany("DELETE FROM blobs WHERE sha256 = ?", [(row['sha256'],) for row in removed])
+        connection.executemany("DELETE FROM owners WHERE path = ?", [(row['path'],) for row in removed])
+        connection.executemany("DELETE FROM files WHERE path = ?", [(row['path'],) for row in removed])
+    return len(removed), freed
+
+
+def get_dedup_stats():
+    """
+    Déduplication des fichiers reçus
+
+    Returns:
+        dict: Contenus stockés ('blobs', 'stored_bytes', 'referenced_bytes' :
+              taille cumulée des envois qui les référencent, 'ratio'), et
+              totaux depuis la mise en service ('uploads', 'upload_bytes',
+              'hits', 'saved_bytes', 'skipped_transfers', 'total_ratio')
+    """
+    connection = get_connection()
+    row = connection.execute(
+        "SELECT COUNT(*) AS blobs, COALESCE(SUM(size), 0) AS stored_bytes,"
+        " COALESCE(SUM(size * uploads), 0) AS referenced_bytes FROM blobs"
+    ).fetchone()
+    totals = {row['key']: int(row['value']) for row in connection.execute(
+        "SELECT key, value FROM meta WHERE key IN ('upload_count', 'upload_bytes', 'dedup_hits',"
+        " 'dedup_saved_bytes', 'dedup_skipped_transfers')")}
+    upload_bytes = totals.get('upload_bytes', 0)
+    saved_bytes = totals.get('dedup_saved_bytes', 0)
+    return {
+        'blobs': row['blobs'],
+        'stored_bytes': row['stored_bytes'],
+        'referenced_bytes': row['referenced_bytes'],
+        'ratio': row['referenced_bytes'] / row['stored_bytes'] if row['stored_bytes'] else 1.0,
+        'uploads': totals.get('upload_count', 0),
+        'upload_bytes': upload_bytes,
+        'hits': totals.get('dedup_hits', 0),
+        'saved_bytes': saved_bytes,
+        'skipped_transfers': totals.get('dedup_skipped_transfers', 0),
+        'total_ratio': upload_bytes / (upload_bytes - saved_bytes) if upload_bytes > saved_bytes else 1.0
+    }
+
+
+def enqueue_job(job_id, session_id, operation, params, inputs=()):
+    """
+    Ajoute un traitement à la file
+
+    Args:
+        job_id: Identifiant du traitement
+        session_id: Session propriétaire
+        operation: Opération (voir jobs.OPERATIONS)
+        params: Paramètres du traitement (JSON)
+        inputs: Chemins des documents d'entrée, jamais évincés tant que le
+                traitement est en attente ou en cours
+    """
+    with transaction() as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, session_id, operation, params, status, created_at) VALUES (?, ?, ?, ?, 'queued', ?)",
+            (job_id, session_id, operation, params, time.time())
+        )
+        connection.executemany(
+            "INSERT OR IGNORE INTO job_inputs (job_id, path) VALUES (?, ?)",
+            [(job_id, os.path.abspath(path)) for path in inputs]
+        )
+
+
+def get_job(job_id):
+    """Ligne d'un traitement, ou None"""
+    return get_connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+
+def count_pending_jobs(session_id):
+    """Traitements d'une session en attente ou en cours"""
+    return get_connection().execute(
+        "SELECT COUNT(*) FROM jobs WHERE session_id = ? AND status IN ('queued', 'running')", (session_id,)
+    ).fetchone()[0]
+
+
+def get_queue_position(job):
+    """Nombre de traitements en attente avant un traitement de la file"""
+    return get_connection().execute(
+        "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?", (job['created_at'],)
+    ).fetchone()[0]
+
+
+def claim_job(worker):
+    """
+    Prend le plus ancien traitement en attente
+
+    Args:
+        worker: Identifiant du worker (hôte:pid)
+
+    Returns:
+        sqlite3.Row: Traitement pris (status 'running'), ou None si la file est vide
+    """
+    now = time.time()
+    with transaction() as connection:
+        row = connection.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE jobs SET status = 'running', worker = ?, heartbeat = ?, attempts = attempts + 1,"
+            " started_at = ? WHERE id = ?",
+            (worker, now, now, row['id'])
+        )
+        return connection.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+
+
+def heartbeat_job(job_id, worker):
+    """Signale qu'un traitement en cours est toujours exécuté par son worker"""
+    get_connection().execute(
+        "UPDATE jobs SET heartbeat = ? WHERE id = ? AND worker = ? AND status = 'running'",
+        (time.time(), job_id, worker)
+    )
+
+
+def finish_job(job_id, worker, status, status_code, result, error=None):
+    """
+    Enregistre la fin d'un traitement
+
+    Sans effet si le traitement a été remis en file entre-temps (worker
+    considéré comme arrêté).
+
+    Args:
+        job_id: Identifiant du traitement
+        worker: Worker qui l'a exécuté
+        status: 'succeeded' ou 'failed'
+        status_code: Code HTTP de la réponse du traitement
+        result: Réponse du traitement (JSON) ou None
+        error: Message d'erreur
+
+    Returns:
+        bool: True si la fin a été enregistrée
+    """
+    cursor = get_connection().execute(
+        "UPDATE jobs SET status = ?, status_code = ?, result = ?, error = ?, finished_at = ?"
+        " WHERE id = ? AND worker = ? AND status = 'running'",
+        (status, status_code, result, error, time.time(), job_id, worker)
+    )
+    return cursor.rowcount > 0
+
+
+def cancel_job(job_id):
+    """
+    Annule un traitement encore en attente
+
+    Returns:
+        bool: True si le traitement a été annulé
+    """
+    cursor = get_connection().execute(
+        "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+        (time.time(), job_id)
+    )
+    return cursor.rowcount > 0
+
+
+def requeue_stale_jobs(stale_before, max_attempts):
+    """
+    Remet en file les traitements dont le worker s'est arrêté
+
+    Un traitement sans signe de vie depuis stale_before est repris par un
+    autre worker, ou abandonné après max_attempts tentatives.
+
+    Returns:
+        Tuple (traitements remis en file, traitements abandonnés)
+    """
+    now = time.time()
+    with transaction() as connection:
+        failed = connection.execute(
+            "UPDATE jobs SET status = 'failed', status_code = 500, finished_at = ?,"
+            " error = 'The worker processing this job stopped' WHERE status = 'running' AND heartbeat < ?"
+            " AND attempts >= ?",
+            (now, stale_before, max_attempts)
+        ).rowcount
+        requeued = connection.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, heartbeat = NULL, started_at = NULL"
+            " WHERE status = 'running' AND heartbeat < ?",
+            (stale_before,)
+        ).rowcount
+    return requeued, failed
+
+
+def purge_jobs(finished_before):
+    """
+    Supprime les traitements terminés avant une date
+
+    Returns:
+        int: Nombre de traitements supprimés
+    """
+    with transaction() as connection:
+        purged = connection.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?",
+            (finished_before,)
+        ).rowcount
+        connection.execute("DELETE FROM job_inputs WHERE job_id NOT IN (SELECT id FROM jobs)")
+    return purged
+
+
+def get_job_stats():
+    """
+    État de la file des traitements
+
+    Returns:
+        dict: Nombre de traitements par état ('queued', 'running', 'succeeded',
+              'failed', 'cancelled'), date du plus ancien traitement en attente
+              ('oldest_queued') et attente moyenne des traitements démarrés
+              dans l'heure ('average_wait', secondes)
+    """
+    connection = get_connection()
+    stats = {status: 0 for status in ('queued', 'running', 'succeeded', 'failed', 'cancelled')}
+    for row in connection.execute("SELECT status, COUNT(*) AS count FROM jobs GROUP BY status"):
+        stats[row['status']] = row['count']
+    stats['oldest_queued'] = connection.execute(
+        "SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    stats['average_wait'] = connection.execute(
+        "SELECT AVG(started_at - created_at) FROM jobs WHERE started_at >= ?", (time.time() - 3600,)
+    ).fetchone()[0]
+    return stats
+
+
+def _infer_operation(name):
+    """Opération et type d'un fichier d'après son nom"""
+    for pattern, operation, kind in NAME_OPERATIONS:
+        if pattern.search(name):
+            return operation, kind
+    return None, 'file'
+
+
+def _iter_area(area):
+    """Fichiers publiés d'une zone de stockage (répartis pour processed)"""
+    if area == 'processed':
+        yield from outputs.iter_files()
+        return
+    # Fichiers reçus : à la racine, ou répartis par empreinte (uploads/blobs/ab/cd)
+    directories = [get_area_dir(area)]
+    while directories:
+        try:
+            entries = os.scandir(directories.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                # Fichiers publiés seulement (les fichiers .tmp sont en cours d'écriture)
+                if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+                except OSError:
+                    continue
+
+
+def relocate(moves):
+    """
+    Met à jour le chemin de fichiers déplacés (migration de la répartition)
+
+    Args:
+        moves: Couples (ancien chemin, nouveau chemin)
+    """
+    rows = [(os.path.abspath(new), os.path.abspath(old)) for old, new in moves]
+    if not rows:
+        return
+    with transaction() as connection:
+        connection.executemany("UPDATE files SET path = ? WHERE path = ?", rows)
+        connection.executemany("UPDATE owners SET path = ? WHERE path = ?", rows)
+
+
+def reconcile():
+    """
+    Répare l'index à partir du contenu des répertoires
+
+    Les fichiers absents de l'index sont ajoutés (sans propriétaire, date de
+    création tirée de la date de modification), les lignes des fichiers
+    disparus sont supprimées et les tailles modifiées sont corrigées. Les
+    fichiers dont seule la copie locale a été évincée ne sont pas disparus.
+
+    Returns:
+        dict: Nombre de lignes ajoutées, supprimées et corrigées, et de compteurs corrigés
+    """
+    retention = get_retention()
+    connection = get_connection()
+    summary = {'added': 0, 'removed': 0, 'updated': 0}
+
+    for area in AREAS:
+        # Index lu avant le parcours : un fichier enregistré pendant le parcours
+        # n'est pas pris pour un fichier disparu
+        indexed = {row['path']: row['size'] for row in connection.execute(
+            "SELECT path, size FROM files WHERE area = ? AND evicted_at IS NULL", (area,))}
+
+        on_disk = {}
+        for entry in _iter_area(area):
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            on_disk[os.path.abspath(entry.path)] = (st.st_size, st.st_mtime)
+
+        blob_paths = {row['path'] for row in connection.execute("SELECT path FROM blobs")} if area == 'uploads' else set()
+
+        added = []
+        for path, (size, mtime) in on_disk.items():
+            if path not in indexed:
+                operation, kind = _infer_operation(os.path.basename(path))
+                if area == 'uploads':
+                    operation, kind = 'upload', 'blob' if path in blob_paths else 'file'
+                added.append((path, area, os.path.basename(path), operation, kind, size, mtime,
+                              mtime + retention, mtime))
+        missing = [path for path in indexed if path not in on_disk]
+        updated = [(on_disk[path][0], path) for path, size in indexed.items()
+                   if path in on_disk and on_disk[path][0] != size]
+
+        with transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO files (path, area, name, operation, kind, size, created_at, expires_at,"
+                " last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                added
+            )
+            # Copie locale d'un fichier évincé de nouveau présente
+            connection.executemany("UPDATE files SET evicted_at = NULL WHERE path = ? AND evicted_at IS NOT NULL",
+                                   [(row[0],) for row in added])
+            # Absence vérifiée à nouveau dans la transaction (fichier publié ou déplacé entre-temps)
+            removed = [(path,) for path in missing if not os.path.exists(path)]
+            connection.executemany("DELETE FROM owners WHERE path = ?", removed)
+            connection.executemany("DELETE FROM files WHERE path = ?", removed)
+            connection.executemany("UPDATE files SET size = ?, sha256 = NULL WHERE path = ?", updated)
+
+        summary['added'] += len(added)
+        summary['removed'] += len(removed)
+        summary['updated'] += len(updated)
+
+    with transaction() as connection:
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('reconciled_at', ?)", (str(time.time()),))
+
+    # Compteurs de stockage recalculés à chaque réconciliation
+    summary['counters'] = rebuild_counters()
+
+    if any(summary.values()):
+        logger.info(f"Index des fichiers réconcilié: {summary['added']} ajoutés, "
+                    f"{summary['removed']} supprimés, {summary['updated']} corrigés")
+    return summary
+
+
+def reconcile_if_due():
+    """
+    Lance reconcile() si la dernière réconciliation date de plus de RECONCILE_INTERVAL
+
+    Un seul worker la lance : la date est réservée dans une transaction avant
+    la réconciliation.
+
+    Returns:
+        dict: Résultat de reconcile(), ou None si elle n'était pas due
+    """
+    interval = current_app.config.get('RECONCILE_INTERVAL', 3600)
+    now = time.time()
+    with transaction() as connection:
+        row = connection.execute("SELECT value FROM meta WHERE key = 'reconciled_at'").fetchone()
+        if row and now - float(row['value']) < interval:
+            return None
+        connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('reconciled_at', ?)", (str(now),))
+    return reconcile()
@@ -0,0 +1,237 @@
+"""
+Coalescence des traitements identiques exécutés en parallèle (single-flight)
+
+Lorsque plusieurs requêtes identiques (même document, même opération, mêmes
+paramètres) arrivent en même temps sur les workers gunicorn, une seule
+exécute réellement l'outil pdfeditor. Les autres attendent la fin de ce
+traitement et reçoivent le même résultat.
+
+La coordination se fait entre processus grâce à un fichier de verrou (flock)
+et un fichier d'état par clé, stockés dans DATA_DIR/locks.
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus disponible
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Taille des blocs lus pour le calcul des empreintes
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Intervalle d'attente entre deux tentatives de prise du verrou
+LOCK_POLL_INTERVAL = 0.1
+
+# Empreintes récemment calculées, pour ne pas relire un même fichier
+# entre la coalescence et l'appel au moteur
+_hash_memo = {}
+HASH_MEMO_SIZE = 256
+
+
+def _memo_key(path):
+    """Clé de mémorisation : identifie le contenu, y compris à travers les liens physiques"""
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def remember_hash(path, digest):
+    """
+    Mémorise l'empreinte d'un fichier calculée pendant sa réception
+
+    Args:
+        path: Chemin du fichier (dans son état définitif)
+        digest: Empreinte SHA-256 hexadécimale
+    """
+    if len(_hash_memo) >= HASH_MEMO_SIZE:
+        _hash_memo.clear()
+    _hash_memo[_memo_key(path)] = digest
+
+
+def known_hash(path):
+    """
+    Empreinte déjà calculée d'un fichier inchangé, sans le relire
+
+    Args:
+        path: Chemin du fichier
+
+    Returns:
+        str: Empreinte hexadécimale, ou None si elle n'est pas mémorisée
+    """
+    return _hash_memo.get(_memo_key(path))
+
+
+def hash_file(path):
+    """
+    Calcule l'empreinte SHA-256 d'un fichier par blocs
+
+    Le résultat est mémorisé tant que le fichier n'est pas modifié.
+
+    Args:
+        path: Chemin du fichier
+
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    memo_key = _memo_key(path)
+    if memo_key in _hash_memo:
+        return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+
+    if len(_hash_memo) >= HASH_MEMO_SIZE:
+        _hash_memo.clear()
+    _hash_memo[memo_key] = digest.hexdigest()
+    return _hash_memo[memo_key]
+
+
+def make_key(operation, input_hashes, params=None):
+    """
+    Construit la clé de coalescence d'un traitement
+
+    Args:
+        operation: Nom de l'opération (merge, split, rotate...)
+        input_hashes: Empreintes SHA-256 des fichiers d'entrée, dans l'ordre
+        params: Paramètres de l'opération (sérialisables en JSON)
+
+    Returns:
+        str: Clé hexadécimale
+    """
+    payload = {
+        'operation': operation,
+        'inputs': list(input_hashes),
+        'params': params or {}
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def get_locks_dir():
+    """
+    Retourne le répertoire des verrous et états de coalescence
+
+    Returns:
+        str: Chemin vers le répertoire des verrous
+    """
+    locks_dir = os.path.join(current_app.config['DATA_DIR'], 'locks')
+    os.makedirs(locks_dir, exist_ok=True)
+    return locks_dir
+
+
+def _read_state(state_path):
+    """Lit le fichier d'état d'une clé, ou None s'il est absent ou illisible"""
+    try:
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state_path, state):
+    """Écrit le fichier d'état de manière atomique"""
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, default=str)
+    os.replace(tmp_path, state_path)
+
+
+def _result_files_exist(result):
+    """
+    Vérifie que les fichiers référencés par un résultat existent toujours
+    (ils ont pu être supprimés après un téléchargement avec clean=true)
+    """
+    entries = result if isinstance(result, list) else [result]
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get('path') and not os.path.exists(entry['path']):
+            return False
+    return True
+
+
+def _acquire(fd, deadline):
+    """
+    Prend le verrou exclusif, en attendant au plus jusqu'à deadline
+
+    Returns:
+        bool: True si le verrou a été obtenu
+    """
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            if time.time() >= deadline:
+                return False
+            time.sleep(LOCK_POLL_INTERVAL)
+
+
+def single_flight(key, compute, timeout=None):
+    """
+    Exécute compute() une seule fois pour toutes les requêtes concurrentes de même clé
+
+    Le premier appelant qui obtient le verrou exécute le traitement et publie
+    son résultat (ou son erreur) dans le fichier d'état. Les appelants arrivés
+    pendant ce traitement attendent le verrou, puis réutilisent ce résultat
+    au lieu de relancer l'outil. Un appelant qui arrive après la fin du
+    traitement relance un calcul normal : il ne s'agit pas d'un cache.
+
+    Args:
+        key: Clé de coalescence (voir make_key)
+        compute: Fonction sans argument réalisant le traitement
+        timeout: Attente maximale du verrou en secondes
+
+    Returns:
+        Le résultat de compute(), éventuellement produit par un autre processus
+
+    Raises:
+        Exception: L'erreur levée par compute() (ou celle du processus meneur)
+    """
+    if fcntl is None or not current_app.config.get('COALESCE_ENABLED', True):
+        return compute()
+
+    if timeout is None:
+        timeout = current_app.config.get('COALESCE_WAIT_TIMEOUT', 180)
+
+    locks_dir = get_locks_dir()
+    lock_path = os.path.join(locks_dir, f"{key}.lock")
+    state_path = os.path.join(locks_dir, f"{key}.json")
+
+    waited_since = time.time()
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o640)
+    try:
+        if not _acquire(fd, waited_since + timeout):
+            # Le meneur est bloqué trop longtemps : traiter la requête nous-mêmes
+            logger.warning(f"Attente du verrou de coalescence expirée pour {key[:12]}, traitement indépendant")
+            return compute()
+
+        # Un traitement identique s'est terminé pendant notre attente : réutiliser son résultat
+        state = _read_state(state_path)
+        if state and state.get('finished_at', 0) >= waited_since:
+            if not state.get('ok'):
+                logger.info(f"Requête coalescée {key[:12]}: erreur partagée du traitement meneur")
+                raise Exception(state.get('error', 'Erreur lors du traitement'))
+            if _result_files_exist(state.get('result')):
+                logger.info(f"Requête coalescée {key[:12]}: résultat partagé réutilisé")
+                return state.get('result')
+
+        try:
+            result = compute()
+        except Exception as e:
+            _write_state(state_path, {'ok': False, 'error': str(e), 'finished_at': time.time()})
+            raise
+
+        try:
+            _write_state(state_path, {'ok': True, 'result': result, 'finished_at': time.time()})
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"Impossible de publier le résultat coalescé {key[:12]}: {str(e)}")
+        return result
+    finally:
+        os.close(fd)  # Libère aussi le verrou
@@ -0,0 +1,140 @@
+"""
+Envoi des fichiers traités : requêtes conditionnelles, reprise et délégation
+
+Les téléchargements portent un ETag fort tiré de l'empreinte SHA-256 du
+contenu quand elle est connue (index des fichiers) : un client qui possède
+déjà le fichier reçoit une réponse 304, et une reprise (Range + If-Range)
+n'est acceptée que si le contenu n'a pas changé. Sinon, l'ETag est faible,
+tiré de l'état du fichier (inode, taille, date) : le fichier n'est jamais
+relu pendant la requête, et une reprise s'appuie sur la date de
+modification. Les requêtes partielles (Range) sont servies par send_file.
+
+Avec DOWNLOAD_OFFLOAD, l'application ne fait qu'autoriser le téléchargement :
+la réponse ne contient que les en-têtes et un en-tête X-Accel-Redirect
+(nginx) ou X-Sendfile (Apache, lighttpd) désignant le fichier, que le proxy
+frontal envoie lui-même (plages d'octets comprises). Le worker est libéré
+immédiatement, quelle que soit la taille du fichier. Voir
+tools/offload_proxy.py pour un proxy de test local.
+"""
+import os
+import sqlite3
+import logging
+import mimetypes
+from urllib.parse import quote
+from flask import current_app, request, send_file, Response
+from werkzeug.utils import secure_filename
+from . import catalog
+from . import coalesce
+from . import outputs
+
+logger = logging.getLogger(__name__)
+
+OFFLOAD_MODES = ('x-accel', 'x-sendfile')
+
+
+def content_etag(path):
+    """
+    Retourne l'ETag d'un fichier, sans le relire
+
+    L'empreinte SHA-256 connue (index des fichiers, ou mémorisée par la
+    coalescence et alors reportée dans l'index) donne un ETag fort ; à défaut,
+    l'état du fichier (inode, taille, date) donne un ETag faible.
+
+    Args:
+        path: Chemin du fichier
+
+    Returns:
+        Tuple (valeur de l'ETag sans guillemets, True si l'ETag est faible)
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+
+    sha256, size = catalog.get_hashes([path]).get(path, (None, None))
+    if sha256 is not None and size == st.st_size:
+        return sha256, False
+
+    sha256 = coalesce.known_hash(path)
+    if sha256 is not None:
+        # Empreinte reportée dans l'index des fichiers stockés
+        try:
+            catalog.set_hash(path, sha256)
+        except sqlite3.Error as e:
+            logger.error(f"Erreur lors de la mise à jour de l'index des fichiers: {str(e)}")
+        return sha256, False
+
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}", True
+
+
+def content_disposition(download_name):
+    """En-tête Content-Disposition d'un téléchargement, nom UTF-8 compris"""
+    ascii_name = secure_filename(download_name) or 'download'
+    if ascii_name == download_name:
+        return f'attachment; filename="{ascii_name}"'
+    return f"attachment; filename=\"{ascii_name}\"; filename*=UTF-8''{quote(download_name, safe='')}"
+
+
+def _offload_target(path, mode):
+    """
+    Valeur de l'en-tête de délégation pour un fichier, ou None s'il ne peut pas être délégué
+
+    En mode x-accel, seul le répertoire des fichiers traités est exposé au
+    proxy (emplacement interne DOWNLOAD_OFFLOAD_PREFIX).
+    """
+    path = os.path.realpath(path)
+    if mode == 'x-sendfile':
+        return path
+    processed_dir = os.path.realpath(outputs.get_processed_dir())
+    if os.path.commonpath([processed_dir, path]) != processed_dir:
+        return None
+    relative_path = os.path.relpath(path, processed_dir).replace(os.sep, '/')
+    prefix = current_app.config.get('DOWNLOAD_OFFLOAD_PREFIX', '/protected/processed').rstrip('/')
+    return f"{prefix}/{quote(relative_path)}"
+
+
+def send_processed(path, download_name, mimetype=None, offload=True):
+    """
+    Envoie un fichier traité en pièce jointe
+
+    Args:
+        path: Chemin du fichier
+        download_name: Nom proposé au client
+        mimetype: Type du contenu (deviné depuis le nom si absent)
+        offload: Autoriser la délégation au proxy (à désactiver si le fichier
+                 est supprimé à la fin de la requête)
+
+    Returns:
+        Flask response (200, 206, 304 ou 416)
+    """
+    etag, weak = content_etag(path)
+    # Dernier accès : ordre d'éviction du gouverneur de stockage
+    try:
+        catalog.touch(path)
+    except sqlite3.Error as e:
+        logger.error(f"Erreur lors de la mise à jour de l'index des fichiers: {str(e)}")
+    mimetype = mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    mode = (current_app.config.get('DOWNLOAD_OFFLOAD') or '').lower()
+    target = _offload_target(path, mode) if offload and mode in OFFLOAD_MODES else None
+    if target is None and not weak:
+        return send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                         conditional=True, etag=etag)
+
+    if request.if_none_match.contains_weak(etag) if weak else request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag, weak=weak)
+        return response
+
+    if target is None:
+        # ETag faible : inutilisable pour If-Range, la reprise s'appuie sur Last-Modified
+        response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=download_name,
+                             conditional=True, etag=False)
+        response.set_etag(etag, weak=True)
+        return response
+
+    # Corps vide : le proxy envoie le fichier et gère lui-même les plages d'octets
+    response = Response(mimetype=mimetype)
+    response.set_etag(etag, weak=weak)
+    response.headers['Content-Disposition'] = content_disposition(download_name)
+    response.headers['X-Accel-Redirect' if mode == 'x-accel' else 'X-Sendfile'] = target
+    logger.info(f"Téléchargement délégué au proxy ({mode}): {os.path.basename(path)}")
+    return response
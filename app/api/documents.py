@@ -0,0 +1,152 @@
+"""
+Identifiants de documents (handles) réutilisables par les points d'API
+
+Un fichier déjà présent sur le serveur (upload via /upload ou résultat d'un
+traitement) reçoit un identifiant opaque, rattaché à la session qui l'a
+produit. Les points d'API de traitement acceptent cet identifiant à la place
+d'un nouvel envoi du fichier, ce qui évite de retransférer le document à
+chaque étape d'un enchaînement d'opérations.
+
+Le registre est stocké dans DATA_DIR/handles, un fichier JSON par identifiant.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import logging
+from flask import current_app, session
+from . import storage
+from .ingest import StagedFile
+
+logger = logging.getLogger(__name__)
+
+HANDLE_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class DocumentHandleError(Exception):
+    """Identifiant de document invalide, inconnu, expiré ou d'une autre session"""
+
+    def __init__(self, message, status_code=404):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class StoredDocument(StagedFile):
+    """
+    Document déjà stocké sur le serveur, désigné par un identifiant
+
+    Utilisable par les fonctions de pdf_processor comme un fichier reçu.
+    """
+
+    def __init__(self, handle, path, filename, size, sha256=None):
+        super().__init__(path, filename, size, sha256)
+        self.handle = handle
+
+
+def get_handles_dir():
+    """
+    Retourne le répertoire du registre des identifiants
+
+    Returns:
+        str: Chemin vers le répertoire des identifiants
+    """
+    handles_dir = os.path.join(current_app.config['DATA_DIR'], 'handles')
+    os.makedirs(handles_dir, exist_ok=True)
+    return handles_dir
+
+
+def current_session_id():
+    """ID de session PDF courant (créé si nécessaire)"""
+    if 'pdf_session_id' not in session:
+        session['pdf_session_id'] = str(uuid.uuid4())
+    return session['pdf_session_id']
+
+
+def register(path, filename, kind='output', sha256=None):
+    """
+    Enregistre un fichier stocké et retourne son identifiant
+
+    Args:
+        path: Chemin du fichier (sous DATA_DIR)
+        filename: Nom d'origine du document
+        kind: 'upload' ou 'output'
+        sha256: Empreinte du contenu si elle est connue (fichiers reçus)
+
+    Returns:
+        str: Identifiant du document
+    """
+    handle = uuid.uuid4().hex
+    record = {
+        'handle': handle,
+        'session_id': current_session_id(),
+        'path': os.path.abspath(path),
+        'filename': filename,
+        'kind': kind,
+        'size': os.path.getsize(path),
+        'sha256': sha256,
+        'created_at': time.time()
+    }
+    record_path = os.path.join(get_handles_dir(), f"{handle}.json")
+    with open(record_path, 'w') as f:
+        json.dump(record, f)
+
+    # Les fichiers sont indexés par register_outputs (produits) et blobs.store (reçus)
+    return handle
+
+
+def resolve(handle):
+    """
+    Valide un identifiant pour la session courante et retourne le document
+
+    Args:
+        handle: Identifiant fourni par le client
+
+    Returns:
+        StoredDocument: Document correspondant
+
+    Raises:
+        DocumentHandleError: Identifiant mal formé, inconnu, expiré ou d'une autre session
+    """
+    if not handle or not HANDLE_PATTERN.match(handle):
+        raise DocumentHandleError('Invalid document handle', 400)
+
+    record_path = os.path.join(get_handles_dir(), f"{handle}.json")
+    try:
+        with open(record_path, 'r') as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        raise DocumentHandleError('Unknown or expired document handle')
+
+    # Ne pas révéler l'existence des documents des autres sessions
+    if record.get('session_id') != session.get('pdf_session_id'):
+        logger.warning(f"Identifiant {handle} utilisé par une autre session")
+        raise DocumentHandleError('Unknown or expired document handle')
+
+    data_dir = os.path.realpath(current_app.config['DATA_DIR'])
+    path = os.path.realpath(record.get('path', ''))
+    if record.get('kind') == 'output' and not os.path.isfile(path):
+        # Fichier traité déplacé dans son répertoire de répartition (migration),
+        # évincé du disque local ou produit sur un autre nœud (stockage partagé)
+        path = os.path.realpath(storage.resolve(os.path.basename(path)) or path)
+    if os.path.commonpath([data_dir, path]) != data_dir or not os.path.isfile(path):
+        raise DocumentHandleError('Unknown or expired document handle')
+
+    return StoredDocument(handle, path, record.get('filename') or os.path.basename(path), os.path.getsize(path),
+                          record.get('sha256'))
+
+
+def resolve_many(handles):
+    """
+    Résout une liste d'identifiants, dans l'ordre
+
+    Args:
+        handles: Identifiants (liste de chaînes, chacune pouvant être séparée par des virgules)
+
+    Returns:
+        list: Documents correspondants
+    """
+    if isinstance(handles, str):
+        handles = [handles]
+    values = [value.strip() for item in handles for value in item.split(',')]
+    return [resolve(value) for value in values if value]
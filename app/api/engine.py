@@ -0,0 +1,164 @@
+"""
+Client du moteur pdfeditor résident (mode serve)
+
+Le moteur résident garde en mémoire les documents récemment analysés, dans un
+cache LRU indexé par empreinte de contenu. Les requêtes lui sont transmises
+sur un socket Unix ; si le moteur n'est pas disponible, l'appelant se replie
+sur l'exécution ponctuelle de l'outil.
+"""
+import os
+import json
+import socket
+import logging
+from flask import current_app
+from . import coalesce
+
+logger = logging.getLogger(__name__)
+
+# Taille maximale lue pour l'en-tête d'une réponse
+MAX_HEADER_SIZE = 64
+
+
+def input_arguments(cmd_args):
+    """
+    Positions des fichiers d'entrée dans les arguments d'une commande
+
+    Doit rester aligné sur inputArguments() dans cppeditor/src/pdfeditor.cpp.
+    unlock n'est pas mis en cache car son chargement dépend du mot de passe.
+
+    Args:
+        cmd_args: Arguments de la commande (cmd_args[0] = nom de la commande)
+
+    Returns:
+        list: Indices des arguments qui désignent un fichier d'entrée
+    """
+    if not cmd_args:
+        return []
+    command = cmd_args[0]
+    if command == 'merge':
+        return list(range(2, len(cmd_args)))
+    if command in ('split', 'compress', 'rotate', 'watermark', 'protect', 'info') and len(cmd_args) > 1:
+        return [1]
+    return []
+
+
+def get_socket_path():
+    """Retourne le chemin du socket du moteur, ou None s'il n'est pas disponible"""
+    socket_path = current_app.config.get('ENGINE_SOCKET')
+    if not socket_path or not os.path.exists(socket_path):
+        return None
+    return socket_path
+
+
+def _connect(socket_path, timeout):
+    """Ouvre une connexion vers le moteur, ou None en cas d'échec"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        return sock
+    except OSError as e:
+        logger.warning(f"Moteur résident injoignable ({socket_path}): {str(e)}")
+        sock.close()
+        return None
+
+
+def _encode_request(cmd_args, input_hashes, timeout):
+    """Encode une requête : champs séparés par NUL, terminée par un champ vide"""
+    fields = [f"hashes={','.join(input_hashes)}", f"timeout={int(timeout)}", '--'] + list(cmd_args)
+    return b'\0'.join(field.encode('utf-8') for field in fields) + b'\0\0'
+
+
+def _read_response(sock):
+    """
+    Lit la réponse du moteur
+
+    Returns:
+        Tuple (return_code, stdout, stderr)
+    """
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    data = b''.join(chunks)
+
+    parts = data.split(b'\n', 3)
+    if len(parts) < 4 or len(parts[0]) > MAX_HEADER_SIZE:
+        return -1, "", "Le moteur résident s'est arrêté sans réponse (timeout ou plantage)"
+
+    returncode = int(parts[0])
+    stdout_size = int(parts[1])
+    body = parts[3]
+    stdout = body[:stdout_size].decode('utf-8', errors='replace')
+    stderr = body[stdout_size:].decode('utf-8', errors='replace')
+    return returncode, stdout, stderr
+
+
+def run_command(cmd_args, timeout):
+    """
+    Exécute une commande sur le moteur résident
+
+    Les empreintes des fichiers d'entrée sont transmises pour que le moteur
+    réutilise les documents déjà analysés.
+
+    Args:
+        cmd_args: Arguments déjà validés de la commande
+        timeout: Durée maximale d'exécution en secondes
+
+    Returns:
+        Tuple (return_code, stdout, stderr), ou None si le moteur n'est pas disponible
+    """
+    socket_path = get_socket_path()
+    if socket_path is None:
+        return None
+
+    try:
+        input_hashes = [coalesce.hash_file(cmd_args[i]) for i in input_arguments(cmd_args)]
+    except OSError:
+        input_hashes = []
+
+    sock = _connect(socket_path, timeout)
+    if sock is None:
+        return None
+
+    try:
+        sock.sendall(_encode_request(cmd_args, input_hashes, timeout))
+        return _read_response(sock)
+    except socket.timeout:
+        logger.error(f"Timeout du moteur résident (après {timeout}s)")
+        return -1, "", f"Timeout lors de l'exécution de pdfeditor (après {timeout}s)"
+    except (OSError, ValueError) as e:
+        logger.error(f"Erreur de communication avec le moteur résident: {str(e)}")
+        return -1, "", f"Erreur de communication avec le moteur résident: {str(e)}"
+    finally:
+        sock.close()
+
+
+def get_stats():
+    """
+    Statistiques du cache de documents du moteur résident
+
+    Returns:
+        dict: entries, bytes, budget, hits, misses, evictions, evictedBytes ;
+              ou None si le moteur n'est pas disponible
+    """
+    socket_path = get_socket_path()
+    if socket_path is None:
+        return None
+
+    sock = _connect(socket_path, 5)
+    if sock is None:
+        return None
+
+    try:
+        sock.sendall(_encode_request(['stats'], [], 5))
+        returncode, stdout, stderr = _read_response(sock)
+        if returncode != 0:
+            return None
+        return json.loads(stdout)
+    except (OSError, ValueError):
+        return None
+    finally:
+        sock.close()
@@ -0,0 +1,243 @@
+"""
+Gouverneur de stockage : éviction sous pression disque et admission des traitements
+
+La conservation des fichiers est fondée sur leur âge (FILE_RETENTION_HOURS) :
+une rafale de gros découpages peut remplir le volume bien avant la première
+expiration, et tous les traitements échouent alors en cours d'écriture.
+
+Le gouverneur suit l'occupation du volume des données (DATA_DIR) :
+
+    - au-delà de STORAGE_HIGH_WATERMARK, il évince les fichiers traités les
+      moins récemment téléchargés (index sur last_access, voir catalog.py)
+      jusqu'à redescendre sous STORAGE_LOW_WATERMARK. Les fichiers dont le
+      bail court encore (résultats d'un traitement en cours ou tout juste
+      produits, STORAGE_LEASE_SECONDS) ne sont jamais évincés. Avec un
+      stockage partagé (STORAGE_BACKEND=s3), seule la copie locale est
+      supprimée : le fichier reste indexé et téléchargeable ;
+    - avant chaque traitement ou envoi, admit() estime l'occupation après
+      écriture (taille de la requête multipliée par STORAGE_ADMISSION_FACTOR,
+      pour les fichiers de travail et les résultats) : au-delà de
+      STORAGE_CRITICAL_WATERMARK, et si l'éviction ne libère pas assez de
+      place, la requête est refusée d'emblée avec un code 507 au lieu
+      d'échouer en cours d'écriture.
+
+L'éviction est lancée par le janitor à chaque passage, et par l'admission
+quand la place manque. Un seul processus évince à la fois (verrou non
+bloquant sur DATA_DIR/governor.lock) ; les métriques sont enregistrées dans
+la table meta de l'index (tableau de bord d'administration).
+"""
+import os
+import json
+import time
+import shutil
+import sqlite3
+import logging
+from flask import current_app, request, jsonify, render_template
+from . import catalog
+from . import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus disponible
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = 'governor.lock'
+METRICS_KEY = 'governor'
+
+# Fichiers évincés par lot
+EVICTION_BATCH_SIZE = 100
+
+# Requêtes soumises à l'admission (elles écrivent des fichiers de travail ou des résultats)
+ADMISSION_ENDPOINTS = {
+    'api.merge_pdf', 'api.split_pdf', 'api.compress_pdf', 'api.rotate_pdf', 'api.watermark_pdf',
+    'api.protect_pdf', 'api.unlock_pdf', 'api.create_upload', 'api.upload_chunk', 'api.create_job',
+    'main.upload_file', 'main.merge_pdf', 'main.split_pdf', 'main.compress_pdf', 'main.rotate_pdf',
+}
+ADMISSION_METHODS = {'POST', 'PATCH'}
+
+
+class StorageFullError(Exception):
+    """Espace disque insuffisant pour accepter un traitement, avec le code HTTP à retourner"""
+
+    def __init__(self, message, status_code=507):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_usage():
+    """
+    Occupation du volume des données
+
+    Returns:
+        dict: 'total', 'used', 'free' (octets) et 'ratio' (part occupée, entre 0 et 1)
+    """
+    usage = shutil.disk_usage(current_app.config['DATA_DIR'])
+    return {
+        'total': usage.total,
+        'used': usage.used,
+        'free': usage.free,
+        'ratio': usage.used / usage.total if usage.total else 0
+    }
+
+
+def enforce(force=False):
+    """
+    Évince des fichiers traités si l'occupation dépasse le seuil haut
+
+    Les fichiers sont supprimés du moins récemment téléchargé au plus récent,
+    par lots, jusqu'à redescendre sous le seuil bas ou épuiser les fichiers
+    évinçables.
+
+    Args:
+        force: Évincer jusqu'au seuil bas même sous le seuil haut
+
+    Returns:
+        Tuple (nombre de fichiers, octets libérés), (0, 0) si rien n'a été fait
+    """
+    high = current_app.config.get('STORAGE_HIGH_WATERMARK', 0.85)
+    low = current_app.config.get('STORAGE_LOW_WATERMARK', 0.75)
+    usage = get_usage()
+    if usage['ratio'] <= (low if force else high):
+        return 0, 0
+
+    lock_fd = _acquire_lock()
+    if lock_fd is False:
+        # Éviction déjà en cours dans un autre processus
+        return 0, 0
+
+    total_files = 0
+    total_freed = 0
+    try:
+        started = time.time()
+        # Stockage partagé : la copie locale n'est qu'un cache, le fichier reste indexé
+        evict = catalog.evict_files if storage.is_shared() else catalog.remove_files
+        while usage['ratio'] > low:
+            rows = catalog.lru_candidates(time.time(), EVICTION_BATCH_SIZE)
+            if not rows:
+                logger.warning(f"Gouverneur de stockage: plus aucun fichier évinçable "
+                               f"(occupation {usage['ratio']:.0%})")
+                break
+            files, freed = evict(rows)
+            total_files += files
+            total_freed += freed
+            if not files:
+                break
+            usage = get_usage()
+
+        logger.info(f"Gouverneur de stockage: {total_files} fichiers évincés ({total_freed} octets) "
+                    f"en {time.time() - started:.1f} s, occupation {usage['ratio']:.0%}")
+        _update_metrics(evicted_files=total_files, evicted_bytes=total_freed, last_eviction=time.time())
+    finally:
+        if lock_fd is not None:
+            os.close(lock_fd)
+    return total_files, total_freed
+
+
+def _acquire_lock():
+    """
+    Prend le verrou d'éviction sans attendre
+
+    Returns:
+        Descripteur du verrou, None sans fcntl (pas de verrou), False si le
+        verrou est déjà pris
+    """
+    if fcntl is None:
+        return None
+    lock_path = os.path.join(current_app.config['DATA_DIR'], LOCK_FILENAME)
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o640)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return False
+    return fd
+
+
+def admit(expected_bytes):
+    """
+    Vérifie qu'un traitement peut écrire ses fichiers sans saturer le volume
+
+    Args:
+        expected_bytes: Taille des données reçues par la requête
+
+    Raises:
+        StorageFullError: Si l'occupation estimée dépasse le seuil critique
+                          malgré l'éviction
+    """
+    critical = current_app.config.get('STORAGE_CRITICAL_WATERMARK', 0.95)
+    factor = current_app.config.get('STORAGE_ADMISSION_FACTOR', 3)
+    needed = (expected_bytes or 0) * factor
+
+    usage = get_usage()
+    if usage['total'] and (usage['used'] + needed) / usage['total'] <= critical:
+        return
+
+    # Libérer de la place avant de refuser
+    try:
+        enforce(force=True)
+    except sqlite3.Error as e:
+        logger.error(f"Erreur lors de l'éviction des fichiers traités: {str(e)}")
+    usage = get_usage()
+    if usage['total'] and (usage['used'] + needed) / usage['total'] <= critical:
+        return
+
+    try:
+        _update_metrics(rejected=get_metrics().get('rejected', 0) + 1, last_rejection=time.time())
+    except sqlite3.Error:
+        pass
+    logger.warning(f"Traitement refusé: espace disque insuffisant (occupation {usage['ratio']:.0%}, "
+                   f"{needed} octets estimés)")
+    raise StorageFullError("Insufficient storage space, please try again later")
+
+
+def init_app(app):
+    """
+    Soumet les requêtes de traitement et d'envoi à l'admission
+
+    À enregistrer avant la protection CSRF : le refus intervient avant la
+    lecture du corps de la requête.
+
+    Args:
+        app (Flask): Instance de l'application
+    """
+    @app.before_request
+    def check_storage_admission():
+        if request.method not in ADMISSION_METHODS or request.endpoint not in ADMISSION_ENDPOINTS:
+            return None
+        try:
+            admit(request.content_length)
+        except StorageFullError as e:
+            retry_after = str(current_app.config.get('JANITOR_INTERVAL', 30))
+            if request.blueprint == 'api':
+                response = jsonify({'error': str(e)})
+            else:
+                response = current_app.make_response(render_template('error.html', error=str(e)))
+            response.status_code = e.status_code
+            response.headers['Retry-After'] = retry_after
+            return response
+        return None
+
+
+def _update_metrics(**values):
+    """Met à jour les métriques du gouverneur (les compteurs d'éviction sont cumulés)"""
+    metrics = get_metrics()
+    for key in ('evicted_files', 'evicted_bytes'):
+        if key in values:
+            values[key] += metrics.get(key, 0)
+    metrics.update(values)
+    catalog.set_meta(METRICS_KEY, json.dumps(metrics))
+
+
+def get_metrics():
+    """
+    Métriques du gouverneur (tous workers confondus)
+
+    Returns:
+        dict: evicted_files, evicted_bytes, last_eviction, rejected, last_rejection
+    """
+    try:
+        return json.loads(catalog.get_meta(METRICS_KEY) or '{}')
+    except ValueError:
+        return {}
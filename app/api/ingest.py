@@ -0,0 +1,174 @@
+"""
+Réception des fichiers envoyés directement sur disque
+
+Par défaut, Werkzeug recopie chaque fichier d'un envoi multipart dans un
+fichier temporaire anonyme, que les traitements recopiaient ensuite avec
+file.save(). Ici, chaque partie fichier est écrite une seule fois, au fil de
+la lecture de la requête, dans son emplacement de travail définitif (en
+mémoire ou sous DATA_DIR/temp, voir staging.py). L'en-tête PDF et l'empreinte SHA-256 sont calculés pendant
+cette écriture, et les traitements reçoivent un chemin (StagedFile) au lieu
+d'un FileStorage.
+"""
+import os
+import io
+import uuid
+import shutil
+import hashlib
+import logging
+import magic
+from flask import Request, current_app
+from werkzeug.utils import secure_filename
+from . import coalesce
+from . import staging
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'octets inspectés pour reconnaître le type du fichier
+HEADER_SIZE = 4096
+
+
+class StagedFile:
+    """
+    Fichier d'entrée déjà présent sur disque
+
+    Attributes:
+        path: Chemin du fichier
+        filename: Nom d'origine du fichier
+        size: Taille en octets
+        sha256: Empreinte SHA-256 si elle est connue
+        is_pdf: Résultat de la vérification de l'en-tête, ou None si elle n'a pas été faite
+    """
+
+    def __init__(self, path, filename, size=None, sha256=None, is_pdf=None):
+        self.path = path
+        self.filename = filename
+        self.size = os.path.getsize(path) if size is None else size
+        self.sha256 = sha256
+        self.is_pdf = is_pdf
+
+    def save(self, destination):
+        """
+        Rend le fichier disponible à destination sans recopier son contenu
+        (lien physique, ou copie si le lien est impossible)
+        """
+        try:
+            os.link(self.path, destination)
+        except OSError:
+            shutil.copyfile(self.path, destination)
+
+
+class StagingStream(io.FileIO):
+    """
+    Fichier de réception d'une partie multipart
+
+    Calcule l'empreinte et inspecte l'en-tête au fil de l'écriture. Pour un
+    fichier .pdf dont l'en-tête n'est pas celui d'un PDF, la suite du contenu
+    n'est pas écrite sur disque : l'envoi sera de toute façon refusé.
+    """
+
+    def __init__(self, path, filename):
+        super().__init__(path, 'w+')
+        self.filename = filename
+        self.expect_pdf = (filename or '').lower().endswith('.pdf')
+        self.hasher = hashlib.sha256()
+        self.header = b''
+        self.is_pdf = None
+        self.received = 0
+
+    def write(self, data):
+        self.received += len(data)
+        if self.is_pdf is None:
+            self.header += bytes(data[:HEADER_SIZE - len(self.header)])
+            if len(self.header) >= HEADER_SIZE:
+                self._check_header()
+        if self.expect_pdf and self.is_pdf is False:
+            return len(data)
+        self.hasher.update(data)
+        return super().write(data)
+
+    def _check_header(self):
+        try:
+            self.is_pdf = magic.from_buffer(self.header, mime=True) == 'application/pdf'
+        except Exception as e:
+            logger.error(f"Erreur lors de la validation du PDF: {str(e)}")
+            self.is_pdf = False
+
+    def staged(self):
+        """
+        Retourne le fichier reçu
+
+        Returns:
+            StagedFile: Fichier reçu, son empreinte étant mémorisée pour la coalescence
+        """
+        if self.is_pdf is None:
+            self._check_header()
+        self.flush()
+        staged_file = StagedFile(self.name, self.filename, self.received, self.hasher.hexdigest(), self.is_pdf)
+        if not (self.expect_pdf and self.is_pdf is False):
+            coalesce.remember_hash(self.name, staged_file.sha256)
+        return staged_file
+
+
+class IngestRequest(Request):
+    """
+    Requête Flask écrivant les fichiers envoyés directement dans leur répertoire de travail
+
+    Le répertoire de réception est en mémoire pour les petites requêtes, sur
+    disque (DATA_DIR/temp) sinon (voir staging.py). Chaque partie fichier est
+    reçue dans son propre sous-répertoire, sous son nom sécurisé ; le
+    répertoire de réception est supprimé à la fin de la requête (sauf pour les
+    fichiers déplacés entre-temps avec move_to).
+    """
+
+    staging_area = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if self.staging_area is None:
+            self.staging_area = staging.allocate(total_content_length)
+        part_dir = os.path.join(self.staging_area.path, uuid.uuid4().hex[:8])
+        os.makedirs(part_dir, exist_ok=True)
+        safe_filename = secure_filename(filename or '') or 'upload'
+        return StagingStream(os.path.join(part_dir, safe_filename), filename)
+
+    def close(self):
+        super().close()
+        if self.staging_area is not None:
+            self.staging_area.release()
+
+
+def stage(file):
+    """
+    Retourne le fichier reçu sous forme de StagedFile
+
+    Args:
+        file: FileStorage de la requête, ou fichier déjà sur disque (StagedFile)
+
+    Returns:
+        StagedFile: Fichier sur disque
+    """
+    if isinstance(file, StagedFile):
+        return file
+    if isinstance(file.stream, StagingStream):
+        return file.stream.staged()
+
+    # Requête d'une autre classe (tests, appel interne) : une seule écriture sur disque
+    staging_dir = os.path.join(current_app.config['DATA_DIR'], 'temp', str(uuid.uuid4()))
+    os.makedirs(staging_dir, exist_ok=True)
+    path = os.path.join(staging_dir, secure_filename(file.filename) or 'upload')
+    file.save(path)
+    return StagedFile(path, file.filename)
+
+
+def move_to(staged_file, destination):
+    """
+    Déplace un fichier reçu vers son emplacement de stockage (renommage si possible)
+
+    Args:
+        staged_file: Fichier reçu
+        destination: Chemin de destination
+
+    Returns:
+        StagedFile: Fichier à son nouvel emplacement
+    """
+    shutil.move(staged_file.path, destination)
+    return StagedFile(destination, staged_file.filename, staged_file.size, staged_file.sha256, staged_file.is_pdf)
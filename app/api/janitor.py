@@ -0,0 +1,275 @@
+"""
+Nettoyage en continu des fichiers expirés (janitor)
+
+Un seul processus nettoie, quel que soit le nombre de workers : chaque worker
+démarre un thread qui tente de prendre un verrou exclusif non bloquant sur
+DATA_DIR/janitor.lock ; celui qui l'obtient devient le janitor, les autres
+réessaient périodiquement (le verrou est libéré par le système si le
+processus du janitor s'arrête).
+
+Le janitor suit l'échéancier des expirations tenu par l'index des fichiers
+(voir catalog.py, index sur expires_at) : à chaque passage, il supprime les
+fichiers expirés par lots, avec un débit limité (JANITOR_RATE fichiers par
+seconde) pour ne pas saturer le disque. Il supprime aussi les répertoires de
+travail abandonnés par les traitements interrompus (temp, processed/.staging)
+et lance le nettoyage complet (clean_old_sessions) au plus une fois par
+JANITOR_SWEEP_INTERVAL. Les fichiers reçus que plus rien ne référence sont
+supprimés à chaque passage (voir blobs.py), comme les traitements
+asynchrones terminés depuis plus de FILE_RETENTION_HOURS (voir jobs.py).
+Il calcule enfin l'empreinte de quelques fichiers traités qui n'en ont pas
+(JANITOR_HASH_BATCH par passage) : leurs téléchargements portent alors un
+ETag fort, sans relecture pendant la requête (voir delivery.py).
+Au-delà du seuil d'occupation du disque, il lance l'éviction du gouverneur
+de stockage (voir governor.py).
+
+Les métriques (octets et fichiers récupérés, fichiers expirés en attente)
+sont enregistrées dans la table meta de l'index, lisibles par tous les
+workers (tableau de bord d'administration).
+"""
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+from flask import current_app
+from . import blobs
+from . import catalog
+from . import coalesce
+from . import jobs
+from . import outputs
+from . import storage
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus disponible
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = 'janitor.lock'
+METRICS_KEY = 'janitor'
+
+_thread = None
+
+
+def start(app):
+    """
+    Démarre le thread du janitor du processus courant
+
+    Args:
+        app (Flask): Instance de l'application
+    """
+    global _thread
+    if not app.config.get('JANITOR_ENABLED', True) or fcntl is None:
+        return
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_run, args=(app,), name='janitor', daemon=True)
+    _thread.start()
+
+
+def _run(app):
+    """Boucle du thread : élection, puis passages périodiques"""
+    interval = app.config.get('JANITOR_INTERVAL', 30)
+    lock_path = os.path.join(app.config['DATA_DIR'], LOCK_FILENAME)
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o640)
+    try:
+        # Élection : un seul janitor pour tous les workers
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(interval)
+        logger.info(f"Janitor élu (pid {os.getpid()})")
+
+        while True:
+            started = time.time()
+            try:
+                with app.app_context():
+                    run_once()
+            except Exception as e:
+                logger.error(f"Erreur du janitor: {str(e)}")
+            time.sleep(max(interval - (time.time() - started), 1))
+    finally:
+        os.close(fd)
+
+
+def run_once():
+    """
+    Un passage du janitor
+
+    Returns:
+        dict: Métriques mises à jour
+    """
+    metrics = get_metrics()
+    now = time.time()
+
+    files, freed = delete_expired_batches(now)
+    dirs, dirs_freed = reclaim_orphans(now)
+
+    # Fichiers reçus qui ne sont plus référencés par aucune session ni aucun traitement
+    blob_files, blob_freed = blobs.collect(now)
+    files += blob_files
+    freed += blob_freed
+
+    # Traitements asynchrones terminés depuis plus que la durée de conservation
+    jobs.purge(now)
+
+    # Empreintes des fichiers traités (ETag fort des téléchargements suivants)
+    hash_outputs()
+
+    # Pression disque : éviction des fichiers les moins récemment téléchargés
+    from . import governor
+    governor.enforce()
+
+    sweep_interval = current_app.config.get('JANITOR_SWEEP_INTERVAL', 3600)
+    if now - metrics.get('last_sweep', 0) >= sweep_interval:
+        from .pdf_processor import clean_old_sessions
+        clean_old_sessions(max_age_hours=current_app.config.get('FILE_RETENTION_HOURS', 6))
+        metrics['last_sweep'] = time.time()
+
+    metrics['reclaimed_files'] = metrics.get('reclaimed_files', 0) + files
+    metrics['reclaimed_dirs'] = metrics.get('reclaimed_dirs', 0) + dirs
+    metrics['reclaimed_bytes'] = metrics.get('reclaimed_bytes', 0) + freed + dirs_freed
+    metrics['last_run'] = time.time()
+    metrics['last_run_files'] = files
+    metrics['last_run_bytes'] = freed + dirs_freed
+    metrics['pid'] = os.getpid()
+    backlog = catalog.get_backlog()
+    metrics['backlog'] = backlog['count']
+    metrics['backlog_bytes'] = backlog['bytes']
+    metrics['next_expiry'] = backlog['next_expiry']
+    catalog.set_meta(METRICS_KEY, json.dumps(metrics))
+
+    if files or dirs:
+        logger.info(f"Janitor: {files} fichiers et {dirs} répertoires supprimés "
+                    f"({freed + dirs_freed} octets), {backlog['count']} fichiers expirés en attente")
+    return metrics
+
+
+def delete_expired_batches(now):
+    """
+    Supprime les fichiers expirés par lots, au débit JANITOR_RATE
+
+    Un passage traite au plus JANITOR_MAX_BATCHES lots : le reste est repris
+    au passage suivant (et apparaît dans le backlog).
+
+    Returns:
+        Tuple (nombre de fichiers, octets libérés)
+    """
+    batch_size = current_app.config.get('JANITOR_BATCH_SIZE', 100)
+    rate = current_app.config.get('JANITOR_RATE', 200)
+    max_batches = current_app.config.get('JANITOR_MAX_BATCHES', 50)
+
+    total_files = 0
+    total_freed = 0
+    for _ in range(max_batches):
+        rows = catalog.expiring(now, batch_size)
+        if not rows:
+            break
+        started = time.time()
+        files, freed = catalog.remove_files(rows)
+        storage.discard([row['name'] for row in rows if row['area'] == 'processed'])
+        total_files += files
+        total_freed += freed
+        if len(rows) < batch_size:
+            break
+        # Limiter le débit de suppression
+        if rate:
+            time.sleep(max(len(rows) / rate - (time.time() - started), 0))
+    return total_files, total_freed
+
+
+def hash_outputs():
+    """
+    Renseigne l'empreinte des fichiers traités les plus récemment utilisés qui n'en ont pas
+
+    Returns:
+        int: Nombre d'empreintes calculées
+    """
+    limit = current_app.config.get('JANITOR_HASH_BATCH', 20)
+    if not limit:
+        return 0
+    hashed = 0
+    for row in catalog.unhashed(limit):
+        try:
+            sha256 = coalesce.hash_file(row['path'])
+        except OSError:
+            # Fichier supprimé entre-temps
+            continue
+        catalog.set_hash(row['path'], sha256)
+        hashed += 1
+    return hashed
+
+
+def _tree_size(path):
+    """Taille totale d'un fichier ou d'un répertoire"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dir_path, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dir_path, filename))
+            except OSError:
+                continue
+    return total
+
+
+def reclaim_orphans(now):
+    """
+    Supprime les fichiers et répertoires de travail abandonnés
+
+    Les traitements suppriment leur répertoire de travail en sortie ; ceux
+    qui restent au-delà de JANITOR_ORPHAN_AGE appartiennent à un worker
+    arrêté en cours de traitement.
+
+    Returns:
+        Tuple (nombre d'entrées supprimées, octets libérés)
+    """
+    max_age = current_app.config.get('JANITOR_ORPHAN_AGE', 7200)
+    roots = [
+        os.path.join(current_app.config['DATA_DIR'], 'temp'),
+        os.path.join(outputs.get_processed_dir(), outputs.STAGING_DIR_NAME)
+    ]
+
+    count = 0
+    freed = 0
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            try:
+                if now - os.path.getmtime(path) <= max_age:
+                    continue
+                size = _tree_size(path)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"Erreur lors de la suppression de {path}: {str(e)}")
+                continue
+            count += 1
+            freed += size
+            logger.info(f"Répertoire de travail abandonné supprimé: {path}")
+    return count, freed
+
+
+def get_metrics():
+    """
+    Métriques du janitor (tous workers confondus)
+
+    Returns:
+        dict: reclaimed_bytes, reclaimed_files, reclaimed_dirs, backlog,
+              backlog_bytes, next_expiry, last_run, last_sweep, pid
+    """
+    try:
+        return json.loads(catalog.get_meta(METRICS_KEY) or '{}')
+    except ValueError:
+        return {}
@@ -0,0 +1,392 @@
+"""
+Traitements asynchrones (file de traitements et workers locaux)
+
+Un traitement lourd ne bloque plus un worker web : POST /api/jobs met le
+traitement en file et répond immédiatement avec son identifiant ; le client
+suit son état (GET /api/jobs/<id>, ou flux SSE /api/jobs/<id>/events) puis
+lit son résultat.
+
+La file est tenue dans l'index (table jobs, voir catalog.py) : les
+traitements en attente survivent aux redémarrages. Les traitements sont
+exécutés par des processus dédiés (worker.py), lancés et relancés par un
+superviseur : comme pour le janitor, chaque worker web démarre un thread qui
+tente de prendre un verrou exclusif sur DATA_DIR/jobs.lock, et celui qui
+l'obtient lance JOB_WORKERS processus. Avec JOB_WORKERS=0, les processus
+sont lancés à part (python worker.py, sur un ou plusieurs hôtes partageant
+DATA_DIR).
+
+Un worker exécute le point d'API synchrone de l'opération (/api/split-pdf,
+/api/merge-pdf...) dans un contexte de requête de la session propriétaire :
+le résultat d'un traitement est la réponse que le point d'API aurait
+renvoyée, et les opérations existantes de pdf_processor sont reprises
+telles quelles. Le moteur y dispose de JOB_TIMEOUT secondes au lieu de
+ENGINE_TIMEOUT, et l'attente d'un traitement identique en cours (voir
+coalesce.py) au moins autant.
+
+Chaque worker signale qu'il est vivant pendant un traitement (heartbeat) ;
+un traitement dont le worker s'est arrêté est remis en file par le
+superviseur, ou abandonné après JOB_MAX_ATTEMPTS tentatives.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+import subprocess
+from flask import current_app, session, g
+from . import blobs
+from . import catalog
+from . import documents
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus disponible
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LOCK_FILENAME = 'jobs.lock'
+WORKER_SCRIPT = 'worker.py'
+SUPERVISOR_ENV = 'JOB_SUPERVISOR_PID'
+
+# Opérations disponibles : point d'API exécuté par le worker
+OPERATIONS = {
+    'info': '/api/pdf-info',
+    'merge': '/api/merge-pdf',
+    'split': '/api/split-pdf',
+    'compress': '/api/compress-pdf',
+    'rotate': '/api/rotate-pdf',
+    'watermark': '/api/watermark-pdf',
+    'protect': '/api/protect-pdf',
+    'unlock': '/api/unlock-pdf',
+}
+
+# Opérations sur plusieurs documents (les autres en prennent exactement un)
+MULTI_INPUT_OPERATIONS = ('merge',)
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+_thread = None
+
+
+class JobError(Exception):
+    """Traitement refusé ou introuvable"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_holder(job_id):
+    """Détenteur des références aux contenus utilisés par un traitement (voir blobs.py)"""
+    return f"job:{job_id}"
+
+
+def submit(operation, params, handles):
+    """
+    Met un traitement en file
+
+    Args:
+        operation: Opération (clé de OPERATIONS)
+        params: Paramètres du point d'API (dictionnaire de listes de valeurs)
+        handles: Identifiants des documents à traiter
+
+    Returns:
+        dict: État du traitement (voir public_state)
+
+    Raises:
+        JobError: Opération inconnue, documents invalides ou trop de traitements en attente
+    """
+    if operation not in OPERATIONS:
+        raise JobError(f"Unknown operation: {operation}")
+
+    try:
+        files = documents.resolve_many(handles)
+    except documents.DocumentHandleError as e:
+        raise JobError(str(e), e.status_code)
+    if operation in MULTI_INPUT_OPERATIONS:
+        if len(files) < 2:
+            raise JobError('Please select at least two PDF files to merge')
+    elif len(files) != 1:
+        raise JobError('Exactly one document is required for this operation')
+
+    session_id = documents.current_session_id()
+    max_pending = current_app.config.get('JOB_MAX_PENDING', 20)
+    if max_pending and catalog.count_pending_jobs(session_id) >= max_pending:
+        raise JobError('Too many pending jobs, please wait for them to finish', 429)
+
+    # Contenus conservés jusqu'à l'exécution, même après un redémarrage ; fichiers traités
+    # en entrée exclus de l'éviction tant que le traitement est en attente ou en cours
+    job_id = uuid.uuid4().hex
+    blobs.pin(files, get_holder(job_id), time.time() + catalog.get_retention())
+
+    form = dict(params)
+    if operation in MULTI_INPUT_OPERATIONS:
+        form['handles[]'] = [file.handle for file in files]
+    else:
+        form['handle'] = [files[0].handle]
+    catalog.enqueue_job(job_id, session_id, operation, json.dumps(form), [file.path for file in files])
+    logger.info(f"Traitement {job_id} en file ({operation})")
+    return public_state(catalog.get_job(job_id))
+
+
+def get_job(job_id):
+    """
+    Traitement de la session courante
+
+    Raises:
+        JobError: Identifiant inconnu ou traitement d'une autre session (404)
+    """
+    job = catalog.get_job(job_id) if job_id and documents.HANDLE_PATTERN.match(job_id) else None
+    # Ne pas révéler l'existence des traitements des autres sessions
+    if job is None or job['session_id'] != session.get('pdf_session_id'):
+        raise JobError('Unknown job', 404)
+    return job
+
+
+def cancel(job_id):
+    """
+    Annule un traitement en attente de la session courante
+
+    Returns:
+        dict: État du traitement
+
+    Raises:
+        JobError: Traitement inconnu (404) ou déjà démarré (409)
+    """
+    job = get_job(job_id)
+    if not catalog.cancel_job(job_id):
+        raise JobError('The job has already started', 409)
+    blobs.release(get_holder(job_id))
+    return public_state(catalog.get_job(job['id']))
+
+
+def public_state(job):
+    """
+    État d'un traitement tel qu'exposé aux clients
+
+    Returns:
+        dict: job_id, operation, status, position (traitements en attente
+              avant lui), dates, et, une fois terminé, status_code, result
+              (réponse du point d'API) et error
+    """
+    state = {
+        'job_id': job['id'],
+        'operation': job['operation'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at']
+    }
+    if job['status'] == 'queued':
+        state['position'] = catalog.get_queue_position(job)
+    if job['status'] in TERMINAL_STATUSES:
+        state['status_code'] = job['status_code']
+        state['result'] = json.loads(job['result']) if job['result'] else None
+        state['error'] = job['error']
+    return state
+
+
+def iter_events(job_id):
+    """
+    Événements SSE des changements d'état d'un traitement
+
+    Le flux s'arrête quand le traitement est terminé, ou après
+    JOB_EVENTS_TIMEOUT : le client se reconnecte (EventSource) sans occuper
+    un worker web pendant tout le traitement.
+
+    Args:
+        job_id: Identifiant d'un traitement de la session (vérifié par l'appelant)
+
+    Yields:
+        str: Événements 'queued', 'running', 'succeeded', 'failed' ou 'cancelled'
+             (données : état du traitement, voir public_state)
+    """
+    deadline = time.time() + current_app.config.get('JOB_EVENTS_TIMEOUT', 30)
+    poll_interval = current_app.config.get('JOB_POLL_INTERVAL', 0.5)
+    yield "retry: 1000\n\n"
+
+    last = None
+    while True:
+        job = catalog.get_job(job_id)
+        if job is None:
+            return
+        state = public_state(job)
+        if (state['status'], state.get('position')) != last:
+            last = (state['status'], state.get('position'))
+            yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+        if state['status'] in TERMINAL_STATUSES or time.time() >= deadline:
+            return
+        time.sleep(poll_interval)
+
+
+def execute(app, job, worker):
+    """
+    Exécute un traitement pris dans la file
+
+    Le point d'API de l'opération est appelé dans un contexte de requête de
+    la session propriétaire, avec les paramètres enregistrés.
+
+    Args:
+        app (Flask): Instance de l'application
+        job: Ligne du traitement (status 'running')
+        worker: Identifiant du worker
+    """
+    job_id = job['id']
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(app, job_id, worker, stop),
+                                 name=f"heartbeat-{job_id[:8]}", daemon=True)
+    heartbeat.start()
+
+    started = time.time()
+    payload = None
+    try:
+        with app.test_request_context(OPERATIONS[job['operation']], method='POST', data=json.loads(job['params'])):
+            session['pdf_session_id'] = job['session_id']
+            # Références posées à la mise en file, retirées à la fin de la requête (voir blobs.init_app)
+            g.blob_holder = get_holder(job_id)
+            response = app.full_dispatch_request()
+            payload = response.get_json(silent=True)
+            status_code = response.status_code
+        error = None if status_code < 400 else (payload or {}).get('error') or f"HTTP {status_code}"
+    except Exception as e:
+        logger.exception(f"Erreur lors de l'exécution du traitement {job_id}")
+        status_code = 500
+        error = str(e)
+    finally:
+        stop.set()
+
+    status = 'succeeded' if error is None else 'failed'
+    with app.app_context():
+        recorded = catalog.finish_job(job_id, worker, status, status_code,
+                                      json.dumps(payload) if payload is not None else None, error)
+    if recorded:
+        logger.info(f"Traitement {job_id} ({job['operation']}) terminé en {time.time() - started:.1f}s: {status}")
+    else:
+        logger.warning(f"Traitement {job_id} remis en file pendant son exécution, résultat ignoré")
+
+
+def _heartbeat(app, job_id, worker, stop):
+    """Signale périodiquement qu'un traitement est toujours en cours"""
+    interval = app.config.get('JOB_HEARTBEAT_INTERVAL', 10)
+    while not stop.wait(interval):
+        try:
+            with app.app_context():
+                catalog.heartbeat_job(job_id, worker)
+        except sqlite3.Error as e:
+            logger.error(f"Erreur lors du signalement du traitement {job_id}: {str(e)}")
+
+
+def run_worker(app):
+    """
+    Boucle d'un processus de traitement (voir worker.py)
+
+    Le processus s'arrête entre deux traitements si son superviseur s'est
+    arrêté (le nouveau superviseur lance ses propres processus).
+
+    Args:
+        app (Flask): Instance de l'application
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    supervisor_pid = os.environ.get(SUPERVISOR_ENV)
+    poll_interval = app.config.get('JOB_POLL_INTERVAL', 0.5)
+    app.config['ENGINE_TIMEOUT'] = app.config.get('JOB_TIMEOUT', 1800)
+    # Un traitement identique mené par un autre worker dure jusqu'à JOB_TIMEOUT : l'attendre
+    app.config['COALESCE_WAIT_TIMEOUT'] = max(app.config.get('COALESCE_WAIT_TIMEOUT', 180),
+                                              app.config['ENGINE_TIMEOUT'])
+    logger.info(f"Worker de traitement démarré ({worker})")
+
+    while True:
+        if supervisor_pid and os.getppid() != int(supervisor_pid):
+            logger.info(f"Superviseur arrêté, fin du worker de traitement ({worker})")
+            return
+        try:
+            with app.app_context():
+                job = catalog.claim_job(worker)
+        except sqlite3.Error as e:
+            logger.error(f"Erreur lors de la lecture de la file des traitements: {str(e)}")
+            job = None
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        execute(app, job, worker)
+
+
+def start(app):
+    """
+    Démarre le thread du superviseur du processus courant
+
+    Args:
+        app (Flask): Instance de l'application
+    """
+    global _thread
+    if app.config.get('JOB_WORKERS', 0) <= 0 or fcntl is None:
+        return
+    if _thread is not None and _thread.is_alive():
+        return
+    _thread = threading.Thread(target=_supervise, args=(app,), name='jobs-supervisor', daemon=True)
+    _thread.start()
+
+
+def _spawn(app):
+    """Lance un processus de traitement"""
+    env = dict(os.environ)
+    env[SUPERVISOR_ENV] = str(os.getpid())
+    base_dir = app.config['BASE_DIR']
+    return subprocess.Popen([sys.executable, os.path.join(base_dir, WORKER_SCRIPT)], cwd=base_dir, env=env)
+
+
+def _supervise(app):
+    """Boucle du superviseur : élection, puis maintien des processus et reprise des traitements abandonnés"""
+    interval = app.config.get('JOB_HEARTBEAT_INTERVAL', 10)
+    lock_path = os.path.join(app.config['DATA_DIR'], LOCK_FILENAME)
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o640)
+    try:
+        # Élection : un seul superviseur pour tous les workers web
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                time.sleep(interval)
+        logger.info(f"Superviseur des traitements élu (pid {os.getpid()})")
+
+        processes = []
+        while True:
+            for process in processes:
+                if process.poll() is not None:
+                    logger.warning(f"Worker de traitement {process.pid} arrêté (code {process.returncode})")
+            processes = [process for process in processes if process.poll() is None]
+            while len(processes) < app.config.get('JOB_WORKERS', 0):
+                try:
+                    processes.append(_spawn(app))
+                except OSError as e:
+                    logger.error(f"Impossible de lancer un worker de traitement: {str(e)}")
+                    break
+
+            try:
+                with app.app_context():
+                    stale_before = time.time() - app.config.get('JOB_STALE_AFTER', 60)
+                    requeued, failed = catalog.requeue_stale_jobs(stale_before, app.config.get('JOB_MAX_ATTEMPTS', 3))
+                if requeued or failed:
+                    logger.warning(f"Traitements abandonnés par leur worker: {requeued} remis en file, {failed} en échec")
+            except sqlite3.Error as e:
+                logger.error(f"Erreur lors de la reprise des traitements: {str(e)}")
+            time.sleep(interval)
+    finally:
+        os.close(fd)
+
+
+def purge(now):
+    """
+    Supprime les traitements terminés depuis plus de FILE_RETENTION_HOURS
+
+    Returns:
+        int: Nombre de traitements supprimés
+    """
+    return catalog.purge_jobs(now - catalog.get_retention())
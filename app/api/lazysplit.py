@@ -0,0 +1,383 @@
+"""
+Découpage différé : documents produits à la première demande
+
+Un découpage différé n'écrit que l'index du document source (nombre de
+pages et groupes de pages de chaque document à produire) : la réponse ne
+dépend que du temps d'analyse du document, pas du nombre de documents. Chaque
+document est produit par le moteur lors de son premier téléchargement, puis
+gardé en cache ; le cache de tous les découpages est limité en taille et les
+documents les moins récemment demandés sont supprimés en premier. L'archive
+ZIP n'est construite que si elle est explicitement demandée.
+
+Chaque découpage occupe un répertoire DATA_DIR/lazy/<id> :
+    <nom>.pdf    document source (lien physique vers le fichier reçu si possible)
+    index.json   index du découpage
+    pages/       documents déjà produits (<numéro>.pdf)
+"""
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import logging
+from flask import current_app, session
+from werkzeug.utils import secure_filename
+from . import coalesce
+from . import pdf_processor
+from .ingest import StagedFile
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus disponible
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+SPLIT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+INDEX_FILENAME = 'index.json'
+PAGES_DIR_NAME = 'pages'
+EVICTION_LOCK_NAME = '.eviction.lock'
+
+
+class LazySplitError(Exception):
+    """Découpage ou document introuvable, avec le code HTTP à retourner"""
+
+    def __init__(self, message, status_code=404):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_lazy_dir():
+    """
+    Retourne le répertoire des découpages différés
+
+    Returns:
+        str: Chemin vers DATA_DIR/lazy
+    """
+    lazy_dir = os.path.join(current_app.config['DATA_DIR'], 'lazy')
+    os.makedirs(lazy_dir, exist_ok=True)
+    return lazy_dir
+
+
+def parse_page_groups(page_range, page_count):
+    """
+    Groupes de pages décrits par une plage (même syntaxe que le moteur)
+
+    Args:
+        page_range: Plage "1,3,5-10" (chaque élément donne un document ; une
+                    plage vide ou "all" donne un document par page)
+        page_count: Nombre de pages du document
+
+    Returns:
+        list: Couples (première page, dernière page), numérotées à partir de 1
+
+    Raises:
+        LazySplitError: Plage invalide
+    """
+    page_range = (page_range or '').strip()
+    if not page_range or page_range == 'all':
+        return [(page, page) for page in range(1, page_count + 1)]
+
+    groups = []
+    for item in page_range.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            raise LazySplitError('Invalid page range', 400)
+        if first < 1 or last < first or last > page_count:
+            raise LazySplitError('Invalid page range', 400)
+        groups.append((first, last))
+    if not groups:
+        raise LazySplitError('Invalid page range', 400)
+    return groups
+
+
+def count_page_groups(page_count, pages_per_file):
+    """Groupes d'un découpage par nombre de pages"""
+    return [
+        (first, min(first + pages_per_file - 1, page_count))
+        for first in range(1, page_count + 1, pages_per_file)
+    ]
+
+
+def format_page_range(groups, page_count=None):
+    """
+    Plage "1,3,5-10" correspondant à des groupes de pages
+
+    Args:
+        groups: Couples (première page, dernière page)
+        page_count: Nombre de pages du document ; si chaque page y donne un
+                    document, la plage est vide (valeur par défaut du moteur,
+                    la plage explicite dépasserait la longueur d'argument
+                    admise au-delà de quelques centaines de pages)
+
+    Returns:
+        str: Plage de pages
+    """
+    if page_count and groups == [(page, page) for page in range(1, page_count + 1)]:
+        return ''
+    return ','.join(str(first) if first == last else f"{first}-{last}" for first, last in groups)
+
+
+def _document_name(base_name, first, last):
+    """Nom d'un document produit, identique à celui des archives du moteur"""
+    if first == last:
+        return f"{base_name}_page_{first}.pdf"
+    return f"{base_name}_pages_{first}-{last}.pdf"
+
+
+def _write_index(split_dir, index):
+    """Écrit l'index d'un découpage de manière atomique"""
+    index_path = os.path.join(split_dir, INDEX_FILENAME)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path)
+
+
+def create(file, page_range=None, pages_per_file=None, linearize=False):
+    """
+    Crée un découpage différé : seul l'index du document est construit
+
+    Args:
+        file: Fichier d'entrée sur disque (StagedFile)
+        page_range: Plage de pages, format: "1,3,5-10" (toutes les pages une à une si vide)
+        pages_per_file: Nombre de pages par document (remplace page_range)
+        linearize: Produire des documents linéarisés (affichage web rapide)
+
+    Returns:
+        dict: Index du découpage ('split_id', 'page_count', 'documents' : nom et pages)
+
+    Raises:
+        LazySplitError: Plage de pages invalide
+    """
+    split_id = uuid.uuid4().hex
+    split_dir = os.path.join(get_lazy_dir(), split_id)
+    os.makedirs(os.path.join(split_dir, PAGES_DIR_NAME))
+
+    try:
+        base_name = os.path.splitext(secure_filename(file.filename or ''))[0] or 'document'
+        source_path = os.path.join(split_dir, f"{base_name}.pdf")
+        # Le fichier reçu est conservé sans recopie (lien physique si possible)
+        file.save(source_path)
+
+        page_count = pdf_processor.count_pages(source_path)
+        if pages_per_file:
+            groups = count_page_groups(page_count, pages_per_file)
+        else:
+            groups = parse_page_groups(page_range, page_count)
+
+        index = {
+            'split_id': split_id,
+            'session_id': pdf_processor.get_session_id(),
+            'filename': file.filename,
+            'source': source_path,
+            'page_count': page_count,
+            'documents': [
+                {'name': _document_name(base_name, first, last), 'first_page': first, 'last_page': last}
+                for first, last in groups
+            ],
+            'linearize': bool(linearize),
+            'archive': None,
+            'created_at': time.time()
+        }
+        _write_index(split_dir, index)
+    except Exception:
+        shutil.rmtree(split_dir, ignore_errors=True)
+        raise
+
+    logger.info(f"Découpage différé {split_id}: {len(groups)} documents indexés sur {page_count} pages")
+    return index
+
+
+def load(split_id):
+    """
+    Lit l'index d'un découpage de la session courante
+
+    Raises:
+        LazySplitError: Identifiant mal formé, inconnu, expiré ou d'une autre session
+    """
+    if not split_id or not SPLIT_ID_PATTERN.match(split_id):
+        raise LazySplitError('Invalid split identifier', 400)
+
+    split_dir = os.path.join(get_lazy_dir(), split_id)
+    try:
+        with open(os.path.join(split_dir, INDEX_FILENAME), 'r') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        raise LazySplitError('Unknown or expired split')
+
+    # Ne pas révéler l'existence des découpages des autres sessions
+    if index.get('session_id') != session.get('pdf_session_id') or not os.path.isfile(index['source']):
+        raise LazySplitError('Unknown or expired split')
+    return index
+
+
+def _page_path(split_id, number):
+    return os.path.join(get_lazy_dir(), split_id, PAGES_DIR_NAME, f"{number}.pdf")
+
+
+def materialize(index, number):
+    """
+    Retourne le chemin d'un document du découpage, en le produisant si nécessaire
+
+    Les demandes simultanées d'un même document, sur tous les workers, ne
+    déclenchent qu'une production.
+
+    Args:
+        index: Index du découpage (voir load)
+        number: Numéro du document, à partir de 1
+
+    Returns:
+        str: Chemin du document
+
+    Raises:
+        LazySplitError: Numéro de document invalide
+    """
+    documents = index['documents']
+    if number < 1 or number > len(documents):
+        raise LazySplitError('Document not found in split')
+
+    page_path = _page_path(index['split_id'], number)
+    try:
+        # Document en cache : marquer comme récemment utilisé
+        os.utime(page_path)
+        return page_path
+    except FileNotFoundError:
+        pass
+
+    document = documents[number - 1]
+
+    def produce():
+        if not os.path.isfile(page_path):
+            tmp_path = f"{page_path}.{os.getpid()}.tmp"
+            try:
+                page_range = format_page_range([(document['first_page'], document['last_page'])])
+                pdf_processor.extract_pages(index['source'], tmp_path, page_range, index.get('linearize', False))
+                os.replace(tmp_path, page_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            logger.info(f"Document {document['name']} produit pour le découpage {index['split_id']}")
+        return {'path': page_path}
+
+    key = coalesce.make_key('lazy-split', [index['split_id']], {'document': number})
+    coalesce.single_flight(key, produce)
+    evict(keep=page_path)
+    return page_path
+
+
+def open_document(index, number):
+    """
+    Ouvre un document du découpage pour l'envoyer
+
+    Le fichier est ouvert aussitôt produit : une éviction concurrente ne peut
+    plus le retirer avant l'envoi.
+
+    Returns:
+        Tuple (fichier ouvert, nom du document, taille)
+    """
+    for _ in range(2):
+        page_path = materialize(index, number)
+        try:
+            f = open(page_path, 'rb')
+        except FileNotFoundError:
+            # Retiré du cache entre-temps par un autre worker : produire à nouveau
+            continue
+        return f, index['documents'][number - 1]['name'], os.fstat(f.fileno()).st_size
+    raise LazySplitError('Document temporarily unavailable', 503)
+
+
+def evict(keep=None):
+    """
+    Ramène le cache des documents produits sous LAZY_SPLIT_CACHE_BYTES
+
+    Les documents les moins récemment demandés sont supprimés en premier. Si
+    un autre worker est déjà en train d'évincer, l'appel ne fait rien.
+
+    Args:
+        keep: Chemin d'un document à ne pas supprimer (celui qui va être envoyé)
+
+    Returns:
+        int: Nombre d'octets libérés
+    """
+    budget = current_app.config.get('LAZY_SPLIT_CACHE_BYTES', 0)
+    if not budget:
+        return 0
+
+    lazy_dir = get_lazy_dir()
+    fd = os.open(os.path.join(lazy_dir, EVICTION_LOCK_NAME), os.O_CREAT | os.O_RDWR, 0o640)
+    try:
+        if fcntl is not None:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return 0
+
+        cached = []
+        total = 0
+        for split_id in os.listdir(lazy_dir):
+            pages_dir = os.path.join(lazy_dir, split_id, PAGES_DIR_NAME)
+            if not os.path.isdir(pages_dir):
+                continue
+            for name in os.listdir(pages_dir):
+                if not name.endswith('.pdf'):
+                    continue
+                path = os.path.join(pages_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                cached.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        freed = 0
+        cached.sort()
+        for _, size, path in cached:
+            if total - freed <= budget:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                continue
+        if freed:
+            logger.info(f"Cache des découpages différés: {freed} octets libérés")
+        return freed
+    finally:
+        os.close(fd)
+
+
+def build_archive(index):
+    """
+    Construit (une seule fois) l'archive ZIP de tous les documents du découpage
+
+    L'archive est écrite par le moteur directement depuis le document source,
+    sans passer par les documents du cache.
+
+    Args:
+        index: Index du découpage (voir load)
+
+    Returns:
+        str: Chemin de l'archive, dans le répertoire des fichiers traités
+    """
+    if index.get('archive') and os.path.isfile(index['archive']):
+        return index['archive']
+
+    groups = [(document['first_page'], document['last_page']) for document in index['documents']]
+    source = StagedFile(index['source'], index['filename'])
+    page_range = format_page_range(groups, index['page_count'])
+    archive = pdf_processor.split_pdf_to_zip(source, page_range, linearize=index.get('linearize', False))
+
+    index['archive'] = archive['path']
+    _write_index(os.path.join(get_lazy_dir(), index['split_id']), index)
+    return archive['path']
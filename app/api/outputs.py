@@ -0,0 +1,237 @@
+"""
+Publication des fichiers produits dans le répertoire des fichiers traités
+
+Les traitements écrivent leurs résultats dans un répertoire de préparation
+situé sur le même système de fichiers que le répertoire des fichiers traités
+(processed/.staging). La publication est alors un simple renommage atomique :
+le contenu n'est jamais recopié, et un fichier n'apparaît dans processed
+qu'une fois complet. Le répertoire de préparation est supprimé à la fin du
+traitement, qu'il ait réussi ou échoué.
+
+Les fichiers traités sont répartis dans des sous-répertoires tirés de
+l'empreinte de leur nom (processed/ab/cd/<nom>, 65 536 répertoires) : aucun
+répertoire ne grossit avec le nombre de fichiers conservés. Le nom reste
+l'identifiant public d'un fichier (/download/<nom>) ; resolve() retrouve son
+chemin, y compris pour les fichiers publiés avant la répartition, restés à
+la racine de processed (voir tools/migrate_processed_layout.py).
+"""
+import os
+import re
+import uuid
+import errno
+import shutil
+import hashlib
+import logging
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+# Sous-répertoire de préparation, ignoré par les listes de fichiers (pas d'extension)
+STAGING_DIR_NAME = '.staging'
+
+# Répertoires de répartition : deux niveaux de deux caractères hexadécimaux
+SHARD_LEVELS = 2
+SHARD_PATTERN = re.compile(r'^[0-9a-f]{2}$')
+
+
+def get_processed_dir():
+    """
+    Retourne le répertoire pour les fichiers traités
+
+    Returns:
+        str: Chemin vers le répertoire des fichiers traités
+    """
+    processed_dir = os.path.join(current_app.config['DATA_DIR'], 'processed')
+    os.makedirs(processed_dir, exist_ok=True)
+    return processed_dir
+
+
+def get_staging_root():
+    """
+    Retourne la racine des répertoires de préparation
+
+    Returns:
+        str: Chemin vers processed/.staging
+    """
+    staging_root = os.path.join(get_processed_dir(), STAGING_DIR_NAME)
+    os.makedirs(staging_root, exist_ok=True)
+    return staging_root
+
+
+def shard_path(name, create=False):
+    """
+    Chemin d'un fichier traité dans la répartition
+
+    Args:
+        name: Nom du fichier
+        create: Créer les répertoires de répartition
+
+    Returns:
+        str: Chemin processed/ab/cd/<nom>
+    """
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    shard_dir = os.path.join(get_processed_dir(), *(digest[2 * i:2 * i + 2] for i in range(SHARD_LEVELS)))
+    if create:
+        os.makedirs(shard_dir, exist_ok=True)
+    return os.path.join(shard_dir, name)
+
+
+def is_valid_name(name):
+    """Nom de fichier traité acceptable (ni séparateur, ni fichier caché)"""
+    return bool(name) and os.path.basename(name) == name and not name.startswith('.') and '\\' not in name
+
+
+def resolve(name):
+    """
+    Retourne le chemin d'un fichier traité d'après son nom
+
+    Les fichiers publiés avant la répartition sont cherchés à la racine de
+    processed.
+
+    Args:
+        name: Nom du fichier (/download/<nom>)
+
+    Returns:
+        str: Chemin du fichier, ou None s'il n'existe pas ou si le nom est invalide
+    """
+    if not is_valid_name(name):
+        return None
+    for path in (shard_path(name), os.path.join(get_processed_dir(), name)):
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def iter_files():
+    """
+    Parcourt les fichiers traités publiés (répartis ou à la racine)
+
+    Les répertoires de préparation, du cache des archives et les fichiers
+    temporaires sont ignorés.
+
+    Yields:
+        os.DirEntry: Fichiers publiés
+    """
+    def scan(directory, depth):
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            return
+        with entries:
+            for entry in entries:
+                if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if depth < SHARD_LEVELS and SHARD_PATTERN.match(entry.name):
+                            yield from scan(entry.path, depth + 1)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry
+                except OSError:
+                    continue
+
+    yield from scan(get_processed_dir(), 0)
+
+
+def migrate_flat_layout(on_move=None):
+    """
+    Déplace les fichiers restés à la racine de processed dans la répartition
+
+    Args:
+        on_move: Fonction appelée avec (ancien chemin, nouveau chemin) après chaque déplacement
+
+    Returns:
+        int: Nombre de fichiers déplacés
+    """
+    processed_dir = get_processed_dir()
+    moved = 0
+    with os.scandir(processed_dir) as entries:
+        legacy = [entry.path for entry in entries
+                  if entry.is_file(follow_symlinks=False) and is_valid_name(entry.name)
+                  and not entry.name.endswith('.tmp')]
+    for path in legacy:
+        target = shard_path(os.path.basename(path), create=True)
+        try:
+            # Même système de fichiers : renommage atomique, le fichier reste accessible
+            os.rename(path, target)
+        except FileNotFoundError:
+            continue
+        moved += 1
+        if on_move:
+            on_move(path, target)
+    return moved
+
+
+def commit(path, name=None):
+    """
+    Publie un fichier produit dans le répertoire des fichiers traités
+
+    Le fichier est placé dans son répertoire de répartition (voir
+    shard_path) et renommé (atomique, sans recopie). Si la source se trouve
+    sur un autre système de fichiers, un lien physique puis une copie vers un
+    fichier temporaire suivie d'un renommage sont tentés, afin que le fichier
+    final n'apparaisse jamais incomplet.
+
+    Args:
+        path: Chemin du fichier produit
+        name: Nom dans le répertoire des fichiers traités (par défaut, celui du fichier)
+
+    Returns:
+        str: Chemin du fichier publié
+    """
+    final_path = shard_path(name or os.path.basename(path))
+    try:
+        try:
+            os.rename(path, final_path)
+        except FileNotFoundError:
+            # Premier fichier de ce répertoire de répartition (jamais supprimé ensuite)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            os.rename(path, final_path)
+        return final_path
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    logger.warning(f"Publication hors du système de fichiers de préparation: {path}")
+    try:
+        os.link(path, final_path)
+    except OSError:
+        tmp_path = os.path.join(get_staging_root(), f".{uuid.uuid4().hex}.tmp")
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.rename(tmp_path, final_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    os.remove(path)
+    return final_path
+
+
+class OutputStage:
+    """
+    Répertoire de préparation d'un traitement
+
+    S'utilise comme gestionnaire de contexte : le répertoire est créé à
+    l'entrée et supprimé à la sortie, avec tout ce qui n'a pas été publié.
+    """
+
+    def __init__(self):
+        self.dir = None
+
+    def __enter__(self):
+        self.dir = os.path.join(get_staging_root(), str(uuid.uuid4()))
+        os.makedirs(self.dir)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        shutil.rmtree(self.dir, ignore_errors=True)
+        return False
+
+    def path(self, filename):
+        """Chemin d'un fichier dans le répertoire de préparation"""
+        return os.path.join(self.dir, filename)
+
+    def commit(self, path, name=None):
+        """Publie un fichier du répertoire de préparation (voir commit)"""
+        return commit(path, name)
@@ -10,7 +10,21 @@ from werkzeug.utils import secure_filename
 import logging
 import time
 import re
+import json
+import hashlib
+import threading
+import sqlite3
 import magic
+from . import coalesce
+from . import engine
+from . import documents
+from . import outputs
+from . import staging
+from . import bundles
+from . import blobs
+from . import catalog
+from . import storage
+from .ingest import StagedFile
 
 logger = logging.getLogger(__name__)
 
@@ -55,21 +69,47 @@ def get_processed_dir():
     Returns:
         str: Chemin vers le répertoire des fichiers traités
     """
-    processed_dir = os.path.join(current_app.config['DATA_DIR'], 'processed')
-    ensure_dir(processed_dir)
-    return processed_dir
+    return outputs.get_processed_dir()
+
+def get_input_path(file, temp_dir):
+    """
+    Retourne le chemin de travail d'un fichier d'entrée, sans recopier son contenu
+    
+    Le fichier est utilisé en place s'il porte déjà son nom sécurisé (c'est le
+    cas des fichiers reçus) ; sinon un lien physique portant ce nom est créé
+    dans temp_dir, les noms des fichiers produits étant dérivés de ce nom.
+    
+    Args:
+        file: Fichier d'entrée sur disque (StagedFile)
+        temp_dir: Répertoire de travail du traitement
+        
+    Returns:
+        str: Chemin du fichier d'entrée
+    """
+    safe_filename = secure_filename(file.filename)
+    if os.path.basename(file.path) == safe_filename:
+        return file.path
+    input_path = os.path.join(temp_dir, safe_filename)
+    file.save(input_path)
+    return input_path
 
 def is_valid_pdf(file_stream):
     """
     Vérifie si un fichier est un PDF valide en inspectant son contenu
 
     Args:
-        file_stream: Flux du fichier à vérifier
+        file_stream: Flux du fichier à vérifier (ou fichier sur disque)
 
     Returns:
         bool: True si le fichier est un PDF valide, False sinon
     """
     try:
+        # Fichier déjà sur disque : en-tête vérifié à la réception, sinon lu directement
+        if isinstance(file_stream, StagedFile):
+            if file_stream.is_pdf is not None:
+                return file_stream.is_pdf
+            return magic.from_file(file_stream.path, mime=True) == 'application/pdf'
+        
         # Sauvegarder la position actuelle dans le flux
         current_position = file_stream.tell()
         
@@ -158,8 +198,15 @@ def run_pdfeditor(cmd_args):
             logger.error(f"L'exécutable pdfeditor n'est pas exécutable: {pdfeditor_path}")
             return -1, "", f"L'exécutable pdfeditor n'est pas exécutable: {pdfeditor_path}"
         
-        # Définir un timeout pour éviter les processus bloqués
-        timeout = 60  # 1 minute au lieu de 5
+        # Définir un timeout pour éviter les processus bloqués (plus long dans les workers des traitements asynchrones)
+        timeout = current_app.config.get('ENGINE_TIMEOUT', 60)
+        
+        # Utiliser le moteur résident s'il est disponible (documents déjà analysés en cache)
+        engine_result = engine.run_command(sanitized_args, timeout)
+        if engine_result is not None:
+            if engine_result[0] != 0:
+                logger.error(f"Erreur lors de l'exécution de pdfeditor (code {engine_result[0]}): {engine_result[2]}")
+            return engine_result
         
         process = subprocess.Popen(
             cmd, 
@@ -188,12 +235,333 @@ def run_pdfeditor(cmd_args):
         logger.exception(error_msg)
         return -1, "", error_msg
 
-def merge_pdfs(files):
+# Option du moteur pour écrire des PDF linéarisés (affichage web rapide)
+LINEARIZE_OPTION = '--linearize'
+
+def should_linearize(input_size, requested=None):
+    """
+    Indique si les PDF produits doivent être linéarisés
+    
+    Un PDF linéarisé commence par les objets de sa première page : un
+    lecteur qui le télécharge par plages d'octets peut l'afficher sans
+    attendre la fin du fichier.
+    
+    Args:
+        input_size: Taille totale des fichiers d'entrée en octets
+        requested: True ou False pour imposer le choix, None pour linéariser
+                   au-delà de LINEARIZE_THRESHOLD
+        
+    Returns:
+        bool: True si les documents doivent être linéarisés
+    """
+    if requested is not None:
+        return bool(requested)
+    threshold = current_app.config.get('LINEARIZE_THRESHOLD', 0)
+    return bool(threshold) and (input_size or 0) >= threshold
+
+# Taille des blocs échangés avec pdfeditor en mode flux
+PIPE_CHUNK_SIZE = 64 * 1024
+
+# Opérations à un seul fichier produit, exécutables en mode flux (entrée et sortie sur des tubes)
+PIPE_OPERATIONS = ('compress', 'rotate', 'watermark', 'protect', 'unlock')
+
+def read_stream_header(source, size=1024):
+    """
+    Lit le début d'un flux pour en vérifier le type
+
+    Args:
+        source: Flux binaire (corps de la requête)
+        size: Nombre d'octets à lire
+
+    Returns:
+        bytes: Début du flux (moins de size octets si le flux est plus court)
+    """
+    header = b''
+    while len(header) < size:
+        data = source.read(size - len(header))
+        if not data:
+            break
+        header += data
+    return header
+
+def stream_pdfeditor(cmd_args, source, header=b'', timeout=None):
+    """
+    Exécute pdfeditor en mode flux : le document est lu sur l'entrée standard
+    et le résultat écrit sur la sortie standard, sans fichier intermédiaire
+
+    Le moteur résident n'est pas utilisé (il travaille sur des fichiers) et le
+    traitement n'est pas coalescé : l'empreinte de l'entrée n'est connue qu'une
+    fois le flux entièrement lu.
+
+    Args:
+        cmd_args: Arguments pour l'outil, '-' désignant l'entrée et la sortie standard
+        source: Flux binaire transmis sur l'entrée standard (corps de la requête)
+        header: Octets déjà lus au début du flux
+        timeout: Durée maximale d'exécution en secondes (ENGINE_TIMEOUT par défaut)
+
+    Returns:
+        Générateur des blocs du PDF produit
+
+    Raises:
+        Exception: Si la commande échoue avant d'avoir produit son résultat
+    """
+    try:
+        sanitized_args = [sanitize_command_arg(arg) for arg in cmd_args]
+    except ValueError as e:
+        logger.error(f"Argument invalide pour pdfeditor: {str(e)}")
+        raise Exception(f"Argument invalide détecté: {str(e)}")
+
+    pdfeditor_path = get_pdfeditor_path()
+    if not os.path.isfile(pdfeditor_path):
+        raise Exception(f"L'exécutable pdfeditor n'existe pas: {pdfeditor_path}")
+
+    # Plus long dans les workers des traitements asynchrones (voir jobs.py)
+    if timeout is None:
+        timeout = current_app.config.get('ENGINE_TIMEOUT', 60)
+
+    cmd = [pdfeditor_path] + sanitized_args
+    logger.info(f"Exécution de la commande en mode flux: {' '.join(cmd)}")
+
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        shell=False  # Éviter l'injection de commandes
+    )
+
+    def feed():
+        # pdfeditor lit toute son entrée avant d'écrire : pas d'interblocage possible
+        try:
+            if header:
+                process.stdin.write(header)
+            for data in iter(lambda: source.read(PIPE_CHUNK_SIZE), b''):
+                process.stdin.write(data)
+        except (BrokenPipeError, OSError) as e:
+            logger.warning(f"Transmission interrompue vers pdfeditor: {str(e)}")
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    stderr_chunks = []
+    feeder = threading.Thread(target=feed, daemon=True)
+    collector = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True)
+    watchdog = threading.Timer(timeout, process.kill)
+    feeder.start()
+    collector.start()
+    watchdog.start()
+
+    def finish():
+        watchdog.cancel()
+        returncode = process.wait()
+        feeder.join()
+        collector.join()
+        stderr = b''.join(stderr_chunks).decode('utf-8', 'replace')
+        if returncode != 0:
+            logger.error(f"Erreur lors de l'exécution de pdfeditor (code {returncode}): {stderr}")
+            raise Exception(stderr.strip() or f"pdfeditor a échoué (code {returncode})")
+
+    # Le premier bloc n'arrive qu'une fois le document traité : une erreur est
+    # donc signalée avant que la réponse ne commence
+    first_chunk = process.stdout.read1(PIPE_CHUNK_SIZE)
+    if not first_chunk:
+        finish()
+        raise Exception("pdfeditor n'a produit aucun résultat")
+
+    def chunks():
+        finished = False
+        try:
+            yield first_chunk
+            for data in iter(lambda: process.stdout.read1(PIPE_CHUNK_SIZE), b''):
+                yield data
+            finished = True
+            finish()
+        finally:
+            if not finished and process.poll() is None:
+                # Client déconnecté ou erreur en cours d'envoi
+                process.kill()
+                process.wait()
+                watchdog.cancel()
+
+    return chunks()
+
+def process_stream(operation, source, *params, linearize=False):
+    """
+    Traite un PDF reçu en flux et retourne le résultat en flux
+
+    Args:
+        operation: Opération à un seul fichier produit (voir PIPE_OPERATIONS)
+        source: Flux binaire du PDF (corps de la requête)
+        params: Paramètres de l'opération, dans l'ordre attendu par pdfeditor
+        linearize: Écrire un PDF linéarisé (voir should_linearize)
+
+    Returns:
+        Générateur des blocs du PDF produit
+
+    Raises:
+        ValueError: Opération non disponible en mode flux ou flux qui n'est pas un PDF
+        Exception: Si le traitement échoue
+    """
+    if operation not in PIPE_OPERATIONS:
+        raise ValueError(f"Opération non disponible en mode flux: {operation}")
+
+    header = read_stream_header(source)
+    try:
+        is_pdf = magic.from_buffer(header, mime=True) == 'application/pdf'
+    except Exception as e:
+        logger.error(f"Erreur lors de la validation du PDF: {str(e)}")
+        is_pdf = False
+    if not is_pdf:
+        raise ValueError('Invalid file type. Please upload a PDF.')
+
+    cmd_args = [operation, '-', '-'] + [str(param) for param in params]
+    if linearize:
+        cmd_args.append(LINEARIZE_OPTION)
+    return stream_pdfeditor(cmd_args, source, header)
+
+def store_stream(chunks, prefix, operation=None):
+    """
+    Publie dans le répertoire des fichiers traités un résultat produit en flux
+
+    Args:
+        chunks: Blocs du PDF produit (voir process_stream)
+        prefix: Préfixe du nom du fichier produit (rotated, compressed...)
+        operation: Opération qui a produit le flux
+
+    Returns:
+        Dictionnaire avec les informations sur le fichier produit
+    """
+    with outputs.OutputStage() as stage:
+        output_filename = f"{prefix}_{uuid.uuid4()}.pdf"
+        output_path = stage.path(output_filename)
+        with open(output_path, 'wb') as f:
+            for data in chunks:
+                f.write(data)
+        final_path = stage.commit(output_path)
+
+    return register_outputs({
+        'filename': output_filename,
+        'path': final_path,
+        'url': f"/download/{output_filename}"
+    }, operation)
+
+def run_coalesced(operation, input_paths, params, compute):
+    """
+    Exécute un traitement en le coalesçant avec les requêtes identiques concurrentes
+
+    Args:
+        operation: Nom de l'opération
+        input_paths: Chemins des fichiers d'entrée, dans l'ordre
+        params: Paramètres de l'opération
+        compute: Fonction sans argument réalisant le traitement
+
+    Returns:
+        Le résultat du traitement (éventuellement partagé avec une autre requête)
+    """
+    input_hashes = [coalesce.hash_file(path) for path in input_paths]
+    key = coalesce.make_key(operation, input_hashes, params)
+    return coalesce.single_flight(key, compute)
+
+def register_outputs(result, operation=None, job_id=None, parent=None):
+    """
+    Associe un identifiant de document à chaque fichier produit
+
+    L'identifiant est créé pour la session courante, après la coalescence,
+    afin que chaque requête reçoive un identifiant qui lui est propre. Les
+    fichiers sont aussi enregistrés dans l'index des fichiers stockés.
+
+    Args:
+        result: Dictionnaire ou liste de dictionnaires décrivant les fichiers produits
+        operation: Opération qui a produit les fichiers
+        job_id: Identifiant du traitement (créé si absent)
+        parent: Nom de l'archive qui contient les fichiers produits
+
+    Returns:
+        Le résultat, complété par les clés 'handle' et 'job_id'
+    """
+    entries = result if isinstance(result, list) else [result]
+    job_id = job_id or uuid.uuid4().hex
+    produced = []
+    for entry in entries:
+        if isinstance(entry, dict) and entry.get('path') and os.path.exists(entry['path']):
+            entry['handle'] = documents.register(entry['path'], entry.get('filename'), 'output')
+            entry['job_id'] = job_id
+            produced.append(catalog_entry(entry, parent))
+
+    try:
+        catalog.record(produced, operation, get_session_id(), job_id)
+    except sqlite3.Error as e:
+        # L'index sera réparé par la prochaine réconciliation
+        logger.error(f"Erreur lors de l'enregistrement dans l'index des fichiers: {str(e)}")
+
+    # Copie dans le stockage partagé (téléchargeable depuis tous les nœuds)
+    storage.publish(produced)
+    return result
+
+def release_outputs(paths, session_id):
+    """
+    Retire des fichiers traités d'une session après leur téléchargement (clean=true)
+
+    Un résultat partagé par des requêtes identiques concurrentes (voir
+    coalesce.py) appartient à chacune de leurs sessions : il n'est supprimé
+    (disque local, index, stockage partagé) qu'une fois retiré par sa
+    dernière session propriétaire.
+
+    Args:
+        paths: Chemins des fichiers téléchargés
+        session_id: Session qui les a téléchargés
+
+    Returns:
+        int: Nombre de fichiers supprimés
+    """
+    orphaned = catalog.release_owner(session_id, paths)
+    for path in orphaned:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    catalog.forget(orphaned)
+    storage.discard([os.path.basename(path) for path in orphaned])
+    return len(orphaned)
+
+def catalog_entry(entry, parent=None):
+    """
+    Description d'un fichier produit pour l'index des fichiers stockés
+
+    Args:
+        entry: Dictionnaire décrivant le fichier produit
+        parent: Nom de l'archive qui contient le fichier
+
+    Returns:
+        dict: path, size, kind ('archive', 'page' ou 'file'), parent, page_count
+    """
+    first_page = entry.get('page_number')
+    if entry['path'].endswith('.zip'):
+        kind = 'archive'
+    elif first_page:
+        kind = 'page'
+    else:
+        kind = 'file'
+    page_count = entry.get('page_count')
+    if page_count is None and first_page:
+        page_count = int(entry.get('last_page') or first_page) - int(first_page) + 1
+    return {
+        'path': entry['path'],
+        'size': entry.get('size'),
+        'kind': kind,
+        'parent': parent,
+        'page_count': page_count
+    }
+
+def merge_pdfs(files, linearize=None):
     """
     Fusionne plusieurs fichiers PDF en un seul
     
     Args:
-        files: Liste d'objets fichiers à fusionner
+        files: Liste de fichiers d'entrée sur disque (StagedFile) à fusionner
+        linearize: Linéariser le document produit (None : selon la taille, voir should_linearize)
         
     Returns:
         Dictionnaire avec les informations sur le fichier fusionné
@@ -201,10 +569,10 @@ def merge_pdfs(files):
     if not files or len(files) == 0:
         raise Exception("Aucun fichier fourni pour la fusion")
         
-    temp_dir = get_temp_dir()
-    
-    try:
-        # Sauvegarder les fichiers d'entrée
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichiers d'entrée (déjà sur disque)
         input_files = []
         total_input_size = 0
         file_count = 0
@@ -219,54 +587,49 @@ def merge_pdfs(files):
                 logger.warning(f"Fichier non PDF ignoré: {file.filename}")
                 continue
                 
-            safe_filename = secure_filename(file.filename)
-            input_path = os.path.join(temp_dir, f"{file_count}_{safe_filename}")
-            file.save(input_path)
-            
-            # Vérifier si le fichier est valide
-            if os.path.getsize(input_path) == 0:
-                logger.warning(f"Fichier vide ignoré: {safe_filename}")
-                os.remove(input_path)
+            # Le fichier reçu est utilisé en place, sans recopie
+            if file.size == 0:
+                logger.warning(f"Fichier vide ignoré: {file.filename}")
                 continue
                 
-            input_files.append(input_path)
-            total_input_size += os.path.getsize(input_path)
+            input_files.append(file.path)
+            total_input_size += file.size
             file_count += 1
         
         if not input_files:
             raise Exception("Aucun fichier PDF valide trouvé pour la fusion")
-            
-        # Générer un nom de fichier de sortie
-        output_filename = f"merged_{uuid.uuid4()}.pdf"
-        output_path = os.path.join(temp_dir, output_filename)
-        
-        # Préparer les arguments pour l'outil C++
-        cmd_args = ["merge", output_path] + input_files
         
-        # Exécuter l'outil
-        logger.info(f"Fusion de {len(input_files)} fichiers PDF")
-        returncode, stdout, stderr = run_pdfeditor(cmd_args)
-        
-        if returncode != 0:
-            # Nettoyer
-            raise Exception(f"Erreur lors de la fusion des PDFs: {stderr}")
+        linearize = should_linearize(total_input_size, linearize)
             
-        # Déplacer vers le répertoire des fichiers traités
-        processed_dir = get_processed_dir()
-        final_path = os.path.join(processed_dir, output_filename)
-        shutil.move(output_path, final_path)
-        
-        return {
-            'filename': output_filename,
-            'path': final_path,
-            'url': f"/download/{output_filename}",
-            'size': os.path.getsize(final_path),
-            'page_count': None  # Pourrait être amélioré pour compter les pages
-        }
-    finally:
-        # Nettoyer les fichiers temporaires dans tous les cas
-        if os.path.exists(temp_dir):
-            shutil.rmtree(temp_dir)
+        def merge():
+            # Générer un nom de fichier de sortie
+            output_filename = f"merged_{uuid.uuid4()}.pdf"
+            output_path = os.path.join(temp_dir, output_filename)
+            
+            # Préparer les arguments pour l'outil C++
+            cmd_args = ["merge", output_path] + input_files
+            if linearize:
+                cmd_args.append(LINEARIZE_OPTION)
+            
+            # Exécuter l'outil
+            logger.info(f"Fusion de {len(input_files)} fichiers PDF")
+            returncode, stdout, stderr = run_pdfeditor(cmd_args)
+            
+            if returncode != 0:
+                raise Exception(f"Erreur lors de la fusion des PDFs: {stderr}")
+                
+            # Publier dans le répertoire des fichiers traités (renommage atomique)
+            final_path = stage.commit(output_path)
+            
+            return {
+                'filename': output_filename,
+                'path': final_path,
+                'url': f"/download/{output_filename}",
+                'size': os.path.getsize(final_path),
+                'page_count': None  # Pourrait être amélioré pour compter les pages
+            }
+        
+        return register_outputs(run_coalesced('merge', input_files, {'linearize': linearize}, merge), 'merge')
 
 def clean_old_sessions(max_age_hours=6):
     """
@@ -279,18 +642,43 @@ def clean_old_sessions(max_age_hours=6):
         now = time.time()
         max_age_seconds = max_age_hours * 3600
         
+        # Fichiers traités et reçus : requête sur l'index (réparé au préalable s'il est temps)
+        indexed_dirs = []
+        try:
+            catalog.reconcile_if_due()
+            expired = catalog.expired(max_age_seconds)
+            removed, freed = catalog.remove_files(expired)
+            storage.discard([row['name'] for row in expired if row['area'] == 'processed'])
+            # Fichiers reçus qui ne sont plus référencés
+            blob_files, blob_freed = blobs.collect(now)
+            removed += blob_files
+            freed += blob_freed
+            if removed:
+                logger.info(f"{removed} fichiers expirés nettoyés ({format_file_size(freed)})")
+            indexed_dirs = ['uploads', 'processed']
+        except sqlite3.Error as e:
+            # Index indisponible : parcours des répertoires
+            logger.error(f"Erreur de l'index des fichiers, nettoyage par parcours: {str(e)}")
+        
         # Nettoyer les répertoires de données
-        for dir_name in ['temp', 'uploads', 'processed']:
+        staging_dir_name = os.path.join('processed', outputs.STAGING_DIR_NAME)
+        for dir_name in ['temp', 'uploads', 'processed', 'locks', 'handles', 'chunked', 'lazy', 'etags', staging_dir_name]:
+            if dir_name in indexed_dirs:
+                continue
             dir_path = os.path.join(current_app.config['DATA_DIR'], dir_name)
             
             if not os.path.exists(dir_path):
                 continue
                 
-            for filename in os.listdir(dir_path):
-                file_path = os.path.join(dir_path, filename)
-                
-                # Si c'est un répertoire dans temp, supprimer tout le répertoire
-                if os.path.isdir(file_path) and dir_name == 'temp':
+            # Fichiers traités : parcours des répertoires de répartition
+            if dir_name == 'processed':
+                paths = [entry.path for entry in outputs.iter_files()]
+            else:
+                paths = [os.path.join(dir_path, filename) for filename in os.listdir(dir_path)]
+            
+            for file_path in paths:
+                # Si c'est un répertoire dans temp (de préparation ou d'un découpage différé), supprimer tout le répertoire
+                if os.path.isdir(file_path) and dir_name in ('temp', 'lazy', staging_dir_name):
                     try:
                         dir_age = now - os.path.getmtime(file_path)
                         if dir_age > max_age_seconds:
@@ -309,6 +697,12 @@ def clean_old_sessions(max_age_hours=6):
                     except Exception as e:
                         logger.error(f"Erreur lors du nettoyage du fichier {file_path}: {str(e)}")
                         
+        # Répertoires de travail en mémoire abandonnés
+        staging.clean_stale(max_age_seconds)
+        
+        # Archives de téléchargement groupé dont les membres ont disparu
+        bundles.clean_stale(max_age_seconds)
+                        
         return True
     except Exception as e:
         logger.error(f"Erreur lors du nettoyage des sessions: {str(e)}")
@@ -326,21 +720,163 @@ def split_pdf(file, page_range=None, **options):
     Divise un fichier PDF en fichiers individuels, un par page
     
     Args:
-        file: Objet fichier à diviser
+        file: Fichier d'entrée sur disque (StagedFile) à diviser
         page_range: Plage de pages à extraire, format: "1,3,5-10"
         **options: Options avancées
         
     Returns:
         Liste de dictionnaires avec les informations sur les fichiers générés
     """
-    temp_dir = get_temp_dir()
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        
+        params = {'page_range': page_range, 'options': options}
+        return register_outputs(run_coalesced('split', [input_path], params,
+                                              lambda: split_saved_pdf(input_path, temp_dir, page_range, **options)),
+                                'split')
+
+def split_pdf_to_zip(file, page_range=None, register_pages=False, linearize=None):
+    """
+    Divise un fichier PDF directement dans une archive ZIP
     
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
+    Le moteur sérialise chaque document produit dans l'archive (mode stocké,
+    CRC calculés au fil de l'écriture) : ni fichier intermédiaire par page, ni
+    relecture pour construire l'archive.
+    
+    Args:
+        file: Fichier d'entrée sur disque (StagedFile) à diviser
+        page_range: Plage de pages, format: "1,3,5-10" (chaque élément donne un document ;
+                    toutes les pages une à une si vide)
+        register_pages: Publier aussi chaque document produit comme fichier individuel
+        linearize: Linéariser les documents produits (None : selon la taille, voir should_linearize)
+        
+    Returns:
+        Dictionnaire décrivant l'archive ('filename', 'path', 'url', 'size', 'handle') et
+        ses membres ('files' : nom, pages, taille, position dans l'archive, et chemin,
+        URL et identifiant si les documents sont publiés)
+    """
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        linearize = should_linearize(file.size, linearize)
+        
+        def split_to_zip():
+            zip_filename = f"split_{uuid.uuid4().hex[:16]}.zip"
+            zip_path = stage.path(zip_filename)
+            
+            # Préparer les arguments pour l'outil C++
+            cmd_args = ["splitzip", input_path, zip_path]
+            if page_range:
+                cmd_args.append(page_range)
+            if register_pages:
+                cmd_args += ["--pages", os.path.join(temp_dir, "page")]
+            if linearize:
+                cmd_args.append(LINEARIZE_OPTION)
+            
+            # Exécuter l'outil
+            returncode, stdout, stderr = run_pdfeditor(cmd_args)
+            
+            if returncode != 0:
+                raise Exception(f"Erreur lors de la division du PDF: {stderr}")
+            
+            manifest = json.loads(stdout)
+            result_files = []
+            for member in manifest['files']:
+                file_info = {
+                    'filename': member['name'],
+                    'name': member['name'],
+                    'size': member['size'],
+                    'page_number': member['first_page'],
+                    'last_page': member['last_page'],
+                    'offset': member['offset'],
+                    'data_offset': member['data_offset'],
+                    'crc': member['crc']
+                }
+                if member.get('path'):
+                    # Publier le document individuel (renommage, sans recopie)
+                    unique_name = f"{uuid.uuid4().hex}_{member['name']}"
+                    file_info['path'] = outputs.commit(member['path'], unique_name)
+                    file_info['url'] = f"/download/{unique_name}"
+                result_files.append(file_info)
+            
+            # Publier l'archive dans le répertoire des fichiers traités (renommage atomique)
+            final_path = stage.commit(zip_path)
+            
+            logger.info(f"PDF divisé dans l'archive {zip_filename}: {len(result_files)} documents")
+            return {
+                'filename': zip_filename,
+                'path': final_path,
+                'url': f"/download/{zip_filename}",
+                'size': manifest['size'],
+                'files': result_files
+            }
+        
+        params = {'page_range': page_range, 'register_pages': register_pages, 'linearize': linearize}
+        result = run_coalesced('splitzip', [input_path], params, split_to_zip)
+        job_id = uuid.uuid4().hex
+        register_outputs(result['files'], 'splitzip', job_id, parent=result['filename'])
+        return register_outputs(result, 'splitzip', job_id)
+
+def extract_pages(input_path, output_path, page_range, linearize=False):
+    """
+    Écrit dans un seul document les pages d'une plage
+    
+    Args:
+        input_path: Chemin vers le fichier PDF d'entrée
+        output_path: Chemin du document à produire
+        page_range: Plage de pages, format: "1,3,5-10" (pages insérées dans l'ordre)
+        linearize: Écrire un PDF linéarisé
+        
+    Returns:
+        str: Chemin du document produit
+    """
+    cmd_args = ["extract", input_path, output_path, page_range]
+    if linearize:
+        cmd_args.append(LINEARIZE_OPTION)
+    returncode, stdout, stderr = run_pdfeditor(cmd_args)
+    if returncode == 0 and os.path.isfile(output_path):
+        return output_path
+    
+    # Solution de secours avec PyPDF2
+    logger.warning(f"Extraction par le moteur impossible, utilisation de PyPDF2: {stderr}")
+    try:
+        from PyPDF2 import PdfReader, PdfWriter
+    except ImportError:
+        raise Exception(f"Erreur lors de l'extraction des pages: {stderr}")
     
+    with open(input_path, 'rb') as f:
+        reader = PdfReader(f)
+        writer = PdfWriter()
+        for item in page_range.split(','):
+            if not item:
+                continue
+            first, _, last = item.partition('-')
+            for page_num in range(int(first), int(last or first) + 1):
+                writer.add_page(reader.pages[page_num - 1])
+        with open(output_path, 'wb') as out_file:
+            writer.write(out_file)
+    return output_path
+
+def split_saved_pdf(input_path, temp_dir, page_range=None, **options):
+    """
+    Divise un PDF déjà sauvegardé dans le répertoire temporaire
+    
+    Args:
+        input_path: Chemin vers le fichier PDF d'entrée
+        temp_dir: Répertoire temporaire pour les opérations
+        page_range: Plage de pages à extraire, format: "1,3,5-10"
+        **options: Options avancées
+        
+    Returns:
+        Liste de dictionnaires avec les informations sur les fichiers générés
+    """
     # Générer un préfixe pour les fichiers de sortie
+    safe_filename = os.path.basename(input_path)
     original_basename = os.path.splitext(safe_filename)[0]
     output_prefix = os.path.join(temp_dir, original_basename)
     
@@ -382,6 +918,8 @@ def split_pdf(file, page_range=None, **options):
     # Si page_range a été défini, l'utiliser
     if page_range:
         cmd_args.append(page_range)
+    if options.get('linearize'):
+        cmd_args.append(LINEARIZE_OPTION)
     
     # Vérifier si l'argument n'est pas trop long
     arg_length = sum(len(arg) for arg in cmd_args)
@@ -400,9 +938,7 @@ def split_pdf(file, page_range=None, **options):
         logger.info("Tentative avec l'approche alternative pour les PDF problématiques")
         return split_pdf_fallback(input_path, temp_dir, "all", options)
     
-    # Déplacer vers le répertoire des fichiers traités
-    processed_dir = get_processed_dir()
-    
+    # Publier dans le répertoire des fichiers traités
     try:
         # Récupérer la liste des fichiers générés
         import json
@@ -424,10 +960,9 @@ def split_pdf(file, page_range=None, **options):
                 
             # Générer un nom unique pour éviter les conflits
             unique_name = f"{uuid.uuid4().hex}_{filename}"
-            dest_path = os.path.join(processed_dir, unique_name)
             
-            # Déplacer le fichier
-            shutil.copy2(source_path, dest_path)
+            # Publier le fichier (renommage, sans recopie)
+            dest_path = outputs.commit(source_path, unique_name)
             
             # URL relative pour le téléchargement
             download_url = f"/download/{unique_name}"
@@ -492,7 +1027,6 @@ def split_pdf_in_batches(input_path, temp_dir, total_pages, **options):
     logger.info(f"Traitement du PDF en {len(batches)} lots")
     
     result_files = []
-    processed_dir = get_processed_dir()
     
     # Traiter chaque lot
     for batch_index, (start_page, end_page) in enumerate(batches):
@@ -521,6 +1055,8 @@ def split_pdf_in_batches(input_path, temp_dir, total_pages, **options):
         
         # Préparer les arguments pour l'outil C++
         cmd_args = ["split", batch_pdf_path, output_prefix]
+        if options.get('linearize'):
+            cmd_args.append(LINEARIZE_OPTION)
         
         # Exécuter l'outil pour ce lot
         returncode, stdout, stderr = run_pdfeditor(cmd_args)
@@ -563,10 +1099,9 @@ def split_pdf_in_batches(input_path, temp_dir, total_pages, **options):
                 
                 # Générer un nom unique pour éviter les conflits
                 unique_name = f"{uuid.uuid4().hex}_{new_filename}"
-                dest_path = os.path.join(processed_dir, unique_name)
                 
-                # Déplacer le fichier
-                shutil.copy2(source_path, dest_path)
+                # Publier le fichier (renommage, sans recopie)
+                dest_path = outputs.commit(source_path, unique_name)
                 
                 # URL relative pour le téléchargement
                 download_url = f"/download/{unique_name}"
@@ -597,36 +1132,22 @@ def split_pdf_in_batches(input_path, temp_dir, total_pages, **options):
     
     return result_files
 
-def split_pdf_by_count(file, pages_per_file, **options):
+def count_pages(input_path):
     """
-    Divise un PDF en fichiers contenant un nombre spécifique de pages chacun
+    Détermine le nombre de pages d'un PDF
     
     Args:
-        file: Objet fichier à diviser
-        pages_per_file: Nombre de pages par fichier de sortie
-        **options: Options avancées
+        input_path: Chemin vers le fichier PDF
         
     Returns:
-        Liste de dictionnaires avec les informations sur les fichiers générés
+        int: Nombre de pages
     """
-    if pages_per_file < 1:
-        raise ValueError("Le nombre de pages par fichier doit être supérieur à 0")
-    
-    temp_dir = get_temp_dir()
-    
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
-    
-    # Obtenir des informations sur le PDF (nombre total de pages)
     total_pages = 0
     try:
         info_cmd_args = ["info", input_path]
         info_returncode, info_stdout, info_stderr = run_pdfeditor(info_cmd_args)
         
         if info_returncode == 0:
-            import json
             info = json.loads(info_stdout)
             if info and 'pageCount' in info:
                 total_pages = info['pageCount']
@@ -643,6 +1164,22 @@ def split_pdf_by_count(file, pages_per_file, **options):
         logger.error(f"Erreur lors de la détermination du nombre de pages: {e}")
         raise Exception("Impossible de déterminer le nombre de pages dans le PDF")
     
+    return total_pages
+
+def build_count_page_range(input_path, pages_per_file):
+    """
+    Construit la plage de pages d'un découpage par nombre de pages
+    
+    Args:
+        input_path: Chemin vers le fichier PDF d'entrée
+        pages_per_file: Nombre de pages par fichier de sortie
+        
+    Returns:
+        str: Plage de pages, format: "1-5,6-10,11"
+    """
+    # Obtenir des informations sur le PDF (nombre total de pages)
+    total_pages = count_pages(input_path)
+    
     # Calculer les plages de pages basées sur le nombre de pages par fichier
     page_ranges = []
     for i in range(0, total_pages, pages_per_file):
@@ -657,6 +1194,26 @@ def split_pdf_by_count(file, pages_per_file, **options):
     page_range = ','.join(page_ranges)
     logger.info(f"Plages de pages générées: {page_range}")
     
+    return page_range
+
+def split_pdf_by_count(file, pages_per_file, **options):
+    """
+    Divise un PDF en fichiers contenant un nombre spécifique de pages chacun
+    
+    Args:
+        file: Fichier d'entrée sur disque (StagedFile) à diviser
+        pages_per_file: Nombre de pages par fichier de sortie
+        **options: Options avancées
+        
+    Returns:
+        Liste de dictionnaires avec les informations sur les fichiers générés
+    """
+    if pages_per_file < 1:
+        raise ValueError("Le nombre de pages par fichier doit être supérieur à 0")
+    
+    # Le fichier reçu est analysé en place ; split_pdf le réutilise sans nouvelle sauvegarde
+    page_range = build_count_page_range(file.path, pages_per_file)
+    
     # Utiliser la fonction standard avec la plage calculée
     return split_pdf(file, page_range, **options)
 
@@ -671,7 +1228,8 @@ def split_pdf_fallback(input_path, temp_dir, page_range=None, options=None):
         input_path: Chemin vers le fichier PDF d'entrée
         temp_dir: Répertoire temporaire pour les opérations
         page_range: Plage de pages à extraire (non utilisé, toutes les pages sont extraites)
-        options: Options supplémentaires (non utilisées actuellement)
+        options: Options supplémentaires ('linearize' : pages extraites par le moteur
+                 pour être linéarisées, PyPDF2 s'il échoue)
         
     Returns:
         Liste de dictionnaires avec les informations sur les fichiers générés
@@ -710,30 +1268,33 @@ def split_pdf_fallback(input_path, temp_dir, page_range=None, options=None):
             # Extraire toutes les pages individuellement
             pages_to_extract = list(range(1, page_count + 1))
             
-            processed_dir = get_processed_dir()
+            linearize = bool((options or {}).get('linearize'))
             
             # Créer un fichier par page
             for page_num in pages_to_extract:
-                # Créer un nouveau PdfWriter
-                writer = PdfWriter()
-                
-                # Ajouter une seule page
-                writer.add_page(reader.pages[page_num - 1])
-                
                 # Générer un nom de fichier unique
                 output_filename = f"{original_name}_page_{page_num}.pdf"
                 unique_id = uuid.uuid4().hex
                 unique_output_filename = f"{unique_id}_{output_filename}"
                 
                 output_path_temp = os.path.join(temp_dir, output_filename)
-                output_path = os.path.join(processed_dir, unique_output_filename)
                 
-                # Écrire le fichier
-                with open(output_path_temp, 'wb') as out_file:
-                    writer.write(out_file)
+                if linearize:
+                    # PyPDF2 n'écrit pas de PDF linéarisé : page extraite par le moteur
+                    extract_pages(input_path, output_path_temp, str(page_num), linearize=True)
+                else:
+                    # Créer un nouveau PdfWriter
+                    writer = PdfWriter()
+                    
+                    # Ajouter une seule page
+                    writer.add_page(reader.pages[page_num - 1])
+                    
+                    # Écrire le fichier
+                    with open(output_path_temp, 'wb') as out_file:
+                        writer.write(out_file)
                 
-                # Déplacer vers le répertoire de traitement
-                shutil.move(output_path_temp, output_path)
+                # Publier dans le répertoire de traitement (renommage, sans recopie)
+                output_path = outputs.commit(output_path_temp, unique_output_filename)
                 
                 result_files.append({
                     'filename': output_filename,  # Utiliser 'filename' pour la cohérence
@@ -751,289 +1312,286 @@ def split_pdf_fallback(input_path, temp_dir, page_range=None, options=None):
         logger.exception(f"Erreur lors de la division du PDF avec la méthode de secours: {str(e)}")
         raise Exception(f"Impossible de diviser le PDF: {str(e)}")
 
-def compress_pdf(file, quality="medium"):
+def compress_pdf(file, quality="medium", linearize=None):
     """
     Compresse un fichier PDF
     
     Args:
-        file: Objet fichier à compresser
+        file: Fichier d'entrée sur disque (StagedFile) à compresser
         quality: Niveau de compression (low, medium, high)
+        linearize: Linéariser le document produit (None : selon la taille, voir should_linearize)
         
     Returns:
         Dictionnaire avec les informations sur le fichier compressé
     """
-    temp_dir = get_temp_dir()
-    
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
-    
-    # Générer un nom de fichier de sortie
-    output_filename = f"compressed_{uuid.uuid4()}.pdf"
-    output_path = os.path.join(temp_dir, output_filename)
-    
-    # Préparer les arguments pour l'outil C++
-    cmd_args = ["compress", input_path, output_path, quality]
-    
-    # Exécuter l'outil
-    returncode, stdout, stderr = run_pdfeditor(cmd_args)
-    
-    if returncode != 0:
-        # Nettoyer
-        shutil.rmtree(temp_dir)
-        raise Exception(f"Erreur lors de la compression du PDF: {stderr}")
-    
-    # Déplacer vers le répertoire des fichiers traités
-    processed_dir = get_processed_dir()
-    final_path = os.path.join(processed_dir, output_filename)
-    shutil.move(output_path, final_path)
-    
-    # Nettoyer les fichiers temporaires
-    shutil.rmtree(temp_dir)
-    
-    return {
-        'filename': output_filename,
-        'path': final_path,
-        'url': f"/download/{output_filename}"
-    }
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        linearize = should_linearize(file.size, linearize)
+        
+        def compress():
+            # Générer un nom de fichier de sortie
+            output_filename = f"compressed_{uuid.uuid4()}.pdf"
+            output_path = os.path.join(temp_dir, output_filename)
+            
+            # Préparer les arguments pour l'outil C++
+            cmd_args = ["compress", input_path, output_path, quality]
+            if linearize:
+                cmd_args.append(LINEARIZE_OPTION)
+            
+            # Exécuter l'outil
+            returncode, stdout, stderr = run_pdfeditor(cmd_args)
+            
+            if returncode != 0:
+                raise Exception(f"Erreur lors de la compression du PDF: {stderr}")
+            
+            # Publier dans le répertoire des fichiers traités (renommage atomique)
+            final_path = stage.commit(output_path)
+            
+            return {
+                'filename': output_filename,
+                'path': final_path,
+                'url': f"/download/{output_filename}"
+            }
+        
+        return register_outputs(run_coalesced('compress', [input_path], {'quality': quality, 'linearize': linearize}, compress), 'compress')
 
 def rotate_pdf(file, degrees):
     """
     Fait pivoter un fichier PDF
     
     Args:
-        file: Objet fichier à faire pivoter
+        file: Fichier d'entrée sur disque (StagedFile) à faire pivoter
         degrees: Angle de rotation (90, 180, 270)
         
     Returns:
         Dictionnaire avec les informations sur le fichier pivoté
     """
-    temp_dir = get_temp_dir()
-    
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
-    
-    # Générer un nom de fichier de sortie
-    output_filename = f"rotated_{uuid.uuid4()}.pdf"
-    output_path = os.path.join(temp_dir, output_filename)
-    
-    # Préparer les arguments pour l'outil C++
-    cmd_args = ["rotate", input_path, output_path, str(degrees)]
-    
-    # Exécuter l'outil
-    returncode, stdout, stderr = run_pdfeditor(cmd_args)
-    
-    if returncode != 0:
-        # Nettoyer
-        shutil.rmtree(temp_dir)
-        raise Exception(f"Erreur lors de la rotation du PDF: {stderr}")
-    
-    # Déplacer vers le répertoire des fichiers traités
-    processed_dir = get_processed_dir()
-    final_path = os.path.join(processed_dir, output_filename)
-    shutil.move(output_path, final_path)
-    
-    # Nettoyer les fichiers temporaires
-    shutil.rmtree(temp_dir)
-    
-    return {
-        'filename': output_filename,
-        'path': final_path,
-        'url': f"/download/{output_filename}"
-    }
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        
+        def rotate():
+            # Générer un nom de fichier de sortie
+            output_filename = f"rotated_{uuid.uuid4()}.pdf"
+            output_path = os.path.join(temp_dir, output_filename)
+            
+            # Préparer les arguments pour l'outil C++
+            cmd_args = ["rotate", input_path, output_path, str(degrees)]
+            
+            # Exécuter l'outil
+            returncode, stdout, stderr = run_pdfeditor(cmd_args)
+            
+            if returncode != 0:
+                raise Exception(f"Erreur lors de la rotation du PDF: {stderr}")
+            
+            # Publier dans le répertoire des fichiers traités (renommage atomique)
+            final_path = stage.commit(output_path)
+            
+            return {
+                'filename': output_filename,
+                'path': final_path,
+                'url': f"/download/{output_filename}"
+            }
+        
+        return register_outputs(run_coalesced('rotate', [input_path], {'degrees': degrees}, rotate), 'rotate')
 
 def watermark_pdf(file, text, opacity=0.5):
     """
     Ajoute un filigrane à un fichier PDF
     
     Args:
-        file: Objet fichier à traiter
+        file: Fichier d'entrée sur disque (StagedFile) à traiter
         text: Texte du filigrane
         opacity: Opacité du filigrane (entre 0 et 1)
         
     Returns:
         Dictionnaire avec les informations sur le fichier traité
     """
-    temp_dir = get_temp_dir()
-    
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
-    
-    # Valider l'opacité
-    try:
-        opacity_value = float(opacity)
-        if opacity_value < 0 or opacity_value > 1:
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        
+        # Valider l'opacité
+        try:
+            opacity_value = float(opacity)
+            if opacity_value < 0 or opacity_value > 1:
+                opacity_value = 0.5
+        except (ValueError, TypeError):
             opacity_value = 0.5
-    except (ValueError, TypeError):
-        opacity_value = 0.5
-    
-    # Générer un nom de fichier de sortie
-    output_filename = f"watermarked_{uuid.uuid4()}.pdf"
-    output_path = os.path.join(temp_dir, output_filename)
-    
-    # Préparer les arguments pour l'outil C++
-    cmd_args = ["watermark", input_path, output_path, text, str(opacity_value)]
-    
-    # Exécuter l'outil
-    logger.info(f"Exécution de watermark_pdf avec les arguments: {cmd_args}")
-    returncode, stdout, stderr = run_pdfeditor(cmd_args)
-    
-    if returncode != 0:
-        # Nettoyer
-        shutil.rmtree(temp_dir)
-        logger.error(f"Erreur lors de l'ajout du filigrane: {stderr}")
-        raise Exception(f"Erreur lors de l'ajout du filigrane: {stderr}")
-    
-    # Vérifier que le fichier de sortie existe
-    if not os.path.exists(output_path):
-        shutil.rmtree(temp_dir)
-        logger.error(f"Le fichier de sortie n'a pas été créé: {output_path}")
-        raise Exception("Le fichier de sortie n'a pas été créé")
-    
-    # Déplacer vers le répertoire des fichiers traités
-    processed_dir = get_processed_dir()
-    final_path = os.path.join(processed_dir, output_filename)
-    shutil.move(output_path, final_path)
-    
-    # Collecter des informations sur le traitement
-    file_info = {
-        'filename': output_filename,
-        'path': final_path,
-        'url': f"/download/{output_filename}",
-        'watermark_text': text,
-        'watermark_opacity': opacity_value,
-        'original_size': os.path.getsize(input_path) if os.path.exists(input_path) else 0,
-        'processed_size': os.path.getsize(final_path)
-    }
-    
-    # Ajouter des informations formatées pour l'UI
-    file_info['original_size_formatted'] = format_file_size(file_info['original_size'])
-    file_info['processed_size_formatted'] = format_file_size(file_info['processed_size'])
-    
-    # Sortie de débogage
-    logger.info(f"Filigrane ajouté avec succès: {output_filename}")
-    
-    # Nettoyer les fichiers temporaires
-    shutil.rmtree(temp_dir)
-    
-    return file_info
+        
+        def watermark():
+            # Générer un nom de fichier de sortie
+            output_filename = f"watermarked_{uuid.uuid4()}.pdf"
+            output_path = os.path.join(temp_dir, output_filename)
+            
+            # Préparer les arguments pour l'outil C++
+            cmd_args = ["watermark", input_path, output_path, text, str(opacity_value)]
+            
+            # Exécuter l'outil
+            logger.info(f"Exécution de watermark_pdf avec les arguments: {cmd_args}")
+            returncode, stdout, stderr = run_pdfeditor(cmd_args)
+            
+            if returncode != 0:
+                logger.error(f"Erreur lors de l'ajout du filigrane: {stderr}")
+                raise Exception(f"Erreur lors de l'ajout du filigrane: {stderr}")
+            
+            # Vérifier que le fichier de sortie existe
+            if not os.path.exists(output_path):
+                logger.error(f"Le fichier de sortie n'a pas été créé: {output_path}")
+                raise Exception("Le fichier de sortie n'a pas été créé")
+            
+            # Publier dans le répertoire des fichiers traités (renommage atomique)
+            final_path = stage.commit(output_path)
+            
+            # Collecter des informations sur le traitement
+            file_info = {
+                'filename': output_filename,
+                'path': final_path,
+                'url': f"/download/{output_filename}",
+                'watermark_text': text,
+                'watermark_opacity': opacity_value,
+                'original_size': os.path.getsize(input_path) if os.path.exists(input_path) else 0,
+                'processed_size': os.path.getsize(final_path)
+            }
+            
+            # Ajouter des informations formatées pour l'UI
+            file_info['original_size_formatted'] = format_file_size(file_info['original_size'])
+            file_info['processed_size_formatted'] = format_file_size(file_info['processed_size'])
+            
+            # Sortie de débogage
+            logger.info(f"Filigrane ajouté avec succès: {output_filename}")
+            
+            return file_info
+        
+        params = {'text': text, 'opacity': opacity_value}
+        return register_outputs(run_coalesced('watermark', [input_path], params, watermark), 'watermark')
 
 def protect_pdf(file, password):
     """
     Protège un fichier PDF avec un mot de passe
     
     Args:
-        file: Objet fichier à protéger
+        file: Fichier d'entrée sur disque (StagedFile) à protéger
         password: Mot de passe pour protéger le fichier
         
     Returns:
         Dictionnaire avec les informations sur le fichier protégé
     """
-    temp_dir = get_temp_dir()
-    
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
-    
-    # Générer un nom de fichier de sortie
-    output_filename = f"protected_{uuid.uuid4()}.pdf"
-    output_path = os.path.join(temp_dir, output_filename)
-    
-    # Préparer les arguments pour l'outil C++
-    cmd_args = ["protect", input_path, output_path, password]
-    
-    # Exécuter l'outil
-    returncode, stdout, stderr = run_pdfeditor(cmd_args)
-    
-    if returncode != 0:
-        # Nettoyer
-        shutil.rmtree(temp_dir)
-        raise Exception(f"Erreur lors de la protection du PDF: {stderr}")
-    
-    # Déplacer vers le répertoire des fichiers traités
-    processed_dir = get_processed_dir()
-    final_path = os.path.join(processed_dir, output_filename)
-    shutil.move(output_path, final_path)
-    
-    # Nettoyer les fichiers temporaires
-    shutil.rmtree(temp_dir)
-    
-    return {
-        'filename': output_filename,
-        'path': final_path,
-        'url': f"/download/{output_filename}"
-    }
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        
+        def protect():
+            # Générer un nom de fichier de sortie
+            output_filename = f"protected_{uuid.uuid4()}.pdf"
+            output_path = os.path.join(temp_dir, output_filename)
+            
+            # Préparer les arguments pour l'outil C++
+            cmd_args = ["protect", input_path, output_path, password]
+            
+            # Exécuter l'outil
+            returncode, stdout, stderr = run_pdfeditor(cmd_args)
+            
+            if returncode != 0:
+                raise Exception(f"Erreur lors de la protection du PDF: {stderr}")
+            
+            # Publier dans le répertoire des fichiers traités (renommage atomique)
+            final_path = stage.commit(output_path)
+            
+            return {
+                'filename': output_filename,
+                'path': final_path,
+                'url': f"/download/{output_filename}"
+            }
+        
+        # Le mot de passe n'entre dans la clé que sous forme d'empreinte
+        params = {'password': hashlib.sha256(password.encode('utf-8')).hexdigest()}
+        return register_outputs(run_coalesced('protect', [input_path], params, protect), 'protect')
 
 def unlock_pdf(file, password):
     """
     Déverrouille un fichier PDF protégé par mot de passe
     
     Args:
-        file: Objet fichier à déverrouiller
+        file: Fichier d'entrée sur disque (StagedFile) à déverrouiller
         password: Mot de passe pour déverrouiller le fichier
         
     Returns:
         Dictionnaire avec les informations sur le fichier déverrouillé
     """
-    temp_dir = get_temp_dir()
-    
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
-    
-    # Générer un nom de fichier de sortie
-    output_filename = f"unlocked_{uuid.uuid4()}.pdf"
-    output_path = os.path.join(temp_dir, output_filename)
-    
-    # Préparer les arguments pour l'outil C++
-    cmd_args = ["unlock", input_path, output_path, password]
-    
-    # Exécuter l'outil
-    returncode, stdout, stderr = run_pdfeditor(cmd_args)
-    
-    if returncode != 0:
-        # Nettoyer
-        shutil.rmtree(temp_dir)
-        raise Exception(f"Erreur lors du déverrouillage du PDF: {stderr}")
-    
-    # Déplacer vers le répertoire des fichiers traités
-    processed_dir = get_processed_dir()
-    final_path = os.path.join(processed_dir, output_filename)
-    shutil.move(output_path, final_path)
-    
-    # Nettoyer les fichiers temporaires
-    shutil.rmtree(temp_dir)
-    
-    return {
-        'filename': output_filename,
-        'path': final_path,
-        'url': f"/download/{output_filename}"
-    }
+    # Répertoire de préparation sur le système de fichiers de processed, supprimé en sortie
+    with outputs.OutputStage() as stage:
+        temp_dir = stage.dir
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        
+        def unlock():
+            # Générer un nom de fichier de sortie
+            output_filename = f"unlocked_{uuid.uuid4()}.pdf"
+            output_path = os.path.join(temp_dir, output_filename)
+            
+            # Préparer les arguments pour l'outil C++
+            cmd_args = ["unlock", input_path, output_path, password]
+            
+            # Exécuter l'outil
+            returncode, stdout, stderr = run_pdfeditor(cmd_args)
+            
+            if returncode != 0:
+                raise Exception(f"Erreur lors du déverrouillage du PDF: {stderr}")
+            
+            # Publier dans le répertoire des fichiers traités (renommage atomique)
+            final_path = stage.commit(output_path)
+            
+            return {
+                'filename': output_filename,
+                'path': final_path,
+                'url': f"/download/{output_filename}"
+            }
+        
+        # Le mot de passe n'entre dans la clé que sous forme d'empreinte
+        params = {'password': hashlib.sha256(password.encode('utf-8')).hexdigest()}
+        return register_outputs(run_coalesced('unlock', [input_path], params, unlock), 'unlock')
 
 def get_pdf_info(file):
     """
     Obtient des informations sur un fichier PDF
     
     Args:
-        file: Objet fichier à analyser
+        file: Fichier d'entrée sur disque (StagedFile) à analyser
         
     Returns:
         Dictionnaire avec les informations sur le fichier PDF
     """
     temp_dir = get_temp_dir()
     
-    # Sauvegarder le fichier d'entrée
-    safe_filename = secure_filename(file.filename)
-    input_path = os.path.join(temp_dir, safe_filename)
-    file.save(input_path)
+    try:
+        # Fichier d'entrée déjà sur disque : pas de recopie
+        input_path = get_input_path(file, temp_dir)
+        
+        return run_coalesced('info', [input_path], {}, lambda: read_pdf_info(input_path))
+    finally:
+        # Nettoyer les fichiers temporaires dans tous les cas
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def read_pdf_info(input_path):
+    """
+    Analyse un PDF déjà sauvegardé avec l'outil info
     
+    Args:
+        input_path: Chemin vers le fichier PDF
+        
+    Returns:
+        Dictionnaire avec les informations sur le fichier PDF
+    """
     # Préparer les arguments pour l'outil C++
     cmd_args = ["info", input_path]
     
@@ -1041,13 +1599,10 @@ def get_pdf_info(file):
     returncode, stdout, stderr = run_pdfeditor(cmd_args)
     
     if returncode != 0:
-        # Nettoyer
-        shutil.rmtree(temp_dir)
         raise Exception(f"Erreur lors de l'obtention des informations du PDF: {stderr}")
     
     # Analyser la sortie JSON
     try:
-        import json
         pdf_info = json.loads(stdout)
         
         # Ajouter des informations supplémentaires
@@ -1055,9 +1610,6 @@ def get_pdf_info(file):
             pdf_info['size'] = os.path.getsize(input_path)
             pdf_info['size_formatted'] = format_file_size(pdf_info['size'])
         
-        # Nettoyer les fichiers temporaires
-        shutil.rmtree(temp_dir)
-        
         return pdf_info
     except json.JSONDecodeError as e:
         logger.error(f"Erreur lors de l'analyse de la sortie JSON: {e}")
@@ -1066,7 +1618,7 @@ def get_pdf_info(file):
         # Format de secours si le format JSON n'est pas disponible
         # Analyser la sortie texte brute
         result = {
-            'fileName': safe_filename,
+            'fileName': os.path.basename(input_path),
             'filePath': input_path,
             'size': os.path.getsize(input_path),
             'size_formatted': format_file_size(os.path.getsize(input_path))
@@ -1084,9 +1636,6 @@ def get_pdf_info(file):
                 
         result['pageCount'] = page_count
         
-        # Nettoyer les fichiers temporaires
-        shutil.rmtree(temp_dir)
-        
         return result
 
 def format_file_size(size_bytes):
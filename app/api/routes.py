@@ -1,35 +1,144 @@
 """
 API Routes for PDF processing
 """
-from flask import Blueprint, request, jsonify, current_app, send_file, after_this_request, url_for
+from flask import Blueprint, request, jsonify, current_app, url_for, Response, redirect, stream_with_context
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
 import os
 import zipfile
 import traceback
-from io import BytesIO
 from . import pdf_processor
+from . import documents
+from . import blobs
+from . import uploads
+from . import jobs
+from . import ingest
+from . import outputs
+from . import zipstream
+from . import archives
+from . import lazysplit
+from . import bundles
+from . import delivery
+from . import catalog
+from . import storage
 import uuid
-import io
-import shutil
 import json
 import re
+import base64
+import mimetypes
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
-@api.route('/pdf-info', methods=['POST'])
-def pdf_info():
-    """Get PDF information"""
-    try:
+def get_input_file():
+    """
+    Get the PDF to process: an uploaded file ('file') or a document handle ('handle')
+    
+    Returns:
+        Tuple (file, error_response) - file is a StagedFile on disk, error_response
+        is None when the input is valid
+    """
+    handle = request.form.get('handle') or request.args.get('handle')
+    if handle:
+        try:
+            file = documents.resolve(handle.strip())
+        except documents.DocumentHandleError as e:
+            return None, (jsonify({'error': str(e)}), e.status_code)
+        # Contenu conservé pendant le traitement
+        blobs.pin([file])
+    else:
         if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
+            return None, (jsonify({'error': 'No file provided'}), 400)
             
         file = request.files['file']
         
         if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+            return None, (jsonify({'error': 'No file selected'}), 400)
+        
+        # Fichier déjà écrit sur disque pendant la lecture de la requête
+        file = ingest.stage(file)
+        
+    # L'en-tête a été vérifié à la réception (is_pdf vaut None pour un document stocké)
+    if not file.filename.lower().endswith('.pdf') or file.is_pdf is False:
+        return None, (jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400)
+        
+    return file, None
+
+def get_linearize_option():
+    """
+    Requested linearization (fast web view) of the produced PDFs
+    
+    Returns:
+        True or False when the request sets 'linearize', None to decide from the
+        input size (see pdf_processor.should_linearize)
+    """
+    value = (request.values.get('linearize') or '').strip().lower()
+    if value in ('true', '1', 'yes'):
+        return True
+    if value in ('false', '0', 'no'):
+        return False
+    return None
+
+def is_piped_request():
+    """
+    Whether the request body is the raw PDF (Content-Type: application/pdf)
+    
+    Such requests are processed in pipe mode: the body is streamed into the
+    engine and its output streamed back, without intermediate files.
+    """
+    return request.mimetype == 'application/pdf'
+
+def piped_response(operation, prefix, *params):
+    """
+    Process a raw PDF request body in pipe mode
+    
+    The result is streamed back as the response body, or published in the
+    processed files when the query string contains store=true.
+    
+    Args:
+        operation: Single-output engine operation (compress, rotate...)
+        prefix: Prefix of the output filename
+        params: Operation parameters, in engine order
+        
+    Returns:
+        Flask response
+    """
+    max_length = current_app.config.get('MAX_CONTENT_LENGTH')
+    if not request.content_length:
+        return jsonify({'error': 'No file provided'}), 400
+    if max_length and request.content_length > max_length:
+        return jsonify({'error': 'File too large'}), 413
+    
+    try:
+        linearize = pdf_processor.should_linearize(request.content_length, get_linearize_option())
+        chunks = pdf_processor.process_stream(operation, request.stream, *params, linearize=linearize)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if request.args.get('store', 'false').lower() == 'true':
+        result = pdf_processor.store_stream(chunks, prefix, operation)
+        return jsonify({
+            'status': 'success',
+            'downloadUrl': result['url'],
+            'filename': result['filename'],
+            'handle': result.get('handle')
+        })
+    
+    # Résultat renvoyé au fil de l'eau, sans passer par le disque
+    download_name = secure_filename(request.args.get('filename', '')) or 'document.pdf'
+    return Response(
+        chunks,
+        mimetype='application/pdf',
+        headers={'Content-Disposition': f'attachment; filename="{prefix}_{download_name}"'}
+    )
+
+@api.route('/pdf-info', methods=['POST'])
+def pdf_info():
+    """Get PDF information"""
+    try:
+        # Fichier envoyé ou identifiant d'un document déjà stocké
+        file, error_response = get_input_file()
+        if error_response:
+            return error_response
             
         # Get PDF information
         info = pdf_processor.get_pdf_info(file)
@@ -50,12 +159,21 @@ def merge_pdf():
         print("API: merge-pdf endpoint called")
         
         # Vérifie les différents formats possibles pour les fichiers
-        if 'files[]' in request.files:
+        handles = request.form.getlist('handles[]') or request.form.getlist('handles')
+        if handles:
+            current_app.logger.debug(f"Merging {len(handles)} document handles")
+            try:
+                files = documents.resolve_many(handles)
+            except documents.DocumentHandleError as e:
+                return jsonify({'error': str(e)}), e.status_code
+            # Contenus conservés pendant le traitement
+            blobs.pin(files)
+        elif 'files[]' in request.files:
             print("API: Using files[] parameter")
-            files = request.files.getlist('files[]')
+            files = [ingest.stage(f) for f in request.files.getlist('files[]')]
         elif 'files' in request.files:
             print("API: Using files parameter")
-            files = request.files.getlist('files')
+            files = [ingest.stage(f) for f in request.files.getlist('files')]
         else:
             print("API: No files provided in request")
             print(f"Available keys: {list(request.files.keys())}")
@@ -82,7 +200,7 @@ def merge_pdf():
         print(f"API: Directories exist: {os.path.exists(current_app.config.get('DATA_DIR'))}, {os.path.exists(current_app.config.get('UPLOAD_FOLDER'))}")
         
         # Merge PDFs
-        result = pdf_processor.merge_pdfs(files)
+        result = pdf_processor.merge_pdfs(files, get_linearize_option())
         
         print(f"API: Merge successful, result = {result}")
         return jsonify({
@@ -97,26 +215,101 @@ def merge_pdf():
         print(f"API ERROR Traceback: {traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
+def split_archive_response(archive, size_warning=None):
+    """
+    Response for a split written directly into a ZIP archive by the engine
+    
+    Args:
+        archive: Result of pdf_processor.split_pdf_to_zip
+        size_warning: Optional large-file warning
+        
+    Returns:
+        Flask JSON response, in the format of multi-file splits
+    """
+    files = archive['files']
+    response = {
+        "success": True,
+        "message": f"PDF divisé avec succès en {len(files)} fichiers.",
+        "files_count": len(files),
+        "download_url": url_for('main.download_file', filename=archive['filename'], _external=False),
+        "is_zip": True,
+        "filename": archive['filename'],
+        "handle": archive.get('handle'),
+        "data": {
+            "files": [
+                {
+                    "filename": file_info.get("filename"),
+                    "size": file_info.get("size", 0),
+                    "size_formatted": pdf_processor.format_file_size(file_info.get("size", 0)),
+                    "page_number": file_info.get("page_number", 0),
+                    "handle": file_info.get("handle"),
+                    # Document publié individuellement (register_pages), sinon servi depuis l'archive
+                    "url": url_for('main.download_file', filename=os.path.basename(file_info['path']), _external=False)
+                           if file_info.get("path") else
+                           url_for('api.download_archive_member', zip_filename=archive['filename'],
+                                   member_name=file_info['filename'], _external=False)
+                }
+                for file_info in files
+            ]
+        }
+    }
+    if size_warning:
+        response['warning'] = size_warning
+    return jsonify(response)
+
+def lazy_split_response(index, size_warning=None):
+    """
+    Response for a lazy split: per-document URLs, nothing generated yet
+    
+    Args:
+        index: Split index returned by lazysplit.create
+        size_warning: Optional large-file warning
+        
+    Returns:
+        Flask JSON response, in the format of multi-file splits
+    """
+    split_id = index['split_id']
+    documents_count = len(index['documents'])
+    response = {
+        "success": True,
+        "message": f"PDF divisé avec succès en {documents_count} fichiers.",
+        "files_count": documents_count,
+        # L'archive n'est construite qu'à sa première demande
+        "download_url": url_for('api.download_lazy_split_archive', split_id=split_id, _external=False),
+        "is_zip": False,
+        "lazy": True,
+        "split_id": split_id,
+        "page_count": index['page_count'],
+        "data": {
+            "files": [
+                {
+                    "filename": document['name'],
+                    "size": None,
+                    "size_formatted": "-",
+                    "page_number": document['first_page'],
+                    "last_page": document['last_page'],
+                    "url": url_for('api.download_lazy_split_document', split_id=split_id,
+                                   number=number, _external=False)
+                }
+                for number, document in enumerate(index['documents'], start=1)
+            ]
+        }
+    }
+    if size_warning:
+        response['warning'] = size_warning
+    return jsonify(response)
+
 @api.route('/split-pdf', methods=['POST'])
 def split_pdf():
     """Split a PDF"""
     try:
         print("API: split-pdf endpoint called")
         
-        if 'file' not in request.files:
-            print("API: No file provided in request")
+        # Fichier envoyé ou identifiant d'un document déjà stocké
+        file, error_response = get_input_file()
+        if error_response:
             print(f"Available keys: {list(request.files.keys())}")
-            return jsonify({'error': 'No file provided'}), 400
-            
-        file = request.files['file']
-        
-        if file.filename == '':
-            print("API: Empty filename")
-            return jsonify({'error': 'No file selected'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            print(f"API: Invalid file type: {file.filename}")
-            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+            return error_response
         
         # Print all form data for debugging
         print(f"API: Form data: {request.form}")
@@ -128,9 +321,7 @@ def split_pdf():
         print(f"API: Split method: {split_method}, Page range: {page_range}")
         
         # Vérifier la taille du fichier
-        file.seek(0, os.SEEK_END)
-        file_size = file.tell()
-        file.seek(0)
+        file_size = file.size
         
         # Si le fichier est trop grand, donnez un avertissement
         size_warning = None
@@ -172,11 +363,52 @@ def split_pdf():
         options = {
             'optimize': optimize,
             'single_files': single_files,
-            'output_naming': output_naming
+            'output_naming': output_naming,
+            'linearize': pdf_processor.should_linearize(file.size, get_linearize_option())
         }
         
         # Déterminer la méthode de division appropriée à appeler
         try:
+            # Découpage différé : seul l'index est construit, chaque document est produit à sa demande
+            if request.form.get('lazy', 'false').lower() == 'true':
+                lazy_pages_per_file = None
+                if split_method == 'count' and page_range.startswith('count:'):
+                    if pages_per_file < 1:
+                        return jsonify({'error': 'Le nombre de pages par fichier doit être supérieur à 0'}), 400
+                    lazy_pages_per_file = pages_per_file
+                try:
+                    index = lazysplit.create(file, request_page_range, lazy_pages_per_file, options['linearize'])
+                except lazysplit.LazySplitError as e:
+                    return jsonify({'error': str(e), 'status': 'error'}), e.status_code
+                return lazy_split_response(index, size_warning)
+            
+            # Plusieurs documents attendus (d'après les groupes de pages, avant tout traitement) :
+            # le moteur les écrit directement dans l'archive
+            register_pages = request.form.get('register_pages', 'false').lower() == 'true'
+            groups = None
+            page_count = None
+            if split_method in ('range', 'extract') and (not request_page_range or ',' in request_page_range):
+                page_count = pdf_processor.count_pages(file.path)
+                try:
+                    groups = lazysplit.parse_page_groups(request_page_range, page_count)
+                except lazysplit.LazySplitError:
+                    # Plage signalée par le découpage classique
+                    groups = None
+            elif split_method == 'count' and pages_per_file >= 1:
+                page_count = pdf_processor.count_pages(file.path)
+                groups = lazysplit.count_page_groups(page_count, pages_per_file)
+            
+            if groups and len(groups) > 1:
+                try:
+                    # Une page par document : plage vide (défaut du moteur) plutôt qu'une liste de toutes les pages
+                    archive = pdf_processor.split_pdf_to_zip(file, lazysplit.format_page_range(groups, page_count),
+                                                             register_pages, options['linearize'])
+                except Exception as e:
+                    # Découpage classique (fichiers par page puis archive) si le moteur échoue
+                    current_app.logger.warning(f"Split into archive failed, using page files: {str(e)}")
+                else:
+                    return split_archive_response(archive, size_warning)
+            
             if split_method == 'range' or split_method == 'extract':
                 # Pour 'range' et 'extract', on utilise le même backend mais avec une plage de pages différente
                 output_files = pdf_processor.split_pdf(file, request_page_range, **options)
@@ -220,60 +452,43 @@ def split_pdf():
                 zip_filename = f"split_{download_id}.zip"
                 
                 # Créer physiquement le fichier ZIP pour qu'il apparaisse dans My Files
-                processed_dir = current_app.config.get('PROCESSED_FOLDER', '/tmp/processed')
-                temp_dir = current_app.config.get('TEMP_FOLDER', '/tmp/uploads')
-                
-                # Ensure the directories exist
-                os.makedirs(processed_dir, exist_ok=True)
-                os.makedirs(temp_dir, exist_ok=True)
-                
-                zip_temp_path = os.path.join(temp_dir, zip_filename)
-                zip_dest_path = os.path.join(processed_dir, zip_filename)
-                
-                print(f"API: Creating ZIP file at {zip_temp_path}")
-                
-                # Créer un fichier ZIP avec les fichiers générés
-                with zipfile.ZipFile(zip_temp_path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                    for file_info in output_files:
-                        source_path = file_info.get('path')
-                        arc_name = file_info.get('filename')  # Nom dans l'archive
-                        if os.path.exists(source_path):
-                            print(f"API: Adding file to ZIP: {source_path}")
-                            zip_file.write(source_path, arcname=arc_name)
-                
-                # Vérifier que le ZIP a bien été créé
-                if not os.path.exists(zip_temp_path):
-                    print(f"API: ERROR - ZIP file was not created at {zip_temp_path}")
-                    return jsonify({'error': 'Failed to create ZIP file'}), 500
-                
-                # Déplacer le ZIP vers le répertoire de traitement
-                try:
-                    shutil.move(zip_temp_path, zip_dest_path)
-                    print(f"API: ZIP file successfully moved to {zip_dest_path}")
+                # (préparé à côté du répertoire de traitement, puis publié par renommage)
+                with outputs.OutputStage() as stage:
+                    zip_temp_path = stage.path(zip_filename)
                     
-                    # Vérifier que le ZIP a bien été créé dans le répertoire de traitement
-                    print(f"API: ZIP file exists at destination: {os.path.exists(zip_dest_path)}")
-                    print(f"API: ZIP file size: {os.path.getsize(zip_dest_path) if os.path.exists(zip_dest_path) else 'N/A'}")
-                except Exception as e:
-                    print(f"API: ERROR - Failed to move ZIP file: {str(e)}")
-                    # If the move fails, try a copy instead
+                    current_app.logger.debug(f"Creating ZIP file at {zip_temp_path}")
+                    
+                    # Créer un fichier ZIP avec les fichiers générés (stockés : servis en place depuis l'archive)
+                    with zipfile.ZipFile(zip_temp_path, 'w', zipfile.ZIP_STORED) as zip_file:
+                        for file_info in output_files:
+                            source_path = file_info.get('path')
+                            arc_name = file_info.get('filename')  # Nom dans l'archive
+                            if os.path.exists(source_path):
+                                current_app.logger.debug(f"Adding file to ZIP: {source_path}")
+                                zip_file.write(source_path, arcname=arc_name)
+                    
+                    # Publier le ZIP dans le répertoire de traitement
                     try:
-                        shutil.copy(zip_temp_path, zip_dest_path)
-                        print(f"API: ZIP file successfully copied to {zip_dest_path}")
-                    except Exception as copy_error:
-                        print(f"API: ERROR - Failed to copy ZIP file: {str(copy_error)}")
+                        zip_dest_path = stage.commit(zip_temp_path)
+                        current_app.logger.info(f"ZIP file committed to {zip_dest_path}")
+                    except OSError as e:
+                        current_app.logger.error(f"Failed to save ZIP file: {str(e)}")
                         return jsonify({'error': f'Failed to save ZIP file: {str(e)}'}), 500
                 
-                # Si la chaîne est trop longue, utiliser plutôt l'ID de session
+                # Enregistrer le ZIP avec les documents du même traitement
+                job_id = output_files[0].get('job_id')
+                pdf_processor.register_outputs({'filename': zip_filename, 'path': zip_dest_path}, 'split', job_id)
+                
+                # Si la chaîne est trop longue, utiliser plutôt le traitement de la session
                 if len(filenames) > 2000:
-                    download_url = url_for('main.download_session_files', session_id=session_id, clean=False, _external=False)
-                    print(f"API: URL too long, using session ID instead: {session_id}")
+                    download_url = url_for('main.download_session_files', session_id=session_id, job=job_id, clean=False, _external=False)
+                    current_app.logger.debug(f"URL too long, using session job instead: {job_id}")
                 else:
                     download_url = url_for('main.download_all_files', files=filenames, clean=False, _external=False)
                 
                 # Ajouter une URL directe pour le fichier ZIP
                 zip_download_url = url_for('main.download_file', filename=zip_filename, _external=False)
-                print(f"API: Direct ZIP download URL: {zip_download_url}")
+                current_app.logger.debug(f"Direct ZIP download URL: {zip_download_url}")
                 
                 # Format de réponse simplifié pour les téléchargements multiples
                 return jsonify({
@@ -290,6 +505,7 @@ def split_pdf():
                                 "size": file_info.get("size", 0),
                                 "size_formatted": pdf_processor.format_file_size(file_info.get("size", 0)),
                                 "page_number": file_info.get("page_number", 0),
+                                "handle": file_info.get("handle"),
                                 "url": url_for('main.download_file', filename=os.path.basename(file_info.get("path", "")), _external=False)
                             } 
                             for file_info in output_files
@@ -378,24 +594,23 @@ def split_pdf():
 def compress_pdf():
     """Compress a PDF"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-            
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+        # Corps brut (application/pdf) : mode flux ; sinon fichier envoyé ou identifiant
+        piped = is_piped_request()
+        if not piped:
+            file, error_response = get_input_file()
+            if error_response:
+                return error_response
         
         # Get compression quality
-        quality = request.form.get('quality', 'medium')
+        quality = request.values.get('quality', 'medium')
         if quality not in ['low', 'medium', 'high']:
             quality = 'medium'
         
+        if piped:
+            return piped_response('compress', 'compressed', quality)
+        
         # Compress the PDF
-        result = pdf_processor.compress_pdf(file, quality)
+        result = pdf_processor.compress_pdf(file, quality, get_linearize_option())
         
         return jsonify({
             'status': 'success',
@@ -404,7 +619,8 @@ def compress_pdf():
             'compressedSize': result['compressed_size'],
             'compressionRate': result['compression_rate'],
             'downloadUrl': result['url'],
-            'filename': result['filename']
+            'filename': result['filename'],
+            'handle': result.get('handle')
         })
             
     except Exception as e:
@@ -415,19 +631,15 @@ def compress_pdf():
 def rotate_pdf():
     """Rotate a PDF"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-            
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+        # Corps brut (application/pdf) : mode flux ; sinon fichier envoyé ou identifiant
+        piped = is_piped_request()
+        if not piped:
+            file, error_response = get_input_file()
+            if error_response:
+                return error_response
         
         # Get rotation angle
-        degrees = request.form.get('degrees', '90')
+        degrees = request.values.get('degrees', '90')
         try:
             degrees = int(degrees)
             if degrees % 90 != 0:
@@ -435,6 +647,9 @@ def rotate_pdf():
         except ValueError:
             return jsonify({'error': 'Rotation angle must be a number'}), 400
         
+        if piped:
+            return piped_response('rotate', 'rotated', degrees)
+        
         # Rotate the PDF
         result = pdf_processor.rotate_pdf(file, degrees)
         
@@ -442,7 +657,8 @@ def rotate_pdf():
             'status': 'success',
             'message': f'PDF successfully rotated by {degrees} degrees.',
             'downloadUrl': result['url'],
-            'filename': result['filename']
+            'filename': result['filename'],
+            'handle': result.get('handle')
         })
             
     except Exception as e:
@@ -453,24 +669,20 @@ def rotate_pdf():
 def watermark_pdf():
     """Add a watermark to a PDF"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-            
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+        # Corps brut (application/pdf) : mode flux ; sinon fichier envoyé ou identifiant
+        piped = is_piped_request()
+        if not piped:
+            file, error_response = get_input_file()
+            if error_response:
+                return error_response
         
         # Get watermark text
-        text = request.form.get('text', '')
+        text = request.values.get('text', '')
         if not text:
             return jsonify({'error': 'Please specify text for the watermark'}), 400
         
         # Get opacity
-        opacity = request.form.get('opacity', '0.5')
+        opacity = request.values.get('opacity', '0.5')
         try:
             opacity = float(opacity)
             if opacity < 0 or opacity > 1:
@@ -478,6 +690,9 @@ def watermark_pdf():
         except ValueError:
             opacity = 0.5
         
+        if piped:
+            return piped_response('watermark', 'watermarked', text, opacity)
+        
         # Add watermark
         result = pdf_processor.watermark_pdf(file, text, opacity)
         
@@ -485,7 +700,8 @@ def watermark_pdf():
             'status': 'success',
             'message': f'Watermark successfully added to PDF.',
             'downloadUrl': result['url'],
-            'filename': result['filename']
+            'filename': result['filename'],
+            'handle': result.get('handle')
         })
             
     except Exception as e:
@@ -496,22 +712,22 @@ def watermark_pdf():
 def protect_pdf():
     """Protect a PDF with a password"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-            
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+        # Corps brut (application/pdf) : mode flux ; sinon fichier envoyé ou identifiant
+        piped = is_piped_request()
+        if not piped:
+            file, error_response = get_input_file()
+            if error_response:
+                return error_response
         
         # Get password
-        password = request.form.get('password', '')
+        # En mode flux, le mot de passe peut être passé dans l'en-tête X-PDF-Password
+        password = request.values.get('password') or request.headers.get('X-PDF-Password', '')
         if not password:
             return jsonify({'error': 'Please specify a password'}), 400
         
+        if piped:
+            return piped_response('protect', 'protected', password)
+        
         # Protect the PDF
         result = pdf_processor.protect_pdf(file, password)
         
@@ -519,7 +735,8 @@ def protect_pdf():
             'status': 'success',
             'message': f'PDF successfully protected with password.',
             'downloadUrl': result['url'],
-            'filename': result['filename']
+            'filename': result['filename'],
+            'handle': result.get('handle')
         })
             
     except Exception as e:
@@ -530,22 +747,22 @@ def protect_pdf():
 def unlock_pdf():
     """Unlock a protected PDF"""
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-            
-        file = request.files['file']
-        
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-            
-        if not file.filename.lower().endswith('.pdf'):
-            return jsonify({'error': 'Invalid file type. Please upload a PDF.'}), 400
+        # Corps brut (application/pdf) : mode flux ; sinon fichier envoyé ou identifiant
+        piped = is_piped_request()
+        if not piped:
+            file, error_response = get_input_file()
+            if error_response:
+                return error_response
         
         # Get password
-        password = request.form.get('password', '')
+        # En mode flux, le mot de passe peut être passé dans l'en-tête X-PDF-Password
+        password = request.values.get('password') or request.headers.get('X-PDF-Password', '')
         if not password:
             return jsonify({'error': 'Please specify the password'}), 400
         
+        if piped:
+            return piped_response('unlock', 'unlocked', password)
+        
         # Unlock the PDF
         result = pdf_processor.unlock_pdf(file, password)
         
@@ -553,55 +770,252 @@ def unlock_pdf():
             'status': 'success',
             'message': f'PDF successfully unlocked.',
             'downloadUrl': result['url'],
-            'filename': result['filename']
+            'filename': result['filename'],
+            'handle': result.get('handle')
         })
             
     except Exception as e:
         current_app.logger.error(f"Error in unlock_pdf: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+def parse_upload_metadata(header):
+    """Parse a tus Upload-Metadata header ("key base64value,key2 base64value2")"""
+    metadata = {}
+    for pair in (header or '').split(','):
+        parts = pair.strip().split(' ', 1)
+        if not parts[0]:
+            continue
+        try:
+            metadata[parts[0]] = base64.b64decode(parts[1]).decode('utf-8') if len(parts) > 1 else ''
+        except (ValueError, UnicodeDecodeError):
+            metadata[parts[0]] = ''
+    return metadata
+
+def upload_response(state, status_code=200):
+    """JSON response carrying the tus offset headers of a chunked upload"""
+    response = jsonify({'status': 'success', 'data': state})
+    response.status_code = status_code
+    response.headers['Tus-Resumable'] = '1.0.0'
+    response.headers['Upload-Offset'] = str(state['offset'])
+    response.headers['Upload-Length'] = str(state['length'])
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@api.route('/uploads', methods=['POST'])
+def create_upload():
+    """Create a resumable chunked upload"""
+    try:
+        data = request.get_json(silent=True) or {}
+        metadata = parse_upload_metadata(request.headers.get('Upload-Metadata'))
+        filename = metadata.get('filename') or data.get('filename', '')
+        try:
+            length = int(request.headers.get('Upload-Length') or data.get('length', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Upload-Length must be a positive integer'}), 400
+        
+        # Empreinte annoncée : un contenu déjà stocké n'est pas transféré
+        sha256 = metadata.get('sha256') or data.get('sha256')
+        state = uploads.create_upload(filename, length, sha256)
+        
+        response = upload_response(state, 201)
+        response.headers['Location'] = url_for('api.upload_chunk', upload_id=state['upload_id'])
+        return response
+        
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        current_app.logger.error(f"Error in create_upload: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/uploads/<upload_id>', methods=['HEAD', 'GET', 'PATCH', 'DELETE'])
+def upload_chunk(upload_id):
+    """Get the offset of a chunked upload, send one of its chunks or abort it"""
+    try:
+        if request.method == 'DELETE':
+            uploads.delete_upload(upload_id)
+            return '', 204
+        
+        if request.method in ('HEAD', 'GET'):
+            return upload_response(uploads.public_state(uploads.get_upload(upload_id)))
+        
+        # PATCH : le morceau est écrit à la position indiquée par Upload-Offset
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return jsonify({'error': 'Upload-Offset header required'}), 400
+        
+        state = uploads.write_chunk(upload_id, offset, request.stream, request.content_length)
+        return upload_response(state)
+        
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        current_app.logger.error(f"Error in upload_chunk: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+# Paramètres d'un traitement asynchrone qui désignent ses documents
+JOB_INPUT_FIELDS = ('handle', 'handles[]', 'handles')
+
+def job_response(state, status_code=200):
+    """JSON response carrying the state of an asynchronous job and its URLs"""
+    state = dict(state,
+                 status_url=url_for('api.get_job', job_id=state['job_id']),
+                 events_url=url_for('api.job_events', job_id=state['job_id']))
+    response = jsonify({'status': 'success', 'data': state})
+    response.status_code = status_code
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@api.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue an asynchronous processing job"""
+    try:
+        operation = request.form.get('operation', '')
+        
+        # Documents déjà stockés, ou fichiers envoyés avec la requête (stockés pour le worker)
+        handles = [handle for field in JOB_INPUT_FIELDS for handle in request.form.getlist(field)]
+        for field in ('file', 'files[]', 'files'):
+            for file in request.files.getlist(field):
+                if file.filename == '':
+                    continue
+                staged_file = ingest.stage(file)
+                if not file.filename.lower().endswith('.pdf') or staged_file.is_pdf is False:
+                    return jsonify({'error': f"The file {file.filename} is not a valid PDF"}), 400
+                handles.append(blobs.store(staged_file, file.filename)['handle'])
+        
+        # Les autres champs sont transmis tels quels au point d'API de l'opération
+        params = {key: request.form.getlist(key) for key in request.form
+                  if key != 'operation' and key not in JOB_INPUT_FIELDS}
+        state = jobs.submit(operation, params, handles)
+        
+        response = job_response(state, 202)
+        response.headers['Location'] = url_for('api.get_job', job_id=state['job_id'])
+        return response
+        
+    except jobs.JobError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        current_app.logger.error(f"Error in create_job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def get_job(job_id):
+    """Get the state of an asynchronous job (and its result once finished), or cancel it"""
+    try:
+        if request.method == 'DELETE':
+            return job_response(jobs.cancel(job_id))
+        return job_response(jobs.public_state(jobs.get_job(job_id)))
+        
+    except jobs.JobError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    except Exception as e:
+        current_app.logger.error(f"Error in get_job: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@api.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream the state changes of an asynchronous job (server-sent events)"""
+    try:
+        jobs.get_job(job_id)
+    except jobs.JobError as e:
+        return jsonify({'error': str(e)}), e.status_code
+    
+    return Response(
+        stream_with_context(jobs.iter_events(job_id)),
+        mimetype='text/event-stream',
+        # Événements transmis sans mise en tampon par le proxy
+        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'}
+    )
+
 @api.route('/download/<filename>', methods=['GET'])
 def download_file(filename):
     """Download a processed file and clean up afterwards"""
     try:
-        # Obtenir le chemin du répertoire de traitement de la session
-        processed_dir = pdf_processor.get_processed_dir()
-        file_path = os.path.join(processed_dir, filename)
-        
-        if not os.path.exists(file_path):
-            current_app.logger.warning(f"Fichier introuvable: {file_path}")
-            return jsonify({'error': 'File not found', 'status': 'error'}), 404
-        
         # Option pour nettoyer les fichiers après téléchargement
         # Par défaut, ne pas nettoyer pour permettre à l'utilisateur de télécharger à nouveau
         clean_after = request.args.get('clean', 'false').lower() == 'true'
         
-        # Créer une fonction de rappel (callback) pour nettoyer après le téléchargement
-        @after_this_request
-        def cleanup(response):
-            if clean_after:
-                try:
-                    # Supprimer uniquement ce fichier
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                        current_app.logger.info(f"Fichier nettoyé après téléchargement: {filename}")
-                except Exception as e:
-                    current_app.logger.error(f"Erreur lors du nettoyage du fichier {filename}: {str(e)}")
-            return response
+        # Disque local (ETag, reprise, délégation éventuelle au proxy frontal) ou stockage
+        # partagé par tous les nœuds (URL présignée ou relais des plages d'octets) ;
+        # pas de délégation si le fichier est supprimé à la fin de la requête
+        response = storage.send(
+            filename,
+            download_name=filename.split('_', 1)[1] if '_' in filename else filename,
+            offload=not clean_after
+        )
+        
+        if response is None:
+            current_app.logger.warning(f"Fichier introuvable: {filename}")
+            return jsonify({'error': 'File not found', 'status': 'error'}), 404
         
         # Log pour le débogage
         current_app.logger.info(f"Téléchargement du fichier: {filename}, nettoyage après: {clean_after}")
+        
+        if clean_after:
+            logger = current_app.logger
+            app = current_app._get_current_object()
+            session_id = pdf_processor.get_session_id()
             
-        return send_file(
-            file_path,
-            as_attachment=True,
-            download_name=filename.split('_', 1)[1] if '_' in filename else filename
-        )
+            # Nettoyer une fois le fichier entièrement envoyé (hors du contexte de la requête)
+            def cleanup():
+                try:
+                    with app.app_context():
+                        # Retirer ce fichier de la session ; il n'est supprimé (disque local et
+                        # stockage partagé) que si aucune autre session ne le possède
+                        file_path = outputs.resolve(filename) or outputs.shard_path(filename)
+                        pdf_processor.release_outputs([file_path], session_id)
+                    logger.info(f"Fichier nettoyé après téléchargement: {filename}")
+                except Exception as e:
+                    logger.error(f"Erreur lors du nettoyage du fichier {filename}: {str(e)}")
+            
+            response.call_on_close(cleanup)
+        return response
         
     except Exception as e:
         current_app.logger.error(f"Error in download_file: {str(e)}")
         return jsonify({'error': str(e), 'status': 'error'}), 500
 
+def zip_response(files, download_name, on_close=None):
+    """
+    Stream a ZIP archive of the given files
+    
+    The archive is generated while it is sent (see zipstream.py): memory use
+    does not depend on the archive size and the first byte is sent at once.
+    Unless the files are removed after the download (on_close), the archive
+    is recorded in the bundle cache while it is sent, and later requests for
+    the same files send the recorded archive (see bundles.py).
+    
+    Args:
+        files: List of (path, name in the archive) tuples
+        download_name: Name of the downloaded archive
+        on_close: Optional callback run once the response has been sent
+        
+    Returns:
+        Flask response
+    """
+    compression = request.args.get('compression', 'auto')
+    if compression not in ['auto', 'store', 'deflate']:
+        compression = 'auto'
+    
+    bundle = None
+    if on_close is None and bundles.is_enabled():
+        bundle = bundles.lookup(files, compression)
+        if bundle.cached:
+            return delivery.send_processed(bundle.path, download_name, mimetype='application/zip')
+    
+    archive = zipstream.ZipStream(files, compression)
+    body = bundle.record(archive) if bundle is not None else archive
+    
+    response = Response(body, mimetype='application/zip', direct_passthrough=True)
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    total_size = archive.size()
+    if total_size is not None:
+        response.headers['Content-Length'] = str(total_size)
+    if on_close is not None:
+        # Après l'envoi complet (un after_this_request s'exécuterait avant)
+        response.call_on_close(on_close)
+    return response
+
 @api.route('/download-all', methods=['GET'])
 def download_all_files():
     """Download multiple files as a ZIP archive"""
@@ -616,85 +1030,51 @@ def download_all_files():
         if not filenames:
             return jsonify({'error': 'No valid files specified', 'status': 'error'}), 400
         
-        # Create a temporary directory for the ZIP file
-        temp_dir = pdf_processor.get_temp_dir()
+        zip_files = []
+        file_paths = []  # Liste des chemins de fichiers pour le nettoyage
         
-        # Create a ZIP file in memory
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            processed_dir = pdf_processor.get_processed_dir()
-            
-            # Keep track of filenames to avoid duplicates in the ZIP
-            used_names = set()
-            files_added = False
-            file_paths = []  # Liste des chemins de fichiers pour le nettoyage
+        for filename in filenames:
+            # Chercher le fichier d'après son nom (récupéré depuis le stockage partagé si besoin)
+            filepath = storage.resolve(filename)
             
-            # Créer un tableau pour les fichiers à chercher
-            for filename in filenames:
-                # Chercher le fichier directement dans le répertoire
-                filepath = os.path.join(processed_dir, filename)
-                
-                # Si le fichier existe, l'ajouter au ZIP
-                if os.path.exists(filepath):
-                    # Get a clean name for the file in the ZIP
-                    original_name = filename.split('_', 1)[1] if '_' in filename else filename
-                    
-                    # Handle duplicates by adding a suffix
-                    zip_name = original_name
-                    counter = 1
-                    while zip_name in used_names:
-                        name_parts = os.path.splitext(original_name)
-                        zip_name = f"{name_parts[0]}_{counter}{name_parts[1]}"
-                        counter += 1
-                    
-                    used_names.add(zip_name)
-                    file_paths.append(filepath)
-                    
-                    # Add to ZIP archive
-                    zip_file.write(filepath, zip_name)
-                    files_added = True
-            
-            # Si aucun fichier n'a été ajouté
-            if not files_added:
-                # Lister les fichiers dans le répertoire pour le débogage
-                directory_contents = os.listdir(processed_dir) if os.path.exists(processed_dir) else []
-                current_app.logger.error(f"Aucun fichier trouvé à télécharger. Fichiers recherchés: {filenames}. Contenu du répertoire: {directory_contents}")
-                return jsonify({'error': 'No files found to download', 'status': 'error'}), 404
-                
-            # Reset file pointer to the beginning
-            zip_buffer.seek(0)
-            
-            # Create a unique ZIP filename
-            zip_filename = f"pdf_files_{uuid.uuid4()}.zip"
-            
-            # Option pour nettoyer les fichiers après téléchargement
-            # Par défaut, ne pas nettoyer pour permettre à l'utilisateur de télécharger à nouveau
-            clean_after = request.args.get('clean', 'false').lower() == 'true'
-            
-            # Log pour le débogage
-            current_app.logger.info(f"Création du ZIP avec {len(file_paths)} fichiers, nettoyage après: {clean_after}")
-            
-            # Créer une fonction de rappel (callback) pour nettoyer après le téléchargement
-            @after_this_request
-            def cleanup(response):
-                if clean_after:
-                    try:
-                        # Nettoyer les fichiers individuels
-                        for filepath in file_paths:
-                            if os.path.exists(filepath):
-                                os.remove(filepath)
-                        current_app.logger.info(f"Fichiers nettoyés après téléchargement ZIP: {len(file_paths)} fichiers")
-                    except Exception as e:
-                        current_app.logger.error(f"Erreur lors du nettoyage des fichiers: {str(e)}")
-                return response
-            
-            # Return the ZIP file
-            return send_file(
-                zip_buffer,
-                as_attachment=True,
-                download_name=zip_filename,
-                mimetype='application/zip'
-            )
+            # Si le fichier existe, l'ajouter au ZIP (les doublons sont renommés par zipstream)
+            if filepath is not None:
+                # Get a clean name for the file in the ZIP
+                original_name = filename.split('_', 1)[1] if '_' in filename else filename
+                zip_files.append((filepath, original_name))
+                file_paths.append(filepath)
+        
+        # Si aucun fichier n'a été ajouté
+        if not zip_files:
+            current_app.logger.error(f"Aucun fichier trouvé à télécharger. Fichiers recherchés: {filenames}")
+            return jsonify({'error': 'No files found to download', 'status': 'error'}), 404
+        
+        # Create a unique ZIP filename
+        zip_filename = f"pdf_files_{uuid.uuid4()}.zip"
+        
+        # Option pour nettoyer les fichiers après téléchargement
+        # Par défaut, ne pas nettoyer pour permettre à l'utilisateur de télécharger à nouveau
+        clean_after = request.args.get('clean', 'false').lower() == 'true'
+        
+        # Log pour le débogage
+        current_app.logger.info(f"Création du ZIP avec {len(file_paths)} fichiers, nettoyage après: {clean_after}")
+        
+        logger = current_app.logger
+        app = current_app._get_current_object()
+        session_id = pdf_processor.get_session_id()
+        
+        # Nettoyer une fois l'archive entièrement envoyée (hors du contexte de la requête)
+        def cleanup():
+            try:
+                # Fichiers retirés de la session, supprimés s'ils n'ont plus d'autre propriétaire
+                with app.app_context():
+                    pdf_processor.release_outputs(file_paths, session_id)
+                logger.info(f"Fichiers nettoyés après téléchargement ZIP: {len(file_paths)} fichiers")
+            except Exception as e:
+                logger.error(f"Erreur lors du nettoyage des fichiers: {str(e)}")
+        
+        # Return the ZIP file, streamed while it is generated
+        return zip_response(zip_files, zip_filename, cleanup if clean_after else None)
             
     except Exception as e:
         current_app.logger.error(f"Error in download_all_files: {str(e)}")
@@ -711,24 +1091,13 @@ def download_session_files():
         # Par défaut, ne pas nettoyer pour permettre à l'utilisateur de télécharger à nouveau
         should_clean = request.args.get('clean', 'false').lower() == 'true'
         
-        # Récupérer tous les fichiers du dossier processed
-        processed_dir = pdf_processor.get_processed_dir()
-        if not os.path.exists(processed_dir):
-            return jsonify({'error': 'No files available', 'status': 'error'}), 404
-            
-        # Lister tous les fichiers PDF dans le répertoire processed
-        pdf_files = []
-        for filename in os.listdir(processed_dir):
-            if filename.lower().endswith('.pdf'):
-                file_path = os.path.join(processed_dir, filename)
-                # Trier par date de modification (plus récent en premier)
-                pdf_files.append((filename, file_path, os.path.getmtime(file_path)))
-                
-        # Trier par date de modification (plus récent en premier)
-        pdf_files.sort(key=lambda x: x[2], reverse=True)
-        
-        # Ne garder que les noms et chemins de fichiers
-        session_files = [(name, path) for name, path, _ in pdf_files]
+        # Fichiers PDF de la session (ou d'un de ses traitements), depuis l'index (plus récent en premier)
+        # L'ID de session de la requête n'est pas utilisé : seuls les fichiers de l'appelant sont envoyés
+        job_id = request.args.get('job') or None
+        session_id = pdf_processor.get_session_id()
+        session_files = [(row['name'], row['path'])
+                         for row in catalog.list_files(session_id, job_id=job_id,
+                                                       exclude_kinds=None, extension='.pdf')]
                 
         if not session_files:
             return jsonify({'error': 'No files found', 'status': 'error'}), 404
@@ -740,55 +1109,58 @@ def download_session_files():
         if len(session_files) == 1:
             filename, file_path = session_files[0]
             
-            # Créer une fonction de rappel (callback) pour nettoyer après le téléchargement
-            @after_this_request
-            def cleanup_single(response):
-                if should_clean:
+            # Disque local ou stockage partagé (fichier produit sur un autre nœud, ou copie
+            # locale évincée) ; pas de délégation si le fichier est supprimé après l'envoi
+            response = storage.send(
+                filename,
+                download_name=filename.split('_', 1)[1] if '_' in filename else filename,
+                offload=not should_clean
+            )
+            if response is None:
+                return jsonify({'error': 'No files found', 'status': 'error'}), 404
+            
+            if should_clean:
+                logger = current_app.logger
+                app = current_app._get_current_object()
+                
+                # Nettoyer une fois le fichier entièrement envoyé (hors du contexte de la requête)
+                def cleanup_single():
                     try:
-                        os.remove(file_path)
-                        print(f"API: Cleaned up file after download: {file_path}")
+                        with app.app_context():
+                            pdf_processor.release_outputs([file_path], session_id)
+                        logger.info(f"Fichier nettoyé après téléchargement: {file_path}")
                     except Exception as e:
-                        print(f"API: Error cleaning up file: {str(e)}")
-                return response
+                        logger.error(f"Erreur lors du nettoyage du fichier {file_path}: {str(e)}")
                 
-            return send_file(
-                file_path, 
-                as_attachment=True,
-                download_name=filename.split('_', 1)[1] if '_' in filename else filename
-            )
+                response.call_on_close(cleanup_single)
+            return response
             
-        # Pour plusieurs fichiers, les comprimer
+        # Pour plusieurs fichiers, les archiver au fil de l'envoi
         current_app.logger.info(f"API: Creating ZIP with {len(session_files)} files")
-        memory_file = io.BytesIO()
         
-        with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for filename, file_path in session_files:
-                # Utiliser un nom plus propre pour le fichier dans le ZIP
-                clean_name = filename.split('_', 1)[1] if '_' in filename else filename
-                zf.write(file_path, clean_name)
-                
-        memory_file.seek(0)
+        # Utiliser un nom plus propre pour chaque fichier dans le ZIP ; chemins locaux
+        # récupérés depuis le stockage partagé si besoin
+        zip_files = []
+        for filename, file_path in session_files:
+            local_path = storage.resolve(filename)
+            if local_path is not None:
+                zip_files.append((local_path, filename.split('_', 1)[1] if '_' in filename else filename))
+        if not zip_files:
+            return jsonify({'error': 'No files found', 'status': 'error'}), 404
+        logger = current_app.logger
+        app = current_app._get_current_object()
         
-        # Créer une fonction de rappel (callback) pour nettoyer après le téléchargement
-        @after_this_request
-        def cleanup_multi(response):
-            if should_clean:
-                try:
-                    for _, file_path in session_files:
-                        if os.path.exists(file_path):
-                            os.remove(file_path)
-                    print(f"API: Cleaned up {len(session_files)} files after download")
-                except Exception as e:
-                    print(f"API: Error cleaning up files: {str(e)}")
-            return response
+        # Nettoyer une fois l'archive entièrement envoyée (hors du contexte de la requête)
+        def cleanup_multi():
+            try:
+                with app.app_context():
+                    pdf_processor.release_outputs([file_path for _, file_path in session_files], session_id)
+                logger.info(f"Fichiers nettoyés après téléchargement ZIP: {len(session_files)} fichiers")
+            except Exception as e:
+                logger.error(f"Erreur lors du nettoyage des fichiers: {str(e)}")
                 
         download_id = uuid.uuid4().hex[:8]
-        return send_file(
-            memory_file,
-            download_name=f'pdf_files_{download_id}.zip',
-            as_attachment=True,
-            mimetype='application/zip'
-        )
+        return zip_response(zip_files, f'pdf_files_{download_id}.zip', cleanup_multi if should_clean else None)
         
     except Exception as e:
         current_app.logger.error(f"Error in download_session_files: {str(e)}")
@@ -805,62 +1177,32 @@ def list_split_files():
             
         zip_filename = data['zip_filename']
         
-        # Validate filename for security
-        if not zip_filename or '..' in zip_filename or not zip_filename.startswith('split_') or not zip_filename.endswith('.zip'):
-            return jsonify({'error': 'Invalid ZIP filename', 'success': False}), 400
-            
-        # Get the processed directory
-        processed_dir = current_app.config.get('PROCESSED_FOLDER', '/tmp/processed')
-        zip_path = os.path.join(processed_dir, zip_filename)
-        
-        if not os.path.exists(zip_path):
-            return jsonify({'error': 'ZIP file not found', 'success': False}), 404
-            
-        # Get the file list from the ZIP
-        files = []
+        # Lecture du seul répertoire central (mis en cache) : rien n'est extrait
         try:
-            # Extraire les fichiers du ZIP dans un dossier temporaire pour les rendre disponibles au téléchargement
-            session_id = pdf_processor.get_session_id()
-            temp_extract_dir = os.path.join(pdf_processor.get_temp_dir(), session_id)
-            os.makedirs(temp_extract_dir, exist_ok=True)
-            
-            with zipfile.ZipFile(zip_path, 'r') as zip_file:
-                # Extraire et déplacer les fichiers vers le dossier traité
-                for file_info in zip_file.infolist():
-                    if file_info.filename.lower().endswith('.pdf'):
-                        # Extract page number from filename if possible
-                        page_match = re.search(r'page_(\d+)', file_info.filename)
-                        page_number = int(page_match.group(1)) if page_match else 0
-                        
-                        # Générer un nom unique pour éviter les collisions
-                        unique_id = uuid.uuid4().hex[:8]
-                        unique_filename = f"{unique_id}_{file_info.filename}"
-                        extract_path = os.path.join(processed_dir, unique_filename)
-                        
-                        # Extraire le fichier
-                        zip_file.extract(file_info.filename, temp_extract_dir)
-                        source_path = os.path.join(temp_extract_dir, file_info.filename)
-                        
-                        # Déplacer vers le dossier traité
-                        shutil.copy(source_path, extract_path)
-                        
-                        # Créer l'URL de téléchargement
-                        download_url = url_for('main.download_file', filename=unique_filename, _external=False)
-                        
-                        # Add file info to the list
-                        files.append({
-                            'filename': file_info.filename,
-                            'size': file_info.file_size,
-                            'size_formatted': pdf_processor.format_file_size(file_info.file_size),
-                            'page_number': page_number,
-                            'url': download_url
-                        })
-                
-                # Clean up temporary directory
-                shutil.rmtree(temp_extract_dir, ignore_errors=True)
+            zip_path = archives.get_archive_path(zip_filename)
+            members = archives.list_members(zip_path)
+        except archives.ArchiveError as e:
+            return jsonify({'error': str(e), 'success': False}), e.status_code
         except Exception as zip_error:
             print(f"API: Error reading ZIP file contents: {str(zip_error)}")
             return jsonify({'error': f'Error reading ZIP file contents: {str(zip_error)}', 'success': False}), 500
+        
+        files = []
+        for member in members:
+            if member['name'].lower().endswith('.pdf'):
+                # Extract page number from filename if possible
+                page_match = re.search(r'page_(\d+)', member['name'])
+                page_number = int(page_match.group(1)) if page_match else 0
+                
+                files.append({
+                    'filename': member['name'],
+                    'size': member['size'],
+                    'size_formatted': pdf_processor.format_file_size(member['size']),
+                    'page_number': page_number,
+                    # Servi directement depuis l'archive
+                    'url': url_for('api.download_archive_member', zip_filename=zip_filename,
+                                   member_name=member['name'], _external=False)
+                })
             
         # Sort files by page number
         files.sort(key=lambda x: x['page_number'])
@@ -874,4 +1216,72 @@ def list_split_files():
         
     except Exception as e:
         print(f"API: Error in list_split_files: {str(e)}")
-        return jsonify({'error': str(e), 'success': False}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e), 'success': False}), 500
+
+@api.route('/archives/<zip_filename>/<path:member_name>', methods=['GET'])
+def download_archive_member(zip_filename, member_name):
+    """Download one file of a split ZIP archive, served in place from the archive"""
+    try:
+        try:
+            zip_path = archives.get_archive_path(zip_filename)
+            member = archives.get_member(zip_path, member_name)
+            body = archives.open_member(zip_path, member)
+        except archives.ArchiveError as e:
+            return jsonify({'error': str(e), 'status': 'error'}), e.status_code
+        
+        if isinstance(body, archives.MemberReader):
+            # Membre stocké : octets de l'archive transmis tels quels (sendfile si disponible)
+            body = wrap_file(request.environ, body)
+        
+        download_name = os.path.basename(member_name)
+        response = Response(
+            body,
+            mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+            direct_passthrough=True
+        )
+        response.content_length = member['size']
+        response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(download_name) or "download"}"'
+        return response
+        
+    except Exception as e:
+        current_app.logger.error(f"Error in download_archive_member: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
+@api.route('/lazy-splits/<split_id>/documents/<int:number>', methods=['GET'])
+def download_lazy_split_document(split_id, number):
+    """Download one document of a lazy split, generated on its first request"""
+    try:
+        try:
+            index = lazysplit.load(split_id)
+            f, download_name, size = lazysplit.open_document(index, number)
+        except lazysplit.LazySplitError as e:
+            return jsonify({'error': str(e), 'status': 'error'}), e.status_code
+        
+        response = Response(
+            wrap_file(request.environ, f),
+            mimetype='application/pdf',
+            direct_passthrough=True
+        )
+        response.content_length = size
+        response.headers['Content-Disposition'] = f'attachment; filename="{secure_filename(download_name) or "download.pdf"}"'
+        return response
+        
+    except Exception as e:
+        current_app.logger.error(f"Error in download_lazy_split_document: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'error'}), 500
+
+@api.route('/lazy-splits/<split_id>/archive', methods=['GET'])
+def download_lazy_split_archive(split_id):
+    """Download all documents of a lazy split as a ZIP, built on explicit request only"""
+    try:
+        try:
+            index = lazysplit.load(split_id)
+        except lazysplit.LazySplitError as e:
+            return jsonify({'error': str(e), 'status': 'error'}), e.status_code
+        
+        zip_path = lazysplit.build_archive(index)
+        return redirect(url_for('main.download_file', filename=os.path.basename(zip_path)))
+        
+    except Exception as e:
+        current_app.logger.error(f"Error in download_lazy_split_archive: {str(e)}")
+        return jsonify({'error': str(e), 'status': 'error'}), 500
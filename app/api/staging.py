@@ -0,0 +1,224 @@
+"""
+Répertoires de travail en mémoire (tmpfs) pour les petits traitements
+
+La plupart des requêtes portent sur des fichiers de quelques Mo. Leurs
+fichiers de travail (fichier reçu, lu ensuite par le moteur) sont placés sur
+un système de fichiers en mémoire (/dev/shm par défaut), dans la limite d'un
+budget global partagé par tous les workers. Les fichiers plus volumineux, ou
+reçus alors que le budget est épuisé, sont placés sur disque sous
+DATA_DIR/temp comme auparavant.
+
+Le registre des réservations et les compteurs (traitements servis en
+mémoire / sur disque) sont tenus dans un fichier JSON protégé par flock, à la
+racine du répertoire en mémoire.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+from contextlib import contextmanager
+from flask import current_app
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus disponible
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+LEDGER_FILENAME = 'ledger.json'
+
+# Marge laissée libre sur le système de fichiers en mémoire
+FREE_SPACE_MARGIN = 16 * 1024 * 1024
+
+
+class StagingDir:
+    """
+    Répertoire de travail d'une requête, en mémoire ou sur disque
+
+    Attributes:
+        path: Chemin du répertoire
+        in_ram: True si le répertoire est sur le système de fichiers en mémoire
+        reserved: Octets réservés sur le budget mémoire
+    """
+
+    def __init__(self, path, in_ram, reserved=0, ram_root=None):
+        self.path = path
+        self.in_ram = in_ram
+        self.reserved = reserved
+        self.ram_root = ram_root
+
+    def release(self):
+        """Supprime le répertoire et libère sa réservation"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        if self.in_ram:
+            with _ledger(self.ram_root) as ledger:
+                ledger['reservations'].pop(os.path.basename(self.path), None)
+
+
+def get_ram_root():
+    """
+    Retourne la racine des répertoires en mémoire, ou None si elle n'est pas utilisable
+
+    Returns:
+        str: Chemin du répertoire en mémoire (RAM_STAGING_DIR)
+    """
+    ram_root = current_app.config.get('RAM_STAGING_DIR')
+    if not ram_root or fcntl is None:
+        return None
+    try:
+        os.makedirs(ram_root, exist_ok=True)
+    except OSError as e:
+        logger.warning(f"Répertoire de travail en mémoire indisponible ({ram_root}): {str(e)}")
+        return None
+    return ram_root
+
+
+def _empty_ledger():
+    return {
+        'reservations': {},
+        'stats': {'ram_jobs': 0, 'disk_jobs': 0, 'ram_bytes': 0, 'disk_bytes': 0, 'spilled_budget': 0}
+    }
+
+
+@contextmanager
+def _ledger(ram_root):
+    """Registre des réservations, lu et réécrit sous verrou exclusif"""
+    ledger_path = os.path.join(ram_root, LEDGER_FILENAME)
+    fd = os.open(f"{ledger_path}.lock", os.O_CREAT | os.O_RDWR, 0o640)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            with open(ledger_path, 'r') as f:
+                ledger = json.load(f)
+        except (OSError, ValueError):
+            ledger = _empty_ledger()
+
+        yield ledger
+
+        tmp_path = f"{ledger_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(ledger, f)
+        os.replace(tmp_path, ledger_path)
+    finally:
+        os.close(fd)  # Libère aussi le verrou
+
+
+def _purge_stale(ram_root, ledger):
+    """Oublie les réservations dont le répertoire n'existe plus (worker arrêté, nettoyage)"""
+    for name in list(ledger['reservations']):
+        if not os.path.isdir(os.path.join(ram_root, name)):
+            del ledger['reservations'][name]
+
+
+def _free_space(ram_root):
+    """Espace libre sur le système de fichiers en mémoire"""
+    st = os.statvfs(ram_root)
+    return st.f_bavail * st.f_frsize
+
+
+def _disk_dir():
+    temp_dir = os.path.join(current_app.config['DATA_DIR'], 'temp', str(uuid.uuid4()))
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
+
+
+def _count(ram_root, in_ram, size, over_budget=False):
+    """Met à jour les compteurs quand le registre n'a pas déjà été ouvert"""
+    with _ledger(ram_root) as ledger:
+        _record(ledger, in_ram, size, over_budget)
+
+
+def _record(ledger, in_ram, size, over_budget=False):
+    stats = ledger.setdefault('stats', _empty_ledger()['stats'])
+    key = 'ram' if in_ram else 'disk'
+    stats[f'{key}_jobs'] += 1
+    stats[f'{key}_bytes'] += size
+    if over_budget:
+        stats['spilled_budget'] += 1
+
+
+def allocate(size):
+    """
+    Crée le répertoire de travail d'une requête, en mémoire si possible
+
+    Args:
+        size: Taille attendue des données de la requête en octets (None si inconnue)
+
+    Returns:
+        StagingDir: Répertoire de travail (à libérer avec release())
+    """
+    ram_root = get_ram_root()
+    threshold = current_app.config.get('RAM_STAGING_THRESHOLD', 5 * 1024 * 1024)
+    budget = current_app.config.get('RAM_STAGING_BUDGET', 0)
+    size = size or 0
+
+    if ram_root is None or budget <= 0:
+        return StagingDir(_disk_dir(), False)
+
+    # Taille inconnue ou trop grande : sur disque
+    if not size or size > threshold:
+        _count(ram_root, False, size)
+        return StagingDir(_disk_dir(), False)
+
+    name = str(uuid.uuid4())
+    with _ledger(ram_root) as ledger:
+        _purge_stale(ram_root, ledger)
+        reserved = sum(entry['bytes'] for entry in ledger['reservations'].values())
+        if reserved + size > budget or size + FREE_SPACE_MARGIN > _free_space(ram_root):
+            # Budget épuisé : débordement sur disque
+            _record(ledger, False, size, over_budget=True)
+            in_ram = False
+        else:
+            os.makedirs(os.path.join(ram_root, name))
+            ledger['reservations'][name] = {'bytes': size, 'pid': os.getpid(), 'created_at': time.time()}
+            _record(ledger, True, size)
+            in_ram = True
+
+    if not in_ram:
+        logger.info(f"Budget de travail en mémoire épuisé, requête de {size} octets placée sur disque")
+        return StagingDir(_disk_dir(), False)
+    return StagingDir(os.path.join(ram_root, name), True, size, ram_root)
+
+
+def get_stats():
+    """
+    Statistiques du travail en mémoire
+
+    Returns:
+        dict: ram_jobs, disk_jobs, ram_share (en %), ram_bytes, disk_bytes, spilled_budget,
+              reserved, budget ; ou None si le travail en mémoire est désactivé
+    """
+    ram_root = get_ram_root()
+    if ram_root is None or current_app.config.get('RAM_STAGING_BUDGET', 0) <= 0:
+        return None
+
+    with _ledger(ram_root) as ledger:
+        _purge_stale(ram_root, ledger)
+        stats = dict(ledger.get('stats', _empty_ledger()['stats']))
+        stats['reserved'] = sum(entry['bytes'] for entry in ledger['reservations'].values())
+
+    total_jobs = stats['ram_jobs'] + stats['disk_jobs']
+    stats['ram_share'] = round(100.0 * stats['ram_jobs'] / total_jobs, 1) if total_jobs else 0.0
+    stats['budget'] = current_app.config.get('RAM_STAGING_BUDGET', 0)
+    return stats
+
+
+def clean_stale(max_age_seconds):
+    """
+    Supprime les répertoires en mémoire abandonnés (worker arrêté en cours de requête)
+
+    Args:
+        max_age_seconds: Âge au-delà duquel un répertoire est considéré abandonné
+    """
+    ram_root = get_ram_root()
+    if ram_root is None:
+        return
+    now = time.time()
+    for name in os.listdir(ram_root):
+        path = os.path.join(ram_root, name)
+        if os.path.isdir(path) and now - os.path.getmtime(path) > max_age_seconds:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Répertoire de travail en mémoire nettoyé: {path}")
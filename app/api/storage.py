@@ -0,0 +1,438 @@
+"""
+Stockage des fichiers traités : disque local ou stockage objet compatible S3
+
+Les fichiers traités sont toujours produits et publiés sur le disque local
+(DATA_DIR/processed, voir outputs.py). Avec le disque local seul
+(STORAGE_BACKEND=local, par défaut), un fichier n'est téléchargeable que sur
+le nœud qui l'a produit.
+
+Avec STORAGE_BACKEND=s3, chaque fichier publié est aussi envoyé dans un
+bucket compatible S3 (AWS S3, MinIO, Ceph...) par un envoi multipart lu en
+continu (S3_MULTIPART_CHUNK_MB par partie, jamais le fichier entier en
+mémoire). Tout nœud derrière le répartiteur de charge peut alors servir
+/download/<nom> :
+
+    - par une redirection vers une URL présignée (S3_PRESIGNED_DOWNLOADS) :
+      le client télécharge directement depuis le stockage objet, plages
+      d'octets comprises ;
+    - sinon en relayant l'objet, avec prise en charge des requêtes
+      partielles (Range) par des lectures partielles de l'objet.
+
+Les traitements qui ont besoin du fichier lui-même (téléchargement groupé,
+membres d'une archive de découpage) le récupèrent d'abord sur le disque
+local (resolve) : la copie locale est ensuite un cache, indexé et évincé
+comme les autres fichiers traités. Les objets sont supprimés à l'expiration
+des fichiers (janitor) et après un téléchargement avec nettoyage.
+
+La bibliothèque boto3 n'est importée que pour le stockage S3. Pour essayer
+le stockage S3 en local, voir tools/check_object_storage.py (MinIO).
+"""
+import os
+import uuid
+import sqlite3
+import logging
+import mimetypes
+from flask import current_app, request, redirect, Response
+from . import catalog
+from . import delivery
+from . import outputs
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('local', 's3')
+
+# Taille des blocs lus depuis le stockage objet
+READ_CHUNK_SIZE = 256 * 1024
+
+# Taille minimale d'une partie d'envoi multipart (sauf la dernière), imposée par S3
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+# Instance par processus (jamais héritée d'un fork) et par configuration
+_backend = None
+
+
+class StorageError(Exception):
+    """Erreur du stockage des fichiers traités, avec le code HTTP à retourner"""
+
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LocalStorage:
+    """Fichiers traités sur le disque local du nœud (DATA_DIR/processed)"""
+
+    name = 'local'
+
+    # Fichiers disponibles sur le seul nœud qui les a produits
+    shared = False
+
+    def publish(self, path, name):
+        """Fichier déjà publié par outputs.commit : rien à faire"""
+
+    def resolve(self, name):
+        """Chemin local d'un fichier traité, ou None"""
+        return outputs.resolve(name)
+
+    def send(self, name, download_name, mimetype=None, offload=True):
+        """Réponse de téléchargement, ou None si le fichier n'existe pas"""
+        path = outputs.resolve(name)
+        if path is None:
+            return None
+        return delivery.send_processed(path, download_name, mimetype=mimetype, offload=offload)
+
+    def delete(self, names):
+        """Fichiers locaux supprimés par l'appelant : rien à faire"""
+
+
+class S3Storage:
+    """
+    Fichiers traités copiés dans un bucket compatible S3
+
+    Args:
+        config: Configuration de l'application (S3_*)
+    """
+
+    name = 's3'
+
+    # Fichiers disponibles sur tous les nœuds : la copie locale n'est qu'un cache
+    shared = True
+
+    def __init__(self, config):
+        self.bucket = config.get('S3_BUCKET')
+        if not self.bucket:
+            raise StorageError('S3_BUCKET must be set for the S3 storage backend', 500)
+        self.prefix = config.get('S3_PREFIX', 'processed/')
+        self.part_size = max(config.get('S3_MULTIPART_CHUNK_SIZE', 8 * 1024 * 1024), MIN_PART_SIZE)
+        self.presigned = config.get('S3_PRESIGNED_DOWNLOADS', True)
+        self.presign_expires = config.get('S3_PRESIGN_EXPIRES', 300)
+        self.client = self._create_client(config)
+
+    @staticmethod
+    def _create_client(config):
+        """Client S3 (boto3 importé seulement pour ce stockage)"""
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise StorageError('The S3 storage backend requires boto3 (pip install boto3)', 500)
+        return boto3.session.Session().client(
+            's3',
+            endpoint_url=config.get('S3_ENDPOINT_URL') or None,
+            region_name=config.get('S3_REGION') or None,
+            aws_access_key_id=config.get('S3_ACCESS_KEY_ID') or None,
+            aws_secret_access_key=config.get('S3_SECRET_ACCESS_KEY') or None,
+            config=Config(signature_version='s3v4',
+                          s3={'addressing_style': config.get('S3_ADDRESSING_STYLE') or 'auto'})
+        )
+
+    def key(self, name):
+        """Clé de l'objet d'un fichier traité"""
+        return f"{self.prefix}{name}"
+
+    def publish(self, path, name):
+        """
+        Envoie un fichier publié dans le bucket
+
+        Args:
+            path: Chemin local du fichier
+            name: Nom du fichier traité
+        """
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        with open(path, 'rb') as f:
+            self.upload_stream(iter(lambda: f.read(READ_CHUNK_SIZE), b''), name, content_type)
+
+    def upload_stream(self, chunks, name, content_type='application/octet-stream'):
+        """
+        Envoie un contenu produit en continu, par parties (envoi multipart)
+
+        Un contenu plus petit qu'une partie est envoyé en une seule requête.
+        Un envoi multipart interrompu est abandonné (aucune partie ne reste
+        facturée dans le bucket).
+
+        Args:
+            chunks: Itérable de blocs d'octets
+            name: Nom du fichier traité
+            content_type: Type du contenu
+
+        Returns:
+            int: Taille envoyée
+        """
+        key = self.key(name)
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        size = 0
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                size += len(chunk)
+                while len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(
+                            Bucket=self.bucket, Key=key, ContentType=content_type)['UploadId']
+                    part = bytes(buffer[:self.part_size])
+                    del buffer[:self.part_size]
+                    response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                       PartNumber=len(parts) + 1, Body=part)
+                    parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buffer), ContentType=content_type)
+                return size
+
+            if buffer:
+                response = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                   PartNumber=len(parts) + 1, Body=bytes(buffer))
+                parts.append({'PartNumber': len(parts) + 1, 'ETag': response['ETag']})
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                  MultipartUpload={'Parts': parts})
+            return size
+        except BaseException:
+            if upload_id is not None:
+                try:
+                    self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+                except Exception as e:
+                    logger.error(f"Erreur lors de l'abandon de l'envoi multipart de {name}: {str(e)}")
+            raise
+
+    def head(self, name):
+        """
+        Métadonnées d'un objet
+
+        Returns:
+            dict: Réponse de HeadObject, ou None si l'objet n'existe pas
+        """
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def read(self, name, start=None, end=None):
+        """
+        Lit un objet, entièrement ou sur une plage d'octets
+
+        Args:
+            name: Nom du fichier traité
+            start: Premier octet (None pour tout l'objet)
+            end: Dernier octet inclus
+
+        Yields:
+            bytes: Blocs du contenu
+        """
+        params = {'Bucket': self.bucket, 'Key': self.key(name)}
+        if start is not None:
+            params['Range'] = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(**params)['Body']
+        try:
+            yield from body.iter_chunks(READ_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def resolve(self, name):
+        """
+        Chemin local d'un fichier traité, récupéré depuis le bucket si besoin
+
+        La copie est publiée comme un fichier produit (préparation puis
+        renommage) et enregistrée dans l'index : elle expire et peut être
+        évincée comme les autres fichiers traités.
+
+        Returns:
+            str: Chemin local, ou None si le fichier n'existe nulle part
+        """
+        path = outputs.resolve(name)
+        if path is not None or not outputs.is_valid_name(name):
+            return path
+        if self.head(name) is None:
+            return None
+
+        with outputs.OutputStage() as stage:
+            tmp_path = stage.path(f"{uuid.uuid4().hex}.tmp")
+            with open(tmp_path, 'wb') as f:
+                for chunk in self.read(name):
+                    f.write(chunk)
+            path = stage.commit(tmp_path, name)
+        logger.info(f"Fichier traité récupéré depuis le stockage objet: {name}")
+
+        try:
+            catalog.record([{'path': path}], 'fetch')
+        except sqlite3.Error as e:
+            logger.error(f"Erreur lors de l'enregistrement dans l'index des fichiers: {str(e)}")
+        return path
+
+    def send(self, name, download_name, mimetype=None, offload=True):
+        """
+        Réponse de téléchargement depuis le bucket
+
+        Args:
+            name: Nom du fichier traité
+            download_name: Nom proposé au client
+            mimetype: Type du contenu (deviné depuis le nom si absent)
+            offload: Autoriser la redirection vers une URL présignée (à
+                     désactiver si l'objet est supprimé à la fin de la requête)
+
+        Returns:
+            Flask response (302, 200, 206 ou 416), ou None si le fichier n'existe pas
+        """
+        if not outputs.is_valid_name(name):
+            return None
+        mimetype = mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+        disposition = delivery.content_disposition(download_name)
+
+        if offload and self.presigned:
+            local_path = outputs.resolve(name)
+            if local_path is None and self.head(name) is None:
+                return None
+            if local_path is not None:
+                try:
+                    catalog.touch(local_path)
+                except sqlite3.Error as e:
+                    logger.error(f"Erreur lors de la mise à jour de l'index des fichiers: {str(e)}")
+            url = self.client.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': self.bucket, 'Key': self.key(name),
+                        'ResponseContentDisposition': disposition, 'ResponseContentType': mimetype},
+                ExpiresIn=self.presign_expires
+            )
+            return redirect(url, code=302)
+
+        # Copie locale disponible : envoi habituel (ETag, reprise)
+        local_path = outputs.resolve(name)
+        if local_path is not None:
+            return delivery.send_processed(local_path, download_name, mimetype=mimetype, offload=offload)
+
+        head = self.head(name)
+        if head is None:
+            return None
+        size = head['ContentLength']
+        etag = head.get('ETag', '').strip('"')
+
+        # Requête partielle (une seule plage) : lecture partielle de l'objet
+        content_range = None
+        if request.range is not None and (request.if_range.etag is None or request.if_range.etag == etag):
+            content_range = request.range.range_for_length(size)
+            if content_range is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f"bytes */{size}"
+                return response
+
+        if content_range is None:
+            body = self.read(name)
+            response = Response(body, mimetype=mimetype, direct_passthrough=True)
+            response.headers['Content-Length'] = str(size)
+        else:
+            start, stop = content_range
+            body = self.read(name, start, stop - 1)
+            response = Response(body, status=206, mimetype=mimetype, direct_passthrough=True)
+            response.headers['Content-Length'] = str(stop - start)
+            response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Content-Disposition'] = disposition
+        if etag:
+            response.set_etag(etag)
+        return response
+
+    def delete(self, names):
+        """
+        Supprime des objets (par lots de 1000, limite de DeleteObjects)
+
+        Args:
+            names: Noms des fichiers traités
+        """
+        keys = [{'Key': self.key(name)} for name in names]
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': keys[start:start + 1000],
+                                                                   'Quiet': True})
+
+
+def get_backend():
+    """
+    Retourne le stockage des fichiers traités configuré (STORAGE_BACKEND)
+
+    Returns:
+        LocalStorage ou S3Storage
+    """
+    global _backend
+    kind = (current_app.config.get('STORAGE_BACKEND') or 'local').lower()
+    key = (os.getpid(), kind, current_app.config.get('S3_BUCKET'), current_app.config.get('S3_ENDPOINT_URL'))
+    if _backend is None or _backend[0] != key:
+        if kind not in BACKENDS:
+            raise StorageError(f'Unknown storage backend: {kind}', 500)
+        _backend = (key, S3Storage(current_app.config) if kind == 's3' else LocalStorage())
+    return _backend[1]
+
+
+def is_shared():
+    """
+    Indique si les fichiers traités sont conservés hors du disque local
+
+    Returns:
+        bool: True si la copie locale d'un fichier peut être évincée sans le perdre
+    """
+    return get_backend().shared
+
+
+def publish(entries):
+    """
+    Envoie des fichiers publiés vers le stockage configuré
+
+    Un échec est journalisé : le fichier reste téléchargeable sur ce nœud.
+
+    Args:
+        entries: Dictionnaires décrivant les fichiers ('path')
+    """
+    backend = get_backend()
+    for entry in entries:
+        try:
+            backend.publish(entry['path'], os.path.basename(entry['path']))
+        except Exception as e:
+            logger.error(f"Erreur lors de l'envoi de {entry['path']} vers le stockage {backend.name}: {str(e)}")
+
+
+def resolve(name):
+    """
+    Chemin local d'un fichier traité (récupéré depuis le stockage partagé si besoin)
+
+    Args:
+        name: Nom du fichier (/download/<nom>)
+
+    Returns:
+        str: Chemin du fichier, ou None s'il n'existe pas
+    """
+    try:
+        return get_backend().resolve(name)
+    except StorageError:
+        raise
+    except Exception as e:
+        logger.error(f"Erreur lors de la récupération de {name} depuis le stockage: {str(e)}")
+        return outputs.resolve(name)
+
+
+def send(name, download_name, mimetype=None, offload=True):
+    """
+    Réponse de téléchargement d'un fichier traité (voir LocalStorage.send et S3Storage.send)
+
+    Returns:
+        Flask response, ou None si le fichier n'existe pas
+    """
+    return get_backend().send(name, download_name, mimetype=mimetype, offload=offload)
+
+
+def discard(names):
+    """
+    Supprime du stockage partagé des fichiers traités supprimés localement
+
+    Args:
+        names: Noms des fichiers traités
+    """
+    names = [name for name in names if name]
+    if not names:
+        return
+    backend = get_backend()
+    try:
+        backend.delete(names)
+    except Exception as e:
+        logger.error(f"Erreur lors de la suppression de {len(names)} fichiers du stockage {backend.name}: {str(e)}")
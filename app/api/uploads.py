@@ -0,0 +1,400 @@
+"""
+Envois de fichiers par morceaux, reprenables (protocole inspiré de tus)
+
+Un envoi est créé avec sa taille totale, puis ses morceaux sont transmis
+avec leur position (Upload-Offset), dans n'importe quel ordre et en
+parallèle. Chaque morceau est écrit directement à sa place dans le fichier
+définitif sous UPLOAD_FOLDER : il n'y a ni fichier temporaire ni
+réassemblage final. Comme avec tus, un octet n'est écrit qu'une fois : un
+morceau qui chevauche une zone déjà reçue, ou en cours d'écriture par un
+autre morceau, est refusé (409). L'empreinte SHA-256 est calculée au fil de l'eau sur la
+partie contiguë reçue ; le document terminé est stocké par contenu (voir
+blobs.py) et exposé sous forme d'identifiant (voir documents.py).
+
+L'état de chaque envoi est stocké dans DATA_DIR/chunked, protégé par un
+verrou flock pour les workers concurrents.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+from contextlib import contextmanager
+from flask import current_app, session
+from werkzeug.utils import secure_filename
+from . import blobs
+from . import coalesce
+from . import documents
+from .ingest import StagedFile
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus disponible
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Taille des blocs lus et écrits
+IO_CHUNK_SIZE = 1024 * 1024
+
+# Taille de morceau conseillée aux clients
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Durée après laquelle la zone réservée par un morceau interrompu (worker
+# arrêté pendant l'écriture) peut de nouveau être envoyée
+RESERVATION_TIMEOUT = 600
+
+# Calculs d'empreinte en cours dans ce processus : upload_id -> (hasher, position)
+_hashers = {}
+MAX_HASHERS = 64
+
+
+class UploadError(Exception):
+    """Erreur d'envoi par morceaux, avec le code HTTP à retourner"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_chunked_dir():
+    """
+    Retourne le répertoire des états d'envoi par morceaux
+
+    Returns:
+        str: Chemin vers le répertoire des états
+    """
+    chunked_dir = os.path.join(current_app.config['DATA_DIR'], 'chunked')
+    os.makedirs(chunked_dir, exist_ok=True)
+    return chunked_dir
+
+
+def _state_path(upload_id):
+    return os.path.join(get_chunked_dir(), f"{upload_id}.json")
+
+
+def _read_state(upload_id):
+    try:
+        with open(_state_path(upload_id), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(state):
+    """Écrit l'état de manière atomique"""
+    state_path = _state_path(state['upload_id'])
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, state_path)
+
+
+@contextmanager
+def _locked(upload_id):
+    """Verrou exclusif sur l'état d'un envoi"""
+    fd = os.open(os.path.join(get_chunked_dir(), f"{upload_id}.lock"), os.O_CREAT | os.O_RDWR, 0o640)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # Libère aussi le verrou
+
+
+def _add_range(ranges, start, end):
+    """Ajoute l'intervalle [start, end) à une liste d'intervalles triés et fusionnés"""
+    merged = []
+    for range_start, range_end in sorted(ranges + [[start, end]]):
+        if merged and range_start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], range_end)
+        else:
+            merged.append([range_start, range_end])
+    return merged
+
+
+def _overlaps(ranges, start, end):
+    """Indique si l'intervalle [start, end) chevauche un des intervalles"""
+    return any(range_start < end and start < range_end for range_start, range_end, *_ in ranges)
+
+
+def _contiguous_offset(ranges):
+    """Nombre d'octets reçus sans trou depuis le début du fichier"""
+    if ranges and ranges[0][0] == 0:
+        return ranges[0][1]
+    return 0
+
+
+def public_state(state):
+    """Informations d'état retournées au client"""
+    return {
+        'upload_id': state['upload_id'],
+        'filename': state['filename'],
+        'length': state['length'],
+        'offset': _contiguous_offset(state['ranges']),
+        'ranges': state['ranges'],
+        'complete': state.get('complete', False),
+        'handle': state.get('handle'),
+        'sha256': state.get('sha256'),
+        'deduplicated': state.get('deduplicated', False),
+        'chunk_size': DEFAULT_CHUNK_SIZE
+    }
+
+
+def create_upload(filename, length, sha256=None):
+    """
+    Crée un envoi par morceaux et réserve son fichier définitif
+
+    Si le client annonce l'empreinte d'un contenu déjà stocké (de même
+    taille), l'envoi est terminé dès sa création, sans aucun morceau à
+    transmettre (voir blobs.attach).
+
+    Args:
+        filename: Nom d'origine du fichier
+        length: Taille totale annoncée en octets
+        sha256: Empreinte SHA-256 annoncée par le client (facultative)
+
+    Returns:
+        dict: État public de l'envoi
+
+    Raises:
+        UploadError: Nom ou taille invalide
+    """
+    safe_filename = secure_filename(filename or '')
+    if not safe_filename:
+        raise UploadError('No file selected')
+
+    max_length = current_app.config.get('MAX_CONTENT_LENGTH')
+    if length <= 0:
+        raise UploadError('Upload-Length must be a positive integer')
+    if max_length and length > max_length:
+        raise UploadError('File too large', 413)
+
+    upload_id = uuid.uuid4().hex
+
+    # Contenu déjà stocké : rattaché à la session, rien à transférer
+    stored = blobs.attach(sha256.lower(), length, safe_filename) if sha256 else None
+    if stored is not None:
+        state = {
+            'upload_id': upload_id,
+            'session_id': documents.current_session_id(),
+            'filename': safe_filename,
+            'path': stored['path'],
+            'length': length,
+            'ranges': [[0, length]],
+            'hashed_offset': length,
+            'created_at': time.time(),
+            'sha256': stored['sha256'],
+            'handle': stored['handle'],
+            'deduplicated': True,
+            'complete': True
+        }
+        _write_state(state)
+        logger.info(f"Envoi par morceaux {upload_id} évité: contenu déjà stocké")
+        return public_state(state)
+
+    _, ext = os.path.splitext(safe_filename)
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    os.makedirs(upload_folder, exist_ok=True)
+    path = os.path.join(upload_folder, f"{upload_id}{ext.lower()}")
+
+    # Le fichier définitif est créé à sa taille finale ; les morceaux y sont écrits en place
+    fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o640)
+    try:
+        os.ftruncate(fd, length)
+    finally:
+        os.close(fd)
+
+    state = {
+        'upload_id': upload_id,
+        'session_id': documents.current_session_id(),
+        'filename': safe_filename,
+        'path': path,
+        'length': length,
+        'ranges': [],
+        'hashed_offset': 0,
+        'created_at': time.time(),
+        'complete': False
+    }
+    _write_state(state)
+    logger.info(f"Envoi par morceaux créé: {upload_id} ({length} octets)")
+    return public_state(state)
+
+
+def get_upload(upload_id):
+    """
+    Retourne l'état d'un envoi de la session courante
+
+    Raises:
+        UploadError: Envoi inconnu ou d'une autre session
+    """
+    if not upload_id or not UPLOAD_ID_PATTERN.match(upload_id):
+        raise UploadError('Invalid upload id')
+    state = _read_state(upload_id)
+    if state is None or state.get('session_id') != session.get('pdf_session_id'):
+        raise UploadError('Upload not found', 404)
+    return state
+
+
+def _advance_hash(state):
+    """
+    Fait avancer le calcul d'empreinte sur la partie contiguë reçue
+
+    Le calcul est porté par le processus qui l'a commencé ; les octets relus
+    viennent d'être écrits et sont normalement encore dans le cache disque.
+    Un autre processus ne peut pas reprendre un calcul en cours : l'empreinte
+    sera alors recalculée entièrement à la fin de l'envoi.
+    """
+    upload_id = state['upload_id']
+    frontier = _contiguous_offset(state['ranges'])
+    hashed_offset = state.get('hashed_offset', 0)
+    if frontier <= hashed_offset:
+        return
+
+    entry = _hashers.get(upload_id)
+    if entry is None or entry[1] != hashed_offset:
+        if hashed_offset != 0:
+            return
+        if len(_hashers) >= MAX_HASHERS:
+            _hashers.clear()
+        entry = (hashlib.sha256(), 0)
+
+    hasher, position = entry
+    with open(state['path'], 'rb') as f:
+        f.seek(position)
+        while position < frontier:
+            data = f.read(min(IO_CHUNK_SIZE, frontier - position))
+            if not data:
+                break
+            hasher.update(data)
+            position += len(data)
+
+    _hashers[upload_id] = (hasher, position)
+    state['hashed_offset'] = position
+
+
+def _final_hash(state):
+    """Empreinte du fichier complet, recalculée si ce processus n'a pas suivi l'envoi"""
+    entry = _hashers.pop(state['upload_id'], None)
+    if entry is not None and entry[1] == state['length']:
+        return entry[0].hexdigest()
+
+    logger.info(f"Empreinte de l'envoi {state['upload_id']} recalculée depuis le disque")
+    hasher = hashlib.sha256()
+    with open(state['path'], 'rb') as f:
+        for chunk in iter(lambda: f.read(IO_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _complete(state):
+    """Valide le fichier reçu et l'enregistre comme document"""
+    if state['filename'].lower().endswith('.pdf'):
+        with open(state['path'], 'rb') as f:
+            header = f.read(1024)
+        if b'%PDF-' not in header:
+            os.remove(state['path'])
+            state['failed'] = True
+            _write_state(state)
+            raise UploadError('Invalid file type. Please upload a PDF.')
+
+    state['sha256'] = _final_hash(state)
+    coalesce.remember_hash(state['path'], state['sha256'])
+
+    # Stockage par contenu : un envoi identique déjà stocké remplace le fichier reçu
+    stored = blobs.store(StagedFile(state['path'], state['filename'], state['length'], state['sha256']),
+                         state['filename'])
+    state['path'] = stored['path']
+    state['sha256'] = stored['sha256']
+    state['handle'] = stored['handle']
+    state['deduplicated'] = stored['deduplicated']
+    state['complete'] = True
+    logger.info(f"Envoi par morceaux terminé: {state['upload_id']} (sha256 {state['sha256'][:12]})")
+
+
+def write_chunk(upload_id, offset, stream, content_length):
+    """
+    Écrit un morceau à sa position dans le fichier définitif
+
+    La zone du morceau est réservée sous verrou, puis le corps est écrit sans
+    verrou (les morceaux concurrents occupent des zones disjointes) ; la mise
+    à jour de l'état est de nouveau verrouillée. Un morceau qui chevauche une
+    zone déjà reçue ou réservée est refusé : les octets déjà pris en compte
+    dans l'empreinte ne sont jamais réécrits. Si la connexion est
+    interrompue, la partie déjà reçue est conservée.
+
+    Args:
+        upload_id: Identifiant de l'envoi
+        offset: Position du morceau (en-tête Upload-Offset)
+        stream: Flux du corps de la requête
+        content_length: Taille annoncée du morceau
+
+    Returns:
+        dict: État public de l'envoi après écriture
+
+    Raises:
+        UploadError: Envoi inconnu, terminé, position ou taille invalide, zone déjà reçue
+    """
+    state = get_upload(upload_id)
+    if content_length is None:
+        raise UploadError('Content-Length required', 411)
+    if offset < 0 or offset + content_length > state['length']:
+        raise UploadError('Chunk outside of the announced Upload-Length', 409)
+
+    end = offset + content_length
+    with _locked(upload_id):
+        state = _read_state(upload_id)
+        if state.get('complete') or state.get('failed'):
+            raise UploadError('Upload already finished', 409)
+        now = time.time()
+        reserved = [entry for entry in state.get('reserved', []) if entry[2] > now]
+        if _overlaps(state['ranges'], offset, end) or _overlaps(reserved, offset, end):
+            raise UploadError('Chunk overlaps bytes already received', 409)
+        state['reserved'] = reserved + [[offset, end, now + RESERVATION_TIMEOUT]]
+        _write_state(state)
+
+    written = 0
+    interrupted = None
+    fd = os.open(state['path'], os.O_WRONLY)
+    try:
+        while written < content_length:
+            data = stream.read(min(IO_CHUNK_SIZE, content_length - written))
+            if not data:
+                break
+            os.pwrite(fd, data, offset + written)
+            written += len(data)
+    except Exception as e:
+        # Connexion interrompue : la partie reçue est conservée et la réservation levée
+        interrupted = e
+    finally:
+        os.close(fd)
+
+    with _locked(upload_id):
+        state = _read_state(upload_id)
+        state['reserved'] = [entry for entry in state.get('reserved', []) if entry[:2] != [offset, end]]
+        if written:
+            state['ranges'] = _add_range(state['ranges'], offset, offset + written)
+            _advance_hash(state)
+        if not state.get('complete') and _contiguous_offset(state['ranges']) == state['length']:
+            _complete(state)
+        _write_state(state)
+
+    if interrupted is not None:
+        raise interrupted
+    if written < content_length:
+        raise UploadError(f'Incomplete chunk: {written} of {content_length} bytes received', 400)
+    return public_state(state)
+
+
+def delete_upload(upload_id):
+    """Abandonne un envoi en cours et supprime ses données"""
+    state = get_upload(upload_id)
+    with _locked(upload_id):
+        if not state.get('complete') and os.path.exists(state['path']):
+            os.remove(state['path'])
+        _hashers.pop(upload_id, None)
+        os.remove(_state_path(upload_id))
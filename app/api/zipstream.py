@@ -0,0 +1,241 @@
+"""
+Archives ZIP produites au fil de l'eau
+
+L'archive est générée pendant l'envoi de la réponse : chaque fichier est lu
+par blocs et transmis aussitôt, sans construire l'archive en mémoire ni sur
+disque. La mémoire utilisée est bornée par la taille d'un bloc, quel que soit
+le volume de l'archive, et le premier octet part immédiatement.
+
+Les CRC ne sont connus qu'après la lecture de chaque fichier : ils sont
+transmis dans un descripteur de données placé après le contenu (bit 3 des
+indicateurs). Les PDF, déjà compressés, sont stockés sans compression par
+défaut ; la taille totale de l'archive est alors connue à l'avance
+(Content-Length). Le format ZIP64 est utilisé dès qu'une taille, une position
+ou le nombre d'entrées dépasse les limites du format ZIP classique.
+"""
+import os
+import time
+import zlib
+import struct
+
+# Taille des blocs lus et transmis
+CHUNK_SIZE = 256 * 1024
+
+# Limites du format ZIP classique
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+
+# Bit 3 : CRC et tailles dans le descripteur de données ; bit 11 : noms en UTF-8
+FLAGS = 0x0008 | 0x0800
+
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+VERSION_MADE_BY = 0x0300 | VERSION_ZIP64  # Unix
+
+
+def unique_name(name, used_names):
+    """
+    Retourne un nom d'entrée qui n'est pas encore utilisé dans l'archive
+
+    Args:
+        name: Nom souhaité
+        used_names: Ensemble des noms déjà utilisés (complété par cette fonction)
+
+    Returns:
+        str: Le nom, suffixé par _1, _2... en cas de doublon
+    """
+    candidate = name
+    counter = 1
+    while candidate in used_names:
+        base, ext = os.path.splitext(name)
+        candidate = f"{base}_{counter}{ext}"
+        counter += 1
+    used_names.add(candidate)
+    return candidate
+
+
+def _dos_datetime(timestamp):
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_date = ((year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return dos_time, dos_date
+
+
+class ZipEntry:
+    """
+    Fichier à inclure dans l'archive
+
+    Attributes:
+        path: Chemin du fichier
+        name: Nom dans l'archive
+        size: Taille du fichier, relevée à la création de l'entrée
+        method: METHOD_STORED ou METHOD_DEFLATED
+    """
+
+    def __init__(self, path, name, method):
+        st = os.stat(path)
+        self.path = path
+        self.name = name
+        self.encoded_name = name.encode('utf-8')
+        self.size = st.st_size
+        self.method = method
+        self.dos_time, self.dos_date = _dos_datetime(st.st_mtime)
+        # La taille compressée peut légèrement dépasser la taille d'origine
+        self.zip64 = self.size + self.size // 100 + 1024 >= ZIP64_LIMIT
+        self.crc = 0
+        self.compressed_size = self.size if method == METHOD_STORED else None
+        self.offset = 0
+
+    def local_header(self):
+        extra = b''
+        sizes = 0
+        if self.zip64:
+            # Tailles réelles dans le descripteur de données (sur 8 octets)
+            extra = struct.pack('<HHQQ', 0x0001, 16, 0, 0)
+            sizes = ZIP64_LIMIT
+        return struct.pack(
+            '<IHHHHHIIIHH',
+            0x04034b50,
+            VERSION_ZIP64 if self.zip64 else VERSION_DEFAULT,
+            FLAGS, self.method, self.dos_time, self.dos_date,
+            0, sizes, sizes,
+            len(self.encoded_name), len(extra)
+        ) + self.encoded_name + extra
+
+    def data_descriptor(self):
+        if self.zip64:
+            return struct.pack('<IIQQ', 0x08074b50, self.crc, self.compressed_size, self.size)
+        return struct.pack('<IIII', 0x08074b50, self.crc, self.compressed_size, self.size)
+
+    def central_header(self):
+        extra_fields = []
+        size = self.size
+        compressed_size = self.compressed_size
+        offset = self.offset
+        if size >= ZIP64_LIMIT:
+            extra_fields.append(size)
+            size = ZIP64_LIMIT
+        if compressed_size >= ZIP64_LIMIT:
+            extra_fields.append(compressed_size)
+            compressed_size = ZIP64_LIMIT
+        if offset >= ZIP64_LIMIT:
+            extra_fields.append(offset)
+            offset = ZIP64_LIMIT
+        extra = b''
+        if extra_fields:
+            extra = struct.pack(f'<HH{len(extra_fields)}Q', 0x0001, 8 * len(extra_fields), *extra_fields)
+        version = VERSION_ZIP64 if (self.zip64 or extra_fields) else VERSION_DEFAULT
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII',
+            0x02014b50, VERSION_MADE_BY, version,
+            FLAGS, self.method, self.dos_time, self.dos_date,
+            self.crc, compressed_size, size,
+            len(self.encoded_name), len(extra), 0, 0, 0,
+            0o100644 << 16, offset
+        ) + self.encoded_name + extra
+
+
+def _end_records(count, cd_offset, cd_size):
+    """Fin du répertoire central, précédée des enregistrements ZIP64 si nécessaire"""
+    records = b''
+    if count >= ZIP64_COUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT:
+        zip64_offset = cd_offset + cd_size
+        records += struct.pack(
+            '<IQHHIIQQQQ',
+            0x06064b50, 44, VERSION_MADE_BY, VERSION_ZIP64, 0, 0,
+            count, count, cd_size, cd_offset
+        )
+        records += struct.pack('<IIQI', 0x07064b50, 0, zip64_offset, 1)
+        count = min(count, ZIP64_COUNT_LIMIT)
+        cd_offset = min(cd_offset, ZIP64_LIMIT)
+        cd_size = min(cd_size, ZIP64_LIMIT)
+    records += struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, count, count, cd_size, cd_offset, 0)
+    return records
+
+
+class ZipStream:
+    """
+    Archive ZIP générée au fil de l'eau
+
+    S'itère pour obtenir les blocs de l'archive.
+
+    Args:
+        files: Liste de tuples (chemin, nom dans l'archive)
+        compression: 'auto' (PDF stockés, autres fichiers compressés), 'store' ou 'deflate'
+        chunk_size: Taille des blocs lus
+    """
+
+    def __init__(self, files, compression='auto', chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.entries = []
+        used_names = set()
+        for path, name in files:
+            if compression == 'store' or (compression == 'auto' and name.lower().endswith('.pdf')):
+                method = METHOD_STORED
+            else:
+                method = METHOD_DEFLATED
+            self.entries.append(ZipEntry(path, unique_name(name, used_names), method))
+
+    def size(self):
+        """
+        Taille exacte de l'archive, si elle est connue à l'avance
+
+        Returns:
+            int: Taille en octets, ou None si une entrée est compressée
+        """
+        if any(entry.method != METHOD_STORED for entry in self.entries):
+            return None
+        offset = 0
+        central_size = 0
+        for entry in self.entries:
+            entry.offset = offset
+            offset += len(entry.local_header()) + entry.size + len(entry.data_descriptor())
+            central_size += len(entry.central_header())
+        return offset + central_size + len(_end_records(len(self.entries), offset, central_size))
+
+    def _entry_data(self, entry):
+        """Lit le fichier d'une entrée et produit ses données, en calculant le CRC"""
+        crc = 0
+        read = 0
+        compressed_size = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15) if entry.method == METHOD_DEFLATED else None
+        with open(entry.path, 'rb') as f:
+            while read < entry.size:
+                data = f.read(min(self.chunk_size, entry.size - read))
+                if not data:
+                    raise IOError(f"Fichier tronqué pendant l'archivage: {entry.path}")
+                read += len(data)
+                crc = zlib.crc32(data, crc)
+                if compressor is not None:
+                    data = compressor.compress(data)
+                if data:
+                    compressed_size += len(data)
+                    yield data
+        if compressor is not None:
+            data = compressor.flush()
+            compressed_size += len(data)
+            yield data
+        entry.crc = crc & 0xFFFFFFFF
+        entry.compressed_size = compressed_size
+
+    def __iter__(self):
+        offset = 0
+        for entry in self.entries:
+            entry.offset = offset
+            header = entry.local_header()
+            yield header
+            offset += len(header)
+            for data in self._entry_data(entry):
+                yield data
+                offset += len(data)
+            descriptor = entry.data_descriptor()
+            yield descriptor
+            offset += len(descriptor)
+
+        central_directory = b''.join(entry.central_header() for entry in self.entries)
+        yield central_directory
+        yield _end_records(len(self.entries), offset, len(central_directory))
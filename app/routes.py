@@ -1,12 +1,21 @@
 import os
 import uuid
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_from_directory, session, abort
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, session, abort
 from werkzeug.utils import secure_filename
 import json
 import time
 import zipfile
 from io import BytesIO
 from app.api import pdf_processor
+from app.api import engine
+from app.api import blobs
+from app.api import ingest
+from app.api import staging
+from app.api import catalog
+from app.api import janitor
+from app.api import governor
+from app.api import storage
+from app.api import outputs
 import logging
 import datetime
 from app.auth import requires_auth, get_client_ip, rate_limit, validate_csrf_token, sanitize_redirect_url
@@ -16,17 +25,16 @@ logger = logging.getLogger(__name__)
 
 main = Blueprint('main', __name__)
 
+# Fichiers par page de « My Files »
+MY_FILES_PAGE_SIZE = 50
+MY_FILES_MAX_PAGE_SIZE = 200
+
 # Helper functions
 def allowed_file(filename, extensions=None):
     if extensions is None:
         extensions = {'pdf', 'jpg', 'jpeg', 'png', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in extensions
 
-def generate_unique_filename(filename):
-    """Génère un nom de fichier unique basé sur UUID"""
-    name, ext = os.path.splitext(filename)
-    return f"{uuid.uuid4().hex}{ext}"
-
 def ensure_dir(directory):
     """Crée un répertoire s'il n'existe pas déjà"""
     if not os.path.exists(directory):
@@ -57,14 +65,24 @@ def upload_file():
         return jsonify({'error': 'Trop de requêtes, veuillez réessayer plus tard.'}), 429
     
     logger.info("Entrée dans upload_file")
-    if 'file' not in request.files:
+    
+    # Fichiers annoncés par leur empreinte (JSON : liste de {name, size, sha256}) :
+    # ceux dont le contenu est déjà stocké ne sont pas transférés
+    try:
+        known_files = json.loads(request.form.get('known_files') or '[]')
+    except ValueError:
+        return jsonify({'error': 'Invalid known_files'}), 400
+    if not isinstance(known_files, list):
+        return jsonify({'error': 'Invalid known_files'}), 400
+    
+    if 'file' not in request.files and not known_files:
         logger.error("Pas de fichier dans request.files")
         return jsonify({'error': 'No file part'}), 400
     
     files = request.files.getlist('file')
-    logger.info(f"Fichiers reçus: {len(files)}")
+    logger.info(f"Fichiers reçus: {len(files)}, annoncés: {len(known_files)}")
     
-    if not files or files[0].filename == '':
+    if not known_files and (not files or files[0].filename == ''):
         logger.error("Pas de fichier sélectionné")
         return jsonify({'error': 'No file selected'}), 400
     
@@ -75,31 +93,64 @@ def upload_file():
         return jsonify({'error': 'Invalid CSRF token'}), 403
     
     uploaded_files = []
+    missing_files = []
+    for known in known_files:
+        if not isinstance(known, dict):
+            continue
+        filename = secure_filename(str(known.get('name') or ''))
+        if not filename or not allowed_file(filename):
+            continue
+        try:
+            size = int(known.get('size'))
+        except (TypeError, ValueError):
+            size = None
+        stored = blobs.attach(str(known.get('sha256') or '').lower(), size, filename)
+        if stored is None:
+            # Contenu inconnu : le client doit envoyer le fichier
+            missing_files.append({'name': known.get('name'), 'sha256': known.get('sha256')})
+            continue
+        uploaded_files.append(uploaded_file_info(filename, stored))
+    
     for file in files:
         if file and allowed_file(file.filename):
             # Validation supplémentaire du type de fichier
-            if file.filename.lower().endswith('.pdf') and not pdf_processor.is_valid_pdf(file):
+            # Fichier déjà écrit sur disque pendant la lecture de la requête
+            staged_file = ingest.stage(file)
+            if file.filename.lower().endswith('.pdf') and not pdf_processor.is_valid_pdf(staged_file):
                 logger.warning(f"Fichier PDF invalide rejeté: {file.filename}")
                 continue
                 
+            # Stockage par contenu : un fichier identique déjà reçu n'est pas conservé deux fois
             filename = secure_filename(file.filename)
-            unique_filename = generate_unique_filename(filename)
-            file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-            file.save(file_path)
-            logger.info(f"Fichier sauvegardé: {file_path}")
-            
-            # Get file information
-            file_size = os.path.getsize(file_path)
-            uploaded_files.append({
-                'name': filename,
-                'unique_name': unique_filename,
-                'size': file_size,
-                'formatted_size': pdf_processor.format_file_size(file_size),
-                'path': file_path
-            })
-    
-    logger.info(f"Fichiers uploadés: {len(uploaded_files)}")
-    return jsonify({'files': uploaded_files})
+            stored = blobs.store(staged_file, filename)
+            logger.info(f"Fichier sauvegardé: {stored['path']}")
+            uploaded_files.append(uploaded_file_info(filename, stored))
+    
+    logger.info(f"Fichiers uploadés: {len(uploaded_files)}, à envoyer: {len(missing_files)}")
+    return jsonify({'files': uploaded_files, 'missing': missing_files})
+
+def uploaded_file_info(filename, stored):
+    """
+    Description d'un fichier reçu retournée au client
+    
+    Args:
+        filename: Nom d'origine du fichier
+        stored: Fichier stocké (voir blobs.store)
+        
+    Returns:
+        dict: Informations du fichier
+    """
+    return {
+        'name': filename,
+        'unique_name': os.path.basename(stored['path']),
+        'size': stored['size'],
+        'formatted_size': pdf_processor.format_file_size(stored['size']),
+        'path': stored['path'],
+        'sha256': stored['sha256'],
+        'deduplicated': stored['deduplicated'],
+        # Identifiant utilisable par les points d'API à la place d'un nouvel envoi
+        'handle': stored['handle']
+    }
 
 @main.route('/merge-pdf', methods=['GET', 'POST'])
 def merge_pdf():
@@ -147,7 +198,7 @@ def merge_pdf():
     try:
         # Déléguer le traitement au composant C++
         logger.info("Début du traitement des fichiers...")
-        result = pdf_processor.merge_pdfs(files)
+        result = pdf_processor.merge_pdfs([ingest.stage(f) for f in files])
         logger.info(f"Résultat du traitement: {result}")
         flash('PDFs merged successfully!', 'success')
         return render_template('merge_pdf.html', success=True, download_url=result['url'])
@@ -174,15 +225,18 @@ def split_pdf():
     
     try:
         # Traitement avec un fichier PDF par page
-        results = pdf_processor.split_pdf(file, "all")
+        results = pdf_processor.split_pdf(ingest.stage(file), "all")
         
         # Créer un fichier ZIP contenant tous les fichiers PDF (une page par fichier)
         zip_filename = f"split_{uuid.uuid4().hex}.zip"
-        zip_path = os.path.join(current_app.config['PROCESSED_FOLDER'], zip_filename)
-        
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for result in results:
-                zipf.write(result['path'], os.path.basename(result['path']))
+        with outputs.OutputStage() as stage:
+            zip_path = stage.path(zip_filename)
+            with zipfile.ZipFile(zip_path, 'w') as zipf:
+                for result in results:
+                    zipf.write(result['path'], os.path.basename(result['path']))
+            zip_path = stage.commit(zip_path)
+        pdf_processor.register_outputs({'filename': zip_filename, 'path': zip_path}, 'split',
+                                       results[0].get('job_id') if results else None)
         
         flash('PDF split successfully!', 'success')
         return render_template('split_pdf.html', success=True, download_url=f"/download/{zip_filename}")
@@ -211,7 +265,7 @@ def compress_pdf():
     
     try:
         # Déléguer le traitement au composant C++
-        result = pdf_processor.compress_pdf(file, quality)
+        result = pdf_processor.compress_pdf(ingest.stage(file), quality)
         flash('PDF compressed successfully!', 'success')
         return render_template('compress_pdf.html', success=True, download_url=result['url'])
     except Exception as e:
@@ -240,7 +294,7 @@ def rotate_pdf():
     try:
         degrees = int(degrees)
         # Déléguer le traitement au composant C++
-        result = pdf_processor.rotate_pdf(file, degrees)
+        result = pdf_processor.rotate_pdf(ingest.stage(file), degrees)
         flash('PDF rotated successfully!', 'success')
         return render_template('rotate_pdf.html', success=True, download_url=result['url'])
     except ValueError:
@@ -257,7 +311,11 @@ def download_file(filename):
         logger.warning(f"Tentative d'accès à un fichier non sécurisé: {filename}")
         abort(404)
          
-    return send_from_directory(current_app.config['PROCESSED_FOLDER'], filename, as_attachment=True)
+    # Disque local, ou stockage partagé par tous les nœuds (URL présignée ou relais)
+    response = storage.send(filename, filename)
+    if response is None:
+        abort(404)
+    return response
 
 @main.route('/download-all')
 def download_all_files():
@@ -273,7 +331,8 @@ def download_session_files():
     # Récupérer les paramètres pour les transmettre à l'API
     session_id = request.args.get('session_id', '')
     clean_param = request.args.get('clean', 'false')
-    return redirect(url_for('api.download_session_files', session_id=session_id, clean=clean_param))
+    job_id = request.args.get('job')
+    return redirect(url_for('api.download_session_files', session_id=session_id, clean=clean_param, job=job_id))
 
 @main.route('/split-pdf')
 def split_pdf_page():
@@ -291,85 +350,62 @@ def my_files():
     # Obtenir l'ID de session de l'utilisateur
     session_id = pdf_processor.get_session_id()
     
-    # Obtenir le chemin du répertoire de traitement
-    processed_dir = pdf_processor.get_processed_dir()
-    
-    print(f"MY FILES: Checking for files in directory: {processed_dir}")
+    # Pagination (une session peut compter des milliers de fichiers)
+    per_page = min(max(request.args.get('per_page', MY_FILES_PAGE_SIZE, type=int), 1), MY_FILES_MAX_PAGE_SIZE)
+    total = catalog.count_files(session_id)
+    page_count = max((total + per_page - 1) // per_page, 1)
+    page = min(max(request.args.get('page', 1, type=int), 1), page_count)
     
     # Liste pour stocker les informations des fichiers
     files = []
     
-    # Liste temporaire pour tous les fichiers avant filtrage
-    all_files = []
-    
-    # Vérifier si le répertoire existe
-    if os.path.exists(processed_dir):
-        # Parcourir tous les fichiers du répertoire
-        for filename in os.listdir(processed_dir):
-            if filename.endswith('.pdf') or filename.endswith('.zip'):
-                print(f"MY FILES: Found file: {filename}")
-                file_path = os.path.join(processed_dir, filename)
-                file_stats = os.stat(file_path)
-                
-                # Calculer le temps écoulé depuis la création du fichier
-                creation_time = datetime.datetime.fromtimestamp(file_stats.st_mtime)
-                time_since_creation = datetime.datetime.now() - creation_time
-                
-                # Formater le temps écoulé
-                if time_since_creation.days > 0:
-                    time_elapsed = f"{time_since_creation.days} day{'s' if time_since_creation.days > 1 else ''}"
-                elif time_since_creation.seconds // 3600 > 0:
-                    hours = time_since_creation.seconds // 3600
-                    time_elapsed = f"{hours} hour{'s' if hours > 1 else ''}"
-                elif time_since_creation.seconds // 60 > 0:
-                    minutes = time_since_creation.seconds // 60
-                    time_elapsed = f"{minutes} minute{'s' if minutes > 1 else ''}"
-                else:
-                    time_elapsed = "a few seconds"
-                
-                # Créer une structure avec les informations du fichier
-                file_info = {
-                    'filename': filename,
-                    'display_name': filename.split('_', 1)[1] if '_' in filename else filename,
-                    'size': file_stats.st_size,
-                    'size_formatted': pdf_processor.format_file_size(file_stats.st_size),
-                    'creation_time': creation_time.strftime('%m/%d/%Y at %H:%M'),
-                    'time_elapsed': time_elapsed,
-                    'download_url': f"/download/{filename}",
-                    'is_zip': filename.endswith('.zip'),
-                    'is_split_page': '_page_' in filename and filename.endswith('.pdf')
-                }
-                
-                all_files.append(file_info)
-        
-        # Identifier les ZIP de fractionnement
-        split_zips = [f for f in all_files if f['is_zip'] and f['filename'].startswith('split_')]
-        print(f"MY FILES: Found {len(split_zips)} split ZIP files: {[z['filename'] for z in split_zips]}")
+    # Fichiers de la session depuis l'index, les plus récents d'abord ; les documents
+    # issus d'un découpage (présents dans leur archive) ne sont pas listés
+    for row in catalog.list_files(session_id, limit=per_page, offset=(page - 1) * per_page):
+        filename = row['name']
         
-        # Identifier les pages individuelles de fractionnement
-        split_pages = [f for f in all_files if f['is_split_page']]
-        print(f"MY FILES: Found {len(split_pages)} split pages")
+        # Calculer le temps écoulé depuis la création du fichier
+        creation_time = datetime.datetime.fromtimestamp(row['owned_at'])
+        time_since_creation = datetime.datetime.now() - creation_time
         
-        # Filtrer les fichiers pour exclure les pages individuelles
-        # si un fichier ZIP de fractionnement existe dans la même période
-        filtered_files = []
-        for file in all_files:
-            # Toujours inclure les fichiers ZIP et les fichiers qui ne sont pas des pages individuelles
-            if file['is_zip'] or not file['is_split_page']:
-                filtered_files.append(file)
-                print(f"MY FILES: Including file in filtered list: {file['filename']}")
-            # Pour les pages individuelles, ne les garder que si elles n'ont pas de ZIP correspondant créé à peu près au même moment
-            elif file['is_split_page']:
-                # On ne garde pas les pages individuelles (comportement existant)
-                print(f"MY FILES: Excluding split page from filtered list: {file['filename']}")
-                continue
-        
-        files = filtered_files
+        # Formater le temps écoulé
+        if time_since_creation.days > 0:
+            time_elapsed = f"{time_since_creation.days} day{'s' if time_since_creation.days > 1 else ''}"
+        elif time_since_creation.seconds // 3600 > 0:
+            hours = time_since_creation.seconds // 3600
+            time_elapsed = f"{hours} hour{'s' if hours > 1 else ''}"
+        elif time_since_creation.seconds // 60 > 0:
+            minutes = time_since_creation.seconds // 60
+            time_elapsed = f"{minutes} minute{'s' if minutes > 1 else ''}"
+        else:
+            time_elapsed = "a few seconds"
         
-        # Trier les fichiers par date de création (les plus récents d'abord)
-        files.sort(key=lambda x: x['creation_time'], reverse=True)
-    
-    return render_template('my_files.html', files=files)
+        # Créer une structure avec les informations du fichier
+        files.append({
+            'filename': filename,
+            'display_name': filename.split('_', 1)[1] if '_' in filename else filename,
+            'size': row['size'],
+            'size_formatted': pdf_processor.format_file_size(row['size']),
+            'creation_time': creation_time.strftime('%m/%d/%Y at %H:%M'),
+            'time_elapsed': time_elapsed,
+            'download_url': f"/download/{filename}",
+            'is_zip': filename.endswith('.zip'),
+            'is_split_page': row['kind'] == 'page',
+            'operation': row['operation'],
+            'page_count': row['page_count']
+        })
+    
+    logger.debug(f"Mes fichiers: page {page}/{page_count}, {len(files)} fichiers sur {total}")
+    
+    pagination = {
+        'page': page,
+        'per_page': per_page,
+        'page_count': page_count,
+        'total': total,
+        'prev_url': url_for('main.my_files', page=page - 1, per_page=per_page) if page > 1 else None,
+        'next_url': url_for('main.my_files', page=page + 1, per_page=per_page) if page < page_count else None
+    }
+    return render_template('my_files.html', files=files, pagination=pagination)
 
 @main.route('/admin')
 @requires_auth
@@ -383,24 +419,75 @@ def admin_dashboard():
         'disk_usage_formatted': '0 MB'
     }
     
-    # Compter les fichiers
+    # Compter les fichiers (compteurs de l'index tenus à jour à chaque écriture, en temps constant)
     try:
-        upload_dir = current_app.config['UPLOAD_FOLDER']
-        processed_dir = current_app.config['PROCESSED_FOLDER']
-        
-        if os.path.exists(upload_dir):
-            stats['upload_count'] = len([f for f in os.listdir(upload_dir) if os.path.isfile(os.path.join(upload_dir, f))])
-            
-        if os.path.exists(processed_dir):
-            stats['processed_count'] = len([f for f in os.listdir(processed_dir) if os.path.isfile(os.path.join(processed_dir, f))])
-            
-        # Calculer l'utilisation du disque
-        stats['disk_usage'] = sum(os.path.getsize(os.path.join(upload_dir, f)) for f in os.listdir(upload_dir) if os.path.isfile(os.path.join(upload_dir, f)))
-        stats['disk_usage'] += sum(os.path.getsize(os.path.join(processed_dir, f)) for f in os.listdir(processed_dir) if os.path.isfile(os.path.join(processed_dir, f)))
+        catalog_stats = catalog.get_stats()
+        stats['upload_count'] = catalog_stats['uploads']['count']
+        stats['processed_count'] = catalog_stats['processed']['count']
+        stats['disk_usage'] = catalog_stats['uploads']['bytes'] + catalog_stats['processed']['bytes']
         stats['disk_usage_formatted'] = pdf_processor.format_file_size(stats['disk_usage'])
+        
+        # Répartition par opération (fusion, découpage, compression...), fichiers reçus compris
+        stats['operations'] = [
+            dict(item, bytes_formatted=pdf_processor.format_file_size(item['bytes']))
+            for area in ('processed', 'uploads')
+            for item in catalog_stats[area]['operations']
+        ]
     except Exception as e:
         logger.error(f"Erreur lors du calcul des statistiques: {str(e)}")
     
+    # Part des traitements servis depuis les fichiers de travail en mémoire
+    stats['staging'] = staging.get_stats()
+    if stats['staging']:
+        stats['staging']['reserved_formatted'] = pdf_processor.format_file_size(stats['staging']['reserved'])
+        stats['staging']['budget_formatted'] = pdf_processor.format_file_size(stats['staging']['budget'])
+    
+    # Statistiques du cache de documents du moteur résident
+    stats['engine'] = engine.get_stats()
+    if stats['engine']:
+        stats['engine']['bytes_formatted'] = pdf_processor.format_file_size(stats['engine']['bytes'])
+        stats['engine']['budget_formatted'] = pdf_processor.format_file_size(stats['engine']['budget'])
+    
+    # Nettoyage en continu : espace récupéré et fichiers expirés en attente
+    try:
+        stats['janitor'] = janitor.get_metrics()
+    except Exception as e:
+        logger.error(f"Erreur lors de la lecture des métriques du janitor: {str(e)}")
+        stats['janitor'] = None
+    if stats['janitor']:
+        stats['janitor']['reclaimed_formatted'] = pdf_processor.format_file_size(stats['janitor'].get('reclaimed_bytes', 0))
+        stats['janitor']['backlog_formatted'] = pdf_processor.format_file_size(stats['janitor'].get('backlog_bytes', 0))
+    
+    # Gouverneur de stockage : occupation du volume et fichiers évincés sous pression disque
+    try:
+        stats['storage'] = dict(governor.get_usage(), **governor.get_metrics())
+    except Exception as e:
+        logger.error(f"Erreur lors de la lecture des métriques du gouverneur de stockage: {str(e)}")
+        stats['storage'] = None
+    if stats['storage']:
+        stats['storage']['used_formatted'] = pdf_processor.format_file_size(stats['storage']['used'])
+        stats['storage']['total_formatted'] = pdf_processor.format_file_size(stats['storage']['total'])
+        stats['storage']['evicted_formatted'] = pdf_processor.format_file_size(stats['storage'].get('evicted_bytes', 0))
+    
+    # Déduplication des fichiers reçus : ratio et octets évités
+    try:
+        stats['dedup'] = catalog.get_dedup_stats()
+    except Exception as e:
+        logger.error(f"Erreur lors de la lecture des statistiques de déduplication: {str(e)}")
+        stats['dedup'] = None
+    if stats['dedup']:
+        stats['dedup']['saved_formatted'] = pdf_processor.format_file_size(stats['dedup']['saved_bytes'])
+        stats['dedup']['stored_formatted'] = pdf_processor.format_file_size(stats['dedup']['stored_bytes'])
+    
+    # File des traitements asynchrones
+    try:
+        stats['jobs'] = catalog.get_job_stats()
+    except Exception as e:
+        logger.error(f"Erreur lors de la lecture de la file des traitements: {str(e)}")
+        stats['jobs'] = None
+    if stats['jobs'] and stats['jobs']['oldest_queued']:
+        stats['jobs']['oldest_wait'] = int(time.time() - stats['jobs']['oldest_queued'])
+    
     return render_template('admin/dashboard.html', stats=stats)
 
 @main.route('/admin/clean-files', methods=['POST'])
@@ -413,6 +500,9 @@ def admin_clean_files():
         return redirect(url_for('main.admin_dashboard'))
     
     try:
+        # Réparer l'index des fichiers avant de nettoyer
+        catalog.reconcile()
+        
         # Nettoyer les fichiers
         pdf_processor.clean_old_sessions(max_age_hours=1)  # Nettoyer les fichiers de plus d'une heure
         flash('Les fichiers ont été nettoyés avec succès.', 'success')
@@ -44,6 +44,148 @@ function showNotification(message, type = 'success') {
     }
 }
 
+/**
+ * Send a single chunk of a chunked upload, retrying with backoff on failure
+ * @param {string} uploadId - Upload identifier returned by the server
+ * @param {Blob} chunk - Chunk content
+ * @param {number} offset - Position of the chunk in the file
+ * @param {number} retries - Maximum number of retries
+ * @return {Promise<Object>} Promise resolving to the upload state
+ */
+function sendUploadChunk(uploadId, chunk, offset, retries = 5) {
+    return new Promise((resolve, reject) => {
+        let attempt = 0;
+
+        const send = () => {
+            const xhr = new XMLHttpRequest();
+            xhr.open('PATCH', `/api/uploads/${uploadId}`, true);
+            xhr.setRequestHeader('Tus-Resumable', '1.0.0');
+            xhr.setRequestHeader('Upload-Offset', String(offset));
+            xhr.setRequestHeader('Content-Type', 'application/offset+octet-stream');
+
+            const retry = (message) => {
+                attempt++;
+                if (attempt > retries) {
+                    reject(new Error(message));
+                    return;
+                }
+                // Exponential backoff: 0.5s, 1s, 2s, 4s...
+                setTimeout(send, 500 * Math.pow(2, attempt - 1));
+            };
+
+            xhr.onload = function() {
+                if (xhr.status === 200) {
+                    resolve(JSON.parse(xhr.responseText).data);
+                } else if (xhr.status >= 500 || xhr.status === 0) {
+                    retry(`Chunk upload failed (HTTP ${xhr.status})`);
+                } else {
+                    // Client errors (offset out of range, invalid PDF...) are not retried
+                    let message = `Chunk upload failed (HTTP ${xhr.status})`;
+                    try {
+                        message = JSON.parse(xhr.responseText).error || message;
+                    } catch (error) {}
+                    reject(new Error(message));
+                }
+            };
+            xhr.onerror = () => retry('Network error during chunk upload');
+            xhr.send(chunk);
+        };
+
+        send();
+    });
+}
+
+// Files up to this size are hashed before upload, so that content already stored is not sent again
+const UPLOAD_HASH_MAX_SIZE = 64 * 1024 * 1024;
+
+/**
+ * Compute the SHA-256 of a file, when the browser allows it
+ * @param {File} file - File to hash
+ * @return {Promise<string|null>} Promise resolving to the hex digest, or null
+ */
+async function hashFile(file) {
+    if (!window.crypto || !window.crypto.subtle || file.size > UPLOAD_HASH_MAX_SIZE) {
+        return null;
+    }
+    try {
+        const digest = await window.crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+        return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+    } catch (error) {
+        return null;
+    }
+}
+
+/**
+ * Upload a file in chunks sent in parallel, through the resumable upload API
+ * @param {File} file - File to upload
+ * @param {Object} options - onProgress(loaded, total) callback, parallel chunk count
+ * @return {Promise<Object>} Promise resolving to the finished upload (with its document handle)
+ */
+async function uploadFileInChunks(file, options = {}) {
+    const onProgress = options.onProgress || function() {};
+    const parallel = options.parallel || 3;
+
+    // Announce the content hash: the server skips the transfer if it already stores this content
+    let metadata = 'filename ' + btoa(unescape(encodeURIComponent(file.name)));
+    const sha256 = await hashFile(file);
+    if (sha256) {
+        metadata += ',sha256 ' + btoa(sha256);
+    }
+
+    const createResponse = await fetch('/api/uploads', {
+        method: 'POST',
+        headers: {
+            'Tus-Resumable': '1.0.0',
+            'Upload-Length': String(file.size),
+            'Upload-Metadata': metadata
+        }
+    });
+    const created = await createResponse.json();
+    if (!createResponse.ok) {
+        throw new Error(created.error || `Upload creation failed (HTTP ${createResponse.status})`);
+    }
+    if (created.data.complete) {
+        onProgress(file.size, file.size);
+        return created.data;
+    }
+
+    const uploadId = created.data.upload_id;
+    const chunkSize = created.data.chunk_size;
+
+    // Chunks waiting to be sent, shared by the parallel senders
+    const offsets = [];
+    for (let offset = 0; offset < file.size; offset += chunkSize) {
+        offsets.push(offset);
+    }
+
+    let loaded = 0;
+    let finalState = created.data;
+
+    const worker = async () => {
+        while (offsets.length > 0) {
+            const offset = offsets.shift();
+            const chunk = file.slice(offset, Math.min(offset + chunkSize, file.size));
+            const state = await sendUploadChunk(uploadId, chunk, offset);
+            loaded += chunk.size;
+            onProgress(loaded, file.size);
+            if (state.complete) {
+                finalState = state;
+            }
+        }
+    };
+
+    const workers = [];
+    for (let i = 0; i < Math.min(parallel, offsets.length); i++) {
+        workers.push(worker());
+    }
+    await Promise.all(workers);
+
+    if (!finalState.complete) {
+        throw new Error('Upload did not complete');
+    }
+    return finalState;
+}
+
 // Debug logging
 document.addEventListener('DOMContentLoaded', function() {
     console.log('PDF Studio initialized');
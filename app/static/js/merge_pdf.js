@@ -338,12 +338,52 @@ document.addEventListener('DOMContentLoaded', function() {
         previewContainer.classList.add('hidden');
         progressContainer.classList.remove('hidden');
         
+        // Initialize progress
+        updateProgress(0, 'Preparing files... ');
+        
+        // Upload each file in resumable chunks, then merge them by document handle
+        uploadSelectedFiles().then(handles => {
+            sendMergeRequest(handles);
+        }).catch(error => {
+            console.error('Upload failed:', error);
+            updateProgress(100, 'Error: ' + error.message + ' ');
+            progressText.classList.add('text-red-500');
+        });
+    }
+    
+    /**
+     * Upload the selected files in chunks (0-50% of the progress bar)
+     * @return {Promise<string[]>} Promise resolving to the document handles, in merge order
+     */
+    async function uploadSelectedFiles() {
+        const total = selectedFiles.reduce((sum, file) => sum + file.size, 0) || 1;
+        let uploadedBefore = 0;
+        const handles = [];
+        
+        for (const file of selectedFiles) {
+            const upload = await uploadFileInChunks(file, {
+                onProgress: (loaded) => {
+                    updateProgress(((uploadedBefore + loaded) / total) * 50, 'Uploading files... ');
+                }
+            });
+            uploadedBefore += file.size;
+            handles.push(upload.handle);
+        }
+        
+        return handles;
+    }
+    
+    /**
+     * Ask the server to merge the uploaded documents
+     * @param {string[]} handles - Document handles of the uploaded files
+     */
+    function sendMergeRequest(handles) {
         // Create FormData to send to server
         const formData = new FormData();
         
-        // Add each file
-        selectedFiles.forEach((file, index) => {
-            formData.append('files[]', file);
+        // Add each document handle
+        handles.forEach((handle) => {
+            formData.append('handles[]', handle);
         });
         
         // Add sort method
@@ -360,20 +400,8 @@ document.addEventListener('DOMContentLoaded', function() {
             formData.append('csrf_token', csrfToken);
         }
         
-        // Setup for progress tracking
         const xhr = new XMLHttpRequest();
         
-        // Listen for progress events if supported
-        if (xhr.upload) {
-            xhr.upload.addEventListener('progress', function(event) {
-                if (event.lengthComputable) {
-                    // Calculate upload progress (0-50%)
-                    const uploadPercentage = (event.loaded / event.total) * 50;
-                    updateProgress(uploadPercentage, 'Uploading files... ');
-                }
-            });
-        }
-        
         xhr.onreadystatechange = function() {
             if (xhr.readyState === 4) {
                 if (xhr.status === 200) {
@@ -409,9 +437,6 @@ document.addEventListener('DOMContentLoaded', function() {
             xhr.setRequestHeader('X-CSRFToken', csrfToken);
         }
         xhr.send(formData);
-        
-        // Initialize progress
-        updateProgress(0, 'Preparing files... ');
     }
     
     /**
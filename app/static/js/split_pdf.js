@@ -19,6 +19,7 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // State variables
     let selectedFile = null;
+    let selectedUpload = null; // Promise of the chunked upload of the selected file
     let currentPageCount = 0;
     
     // Set up UI initial state
@@ -42,13 +43,13 @@ document.addEventListener('DOMContentLoaded', function() {
     
     /**
      * Gets the exact page count from the backend
-     * @param {File} file - The PDF file to analyze
+     * @param {string} handle - Document handle of the uploaded PDF
      * @return {Promise<number>} Promise resolving to page count
      */
-    async function getExactPageCount(file) {
+    async function getExactPageCount(handle) {
         return new Promise((resolve) => {
             const formData = new FormData();
-            formData.append('file', file);
+            formData.append('handle', handle);
             
             const xhr = new XMLHttpRequest();
             xhr.open('POST', '/api/pdf-info', true);
@@ -123,11 +124,21 @@ document.addEventListener('DOMContentLoaded', function() {
         const fileSize = formatFileSize(file.size);
         if (fileInfo) fileInfo.textContent = fileSize;
         
-        // Get exact page count from backend
-        updateProgress(20, 'Analyzing PDF...');
+        // Upload the file once, in resumable chunks; analysis and split reuse its handle
+        updateProgress(0, 'Uploading PDF...');
         if (progressContainer) progressContainer.style.display = 'block';
         
-        getExactPageCount(file).then(pageCount => {
+        selectedUpload = uploadFileInChunks(file, {
+            onProgress: (loaded, total) => {
+                updateProgress(Math.round((loaded / total) * 80), 'Uploading PDF...');
+            }
+        });
+        
+        // Get exact page count from backend
+        selectedUpload.then(upload => {
+            updateProgress(90, 'Analyzing PDF...');
+            return getExactPageCount(upload.handle);
+        }).then(pageCount => {
             // Update file info with exact page count
             if (fileInfo) {
                 fileInfo.textContent = `${fileSize} - ${pageCount} page${pageCount > 1 ? 's' : ''}`;
@@ -156,6 +167,7 @@ document.addEventListener('DOMContentLoaded', function() {
         // Reset file input
         if (fileInput) fileInput.value = '';
         selectedFile = null;
+        selectedUpload = null;
         currentPageCount = 0;
         
         // Reset split button state
@@ -268,14 +280,14 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Create FormData object
         const formData = new FormData();
-        formData.append('file', selectedFile);
+        formData.append('operation', 'split');
         
         // Get CSRF token
         const csrfToken = getCsrfToken();
         
-        // Setup request
+        // Setup request: the split is queued as an asynchronous job
         const xhr = new XMLHttpRequest();
-        xhr.open('POST', '/api/split-pdf', true);
+        xhr.open('POST', '/api/jobs', true);
         
         // Set CSRF token header if available
         if (csrfToken) {
@@ -290,18 +302,13 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         };
         
-        // Handle completion
+        // Handle completion: the job is queued, follow it until it finishes
         xhr.onload = function() {
-            if (xhr.status === 200) {
+            if (xhr.status === 202) {
                 try {
-                    const data = JSON.parse(xhr.responseText);
-                    updateProgress(100, 'PDF split successfully!');
-            
-                    // After a short delay to show 100% progress
-                    setTimeout(() => {
-                        if (progressContainer) progressContainer.style.display = 'none';
-                        showResult(data);
-                    }, 500);
+                    const created = JSON.parse(xhr.responseText);
+                    updateProgress(50, 'Waiting for a worker...');
+                    pollJob(created.data.status_url, JOB_POLL_MIN_DELAY);
                 } catch (error) {
                     showError(`Processing response error: ${error.message}`);
                 }
@@ -315,21 +322,60 @@ document.addEventListener('DOMContentLoaded', function() {
             showError('Network error during file sending.');
         };
         
-        // Send the request
-        xhr.send(formData);
-        
-        // Simulate processing while waiting for response
-        let processingProgress = 50;
-        const progressInterval = setInterval(() => {
-            processingProgress += 2;
-            if (processingProgress >= 90) {
-                clearInterval(progressInterval);
-                return;
-            }
-            
-            let message = processingProgress < 70 ? 'Splitting PDF...' : 'Finalizing...';
-            updateProgress(processingProgress, message);
-        }, 200);
+        // Send the request once the file upload has finished
+        selectedUpload.then(upload => {
+            formData.append('handle', upload.handle);
+            // Only the page index is built: each page is generated when first downloaded
+            formData.append('lazy', 'true');
+            xhr.send(formData);
+        }).catch(error => {
+            showError(`Upload error: ${error.message}`);
+        });
+    }
+    
+    // Delay between two job status requests (grows while the job is pending)
+    const JOB_POLL_MIN_DELAY = 300;
+    const JOB_POLL_MAX_DELAY = 2000;
+    
+    /**
+     * Follows an asynchronous job until it finishes, then shows its result
+     * @param {string} statusUrl - Job status URL returned when the job was queued
+     * @param {number} delay - Delay before the next status request (ms)
+     */
+    function pollJob(statusUrl, delay) {
+        setTimeout(() => {
+            fetch(statusUrl, { credentials: 'same-origin', cache: 'no-store' })
+            .then(response => response.json().then(body => ({ ok: response.ok, status: response.status, body })))
+            .then(({ ok, status, body }) => {
+                if (!ok) {
+                    showError(body.error || `HTTP error! Status: ${status}`);
+                    return;
+                }
+                
+                const job = body.data;
+                if (job.status === 'succeeded') {
+                    updateProgress(100, 'PDF split successfully!');
+                    
+                    // After a short delay to show 100% progress
+                    setTimeout(() => {
+                        if (progressContainer) progressContainer.style.display = 'none';
+                        showResult(job.result);
+                    }, 500);
+                } else if (job.status === 'failed' || job.status === 'cancelled') {
+                    showError((job.result && job.result.error) || job.error || 'The split failed.');
+                } else {
+                    if (job.status === 'queued') {
+                        updateProgress(55, job.position ? `Waiting in queue (${job.position} before yours)...` : 'Waiting for a worker...');
+                    } else {
+                        updateProgress(75, 'Splitting PDF...');
+                    }
+                    pollJob(statusUrl, Math.min(delay * 1.5, JOB_POLL_MAX_DELAY));
+                }
+            })
+            .catch(error => {
+                showError(`Network error while following the split: ${error.message}`);
+            });
+        }, delay);
     }
     
     /**
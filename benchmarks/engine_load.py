@@ -0,0 +1,150 @@
+"""
+Mesure du chargement des documents par pdfeditor
+
+Pour chaque taille de fichier, génère un PDF de test puis mesure la durée
+et la mémoire résidente maximale (ru_maxrss) de `pdfeditor info`, avec le
+chargement par projection mémoire (par défaut) et avec la lecture classique
+(PDFEDITOR_NO_MMAP=1). Le mode --concurrency lance plusieurs chargements
+simultanés du même fichier, comme des découpages concurrents d'un même envoi.
+
+Les pages projetées sont comptées dans la mémoire résidente de chaque
+processus alors qu'elles ne sont présentes qu'une fois dans le cache du
+noyau : la colonne "privée" (RSS moins taille du fichier) donne une
+estimation de la mémoire réellement propre à chaque traitement.
+
+Usage:
+    python benchmarks/engine_load.py --sizes 10,50,200 --concurrency 4
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_PDFEDITOR = os.path.join(BASE_DIR, 'bin', 'pdfeditor')
+
+# Taille du flux de contenu de chaque page générée
+PAGE_STREAM_SIZE = 512 * 1024
+
+
+def generate_pdf(path, size_mb):
+    """
+    Écrit un PDF valide d'environ size_mb Mo (pages avec un flux de contenu incompressible)
+
+    Args:
+        path: Chemin du fichier à créer
+        size_mb: Taille visée en Mo
+
+    Returns:
+        int: Nombre de pages
+    """
+    page_count = max(1, (size_mb * 1024 * 1024) // PAGE_STREAM_SIZE)
+    offsets = []
+    with open(path, 'wb') as f:
+        def write_object(number, body):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode('ascii'))
+            f.write(body)
+            f.write(b"\nendobj\n")
+
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        kids = ' '.join(f"{3 + 2 * i} 0 R" for i in range(page_count))
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {page_count} >>".encode('ascii'))
+        for i in range(page_count):
+            page_number = 3 + 2 * i
+            write_object(page_number, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                                      f"/Contents {page_number + 1} 0 R >>".encode('ascii'))
+            # Commentaire PDF aléatoire : le flux est valide et ne se compresse pas
+            filler = b'%' + os.urandom(PAGE_STREAM_SIZE).replace(b'\n', b' ').replace(b'\r', b' ') + b'\n'
+            write_object(page_number + 1, f"<< /Length {len(filler)} >>\nstream\n".encode('ascii') +
+                         filler + b"endstream")
+
+        xref_offset = f.tell()
+        f.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode('ascii'))
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode('ascii'))
+        f.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\n"
+                f"startxref\n{xref_offset}\n%%EOF\n".encode('ascii'))
+    return page_count
+
+
+def drop_page_cache(path):
+    """Retire le fichier du cache du noyau si possible, pour mesurer un chargement à froid"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def run_loads(pdfeditor, path, concurrency, use_mmap):
+    """
+    Lance concurrency chargements simultanés du fichier
+
+    Returns:
+        Tuple (durée totale en secondes, liste des RSS maximales en octets)
+    """
+    env = dict(os.environ)
+    if use_mmap:
+        env.pop('PDFEDITOR_NO_MMAP', None)
+    else:
+        env['PDFEDITOR_NO_MMAP'] = '1'
+
+    start = time.monotonic()
+    processes = [
+        subprocess.Popen([pdfeditor, 'info', path], stdout=subprocess.DEVNULL,
+                         stderr=subprocess.DEVNULL, env=env)
+        for _ in range(concurrency)
+    ]
+    peaks = []
+    for process in processes:
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        if process.returncode != 0:
+            raise RuntimeError(f"pdfeditor info a échoué (code {process.returncode})")
+        peaks.append(usage.ru_maxrss * 1024)  # Ko sous Linux
+    return time.monotonic() - start, peaks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--pdfeditor', default=DEFAULT_PDFEDITOR, help="Chemin de l'exécutable pdfeditor")
+    parser.add_argument('--sizes', default='10,50,200', help="Tailles des fichiers de test, en Mo")
+    parser.add_argument('--concurrency', type=int, default=1, help="Chargements simultanés du même fichier")
+    parser.add_argument('--repeat', type=int, default=3, help="Répétitions par mesure (la meilleure est retenue)")
+    parser.add_argument('--cold', action='store_true', help="Vider le cache du noyau avant chaque mesure")
+    args = parser.parse_args()
+
+    if not os.access(args.pdfeditor, os.X_OK):
+        sys.exit(f"pdfeditor introuvable: {args.pdfeditor} (compiler avec: cd cppeditor && make)")
+
+    mb = 1024 * 1024
+    print(f"{'taille':>8} {'pages':>6} {'mode':>6} {'durée (s)':>10} {'RSS max (Mo)':>13} {'privée (Mo)':>12}")
+    with tempfile.TemporaryDirectory(prefix='pdfstudio-bench-') as work_dir:
+        for size_mb in [int(size) for size in args.sizes.split(',') if size]:
+            path = os.path.join(work_dir, f"bench_{size_mb}mb.pdf")
+            page_count = generate_pdf(path, size_mb)
+            file_size = os.path.getsize(path)
+
+            for use_mmap in (False, True):
+                best = None
+                for _ in range(args.repeat):
+                    if args.cold:
+                        drop_page_cache(path)
+                    elapsed, peaks = run_loads(args.pdfeditor, path, args.concurrency, use_mmap)
+                    if best is None or elapsed < best[0]:
+                        best = (elapsed, peaks)
+                elapsed, peaks = best
+                peak = max(peaks)
+                private = max(0, peak - file_size) if use_mmap else peak
+                print(f"{file_size / mb:>7.1f}M {page_count:>6} {'mmap' if use_mmap else 'read':>6} "
+                      f"{elapsed:>10.3f} {peak / mb:>13.1f} {private / mb:>12.1f}")
+
+
+if __name__ == '__main__':
+    main()
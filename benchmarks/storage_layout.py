@@ -0,0 +1,133 @@
+"""
+Mesure des opérations sur le répertoire des fichiers traités
+
+Compare, pour plusieurs volumes de fichiers conservés, l'ancien répertoire
+processed à plat et la répartition en sous-répertoires de
+app/api/outputs.py (processed/ab/cd/<nom>) :
+
+    publish   publication de nouveaux fichiers (création puis renommage)
+    lookup    résolution d'un nom (/download/<nom>) : stat du chemin
+    delete    suppression de fichiers
+    scan      parcours complet avec stat de chaque fichier (ancien my_files,
+              tableau de bord et nettoyage ; désormais réservé à la
+              réconciliation de l'index)
+
+Les fichiers sont vides : seules les opérations sur les répertoires sont
+mesurées. Le cache des entrées de répertoire du noyau étant chaud, les
+écarts sur disque froid sont plus importants.
+
+Usage:
+    python benchmarks/storage_layout.py --counts 10000,100000,1000000 --ops 2000
+"""
+import os
+import sys
+import time
+import uuid
+import random
+import shutil
+import hashlib
+import argparse
+import tempfile
+
+# Même répartition que outputs.shard_path (deux niveaux de deux caractères hexadécimaux)
+SHARD_LEVELS = 2
+
+
+def flat_path(root, name):
+    return os.path.join(root, name)
+
+
+def shard_path(root, name):
+    digest = hashlib.sha1(name.encode('utf-8')).hexdigest()
+    return os.path.join(root, *(digest[2 * i:2 * i + 2] for i in range(SHARD_LEVELS)), name)
+
+
+def make_name():
+    return f"{uuid.uuid4().hex}_document_page_1.pdf"
+
+
+def publish(root, names, layout, staging):
+    """Publie des fichiers comme outputs.commit : création en préparation, puis renommage"""
+    for name in names:
+        source = os.path.join(staging, name)
+        open(source, 'wb').close()
+        target = layout(root, name)
+        try:
+            os.rename(source, target)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.rename(source, target)
+
+
+def scan(root):
+    """Parcours complet avec stat de chaque fichier"""
+    count = 0
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        stack.append(entry.path)
+                else:
+                    entry.stat()
+                    count += 1
+    return count
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def run(count, ops, layout_name, base_dir):
+    layout = shard_path if layout_name == 'sharded' else flat_path
+    root = tempfile.mkdtemp(prefix=f'layout_{layout_name}_', dir=base_dir)
+    staging = os.path.join(root, '.staging')
+    os.makedirs(staging)
+    try:
+        names = [make_name() for _ in range(count)]
+        fill_time, _ = timed(publish, root, names, layout, staging)
+
+        new_names = [make_name() for _ in range(ops)]
+        publish_time, _ = timed(publish, root, new_names, layout, staging)
+
+        sample = random.sample(names, min(ops, len(names)))
+        lookup_time, _ = timed(lambda: [os.stat(layout(root, name)) for name in sample])
+
+        delete_time, _ = timed(lambda: [os.remove(layout(root, name)) for name in sample])
+
+        scan_time, scanned = timed(scan, root)
+        return {
+            'fill_s': fill_time,
+            'publish_us': publish_time / ops * 1e6,
+            'lookup_us': lookup_time / len(sample) * 1e6,
+            'delete_us': delete_time / len(sample) * 1e6,
+            'scan_s': scan_time,
+            'scanned': scanned
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--counts', default='10000,100000,1000000', help="Nombres de fichiers conservés")
+    parser.add_argument('--ops', type=int, default=2000, help="Opérations mesurées par volume")
+    parser.add_argument('--dir', default=None, help="Répertoire de travail (sur le disque des données)")
+    args = parser.parse_args()
+
+    counts = [int(value) for value in args.counts.split(',') if value]
+    print(f"{'fichiers':>9} {'disposition':>11} {'remplissage':>12} {'publier':>10} {'résoudre':>10} "
+          f"{'supprimer':>10} {'parcours':>10}")
+    for count in counts:
+        for layout_name in ('flat', 'sharded'):
+            result = run(count, args.ops, layout_name, args.dir)
+            print(f"{count:>9} {layout_name:>11} {result['fill_s']:>11.1f}s {result['publish_us']:>8.1f}us "
+                  f"{result['lookup_us']:>8.1f}us {result['delete_us']:>8.1f}us {result['scan_s']:>9.2f}s")
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
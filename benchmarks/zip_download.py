@@ -0,0 +1,119 @@
+"""
+Mesure des téléchargements groupés (download-all, download-session)
+
+Compare, pour plusieurs volumes d'archive, l'ancienne construction de
+l'archive en mémoire (BytesIO + ZIP_DEFLATED, envoyée une fois complète) et
+l'archive produite au fil de l'eau par app/api/zipstream.py. Chaque mesure
+est faite dans un processus séparé, pour relever sa mémoire résidente
+maximale (ru_maxrss), le délai avant le premier octet et la durée totale.
+
+Usage:
+    python benchmarks/zip_download.py --sizes 100,500,2000 --files 50
+"""
+import io
+import os
+import sys
+import time
+import json
+import zipfile
+import argparse
+import resource
+import tempfile
+import subprocess
+import importlib.util
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ZIPSTREAM_PATH = os.path.join(BASE_DIR, 'app', 'api', 'zipstream.py')
+
+# Taille des blocs envoyés dans le mode « en mémoire » (send_file sur un BytesIO)
+SEND_CHUNK_SIZE = 8192
+
+
+def load_zipstream():
+    """Charge zipstream.py sans importer l'application Flask"""
+    spec = importlib.util.spec_from_file_location('zipstream', ZIPSTREAM_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def create_files(directory, total_mb, count):
+    """Crée count fichiers PDF factices (contenu incompressible) totalisant total_mb Mo"""
+    size = max(1, total_mb * 1024 * 1024 // count)
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"file_{i}.pdf")
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4\n')
+            remaining = size
+            while remaining > 0:
+                block = os.urandom(min(remaining, 1024 * 1024))
+                f.write(block)
+                remaining -= len(block)
+        paths.append(path)
+    return paths
+
+
+def buffered_chunks(paths):
+    """Ancien comportement : archive complète en mémoire, puis envoi"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for path in paths:
+            zip_file.write(path, os.path.basename(path))
+    buffer.seek(0)
+    return iter(lambda: buffer.read(SEND_CHUNK_SIZE), b'')
+
+
+def streamed_chunks(paths):
+    zipstream = load_zipstream()
+    return iter(zipstream.ZipStream([(path, os.path.basename(path)) for path in paths]))
+
+
+def measure(mode, paths):
+    """Consomme l'archive comme le ferait le serveur et retourne les mesures"""
+    start = time.monotonic()
+    chunks = buffered_chunks(paths) if mode == 'buffered' else streamed_chunks(paths)
+    first_byte = None
+    total = 0
+    for chunk in chunks:
+        if first_byte is None:
+            first_byte = time.monotonic() - start
+        total += len(chunk)
+    return {
+        'ttfb': first_byte,
+        'duration': time.monotonic() - start,
+        'bytes': total,
+        'max_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # Ko sous Linux
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='100,500,2000', help="Volumes d'archive à mesurer, en Mo")
+    parser.add_argument('--files', type=int, default=50, help="Nombre de fichiers par archive")
+    parser.add_argument('--measure', nargs=2, metavar=('MODE', 'DIRECTORY'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        # Processus de mesure lancé par main()
+        mode, directory = args.measure
+        paths = sorted(os.path.join(directory, name) for name in os.listdir(directory))
+        print(json.dumps(measure(mode, paths)))
+        return
+
+    mb = 1024 * 1024
+    print(f"{'volume':>8} {'mode':>9} {'1er octet (s)':>14} {'durée (s)':>10} {'RSS max (Mo)':>13} {'archive (Mo)':>13}")
+    for total_mb in [int(size) for size in args.sizes.split(',') if size]:
+        with tempfile.TemporaryDirectory(prefix='pdfstudio-bench-') as directory:
+            create_files(directory, total_mb, args.files)
+            for mode in ('buffered', 'streamed'):
+                output = subprocess.check_output(
+                    [sys.executable, os.path.abspath(__file__), '--measure', mode, directory]
+                )
+                result = json.loads(output)
+                print(f"{total_mb:>7}M {mode:>9} {result['ttfb']:>14.3f} {result['duration']:>10.3f} "
+                      f"{result['max_rss'] / mb:>13.1f} {result['bytes'] / mb:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,28 +3,301 @@
 #include <string>
 #include <vector>
 #include <map>
+#include <algorithm>
 #include <functional>
 #include <memory>
 #include <thread>
 #include <mutex>
+#include <list>
+#include <sstream>
+#include <fstream>
+#include <cerrno>
+#include <cstring>
+#include <cstdlib>
+#include <cstdint>
+#include <ctime>
+#include <csignal>
+#include <stdexcept>
+#include <unistd.h>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/socket.h>
+#include <sys/stat.h>
+#include <sys/un.h>
+#include <zlib.h>
 
 using namespace PoDoFo;
 
 // Mutex pour protéger les opérations d'écriture
 std::mutex writeMutex;
 
+// Documents déjà analysés par le moteur résident (mode serve), indexés par chemin
+std::map<std::string, PdfMemDocument*> preloadedDocuments;
+
+bool writeAll(int fd, const char* data, size_t length);
+
+// Entrée ou sortie sur un flux plutôt qu'un fichier : "-" (stdin / stdout)
+// ou "fd:<n>" (descripteur hérité du processus parent)
+bool isStreamPath(const std::string& path) {
+    return path == "-" || path.compare(0, 3, "fd:") == 0;
+}
+
+int streamDescriptor(const std::string& path, int standardFd) {
+    if (path == "-") {
+        return standardFd;
+    }
+    return std::atoi(path.c_str() + 3);
+}
+
+// Vérifie que le fichier d'entrée existe (toujours vrai pour un flux)
+bool inputExists(const std::string& inputFile) {
+    if (isStreamPath(inputFile)) {
+        return true;
+    }
+    FILE* fp = fopen(inputFile.c_str(), "rb");
+    if (!fp) {
+        return false;
+    }
+    fclose(fp);
+    return true;
+}
+
+// Flux des messages de fin de commande : stderr quand le document est écrit sur stdout
+std::ostream& messages(const std::string& outputFile) {
+    if (outputFile == "-") {
+        return std::cerr;
+    }
+    return std::cout;
+}
+
+// Lit entièrement un flux d'entrée et charge le document depuis la mémoire
+void loadFromStream(const std::string& inputFile, PdfMemDocument& document) {
+    int fd = streamDescriptor(inputFile, STDIN_FILENO);
+    std::vector<char> data;
+    char buffer[65536];
+    for (;;) {
+        ssize_t received = read(fd, buffer, sizeof(buffer));
+        if (received < 0 && errno == EINTR) continue;
+        if (received < 0) {
+            throw std::runtime_error(std::string("cannot read input stream: ") + strerror(errno));
+        }
+        if (received == 0) break;
+        data.insert(data.end(), buffer, buffer + received);
+    }
+    if (data.empty()) {
+        throw std::runtime_error("empty input stream");
+    }
+    document.LoadFromBuffer(data.data(), static_cast<long>(data.size()));
+}
+
+// Tampon de sortie écrivant directement sur un descripteur (stdout ou hérité)
+class FdOutputBuffer : public std::streambuf {
+public:
+    explicit FdOutputBuffer(int fd) : fd(fd) {
+        setp(buffer, buffer + sizeof(buffer));
+    }
+    
+    ~FdOutputBuffer() override {
+        sync();
+    }
+    
+protected:
+    int overflow(int ch) override {
+        if (sync() != 0) {
+            return traits_type::eof();
+        }
+        if (ch != traits_type::eof()) {
+            *pptr() = static_cast<char>(ch);
+            pbump(1);
+        }
+        return traits_type::not_eof(ch);
+    }
+    
+    int sync() override {
+        size_t length = static_cast<size_t>(pptr() - pbase());
+        if (length > 0 && !writeAll(fd, pbase(), length)) {
+            return -1;
+        }
+        setp(buffer, buffer + sizeof(buffer));
+        return 0;
+    }
+    
+private:
+    int fd;
+    char buffer[65536];
+};
+
+// Documents produits linéarisés (option --linearize) : dictionnaire de
+// linéarisation, tables d'indices et objets de la première page en tête de
+// fichier, pour un affichage web rapide
+bool linearizeOutput = false;
+
+// Sérialise le document sur un périphérique, linéarisé si demandé. Les
+// documents chiffrés sont écrits normalement.
+void writeToDevice(PdfMemDocument& document, PdfOutputDevice* device) {
+    if (!linearizeOutput || document.GetEncrypt()) {
+        document.Write(device);
+        return;
+    }
+    PdfWriter writer(document.GetObjects(), document.GetTrailer());
+    writer.SetPdfVersion(document.GetPdfVersion());
+    writer.SetWriteMode(document.GetWriteMode());
+    writer.SetLinearized(true);
+    writer.Write(device);
+}
+
+// Écrit le document dans un fichier, ou au fil de l'eau sur un flux de sortie
+void writeDocument(PdfMemDocument& document, const std::string& outputFile) {
+    if (!isStreamPath(outputFile)) {
+        PdfOutputDevice device(outputFile.c_str());
+        writeToDevice(document, &device);
+        return;
+    }
+    FdOutputBuffer buffer(streamDescriptor(outputFile, STDOUT_FILENO));
+    std::ostream stream(&buffer);
+    if (linearizeOutput) {
+        // La linéarisation réécrit des positions déjà produites : le document
+        // est sérialisé en mémoire avant d'être transmis
+        PdfRefCountedBuffer serialized;
+        PdfOutputDevice device(&serialized);
+        writeToDevice(document, &device);
+        stream.write(serialized.GetBuffer(), static_cast<std::streamsize>(device.GetLength()));
+    } else {
+        PdfOutputDevice device(&stream);
+        document.Write(&device);
+    }
+    stream.flush();
+    if (!stream) {
+        throw std::runtime_error("cannot write output stream");
+    }
+}
+
+// Fichier d'entrée projeté en mémoire, en lecture seule. Les pages de la
+// projection sont celles du cache du noyau : elles ne sont pas recopiées dans
+// le tas et sont partagées entre les traitements concurrents du même fichier.
+class MappedFile : public std::streambuf {
+public:
+    explicit MappedFile(const std::string& path) {
+        int fd = open(path.c_str(), O_RDONLY);
+        if (fd < 0) {
+            return;
+        }
+        struct stat st;
+        if (fstat(fd, &st) == 0 && S_ISREG(st.st_mode) && st.st_size > 0) {
+            void* mapping = mmap(nullptr, static_cast<size_t>(st.st_size), PROT_READ, MAP_SHARED, fd, 0);
+            if (mapping != MAP_FAILED) {
+                data = static_cast<char*>(mapping);
+                size = static_cast<size_t>(st.st_size);
+                setg(data, data, data + size);
+            }
+        }
+        close(fd);  // La projection reste valide après la fermeture
+    }
+    
+    ~MappedFile() override {
+        if (data) {
+            munmap(data, size);
+        }
+    }
+    
+    bool mapped() const {
+        return data != nullptr;
+    }
+    
+protected:
+    pos_type seekoff(off_type offset, std::ios_base::seekdir direction, std::ios_base::openmode which) override {
+        if (!(which & std::ios_base::in) || !data) {
+            return pos_type(off_type(-1));
+        }
+        off_type base = 0;
+        if (direction == std::ios_base::cur) {
+            base = gptr() - eback();
+        } else if (direction == std::ios_base::end) {
+            base = static_cast<off_type>(size);
+        }
+        off_type position = base + offset;
+        if (position < 0 || position > static_cast<off_type>(size)) {
+            return pos_type(off_type(-1));
+        }
+        setg(data, data + position, data + size);
+        return pos_type(position);
+    }
+    
+    pos_type seekpos(pos_type position, std::ios_base::openmode which) override {
+        return seekoff(off_type(position), std::ios_base::beg, which);
+    }
+    
+private:
+    char* data = nullptr;
+    size_t size = 0;
+};
+
+struct MappedInput {
+    explicit MappedInput(const std::string& path) : mappedFile(path), mappedStream(&mappedFile) {}
+    MappedFile mappedFile;
+    std::istream mappedStream;
+};
+
+// Document analysé directement depuis la projection de son fichier. La
+// projection est une classe de base déclarée avant PdfMemDocument : elle est
+// libérée après le document, dont les flux sont lus à la demande.
+class MappedDocument : private MappedInput, public PdfMemDocument {
+public:
+    explicit MappedDocument(const std::string& path) : MappedInput(path) {
+        if (!mappedFile.mapped()) {
+            // Fichier vide, spécial ou projection impossible : lecture classique
+            Load(path.c_str());
+            return;
+        }
+        LoadFromDevice(PdfRefCountedInputDevice(new PdfInputDevice(&mappedStream)));
+    }
+};
+
+// Charge un document depuis son fichier, projeté en mémoire sauf si
+// PDFEDITOR_NO_MMAP est défini (comparaison dans benchmarks/engine_load.py)
+std::unique_ptr<PdfMemDocument> loadDocument(const std::string& path) {
+    if (getenv("PDFEDITOR_NO_MMAP")) {
+        std::unique_ptr<PdfMemDocument> document(new PdfMemDocument());
+        document->Load(path.c_str());
+        return document;
+    }
+    return std::unique_ptr<PdfMemDocument>(new MappedDocument(path));
+}
+
+// Retourne le document préchargé pour ce chemin, ou charge le fichier (ou le flux) dans storage
+PdfMemDocument& openDocument(const std::string& inputFile, std::unique_ptr<PdfMemDocument>& storage) {
+    auto it = preloadedDocuments.find(inputFile);
+    if (it != preloadedDocuments.end()) {
+        return *it->second;
+    }
+    if (isStreamPath(inputFile)) {
+        storage.reset(new PdfMemDocument());
+        loadFromStream(inputFile, *storage);
+    } else {
+        storage = loadDocument(inputFile);
+    }
+    return *storage;
+}
+
 // Display help for available commands
 void printUsage() {
     std::cout << "Usage: pdfeditor <command> [options]" << std::endl;
     std::cout << "Commands:" << std::endl;
     std::cout << "  merge <output.pdf> <input1.pdf> <input2.pdf> ..." << std::endl;
     std::cout << "  split <input.pdf> <output_prefix> [<page_range>]" << std::endl;
+    std::cout << "  splitzip <input.pdf> <output.zip> [<page_range>] [--pages <output_prefix>]" << std::endl;
+    std::cout << "  extract <input.pdf> <output.pdf> <page_range>" << std::endl;
     std::cout << "  compress <input.pdf> <output.pdf> [<quality>]" << std::endl;
     std::cout << "  rotate <input.pdf> <output.pdf> <degrees>" << std::endl;
     std::cout << "  watermark <input.pdf> <output.pdf> <text> [<opacity>]" << std::endl;
     std::cout << "  protect <input.pdf> <output.pdf> <password> [<permissions>]" << std::endl;
     std::cout << "  unlock <input.pdf> <output.pdf> <password>" << std::endl;
     std::cout << "  info <input.pdf>" << std::endl;
+    std::cout << "  serve <socket_path> [<cache_mb>] [<parse_limit_mb>]" << std::endl;
+    std::cout << "For extract, compress, rotate, watermark, protect and unlock, <input.pdf> and <output.pdf>" << std::endl;
+    std::cout << "may be '-' (stdin / stdout) or fd:<n> (inherited file descriptor)." << std::endl;
+    std::cout << "Options:" << std::endl;
+    std::cout << "  --linearize   write linearized PDFs (fast web view)" << std::endl;
 }
 
 // Function to merge PDFs with memory optimization
@@ -46,16 +319,16 @@ int mergePDFs(const std::vector<std::string>& inputFiles, const std::string& out
             }
             fclose(fp);
             
-            PdfMemDocument inputDocument;
+            std::unique_ptr<PdfMemDocument> storage;
             try {
-                inputDocument.Load(file.c_str());
+                PdfMemDocument& inputDocument = openDocument(file, storage);
                 // Insert pages from inputDocument to outputDocument
                 outputDocument.InsertPages(inputDocument, 0, inputDocument.GetPageCount());
             } catch (const PdfError& error) {
                 std::cerr << "Error loading PDF file " << file << ": " << error.what() << std::endl;
                 return 1;
             }
-            // inputDocument sera détruit automatiquement à la fin de cette itération
+            // storage sera détruit automatiquement à la fin de cette itération
         }
         
         // Vérifier si le répertoire de sortie existe
@@ -65,7 +338,7 @@ int mergePDFs(const std::vector<std::string>& inputFiles, const std::string& out
             // On pourrait ajouter une vérification du répertoire ici
         }
         
-        outputDocument.Write(outputFile.c_str());
+        writeDocument(outputDocument, outputFile);
         std::cout << "Merge completed successfully. Output file: " << outputFile << std::endl;
         return 0;
     } catch (const PdfError& error) {
@@ -81,7 +354,7 @@ void splitPageRange(const PdfMemDocument& document, int start, int count, const
     std::string outputFile = outputPrefix + "_pages_" + std::to_string(start + 1) + "-" + std::to_string(start + count) + ".pdf";
     {
         std::lock_guard<std::mutex> lock(writeMutex); // Protège l'écriture sur disque
-        newDocument.Write(outputFile.c_str());
+        writeDocument(newDocument, outputFile);
         std::cout << "Created: " << outputFile << std::endl;
     }
 }
@@ -96,8 +369,8 @@ int splitPDF(const std::string& inputFile, const std::string& outputPrefix, cons
         }
         fclose(fp);
         
-        PdfMemDocument document;
-        document.Load(inputFile.c_str());
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
         int pageCount = document.GetPageCount();
         
         if (pageRange.empty()) {
@@ -125,6 +398,359 @@ int splitPDF(const std::string& inputFile, const std::string& outputPrefix, cons
     }
 }
 
+// Échappe une chaîne pour l'inclure dans une sortie JSON
+std::string jsonEscape(const std::string& value) {
+    std::string escaped;
+    for (char c : value) {
+        if (c == '"' || c == '\\') {
+            escaped += '\\';
+            escaped += c;
+        } else if (static_cast<unsigned char>(c) < 0x20) {
+            escaped += ' ';
+        } else {
+            escaped += c;
+        }
+    }
+    return escaped;
+}
+
+// Groupes de pages (indices à partir de 0, bornes incluses) décrits par une
+// plage "1,3,5-10" : chaque élément donne un document. Une plage vide donne
+// un document par page.
+bool parsePageGroups(const std::string& pageRange, int pageCount, std::vector<std::pair<int, int>>& groups) {
+    if (pageRange.empty() || pageRange == "all") {
+        for (int i = 0; i < pageCount; i++) {
+            groups.emplace_back(i, i);
+        }
+        return true;
+    }
+    std::stringstream items(pageRange);
+    std::string item;
+    while (std::getline(items, item, ',')) {
+        if (item.empty()) continue;
+        size_t dash = item.find('-');
+        int first = 0;
+        int last = 0;
+        try {
+            first = std::stoi(item.substr(0, dash));
+            last = dash == std::string::npos ? first : std::stoi(item.substr(dash + 1));
+        } catch (const std::exception&) {
+            return false;
+        }
+        if (first < 1 || last < first || last > pageCount) {
+            return false;
+        }
+        groups.emplace_back(first - 1, last - 1);
+    }
+    return !groups.empty();
+}
+
+// Limite des tailles et positions du format ZIP classique
+const uint32_t ZIP64_LIMIT = 0xFFFFFFFFu;
+
+// Écriture séquentielle d'une archive ZIP en mode stocké (sans compression :
+// les PDF le sont déjà). Chaque membre est entièrement sérialisé avant d'être
+// écrit : son CRC et sa taille figurent directement dans l'en-tête local, sans
+// descripteur de données. Le format ZIP64 est utilisé au-delà de 4 Go ou de
+// 65535 membres.
+class ZipArchiveWriter {
+public:
+    struct Member {
+        std::string name;
+        uint32_t crc;
+        uint64_t size;
+        uint64_t offset;      // En-tête local
+        uint64_t dataOffset;  // Contenu du membre
+    };
+    
+    explicit ZipArchiveWriter(std::ostream& out) : out(out) {
+        std::time_t now = std::time(nullptr);
+        std::tm local = *std::localtime(&now);
+        dosTime = static_cast<uint16_t>((local.tm_hour << 11) | (local.tm_min << 5) | (local.tm_sec / 2));
+        dosDate = static_cast<uint16_t>(((local.tm_year - 80) << 9) | ((local.tm_mon + 1) << 5) | local.tm_mday);
+    }
+    
+    const Member& add(const std::string& name, const char* data, uint64_t size) {
+        uLong crc = crc32(0L, Z_NULL, 0);
+        for (uint64_t done = 0; done < size;) {
+            uInt block = static_cast<uInt>(std::min<uint64_t>(size - done, 1u << 30));
+            crc = crc32(crc, reinterpret_cast<const Bytef*>(data + done), block);
+            done += block;
+        }
+        
+        bool zip64 = size >= ZIP64_LIMIT;
+        std::string header;
+        put32(header, 0x04034b50);
+        put16(header, zip64 ? 45 : 20);
+        put16(header, 0x0800);  // Noms en UTF-8
+        put16(header, 0);       // Stocké
+        put16(header, dosTime);
+        put16(header, dosDate);
+        put32(header, static_cast<uint32_t>(crc));
+        put32(header, zip64 ? ZIP64_LIMIT : static_cast<uint32_t>(size));
+        put32(header, zip64 ? ZIP64_LIMIT : static_cast<uint32_t>(size));
+        put16(header, static_cast<uint16_t>(name.size()));
+        put16(header, zip64 ? 20 : 0);
+        header += name;
+        if (zip64) {
+            put16(header, 0x0001);
+            put16(header, 16);
+            put64(header, size);
+            put64(header, size);
+        }
+        
+        members.push_back(Member{name, static_cast<uint32_t>(crc), size, offset, offset + header.size()});
+        write(header.data(), header.size());
+        write(data, size);
+        return members.back();
+    }
+    
+    // Écrit le répertoire central et la fin d'archive
+    void finish() {
+        uint64_t centralOffset = offset;
+        std::string central;
+        for (const Member& member : members) {
+            std::string extra;
+            if (member.size >= ZIP64_LIMIT) {
+                put64(extra, member.size);
+                put64(extra, member.size);
+            }
+            if (member.offset >= ZIP64_LIMIT) {
+                put64(extra, member.offset);
+            }
+            put32(central, 0x02014b50);
+            put16(central, 0x0300 | 45);  // Unix
+            put16(central, extra.empty() ? 20 : 45);
+            put16(central, 0x0800);
+            put16(central, 0);
+            put16(central, dosTime);
+            put16(central, dosDate);
+            put32(central, member.crc);
+            put32(central, member.size >= ZIP64_LIMIT ? ZIP64_LIMIT : static_cast<uint32_t>(member.size));
+            put32(central, member.size >= ZIP64_LIMIT ? ZIP64_LIMIT : static_cast<uint32_t>(member.size));
+            put16(central, static_cast<uint16_t>(member.name.size()));
+            put16(central, static_cast<uint16_t>(extra.empty() ? 0 : extra.size() + 4));
+            put16(central, 0);
+            put16(central, 0);
+            put16(central, 0);
+            put32(central, 0100644u << 16);
+            put32(central, member.offset >= ZIP64_LIMIT ? ZIP64_LIMIT : static_cast<uint32_t>(member.offset));
+            central += member.name;
+            if (!extra.empty()) {
+                put16(central, 0x0001);
+                put16(central, static_cast<uint16_t>(extra.size()));
+                central += extra;
+            }
+        }
+        
+        uint64_t count = members.size();
+        uint64_t centralSize = central.size();
+        std::string end;
+        if (count >= 0xFFFF || centralOffset >= ZIP64_LIMIT || centralSize >= ZIP64_LIMIT) {
+            uint64_t zip64EndOffset = centralOffset + centralSize;
+            put32(end, 0x06064b50);
+            put64(end, 44);
+            put16(end, 0x0300 | 45);
+            put16(end, 45);
+            put32(end, 0);
+            put32(end, 0);
+            put64(end, count);
+            put64(end, count);
+            put64(end, centralSize);
+            put64(end, centralOffset);
+            put32(end, 0x07064b50);
+            put32(end, 0);
+            put64(end, zip64EndOffset);
+            put32(end, 1);
+        }
+        put32(end, 0x06054b50);
+        put16(end, 0);
+        put16(end, 0);
+        put16(end, static_cast<uint16_t>(std::min<uint64_t>(count, 0xFFFF)));
+        put16(end, static_cast<uint16_t>(std::min<uint64_t>(count, 0xFFFF)));
+        put32(end, static_cast<uint32_t>(std::min<uint64_t>(centralSize, ZIP64_LIMIT)));
+        put32(end, static_cast<uint32_t>(std::min<uint64_t>(centralOffset, ZIP64_LIMIT)));
+        put16(end, 0);
+        
+        write(central.data(), central.size());
+        write(end.data(), end.size());
+        out.flush();
+    }
+    
+    uint64_t size() const {
+        return offset;
+    }
+    
+    const std::vector<Member>& entries() const {
+        return members;
+    }
+    
+private:
+    static void put16(std::string& buffer, uint16_t value) {
+        buffer += static_cast<char>(value & 0xFF);
+        buffer += static_cast<char>((value >> 8) & 0xFF);
+    }
+    
+    static void put32(std::string& buffer, uint32_t value) {
+        put16(buffer, static_cast<uint16_t>(value & 0xFFFF));
+        put16(buffer, static_cast<uint16_t>(value >> 16));
+    }
+    
+    static void put64(std::string& buffer, uint64_t value) {
+        put32(buffer, static_cast<uint32_t>(value & 0xFFFFFFFFu));
+        put32(buffer, static_cast<uint32_t>(value >> 32));
+    }
+    
+    void write(const char* data, uint64_t size) {
+        out.write(data, static_cast<std::streamsize>(size));
+        if (!out) {
+            throw std::runtime_error("cannot write archive");
+        }
+        offset += size;
+    }
+    
+    std::ostream& out;
+    uint64_t offset = 0;
+    uint16_t dosTime = 0;
+    uint16_t dosDate = 0;
+    std::vector<Member> members;
+};
+
+// Découpe un PDF directement dans une archive ZIP : chaque document produit
+// est sérialisé en mémoire puis écrit dans l'archive, sans fichier
+// intermédiaire. Avec pagesPrefix, chaque document est aussi écrit dans
+// son propre fichier. Le contenu de l'archive est décrit en JSON.
+int splitToZip(const std::string& inputFile, const std::string& outputFile, const std::string& pageRange,
+               const std::string& pagesPrefix) {
+    try {
+        // Vérifier si le fichier existe
+        if (!inputExists(inputFile)) {
+            std::cerr << "Error: Input file not found: " << inputFile << std::endl;
+            return 1;
+        }
+        
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
+        
+        std::vector<std::pair<int, int>> groups;
+        if (!parsePageGroups(pageRange, document.GetPageCount(), groups)) {
+            std::cerr << "Error: invalid page range: " << pageRange << std::endl;
+            return 1;
+        }
+        
+        // Nom de base des documents produits : nom du fichier d'entrée sans extension
+        std::string baseName = "document";
+        if (!isStreamPath(inputFile)) {
+            size_t slash = inputFile.find_last_of("/\\");
+            baseName = slash == std::string::npos ? inputFile : inputFile.substr(slash + 1);
+            size_t dot = baseName.find_last_of('.');
+            if (dot != std::string::npos && dot > 0) {
+                baseName = baseName.substr(0, dot);
+            }
+        }
+        
+        std::unique_ptr<std::streambuf> outputBuffer;
+        if (isStreamPath(outputFile)) {
+            outputBuffer.reset(new FdOutputBuffer(streamDescriptor(outputFile, STDOUT_FILENO)));
+        } else {
+            std::unique_ptr<std::filebuf> fileBuffer(new std::filebuf());
+            if (!fileBuffer->open(outputFile.c_str(), std::ios::out | std::ios::binary | std::ios::trunc)) {
+                std::cerr << "Error: cannot create archive: " << outputFile << std::endl;
+                return 1;
+            }
+            outputBuffer = std::move(fileBuffer);
+        }
+        std::ostream out(outputBuffer.get());
+        ZipArchiveWriter archive(out);
+        
+        std::vector<std::string> pagePaths;
+        for (const auto& group : groups) {
+            std::string name = baseName + (group.first == group.second
+                ? "_page_" + std::to_string(group.first + 1)
+                : "_pages_" + std::to_string(group.first + 1) + "-" + std::to_string(group.second + 1)) + ".pdf";
+            
+            PdfMemDocument pageDocument;
+            pageDocument.InsertPages(document, group.first, group.second - group.first + 1);
+            
+            PdfRefCountedBuffer buffer;
+            PdfOutputDevice device(&buffer);
+            writeToDevice(pageDocument, &device);
+            archive.add(name, buffer.GetBuffer(), device.GetLength());
+            
+            if (!pagesPrefix.empty()) {
+                std::string pagePath = pagesPrefix + "_" + name;
+                std::ofstream pageFile(pagePath.c_str(), std::ios::binary | std::ios::trunc);
+                pageFile.write(buffer.GetBuffer(), static_cast<std::streamsize>(device.GetLength()));
+                if (!pageFile) {
+                    std::cerr << "Error: cannot write page file: " << pagePath << std::endl;
+                    return 1;
+                }
+                pagePaths.push_back(pagePath);
+            } else {
+                pagePaths.push_back("");
+            }
+        }
+        archive.finish();
+        
+        std::ostream& json = messages(outputFile);
+        json << "{\"archive\": \"" << jsonEscape(outputFile) << "\", \"size\": " << archive.size()
+             << ", \"files\": [";
+        const auto& members = archive.entries();
+        for (size_t i = 0; i < members.size(); i++) {
+            json << (i ? ", " : "") << "{\"name\": \"" << jsonEscape(members[i].name) << "\""
+                 << ", \"first_page\": " << (groups[i].first + 1)
+                 << ", \"last_page\": " << (groups[i].second + 1)
+                 << ", \"size\": " << members[i].size
+                 << ", \"crc\": " << members[i].crc
+                 << ", \"offset\": " << members[i].offset
+                 << ", \"data_offset\": " << members[i].dataOffset;
+            if (!pagePaths[i].empty()) {
+                json << ", \"path\": \"" << jsonEscape(pagePaths[i]) << "\"";
+            }
+            json << "}";
+        }
+        json << "]}" << std::endl;
+        return 0;
+    } catch (const PdfError& error) {
+        std::cerr << "Error splitting PDF: " << error.what() << std::endl;
+        return 1;
+    }
+}
+
+// Extrait des pages dans un seul document : les groupes de la plage
+// "1,3,5-10" sont insérés dans l'ordre. Sert à produire à la demande un
+// document d'un découpage différé.
+int extractPages(const std::string& inputFile, const std::string& outputFile, const std::string& pageRange) {
+    try {
+        // Vérifier si le fichier existe
+        if (!inputExists(inputFile)) {
+            std::cerr << "Error: Input file not found: " << inputFile << std::endl;
+            return 1;
+        }
+        
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
+        
+        std::vector<std::pair<int, int>> groups;
+        if (pageRange.empty() || !parsePageGroups(pageRange, document.GetPageCount(), groups)) {
+            std::cerr << "Error: invalid page range: " << pageRange << std::endl;
+            return 1;
+        }
+        
+        PdfMemDocument outputDocument;
+        for (const auto& group : groups) {
+            outputDocument.InsertPages(document, group.first, group.second - group.first + 1);
+        }
+        
+        writeDocument(outputDocument, outputFile);
+        messages(outputFile) << "Extraction completed successfully. Output file: " << outputFile << std::endl;
+        return 0;
+    } catch (const PdfError& error) {
+        std::cerr << "Error extracting pages: " << error.what() << std::endl;
+        return 1;
+    }
+}
+
 // Function to compress a PDF with compression enabled
 int compressPDF(const std::string& inputFile, const std::string& outputFile, const std::string& quality) {
     try {
@@ -132,21 +758,19 @@ int compressPDF(const std::string& inputFile, const std::string& outputFile, con
         (void)quality;
         
         // Vérifier si le fichier existe
-        FILE* fp = fopen(inputFile.c_str(), "rb");
-        if (!fp) {
+        if (!inputExists(inputFile)) {
             std::cerr << "Error: Input file not found: " << inputFile << std::endl;
             return 1;
         }
-        fclose(fp);
         
-        PdfMemDocument document;
-        document.Load(inputFile.c_str());
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
         
         // La méthode SetUseCompression n'existe pas dans PoDoFo
         // PoDoFo utilise la compression par défaut
         
-        document.Write(outputFile.c_str());
-        std::cout << "Compression completed successfully. Output file: " << outputFile << std::endl;
+        writeDocument(document, outputFile);
+        messages(outputFile) << "Compression completed successfully. Output file: " << outputFile << std::endl;
         return 0;
     } catch (const PdfError& error) {
         std::cerr << "Error compressing PDF: " << error.what() << std::endl;
@@ -158,15 +782,13 @@ int compressPDF(const std::string& inputFile, const std::string& outputFile, con
 int rotatePDF(const std::string& inputFile, const std::string& outputFile, int degrees) {
     try {
         // Vérifier si le fichier existe
-        FILE* fp = fopen(inputFile.c_str(), "rb");
-        if (!fp) {
+        if (!inputExists(inputFile)) {
             std::cerr << "Error: Input file not found: " << inputFile << std::endl;
             return 1;
         }
-        fclose(fp);
         
-        PdfMemDocument document;
-        document.Load(inputFile.c_str());
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
         
         // Normalize the angle to 0, 90, 180 or 270
         degrees = ((degrees % 360) / 90) * 90;
@@ -179,8 +801,8 @@ int rotatePDF(const std::string& inputFile, const std::string& outputFile, int d
             page->SetRotation(newRotation);
         }
         
-        document.Write(outputFile.c_str());
-        std::cout << "Rotation completed successfully. All pages rotated by " << degrees << " degrees. Output file: " << outputFile << std::endl;
+        writeDocument(document, outputFile);
+        messages(outputFile) << "Rotation completed successfully. All pages rotated by " << degrees << " degrees. Output file: " << outputFile << std::endl;
         return 0;
     } catch (const PdfError& error) {
         std::cerr << "Error rotating PDF: " << error.what() << std::endl;
@@ -228,15 +850,13 @@ void watermarkPage(PdfMemDocument& document, int pageNum, const std::string& tex
 int watermarkPDF(const std::string& inputFile, const std::string& outputFile, const std::string& text, float opacity) {
     try {
         // Vérifier si le fichier existe
-        FILE* fp = fopen(inputFile.c_str(), "rb");
-        if (!fp) {
+        if (!inputExists(inputFile)) {
             std::cerr << "Error: Input file not found: " << inputFile << std::endl;
             return 1;
         }
-        fclose(fp);
         
-        PdfMemDocument document;
-        document.Load(inputFile.c_str());
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
         
         if (opacity < 0.0 || opacity > 1.0) {
             opacity = 0.5; // Default value
@@ -249,8 +869,8 @@ int watermarkPDF(const std::string& inputFile, const std::string& outputFile, co
         }
         for (auto& t : threads) t.join();
         
-        document.Write(outputFile.c_str());
-        std::cout << "Watermark added successfully to " << document.GetPageCount() << " pages." << std::endl;
+        writeDocument(document, outputFile);
+        messages(outputFile) << "Watermark added successfully to " << document.GetPageCount() << " pages." << std::endl;
         return 0;
     } catch (const PdfError& error) {
         std::cerr << "Error adding watermark: " << error.what() << std::endl;
@@ -265,12 +885,10 @@ int protectPDF(const std::string& inputFile, const std::string& outputFile, cons
         (void)permissionsStr;
         
         // Vérifier si le fichier existe
-        FILE* fp = fopen(inputFile.c_str(), "rb");
-        if (!fp) {
+        if (!inputExists(inputFile)) {
             std::cerr << "Error: Input file not found: " << inputFile << std::endl;
             return 1;
         }
-        fclose(fp);
         
         // Vérifier si le mot de passe est vide
         if (password.empty()) {
@@ -278,14 +896,14 @@ int protectPDF(const std::string& inputFile, const std::string& outputFile, cons
             return 1;
         }
         
-        PdfMemDocument document;
-        document.Load(inputFile.c_str());
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
         
         // Fix SetEncrypted - requires owner password and user password
         document.SetEncrypted(password, password);
         
-        document.Write(outputFile.c_str());
-        std::cout << "Protection completed successfully. Output file: " << outputFile << std::endl;
+        writeDocument(document, outputFile);
+        messages(outputFile) << "Protection completed successfully. Output file: " << outputFile << std::endl;
         return 0;
     } catch (const PdfError& error) {
         std::cerr << "Error protecting PDF: " << error.what() << std::endl;
@@ -297,16 +915,26 @@ int protectPDF(const std::string& inputFile, const std::string& outputFile, cons
 int unlockPDF(const std::string& inputFile, const std::string& outputFile, const std::string& password) {
     try {
         // Vérifier si le fichier existe
-        FILE* fp = fopen(inputFile.c_str(), "rb");
-        if (!fp) {
+        if (!inputExists(inputFile)) {
             std::cerr << "Error: Input file not found: " << inputFile << std::endl;
             return 1;
         }
-        fclose(fp);
         
         PdfMemDocument document;
         try {
-            document.Load(inputFile.c_str(), password.c_str());
+            if (isStreamPath(inputFile)) {
+                try {
+                    loadFromStream(inputFile, document);
+                } catch (const PdfError& error) {
+                    // Flux chiffré : le chargement reprend avec le mot de passe (comme Load(path, password))
+                    if (error.GetError() != ePdfError_InvalidPassword) {
+                        throw;
+                    }
+                    document.SetPassword(password);
+                }
+            } else {
+                document.Load(inputFile.c_str(), password.c_str());
+            }
         } catch (const PdfError& error) {
             std::cerr << "Error: Invalid password or PDF is not encrypted." << std::endl;
             return 1;
@@ -320,8 +948,8 @@ int unlockPDF(const std::string& inputFile, const std::string& outputFile, const
             newDocument.InsertPages(document, i, 1);
         }
         
-        newDocument.Write(outputFile.c_str());
-        std::cout << "Unlock completed successfully. Output file: " << outputFile << std::endl;
+        writeDocument(newDocument, outputFile);
+        messages(outputFile) << "Unlock completed successfully. Output file: " << outputFile << std::endl;
         return 0;
     } catch (const PdfError& error) {
         std::cerr << "Error unlocking PDF: " << error.what() << std::endl;
@@ -343,8 +971,8 @@ int getPDFInfo(const std::string& inputFile, const std::string& outputFile) {
         }
         fclose(fp);
         
-        PdfMemDocument document;
-        document.Load(inputFile.c_str());
+        std::unique_ptr<PdfMemDocument> storage;
+        PdfMemDocument& document = openDocument(inputFile, storage);
         
         // Format de sortie JSON pour une intégration plus facile avec Flask
         std::cout << "{" << std::endl;
@@ -401,16 +1029,11 @@ int getPDFInfo(const std::string& inputFile, const std::string& outputFile) {
     }
 }
 
+typedef std::map<std::string, std::function<int(int, char*[])>> CommandMap;
+
 // Map of commands and their functions
-int main(int argc, char* argv[]) {
-    if (argc < 2) {
-        printUsage();
-        return 1;
-    }
-    
-    std::string command = argv[1];
-    
-    std::map<std::string, std::function<int(int, char*[])>> commands = {
+CommandMap buildCommands() {
+    return {
         {"merge", [](int argc, char* argv[]) -> int {
             if (argc < 4) {
                 std::cerr << "Error: Not enough arguments for merge command." << std::endl;
@@ -446,6 +1069,44 @@ int main(int argc, char* argv[]) {
             return splitPDF(inputFile, outputPrefix, pageRange);
         }},
         
+        {"splitzip", [](int argc, char* argv[]) -> int {
+            if (argc < 4) {
+                std::cerr << "Error: Not enough arguments for splitzip command." << std::endl;
+                std::cerr << "Usage: pdfeditor splitzip <input.pdf> <output.zip> [<page_range>] [--pages <output_prefix>]" << std::endl;
+                return 1;
+            }
+            
+            std::string inputFile = argv[2];
+            std::string outputFile = argv[3];
+            std::string pageRange = "";
+            std::string pagesPrefix = "";
+            
+            for (int i = 4; i < argc; i++) {
+                std::string arg = argv[i];
+                if (arg == "--pages" && i + 1 < argc) {
+                    pagesPrefix = argv[++i];
+                } else {
+                    pageRange = arg;
+                }
+            }
+            
+            return splitToZip(inputFile, outputFile, pageRange, pagesPrefix);
+        }},
+        
+        {"extract", [](int argc, char* argv[]) -> int {
+            if (argc < 5) {
+                std::cerr << "Error: Not enough arguments for extract command." << std::endl;
+                std::cerr << "Usage: pdfeditor extract <input.pdf> <output.pdf> <page_range>" << std::endl;
+                return 1;
+            }
+            
+            std::string inputFile = argv[2];
+            std::string outputFile = argv[3];
+            std::string pageRange = argv[4];
+            
+            return extractPages(inputFile, outputFile, pageRange);
+        }},
+        
         {"compress", [](int argc, char* argv[]) -> int {
             if (argc < 4) {
                 std::cerr << "Error: Not enough arguments for compress command." << std::endl;
@@ -542,13 +1203,406 @@ int main(int argc, char* argv[]) {
             return getPDFInfo(inputFile, "");
         }}
     };
+}
+
+// Exécute une commande à partir de ses arguments (args[0] = nom de la commande)
+int runCommand(const CommandMap& commands, const std::vector<std::string>& commandArgs) {
+    // Options communes à toutes les commandes, retirées des arguments
+    std::vector<std::string> args;
+    linearizeOutput = false;
+    for (const auto& arg : commandArgs) {
+        if (arg == "--linearize") {
+            linearizeOutput = true;
+        } else {
+            args.push_back(arg);
+        }
+    }
     
-    auto it = commands.find(command);
-    if (it != commands.end()) {
-        return it->second(argc, argv);
-    } else {
-        std::cerr << "Unknown command: " << command << std::endl;
+    if (args.empty()) {
+        printUsage();
+        return 1;
+    }
+    
+    auto it = commands.find(args[0]);
+    if (it == commands.end()) {
+        std::cerr << "Unknown command: " << args[0] << std::endl;
+        printUsage();
+        return 1;
+    }
+    
+    std::vector<char*> argv;
+    argv.push_back(const_cast<char*>("pdfeditor"));
+    for (const auto& arg : args) {
+        argv.push_back(const_cast<char*>(arg.c_str()));
+    }
+    argv.push_back(nullptr);
+    
+    try {
+        return it->second(static_cast<int>(args.size() + 1), argv.data());
+    } catch (const std::exception& error) {
+        std::cerr << "Error: " << error.what() << std::endl;
+        return 1;
+    }
+}
+
+// ---------------------------------------------------------------------------
+// Moteur résident (mode serve)
+//
+// Le processus parent écoute sur un socket Unix et garde en mémoire les
+// documents récemment analysés, dans un cache LRU indexé par empreinte de
+// contenu. Chaque requête est exécutée dans un processus fils (fork) qui
+// travaille sur une copie copy-on-write du document déjà analysé : les
+// opérations qui modifient le document n'altèrent pas le cache, et le
+// parent reste mono-thread.
+//
+// Un document absent du cache est chargé par le fils qui sert la requête ;
+// le parent ne l'analyse pour le cache qu'après le fork, et seulement sous
+// la limite d'analyse : un gros document ne bloque jamais accept() (ni les
+// requêtes servies depuis le cache, ni stats).
+//
+// Requête  : champs séparés par '\0' ("hashes=h1,h2", "timeout=60", "--",
+//            puis la commande et ses arguments), terminée par un champ vide.
+// Réponse  : "<code>\n<taille stdout>\n<taille stderr>\n" suivi des deux flux.
+// ---------------------------------------------------------------------------
+
+const size_t MAX_REQUEST_SIZE = 1024 * 1024;
+
+struct EngineRequest {
+    std::vector<std::string> hashes;
+    int timeout = 0;
+    std::vector<std::string> args;
+};
+
+// Document partagé : une entrée évincée reste valide tant qu'une requête la détient
+struct CachedDocument {
+    std::string hash;
+    std::shared_ptr<PdfMemDocument> document;
+    size_t cost;
+};
+
+// Cache LRU des documents analysés, borné par un budget mémoire estimé
+class DocumentCache {
+public:
+    explicit DocumentCache(size_t budget) : budget(budget) {}
+    
+    std::shared_ptr<PdfMemDocument> get(const std::string& hash) {
+        auto it = index.find(hash);
+        if (it == index.end()) {
+            misses++;
+            return nullptr;
+        }
+        hits++;
+        entries.splice(entries.begin(), entries, it->second);
+        return it->second->document;
+    }
+    
+    bool contains(const std::string& hash) const {
+        return index.find(hash) != index.end();
+    }
+    
+    // Ajoute un document ; retourne false s'il dépasse à lui seul le budget
+    bool put(const std::string& hash, const std::shared_ptr<PdfMemDocument>& document, size_t cost) {
+        if (cost > budget) {
+            return false;
+        }
+        entries.push_front(CachedDocument{hash, document, cost});
+        index[hash] = entries.begin();
+        used += cost;
+        
+        while (used > budget && entries.size() > 1) {
+            CachedDocument& victim = entries.back();
+            used -= victim.cost;
+            evictions++;
+            evictedBytes += victim.cost;
+            index.erase(victim.hash);
+            entries.pop_back();
+        }
+        return true;
+    }
+    
+    std::string statsJson() const {
+        std::ostringstream json;
+        json << "{\"entries\": " << entries.size()
+             << ", \"bytes\": " << used
+             << ", \"budget\": " << budget
+             << ", \"hits\": " << hits
+             << ", \"misses\": " << misses
+             << ", \"evictions\": " << evictions
+             << ", \"evictedBytes\": " << evictedBytes << "}";
+        return json.str();
+    }
+    
+private:
+    size_t budget;
+    size_t used = 0;
+    unsigned long long hits = 0;
+    unsigned long long misses = 0;
+    unsigned long long evictions = 0;
+    unsigned long long evictedBytes = 0;
+    std::list<CachedDocument> entries;
+    std::map<std::string, std::list<CachedDocument>::iterator> index;
+};
+
+// Mémoire résidente du processus, en octets (0 si indisponible)
+size_t residentMemory() {
+    std::ifstream statm("/proc/self/statm");
+    size_t size = 0;
+    size_t resident = 0;
+    if (!(statm >> size >> resident)) {
+        return 0;
+    }
+    return resident * static_cast<size_t>(sysconf(_SC_PAGESIZE));
+}
+
+// Taille d'un fichier, en octets (0 si indisponible)
+size_t fileSize(const std::string& path) {
+    struct stat st;
+    if (stat(path.c_str(), &st) != 0) {
+        return 0;
+    }
+    return static_cast<size_t>(st.st_size);
+}
+
+// Positions des fichiers d'entrée dans les arguments d'une commande (args[0] = commande)
+// unlock n'est pas mis en cache : son chargement dépend du mot de passe
+std::vector<size_t> inputArguments(const std::vector<std::string>& args) {
+    std::vector<size_t> positions;
+    if (args.empty()) {
+        return positions;
+    }
+    const std::string& command = args[0];
+    if (command == "merge") {
+        for (size_t i = 2; i < args.size(); i++) {
+            if (args[i] != "--linearize") {
+                positions.push_back(i);
+            }
+        }
+    } else if (command == "split" || command == "splitzip" || command == "extract" || command == "compress" ||
+               command == "rotate" || command == "watermark" || command == "protect" || command == "info") {
+        if (args.size() > 1) {
+            positions.push_back(1);
+        }
+    }
+    return positions;
+}
+
+// Charge entièrement un document : tous les objets sont analysés une fois dans
+// le parent ; les flux restent lus à la demande depuis la projection du
+// fichier, dont les processus fils héritent
+std::unique_ptr<PdfMemDocument> loadFully(const std::string& path) {
+    std::unique_ptr<PdfMemDocument> document = loadDocument(path);
+    PdfVecObjects* objects = document->GetObjects();
+    for (PdfVecObjects::iterator it = objects->begin(); it != objects->end(); ++it) {
+        (*it)->GetDataType();
+        (*it)->HasStream();
+    }
+    return document;
+}
+
+bool writeAll(int fd, const char* data, size_t length) {
+    while (length > 0) {
+        ssize_t written = write(fd, data, length);
+        if (written < 0) {
+            if (errno == EINTR) continue;
+            return false;
+        }
+        data += written;
+        length -= static_cast<size_t>(written);
+    }
+    return true;
+}
+
+void sendResponse(int fd, int code, const std::string& out, const std::string& err) {
+    std::ostringstream header;
+    header << code << "\n" << out.size() << "\n" << err.size() << "\n";
+    std::string head = header.str();
+    if (writeAll(fd, head.data(), head.size()) && writeAll(fd, out.data(), out.size())) {
+        writeAll(fd, err.data(), err.size());
+    }
+}
+
+bool readRequest(int fd, EngineRequest& request) {
+    std::string data;
+    char buffer[4096];
+    const std::string terminator("\0\0", 2);
+    while (data.size() < 2 || data.compare(data.size() - 2, 2, terminator) != 0) {
+        ssize_t received = read(fd, buffer, sizeof(buffer));
+        if (received < 0 && errno == EINTR) continue;
+        if (received <= 0 || data.size() + received > MAX_REQUEST_SIZE) {
+            return false;
+        }
+        data.append(buffer, static_cast<size_t>(received));
+    }
+    
+    std::vector<std::string> fields;
+    size_t start = 0;
+    for (size_t i = 0; i < data.size(); i++) {
+        if (data[i] == '\0') {
+            if (i == start) break;  // Champ vide : fin de la requête
+            fields.push_back(data.substr(start, i - start));
+            start = i + 1;
+        }
+    }
+    
+    bool inArgs = false;
+    for (const auto& field : fields) {
+        if (inArgs) {
+            request.args.push_back(field);
+        } else if (field == "--") {
+            inArgs = true;
+        } else if (field.compare(0, 7, "hashes=") == 0) {
+            std::stringstream list(field.substr(7));
+            std::string hash;
+            while (std::getline(list, hash, ',')) {
+                if (!hash.empty()) request.hashes.push_back(hash);
+            }
+        } else if (field.compare(0, 8, "timeout=") == 0) {
+            request.timeout = std::atoi(field.c_str() + 8);
+        }
+    }
+    return !request.args.empty();
+}
+
+// Exécute une requête dans le processus fils et renvoie sa sortie sur la connexion
+void serveInChild(int connection, const CommandMap& commands, const EngineRequest& request) {
+    if (request.timeout > 0) {
+        alarm(static_cast<unsigned int>(request.timeout));
+    }
+    
+    std::ostringstream out;
+    std::ostringstream err;
+    std::streambuf* previousOut = std::cout.rdbuf(out.rdbuf());
+    std::streambuf* previousErr = std::cerr.rdbuf(err.rdbuf());
+    int code = runCommand(commands, request.args);
+    std::cout.rdbuf(previousOut);
+    std::cerr.rdbuf(previousErr);
+    
+    sendResponse(connection, code, out.str(), err.str());
+}
+
+int serveEngine(const std::string& socketPath, size_t cacheBytes, size_t parseLimit) {
+    signal(SIGCHLD, SIG_IGN);  // Les fils sont récupérés automatiquement
+    signal(SIGPIPE, SIG_IGN);
+    
+    int listener = socket(AF_UNIX, SOCK_STREAM, 0);
+    if (listener < 0) {
+        std::cerr << "Error: cannot create socket: " << strerror(errno) << std::endl;
+        return 1;
+    }
+    
+    struct sockaddr_un address;
+    memset(&address, 0, sizeof(address));
+    address.sun_family = AF_UNIX;
+    if (socketPath.size() >= sizeof(address.sun_path)) {
+        std::cerr << "Error: socket path too long: " << socketPath << std::endl;
+        return 1;
+    }
+    strncpy(address.sun_path, socketPath.c_str(), sizeof(address.sun_path) - 1);
+    unlink(socketPath.c_str());
+    
+    if (bind(listener, reinterpret_cast<struct sockaddr*>(&address), sizeof(address)) != 0 ||
+        listen(listener, 64) != 0) {
+        std::cerr << "Error: cannot listen on " << socketPath << ": " << strerror(errno) << std::endl;
+        return 1;
+    }
+    chmod(socketPath.c_str(), 0660);
+    
+    std::cout << "Engine listening on " << socketPath << " (cache budget "
+              << (cacheBytes / (1024 * 1024)) << " MB, documents up to "
+              << (parseLimit / (1024 * 1024)) << " MB cached)" << std::endl;
+    
+    const CommandMap commands = buildCommands();
+    DocumentCache cache(cacheBytes);
+    
+    while (true) {
+        int connection = accept(listener, nullptr, nullptr);
+        if (connection < 0) {
+            continue;
+        }
+        
+        EngineRequest request;
+        if (!readRequest(connection, request)) {
+            close(connection);
+            continue;
+        }
+        
+        if (request.args[0] == "stats") {
+            sendResponse(connection, 0, cache.statsJson(), "");
+            close(connection);
+            continue;
+        }
+        
+        // Résoudre les documents d'entrée depuis le cache. Les documents de la
+        // requête sont détenus jusqu'au fork : une éviction ne les libère pas.
+        std::map<std::string, PdfMemDocument*> documents;
+        std::vector<std::shared_ptr<PdfMemDocument>> held;
+        std::vector<std::pair<std::string, std::string>> misses;
+        std::vector<size_t> positions = inputArguments(request.args);
+        if (positions.size() == request.hashes.size()) {
+            for (size_t i = 0; i < positions.size(); i++) {
+                const std::string& path = request.args[positions[i]];
+                std::shared_ptr<PdfMemDocument> cached = cache.get(request.hashes[i]);
+                if (cached) {
+                    held.push_back(cached);
+                    documents[path] = cached.get();
+                } else {
+                    misses.push_back(std::make_pair(path, request.hashes[i]));
+                }
+            }
+        }
+        
+        pid_t pid = fork();
+        if (pid == 0) {
+            close(listener);
+            preloadedDocuments = documents;
+            serveInChild(connection, commands, request);
+            close(connection);
+            _exit(0);
+        }
+        if (pid < 0) {
+            sendResponse(connection, 1, "", std::string("Error: fork failed: ") + strerror(errno) + "\n");
+        }
+        close(connection);
+        held.clear();
+        
+        // Documents absents du cache : le fils les a chargés lui-même ; le parent
+        // les analyse pour les requêtes suivantes s'ils restent sous la limite
+        for (const auto& miss : misses) {
+            size_t size = fileSize(miss.first);
+            if (size == 0 || size > parseLimit || cache.contains(miss.second)) {
+                continue;
+            }
+            try {
+                size_t before = residentMemory();
+                std::shared_ptr<PdfMemDocument> loaded(loadFully(miss.first));
+                size_t after = residentMemory();
+                cache.put(miss.second, loaded, std::max(size, after > before ? after - before : 0));
+            } catch (...) {
+                // Fichier supprimé ou illisible : il sera chargé par le fils de la prochaine requête
+            }
+        }
+    }
+}
+
+int main(int argc, char* argv[]) {
+    if (argc < 2) {
         printUsage();
         return 1;
     }
+    
+    std::string command = argv[1];
+    
+    if (command == "serve") {
+        if (argc < 3) {
+            std::cerr << "Error: Not enough arguments for serve command." << std::endl;
+            std::cerr << "Usage: pdfeditor serve <socket_path> [<cache_mb>] [<parse_limit_mb>]" << std::endl;
+            return 1;
+        }
+        size_t cacheMb = argc > 3 ? static_cast<size_t>(std::stoul(argv[3])) : 512;
+        size_t parseLimitMb = argc > 4 ? static_cast<size_t>(std::stoul(argv[4])) : 32;
+        return serveEngine(argv[2], cacheMb * 1024 * 1024, parseLimitMb * 1024 * 1024);
+    }
+    
+    std::vector<std::string> args(argv + 1, argv + argc);
+    return runCommand(buildCommands(), args);
 }
\ No newline at end of file
@@ -2,7 +2,7 @@
 set -e
 
 # Create data directories if they don't exist and ensure proper permissions
-mkdir -p /app/data/uploads /app/data/temp /app/data/processed
+mkdir -p /app/data/uploads /app/data/temp /app/data/processed /app/data/engine
 chown -R pdfeditor:pdfeditor /app/data
 
 # First arg is `-f` or `--some-option`
@@ -12,6 +12,10 @@ fi
 
 # If the command starts with an option, prepend gunicorn
 if [ "$1" = 'gunicorn' ] || [ "$1" = 'flask' ]; then
+    # Start the resident PDF engine shared by all workers (parsed-document cache),
+    # restarting it if it exits. The app falls back to one-shot runs while it is down.
+    gosu pdfeditor sh -c 'while true; do /app/bin/pdfeditor serve "${PDFEDITOR_SOCKET:-/app/data/engine/engine.sock}" "${PDFEDITOR_CACHE_MB:-512}" "${PDFEDITOR_PARSE_LIMIT_MB:-32}"; sleep 1; done' &
+
     # Use gosu to drop to a non-root user
     exec gosu pdfeditor "$@"
 else
@@ -0,0 +1,47 @@
+"""
+Fixtures communes : application Flask minimale sur un répertoire de données temporaire
+"""
+import os
+import pytest
+from flask import Flask
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Application dont DATA_DIR est un répertoire temporaire (index, verrous, fichiers)"""
+    app = Flask(__name__)
+    upload_folder = tmp_path / 'uploads'
+    upload_folder.mkdir()
+    app.config.update(
+        TESTING=True,
+        SECRET_KEY='test',
+        DATA_DIR=str(tmp_path),
+        UPLOAD_FOLDER=str(upload_folder),
+        FILE_RETENTION_HOURS=6,
+        STORAGE_LEASE_SECONDS=0,
+        COALESCE_ENABLED=True,
+        COALESCE_WAIT_TIMEOUT=10,
+    )
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def client_session(app):
+    """Contexte de requête d'un client (session PDF propre à chaque contexte)"""
+    with app.test_request_context():
+        yield
+
+
+@pytest.fixture
+def processed_file(app):
+    """Crée un fichier traité publié (répartition de processed) et retourne son chemin"""
+    from app.api import outputs
+
+    def create(name, content=b'%PDF-1.4\n'):
+        path = outputs.shard_path(name, create=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return os.path.abspath(path)
+
+    return create
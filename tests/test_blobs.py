@@ -0,0 +1,112 @@
+"""
+Stockage des fichiers reçus par contenu (app/api/blobs.py)
+"""
+import io
+import os
+import time
+import hashlib
+import pytest
+from app.api import blobs
+from app.api import catalog
+from app.api import uploads
+from app.api.ingest import StagedFile
+
+TEMPLATE = b'%PDF-1.4\n' + b'common template ' * 200 + b'\n%%EOF\n'
+FORGED = b'%PDF-1.4\n' + b'swapped content ' * 200 + b'\n%%EOF\n'
+
+
+@pytest.fixture
+def received(app, tmp_path):
+    """Crée un fichier reçu (hors du stockage par contenu)"""
+    def create(content, sha256=None):
+        path = tmp_path / f"received_{time.time_ns()}.pdf"
+        path.write_bytes(content)
+        return StagedFile(str(path), 'doc.pdf', len(content), sha256)
+    return create
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_identical_uploads_share_one_file(app, received):
+    sha256 = hashlib.sha256(TEMPLATE).hexdigest()
+    with app.test_request_context():
+        first = blobs.store(received(TEMPLATE), 'a.pdf')
+    with app.test_request_context():
+        second_file = received(TEMPLATE)
+        second = blobs.store(second_file, 'b.pdf')
+
+    assert first['deduplicated'] is False
+    assert second['deduplicated'] is True
+    assert first['path'] == second['path'] == blobs.blob_path(sha256, '.pdf')
+    assert first['handle'] != second['handle']
+    assert not os.path.exists(second_file.path)
+    row = catalog.get_blob(sha256)
+    assert row['refs'] == 2
+    assert row['uploads'] == 2
+
+
+def test_forged_hash_is_not_trusted(app, received):
+    """Un contenu annoncé sous l'empreinte d'un autre est stocké sous sa propre empreinte"""
+    template_hash = hashlib.sha256(TEMPLATE).hexdigest()
+    with app.test_request_context():
+        forged = blobs.store(received(FORGED, sha256=template_hash), 'template.pdf')
+
+    assert forged['sha256'] == hashlib.sha256(FORGED).hexdigest()
+    assert catalog.get_blob(template_hash) is None
+
+    # L'envoi authentique du modèle n'est pas dédupliqué sur le contenu falsifié
+    with app.test_request_context():
+        genuine = blobs.store(received(TEMPLATE, sha256=template_hash), 'template.pdf')
+        assert blobs.attach(template_hash, len(TEMPLATE), 'template.pdf')['path'] == genuine['path']
+    assert genuine['sha256'] == template_hash
+    assert read(genuine['path']) == TEMPLATE
+
+
+def test_chunked_upload_cannot_publish_other_content_under_a_hash(app):
+    """Réécrire des octets déjà hachés est refusé : l'empreinte publiée est celle du contenu stocké"""
+    with app.test_request_context():
+        state = uploads.create_upload('template.pdf', len(TEMPLATE))
+        upload_id = state['upload_id']
+        uploads.write_chunk(upload_id, 0, io.BytesIO(TEMPLATE[:-1]), len(TEMPLATE) - 1)
+        with pytest.raises(uploads.UploadError):
+            uploads.write_chunk(upload_id, 0, io.BytesIO(FORGED[:len(TEMPLATE) - 1]), len(TEMPLATE) - 1)
+        done = uploads.write_chunk(upload_id, len(TEMPLATE) - 1, io.BytesIO(TEMPLATE[-1:]), 1)
+
+    stored = catalog.get_blob(done['sha256'])
+    assert hashlib.sha256(read(stored['path'])).hexdigest() == done['sha256']
+
+
+def test_attach_requires_matching_size(app, received):
+    sha256 = hashlib.sha256(TEMPLATE).hexdigest()
+    with app.test_request_context():
+        blobs.store(received(TEMPLATE), 'a.pdf')
+    with app.test_request_context():
+        assert blobs.attach(sha256, len(TEMPLATE) + 1, 'a.pdf') is None
+        assert blobs.attach('0' * 64, len(TEMPLATE), 'a.pdf') is None
+        assert blobs.attach(sha256, len(TEMPLATE), 'a.pdf')['deduplicated'] is True
+
+    app.config['UPLOAD_DEDUP_PRECHECK'] = False
+    with app.test_request_context():
+        assert blobs.attach(sha256, len(TEMPLATE), 'a.pdf') is None
+
+
+def test_unreferenced_blob_is_collected(app, received):
+    sha256 = hashlib.sha256(TEMPLATE).hexdigest()
+    with app.test_request_context():
+        stored = blobs.store(received(TEMPLATE), 'a.pdf')
+    later = time.time() + catalog.get_retention() + 1
+    blobs.pin([StagedFile(stored['path'], 'a.pdf', sha256=sha256)], holder='job:test',
+              expires_at=later + 3600)
+    assert catalog.get_blob(sha256)['refs'] == 2
+
+    # Référence de la session expirée : le traitement le retient encore
+    assert blobs.collect(later) == (0, 0)
+    assert os.path.exists(stored['path'])
+
+    blobs.release('job:test')
+    assert blobs.collect(later) == (1, len(TEMPLATE))
+    assert not os.path.exists(stored['path'])
+    assert catalog.get_blob(sha256) is None
@@ -0,0 +1,73 @@
+"""
+Clés du cache des archives de téléchargement groupé (app/api/bundles.py)
+"""
+import os
+import pytest
+from app.api import bundles
+from app.api import catalog
+from app.api import coalesce
+
+
+@pytest.fixture(autouse=True)
+def no_hashing(monkeypatch):
+    """Les membres ne sont jamais relus pour construire la clé"""
+    def hash_file(path):
+        raise AssertionError(f"membre relu: {path}")
+    monkeypatch.setattr(coalesce, 'hash_file', hash_file)
+
+
+@pytest.fixture
+def members(processed_file):
+    return [(processed_file('merged_a.pdf', b'%PDF a'), 'a.pdf'), (processed_file('merged_b.pdf', b'%PDF b'), 'b.pdf')]
+
+
+def test_key_is_stable_and_archive_is_reused(app, members):
+    bundle = bundles.lookup(members, 'store')
+    assert not bundle.cached
+
+    assert b''.join(bundle.record([b'PK', b'archive'])) == b'PKarchive'
+
+    again = bundles.lookup(list(reversed(members)), 'store')
+    assert again.key == bundle.key
+    assert again.cached
+
+
+def test_known_hash_is_the_member_version(app, members):
+    path = members[0][0]
+    catalog.record([{'path': path, 'sha256': 'a' * 64}], 'merge')
+
+    bundle = bundles.lookup(members, 'store')
+
+    versions = {member['path']: member['version'] for member in bundle.members}
+    assert versions[path] == 'a' * 64
+    # Empreinte inconnue : état du fichier
+    assert versions[members[1][0]].startswith('state:')
+
+
+def test_changed_member_changes_the_key(app, members):
+    bundle = bundles.lookup(members, 'store')
+    list(bundle.record([b'PK']))
+
+    with open(members[1][0], 'ab') as f:
+        f.write(b' modified')
+
+    changed = bundles.lookup(members, 'store')
+    assert changed.key != bundle.key
+    assert not changed.cached
+
+
+def test_compression_is_part_of_the_key(app, members):
+    assert bundles.lookup(members, 'store').key != bundles.lookup(members, 'deflate').key
+
+
+def test_interrupted_send_leaves_no_archive(app, members):
+    bundle = bundles.lookup(members, 'store')
+
+    def interrupted():
+        yield b'PK'
+        raise ConnectionError('client parti')
+
+    with pytest.raises(ConnectionError):
+        list(bundle.record(interrupted()))
+
+    assert os.listdir(bundles.get_bundles_dir()) == []
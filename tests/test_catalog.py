@@ -0,0 +1,101 @@
+"""
+Réconciliation de l'index des fichiers avec le disque (app/api/catalog.py)
+"""
+import os
+import time
+from app.api import catalog
+from app.api import outputs
+
+
+def indexed_paths():
+    return {row['path'] for row in catalog.get_connection().execute("SELECT path FROM files")}
+
+
+def test_reconcile_adds_unindexed_files(app, processed_file):
+    path = processed_file('merged_report.pdf')
+
+    summary = catalog.reconcile()
+
+    assert summary['added'] == 1
+    row = catalog.get_connection().execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+    assert row['operation'] == 'merge'
+    assert row['area'] == 'processed'
+    assert row['size'] == os.path.getsize(path)
+
+
+def test_reconcile_removes_vanished_files(app, processed_file):
+    kept = processed_file('rotated_a.pdf')
+    vanished = processed_file('rotated_b.pdf')
+    catalog.record([{'path': kept}, {'path': vanished}], 'rotate', session_id='session')
+    os.remove(vanished)
+
+    summary = catalog.reconcile()
+
+    assert summary['removed'] == 1
+    assert indexed_paths() == {kept}
+    assert catalog.get_connection().execute(
+        "SELECT COUNT(*) FROM owners WHERE path = ?", (vanished,)).fetchone()[0] == 0
+
+
+def test_reconcile_fixes_sizes_and_drops_stale_hashes(app, processed_file):
+    path = processed_file('compressed_a.pdf', b'12345')
+    catalog.record([{'path': path, 'sha256': 'f' * 64}], 'compress')
+    with open(path, 'ab') as f:
+        f.write(b'678')
+
+    summary = catalog.reconcile()
+
+    assert summary['updated'] == 1
+    row = catalog.get_connection().execute("SELECT size, sha256 FROM files WHERE path = ?", (path,)).fetchone()
+    assert row['size'] == 8
+    assert row['sha256'] is None
+
+
+def test_reconcile_keeps_rows_recorded_during_the_scan(app, processed_file, monkeypatch):
+    """Un fichier publié et enregistré pendant le parcours n'est pas pris pour un fichier disparu"""
+    processed_file('merged_existing.pdf')
+    scan = catalog._iter_area
+    published = []
+
+    def scan_then_publish(area):
+        yield from scan(area)
+        if area == 'processed' and not published:
+            # Publié après le passage du parcours dans son répertoire
+            path = processed_file('merged_late.pdf')
+            catalog.record([{'path': path}], 'merge', session_id='session')
+            published.append(path)
+
+    monkeypatch.setattr(catalog, '_iter_area', scan_then_publish)
+
+    summary = catalog.reconcile()
+
+    assert summary['removed'] == 0
+    assert published[0] in indexed_paths()
+
+
+def test_reconcile_keeps_evicted_rows(app, processed_file):
+    """Copie locale évincée (stockage partagé) : la ligne et ses propriétaires restent"""
+    path = processed_file('split_a_page_1.pdf')
+    catalog.record([{'path': path}], 'split', session_id='session')
+    time.sleep(0.01)
+
+    assert catalog.evict_files(catalog.lru_candidates(time.time(), 10)) == (1, len(b'%PDF-1.4\n'))
+    assert not os.path.exists(path)
+
+    summary = catalog.reconcile()
+
+    assert summary['removed'] == 0
+    assert path in indexed_paths()
+    assert outputs.resolve('split_a_page_1.pdf') is None
+
+
+def test_reconcile_updates_counters(app, processed_file):
+    processed_file('watermarked_a.pdf', b'abc')
+    processed_file('watermarked_b.pdf', b'de')
+
+    catalog.reconcile()
+
+    counters = {row['operation']: row for row in catalog.get_connection().execute(
+        "SELECT operation, files, bytes FROM counters WHERE area = 'processed'")}
+    assert counters['watermark']['files'] == 2
+    assert counters['watermark']['bytes'] == 5
@@ -0,0 +1,139 @@
+"""
+Coalescence des traitements identiques concurrents (app/api/coalesce.py)
+"""
+import threading
+import pytest
+from app.api import coalesce
+
+pytestmark = pytest.mark.skipif(coalesce.fcntl is None, reason="verrous inter-processus indisponibles")
+
+
+@pytest.fixture
+def follower_waiting(monkeypatch):
+    """Événement posé quand un second appelant attend le verrou de coalescence"""
+    waiting = threading.Event()
+    calls = []
+    acquire = coalesce._acquire
+
+    def tracked_acquire(fd, deadline):
+        calls.append(fd)
+        if len(calls) >= 2:
+            waiting.set()
+        return acquire(fd, deadline)
+
+    monkeypatch.setattr(coalesce, '_acquire', tracked_acquire)
+    return waiting
+
+
+def run_caller(app, key, compute, results):
+    """Appelant concurrent, dans son propre contexte d'application"""
+    def call():
+        with app.app_context():
+            try:
+                results.append(coalesce.single_flight(key, compute))
+            except Exception as e:
+                results.append(e)
+    thread = threading.Thread(target=call)
+    thread.start()
+    return thread
+
+
+def test_concurrent_callers_share_the_leader_result(app, follower_waiting):
+    key = coalesce.make_key('merge', ['a' * 64], {'linearize': False})
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def leader_compute():
+        calls.append('leader')
+        started.set()
+        assert release.wait(5)
+        return {'filename': 'merged.pdf'}
+
+    def follower_compute():
+        calls.append('follower')
+        return {'filename': 'other.pdf'}
+
+    leader_results = []
+    leader = run_caller(app, key, leader_compute, leader_results)
+    assert started.wait(5)
+    follower_results = []
+    follower = run_caller(app, key, follower_compute, follower_results)
+    assert follower_waiting.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert calls == ['leader']
+    assert leader_results == [{'filename': 'merged.pdf'}]
+    assert follower_results == [{'filename': 'merged.pdf'}]
+
+
+def test_concurrent_callers_share_the_leader_error(app, follower_waiting):
+    key = coalesce.make_key('split', ['b' * 64])
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader_compute():
+        started.set()
+        assert release.wait(5)
+        raise ValueError('moteur en échec')
+
+    leader_results = []
+    leader = run_caller(app, key, leader_compute, leader_results)
+    assert started.wait(5)
+    follower_results = []
+    follower = run_caller(app, key, lambda: 'recomputed', follower_results)
+    assert follower_waiting.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert isinstance(leader_results[0], ValueError)
+    assert isinstance(follower_results[0], Exception)
+    assert 'moteur en échec' in str(follower_results[0])
+
+
+def test_later_caller_computes_again(app):
+    key = coalesce.make_key('rotate', ['c' * 64], {'angle': 90})
+
+    assert coalesce.single_flight(key, lambda: 'first') == 'first'
+    # Pas un cache : un appel après la fin du traitement le relance
+    assert coalesce.single_flight(key, lambda: 'second') == 'second'
+
+
+def test_follower_computes_when_shared_files_are_gone(app, tmp_path, follower_waiting):
+    key = coalesce.make_key('compress', ['d' * 64])
+    output = tmp_path / 'compressed.pdf'
+    output.write_bytes(b'%PDF')
+    started = threading.Event()
+    release = threading.Event()
+
+    def leader_compute():
+        started.set()
+        assert release.wait(5)
+        return {'path': str(output)}
+
+    leader_results = []
+    leader = run_caller(app, key, leader_compute, leader_results)
+    assert started.wait(5)
+    follower_results = []
+    follower = run_caller(app, key, lambda: {'path': 'recomputed'}, follower_results)
+    # Résultat supprimé (téléchargement avec nettoyage) avant que le suiveur ne le lise
+    output.unlink()
+    assert follower_waiting.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert follower_results == [{'path': 'recomputed'}]
+
+
+def test_disabled_coalescing_always_computes(app):
+    app.config['COALESCE_ENABLED'] = False
+    calls = []
+
+    coalesce.single_flight('key', lambda: calls.append(1))
+    coalesce.single_flight('key', lambda: calls.append(2))
+
+    assert calls == [1, 2]
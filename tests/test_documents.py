@@ -0,0 +1,57 @@
+"""
+Identifiants de documents rattachés à leur session (app/api/documents.py)
+"""
+import pytest
+from app.api import documents
+
+
+def test_handle_resolves_in_its_session(app, processed_file):
+    path = processed_file('rotated_report.pdf', b'%PDF-1.4 rotated')
+    with app.test_request_context():
+        handle = documents.register(path, 'report.pdf')
+        document = documents.resolve(handle)
+
+    assert document.handle == handle
+    assert document.path == path
+    assert document.filename == 'report.pdf'
+    assert document.size == len(b'%PDF-1.4 rotated')
+
+
+def test_handle_is_unknown_to_other_sessions(app, processed_file):
+    path = processed_file('rotated_report.pdf')
+    with app.test_request_context():
+        handle = documents.register(path, 'report.pdf')
+
+    # Même réponse qu'un identifiant inexistant
+    with app.test_request_context():
+        with pytest.raises(documents.DocumentHandleError) as error:
+            documents.resolve(handle)
+        assert error.value.status_code == 404
+        assert str(error.value) == 'Unknown or expired document handle'
+
+
+@pytest.mark.parametrize('handle', ['', '../handles/x', 'A' * 32])
+def test_malformed_handle_is_rejected(client_session, handle):
+    with pytest.raises(documents.DocumentHandleError) as error:
+        documents.resolve(handle)
+    assert error.value.status_code == 400
+
+
+def test_handle_outside_data_dir_is_rejected(app, tmp_path_factory):
+    outside = tmp_path_factory.mktemp('outside') / 'secret.pdf'
+    outside.write_bytes(b'%PDF')
+    with app.test_request_context():
+        handle = documents.register(str(outside), 'secret.pdf', kind='upload')
+        with pytest.raises(documents.DocumentHandleError):
+            documents.resolve(handle)
+
+
+def test_handles_resolve_in_order(app, processed_file):
+    first = processed_file('merged_a.pdf')
+    second = processed_file('merged_b.pdf')
+    with app.test_request_context():
+        handles = [documents.register(first, 'a.pdf'), documents.register(second, 'b.pdf')]
+
+        resolved = documents.resolve_many([f"{handles[1]}, {handles[0]}"])
+
+    assert [document.path for document in resolved] == [second, first]
@@ -0,0 +1,76 @@
+"""
+File des traitements asynchrones (app/api/jobs.py, table jobs de app/api/catalog.py)
+"""
+import time
+from app.api import catalog
+
+
+def evictable(now=None):
+    return {row['path'] for row in catalog.lru_candidates(now or time.time() + 1, 100)}
+
+
+def test_inputs_of_pending_jobs_are_not_evicted(app, processed_file):
+    """Document d'entrée d'un traitement en attente puis en cours : jamais évincé avant sa fin"""
+    path = processed_file('compressed_input.pdf')
+    other = processed_file('compressed_other.pdf')
+    catalog.record([{'path': path}, {'path': other}], 'compress', session_id='session')
+
+    catalog.enqueue_job('a' * 32, 'session', 'rotate', '{}', [path])
+    assert evictable() == {other}
+
+    job = catalog.claim_job('worker:1')
+    assert evictable() == {other}
+
+    catalog.finish_job(job['id'], 'worker:1', 'succeeded', 200, '{}')
+    assert evictable() == {path, other}
+
+
+def test_purged_jobs_release_their_inputs(app, processed_file):
+    path = processed_file('merged_input.pdf')
+    catalog.record([{'path': path}], 'merge', session_id='session')
+    catalog.enqueue_job('b' * 32, 'session', 'compress', '{}', [path])
+    assert catalog.cancel_job('b' * 32)
+
+    assert catalog.purge_jobs(time.time() + 1) == 1
+    assert catalog.get_connection().execute("SELECT COUNT(*) FROM job_inputs").fetchone()[0] == 0
+
+
+def test_jobs_are_claimed_once_in_order(app):
+    catalog.enqueue_job('c' * 32, 'session', 'compress', '{}')
+    time.sleep(0.01)
+    catalog.enqueue_job('d' * 32, 'session', 'rotate', '{}')
+
+    first = catalog.claim_job('worker:1')
+    second = catalog.claim_job('worker:2')
+
+    assert (first['id'], first['status'], first['worker'], first['attempts']) == ('c' * 32, 'running', 'worker:1', 1)
+    assert second['id'] == 'd' * 32
+    assert catalog.claim_job('worker:3') is None
+    assert catalog.count_pending_jobs('session') == 2
+
+
+def test_stale_job_is_requeued_then_abandoned(app):
+    catalog.enqueue_job('e' * 32, 'session', 'compress', '{}')
+    catalog.claim_job('worker:1')
+
+    # Worker arrêté : le traitement est repris par un autre worker
+    assert catalog.requeue_stale_jobs(time.time() + 1, max_attempts=2) == (1, 0)
+    job = catalog.claim_job('worker:2')
+    assert (job['worker'], job['attempts']) == ('worker:2', 2)
+
+    # Le premier worker ne peut plus enregistrer de fin
+    assert not catalog.finish_job(job['id'], 'worker:1', 'succeeded', 200, '{}')
+
+    assert catalog.requeue_stale_jobs(time.time() + 1, max_attempts=2) == (0, 1)
+    job = catalog.get_job('e' * 32)
+    assert (job['status'], job['status_code']) == ('failed', 500)
+
+
+def test_live_job_is_not_requeued(app):
+    catalog.enqueue_job('f' * 32, 'session', 'compress', '{}')
+    job = catalog.claim_job('worker:1')
+    catalog.heartbeat_job(job['id'], 'worker:1')
+
+    assert catalog.requeue_stale_jobs(time.time() - 60, max_attempts=3) == (0, 0)
+    assert catalog.finish_job(job['id'], 'worker:1', 'succeeded', 200, '{}')
+    assert catalog.get_job(job['id'])['status'] == 'succeeded'
@@ -0,0 +1,104 @@
+"""
+Découpage différé : production à la demande et cache des documents (app/api/lazysplit.py)
+"""
+import os
+import time
+import pytest
+from app.api import lazysplit
+from app.api import pdf_processor
+from app.api.ingest import StagedFile
+
+PAGE_COUNT = 500
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """Moteur simulé : chaque document produit fait 100 octets"""
+    extracted = []
+    archived = []
+
+    def extract_pages(input_path, output_path, page_range, linearize=False):
+        extracted.append(page_range)
+        with open(output_path, 'wb') as f:
+            f.write(b'%' * 100)
+
+    def split_pdf_to_zip(file, page_range=None, register_pages=False, linearize=None):
+        # Même contrôle que l'appel réel du moteur
+        pdf_processor.sanitize_command_arg(page_range)
+        archived.append(page_range)
+        return {'path': os.path.join(os.path.dirname(file.path), 'split.zip')}
+
+    monkeypatch.setattr(pdf_processor, 'count_pages', lambda path: PAGE_COUNT)
+    monkeypatch.setattr(pdf_processor, 'extract_pages', extract_pages)
+    monkeypatch.setattr(pdf_processor, 'split_pdf_to_zip', split_pdf_to_zip)
+    return extracted, archived
+
+
+@pytest.fixture
+def split(app, client_session, tmp_path, engine):
+    def create(page_range=None, pages_per_file=None):
+        source = tmp_path / 'report.pdf'
+        source.write_bytes(b'%PDF-1.4\n')
+        return lazysplit.create(StagedFile(str(source), 'report.pdf'), page_range, pages_per_file)
+    return create
+
+
+def cached_pages(index):
+    return sorted(os.listdir(os.path.join(lazysplit.get_lazy_dir(), index['split_id'], lazysplit.PAGES_DIR_NAME)))
+
+
+def test_documents_are_produced_once(split, engine):
+    extracted, _ = engine
+    index = split(pages_per_file=3)
+
+    first = lazysplit.materialize(index, 2)
+    again = lazysplit.materialize(index, 2)
+
+    assert first == again
+    assert extracted == ['4-6']
+
+
+def test_least_recently_used_documents_are_evicted(app, split):
+    app.config['LAZY_SPLIT_CACHE_BYTES'] = 250
+    index = split()
+    now = time.time()
+
+    first = lazysplit.materialize(index, 1)
+    second = lazysplit.materialize(index, 2)
+    os.utime(first, (now - 60, now - 60))
+    os.utime(second, (now - 30, now - 30))
+    # Document 1 redemandé : marqué comme récemment utilisé
+    lazysplit.materialize(index, 1)
+    lazysplit.materialize(index, 3)
+
+    assert cached_pages(index) == ['1.pdf', '3.pdf']
+
+
+def test_document_being_sent_is_never_evicted(app, split):
+    app.config['LAZY_SPLIT_CACHE_BYTES'] = 50
+    index = split()
+
+    path = lazysplit.materialize(index, 1)
+
+    # Budget inférieur à un document : seul le document demandé reste
+    assert os.path.exists(path)
+    assert cached_pages(index) == ['1.pdf']
+
+
+def test_archive_of_every_page_sends_no_range(split, engine):
+    """Un document par page : plage par défaut du moteur, pas de plage de plus de 1024 caractères"""
+    _, archived = engine
+    index = split()
+
+    lazysplit.build_archive(index)
+
+    assert archived == ['']
+
+
+def test_archive_of_selected_pages_sends_their_range(split, engine):
+    _, archived = engine
+    index = split('1,3,5-10')
+
+    lazysplit.build_archive(index)
+
+    assert archived == ['1,3,5-10']
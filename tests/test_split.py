@@ -0,0 +1,98 @@
+"""
+Découpage des PDF (/api/split-pdf, app/api/pdf_processor.py)
+"""
+import io
+import pytest
+from app import create_app
+from app.api import pdf_processor
+
+PAGE_COUNT = 500
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'DATA_DIR': str(tmp_path),
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        'PROCESSED_FOLDER': str(tmp_path / 'processed'),
+        'JANITOR_ENABLED': False,
+        'JOB_WORKERS': 0,
+        'STORAGE_LEASE_SECONDS': 0,
+    })
+    return app.test_client()
+
+
+@pytest.fixture
+def archived(monkeypatch, tmp_path):
+    """Plages transmises au moteur, avec le contrôle de l'appel réel"""
+    ranges = []
+
+    def split_pdf_to_zip(file, page_range=None, register_pages=False, linearize=None):
+        pdf_processor.sanitize_command_arg(page_range)
+        ranges.append(page_range)
+        return {'filename': 'split.zip', 'path': str(tmp_path / 'split.zip'), 'url': '/download/split.zip',
+                'size': 0, 'files': []}
+
+    def split_pdf(*args, **kwargs):
+        raise AssertionError('découpage classique utilisé')
+
+    monkeypatch.setattr(pdf_processor, 'count_pages', lambda path: PAGE_COUNT)
+    monkeypatch.setattr(pdf_processor, 'split_pdf_to_zip', split_pdf_to_zip)
+    monkeypatch.setattr(pdf_processor, 'split_pdf', split_pdf)
+    monkeypatch.setattr(pdf_processor, 'split_pdf_by_count', split_pdf)
+    return ranges
+
+
+def split(client, split_method, page_range):
+    return client.post('/api/split-pdf', data={
+        'file': (io.BytesIO(b'%PDF-1.4\n%%EOF\n'), 'report.pdf'),
+        'split_method': split_method,
+        'page_range': page_range,
+    }, content_type='multipart/form-data')
+
+
+@pytest.mark.parametrize('split_method, page_range', [('range', ''), ('extract', ''), ('count', 'count:1')])
+def test_one_page_per_document_sends_no_range(client, archived, split_method, page_range):
+    """La liste explicite des 500 pages dépasserait 1024 caractères"""
+    assert len(','.join(str(page) for page in range(1, PAGE_COUNT + 1))) > 1024
+
+    response = split(client, split_method, page_range)
+
+    assert response.status_code == 200
+    assert response.get_json()['is_zip'] is True
+    assert archived == ['']
+
+
+def test_selected_pages_send_their_range(client, archived):
+    response = split(client, 'range', '1,3,5-10')
+
+    assert response.status_code == 200
+    assert archived == ['1,3,5-10']
+
+
+def test_batch_and_fallback_splits_keep_linearization(app, tmp_path, monkeypatch):
+    """Lots puis méthode de secours (moteur en échec) : chaque appel du moteur demande la linéarisation"""
+    from PyPDF2 import PdfWriter
+    source = tmp_path / 'large.pdf'
+    writer = PdfWriter()
+    for _ in range(3):
+        writer.add_blank_page(width=200, height=200)
+    with open(source, 'wb') as f:
+        writer.write(f)
+    calls = []
+
+    def run_pdfeditor(cmd_args):
+        calls.append(cmd_args)
+        return 1, '', 'moteur en échec'
+
+    monkeypatch.setattr(pdf_processor, 'run_pdfeditor', run_pdfeditor)
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+
+    files = pdf_processor.split_pdf_in_batches(str(source), str(work_dir), 3, linearize=True)
+
+    assert [f['page_number'] for f in files] == [1, 2, 3]
+    assert [args[0] for args in calls] == ['split', 'extract', 'extract', 'extract']
+    assert all(pdf_processor.LINEARIZE_OPTION in args for args in calls)
@@ -0,0 +1,103 @@
+"""
+Envois par morceaux (app/api/uploads.py)
+"""
+import io
+import hashlib
+import pytest
+from app.api import uploads
+
+CONTENT = b'%PDF-1.4\n' + bytes(range(256)) * 64 + b'\n%%EOF\n'
+
+
+def send(upload_id, offset, data):
+    return uploads.write_chunk(upload_id, offset, io.BytesIO(data), len(data))
+
+
+def test_chunks_in_any_order_complete_the_upload(app, client_session):
+    state = uploads.create_upload('doc.pdf', len(CONTENT))
+    middle = len(CONTENT) // 2
+
+    partial = send(state['upload_id'], middle, CONTENT[middle:])
+    assert partial['complete'] is False
+    assert partial['offset'] == 0
+    assert partial['ranges'] == [[middle, len(CONTENT)]]
+
+    done = send(state['upload_id'], 0, CONTENT[:middle])
+    assert done['complete'] is True
+    assert done['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    with open(uploads.get_upload(state['upload_id'])['path'], 'rb') as f:
+        assert f.read() == CONTENT
+
+
+def test_chunk_outside_upload_length_is_rejected(app, client_session):
+    state = uploads.create_upload('doc.pdf', len(CONTENT))
+
+    with pytest.raises(uploads.UploadError) as error:
+        send(state['upload_id'], len(CONTENT) - 2, b'abc')
+    assert error.value.status_code == 409
+
+
+def test_chunk_overlapping_received_bytes_is_rejected(app, client_session):
+    """Des octets déjà pris en compte dans l'empreinte ne peuvent pas être réécrits"""
+    state = uploads.create_upload('doc.pdf', len(CONTENT))
+    send(state['upload_id'], 0, CONTENT[:-1])
+    forged = b'%PDF-1.4\n' + b'x' * (len(CONTENT) - 10)
+
+    for offset, data in ((0, forged), (len(CONTENT) - 5, b'zzzz'), (3, b'y')):
+        with pytest.raises(uploads.UploadError) as error:
+            send(state['upload_id'], offset, data)
+        assert error.value.status_code == 409
+
+    done = send(state['upload_id'], len(CONTENT) - 1, CONTENT[-1:])
+    assert done['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+    with open(uploads.get_upload(state['upload_id'])['path'], 'rb') as f:
+        assert hashlib.sha256(f.read()).hexdigest() == done['sha256']
+
+
+def test_chunk_overlapping_a_chunk_in_flight_is_rejected(app, client_session):
+    state = uploads.create_upload('doc.pdf', len(CONTENT))
+    upload_id = state['upload_id']
+
+    class SlowStream(io.BytesIO):
+        """Corps dont la lecture envoie, pendant l'écriture, un morceau concurrent"""
+        def read(self, size=-1):
+            with pytest.raises(uploads.UploadError) as error:
+                send(upload_id, 10, CONTENT[10:20])
+            assert error.value.status_code == 409
+            return super().read(size)
+
+    head = CONTENT[:100]
+    uploads.write_chunk(upload_id, 0, SlowStream(head), len(head))
+    assert uploads.public_state(uploads.get_upload(upload_id))['ranges'] == [[0, 100]]
+
+
+def test_interrupted_chunk_keeps_received_part_and_can_be_resumed(app, client_session):
+    state = uploads.create_upload('doc.pdf', len(CONTENT))
+    upload_id = state['upload_id']
+
+    with pytest.raises(uploads.UploadError):
+        # Connexion coupée après 100 octets
+        uploads.write_chunk(upload_id, 0, io.BytesIO(CONTENT[:100]), len(CONTENT))
+    assert uploads.public_state(uploads.get_upload(upload_id))['offset'] == 100
+
+    done = send(upload_id, 100, CONTENT[100:])
+    assert done['complete'] is True
+    assert done['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+
+
+def test_finished_upload_rejects_chunks(app, client_session):
+    state = uploads.create_upload('doc.pdf', len(CONTENT))
+    send(state['upload_id'], 0, CONTENT)
+
+    with pytest.raises(uploads.UploadError) as error:
+        send(state['upload_id'], 0, b'')
+    assert error.value.status_code == 409
+
+
+def test_upload_of_another_session_is_not_found(app):
+    with app.test_request_context():
+        state = uploads.create_upload('doc.pdf', len(CONTENT))
+    with app.test_request_context():
+        with pytest.raises(uploads.UploadError) as error:
+            uploads.get_upload(state['upload_id'])
+        assert error.value.status_code == 404
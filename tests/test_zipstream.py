@@ -0,0 +1,141 @@
+"""
+Archives ZIP produites au fil de l'eau (app/api/zipstream.py)
+"""
+import io
+import struct
+import zipfile
+import pytest
+from app.api import zipstream
+
+
+def build(files, compression='store', chunk_size=zipstream.CHUNK_SIZE):
+    """Retourne l'archive, la taille annoncée par size() et les octets émis"""
+    archive = zipstream.ZipStream(files, compression, chunk_size=chunk_size)
+    expected_size = archive.size()
+    data = b''.join(archive)
+    return archive, expected_size, data
+
+
+@pytest.fixture
+def sample_files(tmp_path):
+    files = []
+    for index, content in enumerate([b'%PDF-1.4 first', b'', b'x' * 300000, bytes(range(256)) * 40]):
+        path = tmp_path / f"file{index}.pdf"
+        path.write_bytes(content)
+        files.append((str(path), f"file{index}.pdf"))
+    return files
+
+
+def test_stored_round_trip(sample_files):
+    _, expected_size, data = build(sample_files, chunk_size=4096)
+
+    assert expected_size == len(data)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.testzip() is None
+        assert archive.namelist() == [name for _, name in sample_files]
+        for path, name in sample_files:
+            with open(path, 'rb') as f:
+                assert archive.read(name) == f.read()
+            assert archive.getinfo(name).compress_type == zipfile.ZIP_STORED
+
+
+def test_deflated_round_trip(sample_files):
+    archive, expected_size, data = build(sample_files, compression='deflate')
+
+    # Taille inconnue à l'avance pour les entrées compressées
+    assert expected_size is None
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        for path, name in sample_files:
+            with open(path, 'rb') as f:
+                assert zf.read(name) == f.read()
+            assert zf.getinfo(name).compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_auto_compression_stores_pdf_only(tmp_path):
+    pdf = tmp_path / 'a.pdf'
+    text = tmp_path / 'a.txt'
+    pdf.write_bytes(b'%PDF' * 100)
+    text.write_bytes(b'text ' * 100)
+
+    _, _, data = build([(str(pdf), 'a.pdf'), (str(text), 'a.txt')], compression='auto')
+
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.getinfo('a.pdf').compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo('a.txt').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_duplicate_and_utf8_names(tmp_path):
+    path = tmp_path / 'doc.pdf'
+    path.write_bytes(b'%PDF')
+    files = [(str(path), 'doc.pdf'), (str(path), 'doc.pdf'), (str(path), 'résumé.pdf')]
+
+    _, expected_size, data = build(files)
+
+    assert expected_size == len(data)
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.namelist() == ['doc.pdf', 'doc_1.pdf', 'résumé.pdf']
+
+
+def test_entry_count_at_zip64_limit(tmp_path):
+    """Au moins 0xFFFF entrées : enregistrements de fin ZIP64"""
+    path = tmp_path / 'p.pdf'
+    path.write_bytes(b'%')
+    files = [(str(path), f"{index}.pdf") for index in range(zipstream.ZIP64_COUNT_LIMIT)]
+
+    _, expected_size, data = build(files)
+
+    assert expected_size == len(data)
+    assert struct.pack('<I', 0x06064b50) in data[-200:]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert len(archive.infolist()) == zipstream.ZIP64_COUNT_LIMIT
+        assert archive.read('65534.pdf') == b'%'
+
+
+def test_entry_count_below_zip64_limit(tmp_path):
+    """Une entrée de moins que la limite : fin de répertoire classique"""
+    path = tmp_path / 'p.pdf'
+    path.write_bytes(b'%')
+    files = [(str(path), f"{index}.pdf") for index in range(zipstream.ZIP64_COUNT_LIMIT - 1)]
+
+    _, expected_size, data = build(files)
+
+    assert expected_size == len(data)
+    assert struct.pack('<I', 0x06064b50) not in data[-200:]
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert len(archive.infolist()) == zipstream.ZIP64_COUNT_LIMIT - 1
+
+
+@pytest.mark.parametrize('limit_offset', [-1, 0, 1])
+def test_size_matches_output_around_zip64_size_limit(tmp_path, monkeypatch, limit_offset):
+    """
+    Taille d'entrée autour de la limite ZIP64 (abaissée : les fichiers de
+    4 Gio ne sont pas produits), taille annoncée égale aux octets émis
+    """
+    path = tmp_path / 'first.pdf'
+    path.write_bytes(b'a' * 2000)
+    # Entrée ZIP64 dès que taille + 1 % + 1024 atteint la limite
+    limit = 2000 + 2000 // 100 + 1024 + limit_offset
+    monkeypatch.setattr(zipstream, 'ZIP64_LIMIT', limit)
+
+    archive, expected_size, data = build([(str(path), 'first.pdf')])
+
+    assert expected_size == len(data)
+    assert archive.entries[0].zip64 == (limit_offset <= 0)
+
+
+def test_offset_beyond_zip64_limit(tmp_path, monkeypatch):
+    """Entrée placée au-delà de la limite : position dans le champ ZIP64 du répertoire central"""
+    first = tmp_path / 'first.pdf'
+    second = tmp_path / 'second.pdf'
+    first.write_bytes(b'a' * 2000)
+    second.write_bytes(b'b' * 100)
+    monkeypatch.setattr(zipstream, 'ZIP64_LIMIT', 2050)
+
+    archive, expected_size, data = build([(str(first), 'first.pdf'), (str(second), 'second.pdf')])
+
+    assert expected_size == len(data)
+    assert archive.entries[1].offset >= 2050
+    assert archive.entries[1].central_header().endswith(struct.pack('<HHQ', 0x0001, 8, archive.entries[1].offset))
+    # Répertoire central au-delà de la limite : enregistrements de fin ZIP64
+    assert struct.pack('<I', 0x06064b50) in data[-200:]
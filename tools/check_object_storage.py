@@ -0,0 +1,126 @@
+"""
+Vérification du stockage objet compatible S3 des fichiers traités
+
+Exerce app/api/storage.py (S3Storage) contre un stockage compatible S3,
+par exemple un MinIO local :
+
+    - envoi multipart d'un fichier de plusieurs parties, puis d'un petit
+      fichier (envoi en une requête) ;
+    - lectures partielles (plages d'octets) comparées au contenu envoyé ;
+    - téléchargement par URL présignée, avec une plage d'octets ;
+    - récupération sur le disque local d'un fichier absent du nœud ;
+    - suppression des objets.
+
+Usage:
+    docker run -d -p 9000:9000 -e MINIO_ROOT_USER=minio -e MINIO_ROOT_PASSWORD=minio123 \\
+        minio/minio server /data
+    pip install boto3
+    python tools/check_object_storage.py --endpoint-url http://127.0.0.1:9000 \\
+        --access-key minio --secret-key minio123 --bucket pdfstudio
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import urllib.request
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def check(label, condition):
+    """Affiche le résultat d'une vérification et s'arrête au premier échec"""
+    print(f"{'ok' if condition else 'ÉCHEC':>5}  {label}")
+    if not condition:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--endpoint-url', default='http://127.0.0.1:9000', help="Adresse du stockage compatible S3")
+    parser.add_argument('--access-key', default=None, help="Identifiant d'accès")
+    parser.add_argument('--secret-key', default=None, help="Clé secrète")
+    parser.add_argument('--region', default='us-east-1', help="Région")
+    parser.add_argument('--bucket', default='pdfstudio', help="Bucket (créé s'il n'existe pas)")
+    parser.add_argument('--size-mb', type=int, default=12, help="Taille du fichier envoyé en plusieurs parties")
+    args = parser.parse_args()
+
+    from flask import Flask
+    from app.api import storage, outputs
+
+    # Application minimale sur un répertoire de données temporaire
+    data_dir = tempfile.mkdtemp(prefix='storage_check_')
+    app = Flask(__name__)
+    app.config.update(
+        DATA_DIR=data_dir,
+        UPLOAD_FOLDER=os.path.join(data_dir, 'uploads'),
+        PROCESSED_FOLDER=os.path.join(data_dir, 'processed'),
+        STORAGE_BACKEND='s3',
+        S3_BUCKET=args.bucket,
+        S3_PREFIX=f"check-{uuid.uuid4().hex[:8]}/",
+        S3_ENDPOINT_URL=args.endpoint_url,
+        S3_REGION=args.region,
+        S3_ACCESS_KEY_ID=args.access_key,
+        S3_SECRET_ACCESS_KEY=args.secret_key,
+        S3_ADDRESSING_STYLE='path',
+        S3_MULTIPART_CHUNK_SIZE=storage.MIN_PART_SIZE
+    )
+
+    try:
+        with app.app_context():
+            backend = storage.get_backend()
+            try:
+                backend.client.head_bucket(Bucket=args.bucket)
+            except Exception:
+                backend.client.create_bucket(Bucket=args.bucket)
+
+            # Fichier de plusieurs parties, publié comme un résultat de traitement
+            large_name = f"{uuid.uuid4()}_large.pdf"
+            content = os.urandom(args.size_mb * 1024 * 1024 + 12345)
+            with outputs.OutputStage() as stage:
+                with open(stage.path(large_name), 'wb') as f:
+                    f.write(content)
+                large_path = stage.commit(stage.path(large_name))
+            start = time.monotonic()
+            backend.publish(large_path, large_name)
+            elapsed = time.monotonic() - start
+            head = backend.head(large_name)
+            check(f"envoi multipart de {len(content)} octets en {elapsed:.2f} s",
+                  head is not None and head['ContentLength'] == len(content) and '-' in head['ETag'])
+
+            small_name = f"{uuid.uuid4()}_small.pdf"
+            sent = backend.upload_stream(iter([b'%PDF-1.4\n', b'small']), small_name, 'application/pdf')
+            check("envoi en une requête d'un petit fichier", sent == 14 and backend.head(small_name) is not None)
+
+            # Lectures partielles
+            part = b''.join(backend.read(large_name, 1000, 1999))
+            check("lecture d'une plage d'octets", part == content[1000:2000])
+            tail = b''.join(backend.read(large_name, len(content) - 10))
+            check("lecture de la fin de l'objet", tail == content[-10:])
+
+            # URL présignée, avec une plage d'octets
+            url = backend.client.generate_presigned_url(
+                'get_object', Params={'Bucket': args.bucket, 'Key': backend.key(large_name)}, ExpiresIn=60)
+            ranged = urllib.request.Request(url, headers={'Range': 'bytes=0-99'})
+            with urllib.request.urlopen(ranged) as response:
+                check("téléchargement partiel par URL présignée",
+                      response.status == 206 and response.read() == content[:100])
+
+            # Nœud sans copie locale : récupération depuis le bucket
+            os.remove(large_path)
+            fetched = backend.resolve(large_name)
+            with open(fetched, 'rb') as f:
+                check("récupération sur le disque local", f.read() == content)
+            check("fichier inconnu", backend.resolve(f"{uuid.uuid4()}_missing.pdf") is None)
+
+            backend.delete([large_name, small_name])
+            check("suppression des objets", backend.head(large_name) is None and backend.head(small_name) is None)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Migration des fichiers traités vers la répartition en sous-répertoires
+
+Déplace dans leur répertoire de répartition (processed/ab/cd/<nom>, voir
+app/api/outputs.py) les fichiers publiés à la racine de processed avant la
+répartition, et met à jour leur chemin dans l'index des fichiers. Chaque
+déplacement est un renommage atomique : l'application peut rester en
+service, les URL /download/<nom> restent valables pendant et après la
+migration. La commande peut être relancée sans risque.
+
+Usage:
+    python tools/migrate_processed_layout.py --data-dir /app/data
+    python tools/migrate_processed_layout.py --data-dir data --dry-run
+"""
+import os
+import sys
+import time
+import argparse
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# Déplacements enregistrés dans l'index par lots
+RELOCATE_BATCH_SIZE = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--data-dir', default='/app/data', help="Répertoire des données (DATA_DIR)")
+    parser.add_argument('--dry-run', action='store_true', help="Compter les fichiers à déplacer sans rien modifier")
+    args = parser.parse_args()
+
+    from flask import Flask
+    from app.api import catalog, outputs
+
+    # Application minimale : pas de nettoyage ni de janitor au démarrage
+    data_dir = os.path.abspath(args.data_dir)
+    app = Flask(__name__)
+    app.config.update(
+        DATA_DIR=data_dir,
+        UPLOAD_FOLDER=os.path.join(data_dir, 'uploads'),
+        PROCESSED_FOLDER=os.path.join(data_dir, 'processed')
+    )
+
+    with app.app_context():
+        processed_dir = outputs.get_processed_dir()
+        if args.dry_run:
+            with os.scandir(processed_dir) as entries:
+                count = sum(1 for entry in entries
+                            if entry.is_file(follow_symlinks=False) and outputs.is_valid_name(entry.name)
+                            and not entry.name.endswith('.tmp'))
+            print(f"{count} fichiers à déplacer dans {processed_dir}")
+            return
+
+        pending = []
+
+        def on_move(old_path, new_path):
+            pending.append((old_path, new_path))
+            if len(pending) >= RELOCATE_BATCH_SIZE:
+                catalog.relocate(pending)
+                pending.clear()
+
+        start = time.monotonic()
+        moved = outputs.migrate_flat_layout(on_move)
+        catalog.relocate(pending)
+        print(f"{moved} fichiers déplacés en {time.monotonic() - start:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+"""
+Proxy frontal de test pour les téléchargements délégués
+
+Reproduit localement le comportement de nginx (X-Accel-Redirect) ou
+d'Apache/lighttpd (X-Sendfile) devant l'application : les requêtes sont
+transmises à l'application, et lorsqu'une réponse contient un en-tête de
+délégation, le proxy envoie lui-même le fichier désigné (avec prise en
+charge des plages d'octets et de If-Range), en conservant les en-têtes
+Content-Type, Content-Disposition, ETag et Set-Cookie de l'application.
+
+Usage:
+    DOWNLOAD_OFFLOAD=x-accel flask run --port 5000
+    python tools/offload_proxy.py --upstream 127.0.0.1:5000 --port 8080 \\
+        --accel-root data/processed
+    curl -r 0-99 -OJ http://127.0.0.1:8080/download/<fichier>
+
+Configuration nginx équivalente:
+    location /protected/processed/ {
+        internal;
+        alias /app/data/processed/;
+    }
+"""
+import os
+import re
+import sys
+import argparse
+import http.client
+from urllib.parse import unquote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# En-têtes propres à une connexion, non transmis
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te',
+              'trailer', 'transfer-encoding', 'upgrade', 'content-length'}
+
+# En-têtes de l'application conservés pour un fichier délégué
+KEPT_HEADERS = ('Content-Type', 'Content-Disposition', 'ETag', 'Last-Modified', 'Cache-Control', 'Set-Cookie')
+
+CHUNK_SIZE = 256 * 1024
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """
+    Plage d'octets demandée (une seule plage prise en charge)
+
+    Returns:
+        Tuple (début, fin incluse), None sans plage valide à appliquer,
+        ou False si la plage ne peut pas être satisfaite
+    """
+    match = RANGE_PATTERN.match((header or '').strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if start == '':
+        length = int(end)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+class OffloadProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    upstream = ('127.0.0.1', 5000)
+    accel_prefix = '/protected/processed'
+    accel_root = None
+
+    def do_GET(self):
+        self.forward()
+
+    do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_GET
+
+    def forward(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else None
+        headers = {name: value for name, value in self.headers.items() if name.lower() not in HOP_BY_HOP}
+        headers['X-Forwarded-For'] = self.client_address[0]
+
+        connection = http.client.HTTPConnection(*self.upstream, timeout=300)
+        try:
+            connection.request(self.command, self.path, body, headers)
+            response = connection.getresponse()
+            target = response.getheader('X-Accel-Redirect') or response.getheader('X-Sendfile')
+            if target:
+                response.read()
+                self.serve_file(self.resolve(target, response.getheader('X-Accel-Redirect') is not None), response)
+            else:
+                self.relay(response)
+        finally:
+            connection.close()
+
+    def resolve(self, target, accel):
+        """Chemin du fichier désigné par l'en-tête de délégation, ou None s'il n'est pas autorisé"""
+        if not accel:
+            return target
+        prefix = self.accel_prefix.rstrip('/') + '/'
+        if not target.startswith(prefix) or not self.accel_root:
+            return None
+        root = os.path.realpath(self.accel_root)
+        path = os.path.realpath(os.path.join(root, unquote(target[len(prefix):])))
+        if os.path.commonpath([root, path]) != root:
+            return None
+        return path
+
+    def relay(self, response):
+        """Transmet la réponse de l'application telle quelle"""
+        self.send_response(response.status, response.reason)
+        for name, value in response.getheaders():
+            if name.lower() not in HOP_BY_HOP:
+                self.send_header(name, value)
+        content_length = response.getheader('Content-Length')
+        if content_length is not None:
+            self.send_header('Content-Length', content_length)
+        else:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        if self.command == 'HEAD':
+            return
+        while True:
+            data = response.read(CHUNK_SIZE)
+            if not data:
+                break
+            self.wfile.write(data)
+
+    def serve_file(self, path, response):
+        """Envoie un fichier délégué, entier ou partiel"""
+        if not path or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        size = os.path.getsize(path)
+        etag = response.getheader('ETag')
+
+        byte_range = None
+        if_range = self.headers.get('If-Range')
+        if self.headers.get('Range') and (not if_range or if_range == etag):
+            byte_range = parse_range(self.headers['Range'], size)
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start, end = byte_range or (0, size - 1)
+        self.send_response(206 if byte_range else 200)
+        for name in KEPT_HEADERS:
+            value = response.getheader(name)
+            if value:
+                self.send_header(name, value)
+        self.send_header('Accept-Ranges', 'bytes')
+        if byte_range:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.send_header('Content-Length', str(max(0, end - start + 1)))
+        self.end_headers()
+        if self.command == 'HEAD' or size == 0:
+            return
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(CHUNK_SIZE, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--upstream', default='127.0.0.1:5000', help="Adresse de l'application (hôte:port)")
+    parser.add_argument('--host', default='127.0.0.1', help="Adresse d'écoute du proxy")
+    parser.add_argument('--port', type=int, default=8080, help="Port d'écoute du proxy")
+    parser.add_argument('--accel-prefix', default='/protected/processed',
+                        help="Emplacement interne (DOWNLOAD_OFFLOAD_PREFIX de l'application)")
+    parser.add_argument('--accel-root', default=None,
+                        help="Répertoire servi pour cet emplacement (répertoire des fichiers traités)")
+    args = parser.parse_args()
+
+    host, _, port = args.upstream.rpartition(':')
+    OffloadProxyHandler.upstream = (host or '127.0.0.1', int(port))
+    OffloadProxyHandler.accel_prefix = args.accel_prefix
+    OffloadProxyHandler.accel_root = args.accel_root
+
+    server = ThreadingHTTPServer((args.host, args.port), OffloadProxyHandler)
+    print(f"Proxy http://{args.host}:{args.port} -> http://{args.upstream}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,14 @@
+"""
+Processus de traitement des traitements asynchrones (voir app/api/jobs.py)
+
+Lancé par le superviseur des traitements de l'application (JOB_WORKERS
+processus), ou à part avec JOB_WORKERS=0 : python worker.py
+"""
+from app import create_app
+from app.api import jobs
+
+# Pas de superviseur dans les processus de traitement
+app = create_app({'JOB_WORKERS': 0})
+
+if __name__ == '__main__':
+    jobs.run_worker(app)